@@ -5,18 +5,29 @@ import secrets
 
 # Core stdlib imports used throughout the file
 import os
+import sys
 import json
+import math
+import re
 import logging
 import datetime
 import sqlite3
 import threading
 import traceback
+import queue
+import urllib.parse
 import hashlib
 import binascii
-from contextlib import contextmanager
-from functools import wraps
-from concurrent.futures import ThreadPoolExecutor
-from collections import defaultdict
+import calendar
+import atexit
+import copy
+import bisect
+from contextlib import contextmanager, ExitStack
+from functools import wraps, lru_cache
+from concurrent.futures import ThreadPoolExecutor, Future
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from collections import defaultdict, deque, OrderedDict
+from collections.abc import Mapping, MutableMapping
 
 # Third-party imports (use safe fallbacks so the module can be parsed
 # even if some optional dependencies are not installed in the environment)
@@ -33,6 +44,7 @@ try:
         jsonify,
         send_from_directory,
         Response,
+        has_request_context,
     )
 except Exception:
     # Minimal fallbacks to allow static analysis / parsing; runtime will still
@@ -55,6 +67,8 @@ except Exception:
         return ""
     class Response:
         pass
+    def has_request_context():
+        return False
 
 try:
     from werkzeug.middleware.proxy_fix import ProxyFix
@@ -62,27 +76,24 @@ except Exception:
     ProxyFix = None
 
 try:
-    from flask_cors import CORS
+    from flask.sessions import SecureCookieSessionInterface
 except Exception:
-    CORS = lambda *a, **k: None
+    SecureCookieSessionInterface = object
 
 try:
-    from flask_compress import Compress
+    from markupsafe import escape
 except Exception:
-    Compress = lambda *a, **k: None
+    from html import escape
 
 try:
-    from flask_limiter import Limiter
-    from flask_limiter.util import get_remote_address
+    from flask_cors import CORS
 except Exception:
-    # Provide simple placeholders so module can import; real rate limiting
-    # requires installing flask-limiter in the runtime environment.
-    class Limiter:
-        def __init__(self, *a, **k):
-            pass
+    CORS = lambda *a, **k: None
 
-    def get_remote_address():
-        return lambda: None
+try:
+    from flask_compress import Compress
+except Exception:
+    Compress = lambda *a, **k: None
 
 try:
     from werkzeug.middleware.profiler import ProfilerMiddleware
@@ -135,6 +146,9 @@ except Exception:
     redis = None
     REDIS_AVAILABLE = False
 
+# Route bo'yicha limitlar (MENU_RATE_LIMIT, CART_RATE_LIMIT, ORDER_RATE_LIMIT)
+from high_performance_config import HighPerformanceConfig
+
 # Bring logging handlers into top-level imports so setup_logging() can use them
 try:
     from logging.handlers import RotatingFileHandler, SMTPHandler
@@ -144,6 +158,7 @@ except Exception:
 
 
 app = Flask(__name__)
+APP_START_TIME = time.time()
 
 print("DEBUG: Flask app created")
 
@@ -204,6 +219,27 @@ class Config:
     # Cache configuration
     SEND_FILE_MAX_AGE_DEFAULT = 31536000 if IS_PRODUCTION else 300
     REDIS_URL = os.environ.get("REDIS_URL", "memory://")
+    # Jarayon ichidagi kesh chegaralari (yozuvlar soni va taxminiy bayt hajmi)
+    CACHE_MAX_ENTRIES = int(os.environ.get("CACHE_MAX_ENTRIES", "2048"))
+    CACHE_MAX_BYTES = int(os.environ.get("CACHE_MAX_BYTES", str(32 * 1024 * 1024)))
+    CACHE_STRIPES = int(os.environ.get("CACHE_STRIPES", "16"))
+    # Teg bilan bekor qilinadigan yozuvlar (menyu, yangiliklar, savatcha) uchun TTL
+    CACHE_TAGGED_TTL = int(os.environ.get("CACHE_TAGGED_TTL", "3600"))
+    # Muddati o'tgan yozuv yangilanayotganda shuncha soniya eski holida beriladi
+    CACHE_STALE_TTL = int(os.environ.get("CACHE_STALE_TTL", "60"))
+    # Boshqa thread hisoblayotgan kalitni kutish chegarasi (soniya)
+    CACHE_FLIGHT_TIMEOUT = float(os.environ.get("CACHE_FLIGHT_TIMEOUT", "10"))
+    # Redis (L2) bilan jarayon ichidagi L1 nusxa shuncha soniyadan uzoq yashamaydi
+    CACHE_L1_TTL = int(os.environ.get("CACHE_L1_TTL", "30"))
+    # Workerlar orasida invalidatsiya shinasi: auto | redis | sqlite | none
+    CACHE_BUS = os.environ.get("CACHE_BUS", "auto")
+    CACHE_BUS_PATH = os.environ.get(
+        "CACHE_BUS_PATH",
+        os.path.join(os.path.dirname(os.path.abspath(__file__)), "cache_bus.sqlite3"),
+    )
+    CACHE_BUS_POLL_INTERVAL = float(os.environ.get("CACHE_BUS_POLL_INTERVAL", "0.5"))
+    # Render qilingan sahifalar (page_cache) muddati
+    PAGE_CACHE_TTL = int(os.environ.get("PAGE_CACHE_TTL", "300"))
 
     # External APIs
     YANDEX_GEOCODER_API = os.environ.get("YANDEX_GEOCODER_API", "")
@@ -232,6 +268,10 @@ class Config:
     RATE_LIMIT_DAILY = int(os.environ.get("RATE_LIMIT_DAILY", "100000"))  # 100k в день
     RATE_LIMIT_HOURLY = int(os.environ.get("RATE_LIMIT_HOURLY", "10000"))  # 10k в час
     RATE_LIMIT_MINUTE = int(os.environ.get("RATE_LIMIT_MINUTE", "1000"))  # 1k в минуту
+    # "auto" - Redis mavjud bo'lsa workerlar orasida umumiy, aks holda xotirada
+    RATE_LIMIT_BACKEND = os.environ.get("RATE_LIMIT_BACKEND", "auto")
+    RATE_LIMIT_STRIPES = int(os.environ.get("RATE_LIMIT_STRIPES", "16"))
+    RATE_LIMIT_SWEEP_INTERVAL = float(os.environ.get("RATE_LIMIT_SWEEP_INTERVAL", "60"))
 
     # Logging
     LOG_LEVEL = os.environ.get("LOG_LEVEL", "INFO")
@@ -245,6 +285,22 @@ class Config:
     DB_POOL_MAX_CONNECTIONS = int(
         os.environ.get("DB_POOL_MAX_CONNECTIONS", "100")
     )  # Больше соединений
+    # Faqat o'qish uchun alohida pool (query_only connectionlar)
+    DB_READ_POOL_MAX_CONNECTIONS = int(
+        os.environ.get("DB_READ_POOL_MAX_CONNECTIONS", "50")
+    )
+    # Bo'sh connection kutish muddati va health check (faqat shuncha soniya bo'sh turgandan keyin)
+    DB_POOL_CHECKOUT_TIMEOUT = float(os.environ.get("DB_POOL_CHECKOUT_TIMEOUT", "30"))
+    DB_POOL_HEALTHCHECK_IDLE = float(os.environ.get("DB_POOL_HEALTHCHECK_IDLE", "60"))
+    # SQL profiling (opt-in): har bir so'rov vaqti, sekin so'rovlar logi
+    SQL_PROFILING = os.environ.get("SQL_PROFILING", "0").lower() in ("1", "true", "yes")
+    SLOW_QUERY_MS = float(os.environ.get("SLOW_QUERY_MS", "200"))
+    SLOW_QUERY_LOG = os.environ.get("SLOW_QUERY_LOG", "logs/slow_queries.log")
+    # sessions.last_seen yozuvlari xotirada yig'ilib shuncha soniyada bir yoziladi
+    SESSION_FLUSH_INTERVAL = float(os.environ.get("SESSION_FLUSH_INTERVAL", "5"))
+    SESSION_FLUSH_MAX_PENDING = int(os.environ.get("SESSION_FLUSH_MAX_PENDING", "5000"))
+    # rating_aggregates ni ratings bilan solishtirish oralig'i (soniya, 0 - o'chiq)
+    RATING_RECONCILE_INTERVAL = float(os.environ.get("RATING_RECONCILE_INTERVAL", "21600"))
 
     # Дополнительные оптимизации производительности
     SQLALCHEMY_ENGINE_OPTIONS = {
@@ -322,18 +378,6 @@ CORS(app, origins=["*"], methods=["GET", "POST", "PUT", "DELETE", "OPTIONS"])
 # Compression
 Compress(app)
 
-# Rate limiting with universal configuration
-limiter = Limiter(
-    key_func=get_remote_address,
-    app=app,
-    default_limits=[
-        f"{Config.RATE_LIMIT_DAILY} per day",
-        f"{Config.RATE_LIMIT_HOURLY} per hour",
-        f"{Config.RATE_LIMIT_MINUTE} per minute",
-    ],
-    storage_uri=Config.REDIS_URL,
-)
-
 # Performance profiling (faqat debug rejimida)
 if os.environ.get("FLASK_ENV") == "development":
     app.wsgi_app = ProfilerMiddleware(app.wsgi_app, restrictions=[30])
@@ -452,13 +496,309 @@ if location_service is None:
 
 
 # Cache tizimi
-class CacheManager:
+def _json_fallback(o):
+    "json.dumps default: Mapping (masalan DbRow) -> dict, qolganlari -> str"
+    if isinstance(o, Mapping):
+        return dict(o)
+    return str(o)
+
+
+class _CacheStripe:
+    "CacheManager bo'lagi: o'z lock i, LRU tartibidagi yozuvlar va hisoblagichlar"
+
+    __slots__ = ("lock", "entries", "bytes", "counters")
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        # key -> (value, expires_at, size, tag_stamp, stale_until);
+        # boshida eng eski ishlatilgan
+        self.entries = OrderedDict()
+        self.bytes = 0
+        # (prefix, counter) -> son
+        self.counters = defaultdict(int)
+
+    def remove(self, key):
+        entry = self.entries.pop(key, None)
+        if entry is not None:
+            self.bytes -= entry[2]
+        return entry
+
+
+class _Flight:
+    "Bitta kalit bo'yicha davom etayotgan hisoblash (single-flight)"
+
+    __slots__ = ("done", "value")
+
     def __init__(self):
-        self.memory_cache = {}
-        self.cache_timestamps = {}
-        self.cache_lock = threading.Lock()
-        self.redis_client = None
-        self._init_redis()
+        self.done = threading.Event()
+        self.value = None
+
+
+class RedisInvalidationBus:
+    """Kesh invalidatsiya xabarlari Redis pub/sub orqali (workerlar orasida).
+
+    Ulanish uzilganda xabarlar yo'qolishi mumkin - shuning uchun Redis bilan
+    L1 yozuvlari Config.CACHE_L1_TTL dan uzoq yashamaydi.
+    """
+
+    name = "redis"
+
+    def __init__(self, client, channel="restaurant:cache:invalidate"):
+        self.client = client
+        self.channel = channel
+        self._stop = threading.Event()
+
+    def publish(self, message):
+        self.client.publish(self.channel, json.dumps(message))
+
+    def start(self, handler):
+        self._stop.clear()
+        threading.Thread(
+            target=self._listen, args=(handler,), name="cache-bus-redis", daemon=True
+        ).start()
+
+    def _listen(self, handler):
+        while not self._stop.is_set():
+            try:
+                pubsub = self.client.pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(self.channel)
+                for message in pubsub.listen():
+                    if self._stop.is_set():
+                        break
+                    if not message or message.get("type") != "message":
+                        continue
+                    data = message["data"]
+                    if isinstance(data, bytes):
+                        data = data.decode()
+                    handler(json.loads(data))
+            except Exception as e:
+                app_logger.warning(f"Cache bus (redis) error: {str(e)}")
+                self._stop.wait(1)
+
+    def close(self):
+        self._stop.set()
+
+
+class SQLiteInvalidationBus:
+    """Redis bo'lmaganda (REDIS_URL=memory://) invalidatsiya xabarlari shinasi.
+
+    Xabarlar umumiy SQLite fayldagi jadvalga yoziladi, har bir worker yangi
+    qatorlarni id bo'yicha poll_interval da o'qiydi. Eski qatorlar RETENTION
+    soniyadan keyin o'chiriladi.
+    """
+
+    name = "sqlite"
+    RETENTION = 300
+    PRUNE_EVERY = 500
+
+    def __init__(self, path, poll_interval=0.5):
+        self.path = path
+        self.poll_interval = poll_interval
+        self._lock = threading.Lock()
+        self._conn = None
+        self._published = 0
+        self._last_id = 0
+        self._stop = threading.Event()
+
+    def _connect(self):
+        conn = sqlite3.connect(
+            self.path, timeout=5, check_same_thread=False, isolation_level=None
+        )
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute(
+            """CREATE TABLE IF NOT EXISTS cache_invalidations (
+                   id INTEGER PRIMARY KEY AUTOINCREMENT,
+                   payload TEXT NOT NULL,
+                   created_ts REAL NOT NULL
+               )"""
+        )
+        return conn
+
+    def publish(self, message):
+        with self._lock:
+            if self._conn is None:
+                self._conn = self._connect()
+            self._conn.execute(
+                "INSERT INTO cache_invalidations (payload, created_ts) VALUES (?, ?)",
+                (json.dumps(message), time.time()),
+            )
+            self._published += 1
+            if self._published % self.PRUNE_EVERY == 0:
+                self._conn.execute(
+                    "DELETE FROM cache_invalidations WHERE created_ts < ?",
+                    (time.time() - self.RETENTION,),
+                )
+
+    def start(self, handler):
+        # fork dan keyin ota jarayon connectioni ishlatilmaydi
+        self._lock = threading.Lock()
+        self._conn = None
+        conn = self._connect()
+        self._last_id = conn.execute(
+            "SELECT COALESCE(MAX(id), 0) FROM cache_invalidations"
+        ).fetchone()[0]
+        self._stop.clear()
+        threading.Thread(
+            target=self._poll_loop, args=(conn, handler), name="cache-bus-sqlite", daemon=True
+        ).start()
+
+    def poll(self, conn, handler):
+        "Yangi xabarlarni o'qib handler ga berish; nechta xabar bo'lganini qaytaradi"
+        rows = conn.execute(
+            "SELECT id, payload FROM cache_invalidations WHERE id > ? ORDER BY id",
+            (self._last_id,),
+        ).fetchall()
+        for row_id, payload in rows:
+            self._last_id = row_id
+            handler(json.loads(payload))
+        return len(rows)
+
+    def _poll_loop(self, conn, handler):
+        try:
+            while not self._stop.wait(self.poll_interval):
+                try:
+                    self.poll(conn, handler)
+                except Exception as e:
+                    app_logger.warning(f"Cache bus (sqlite) poll error: {str(e)}")
+        finally:
+            conn.close()
+
+    def close(self):
+        self._stop.set()
+
+
+def make_invalidation_bus(redis_client=None):
+    """Config.CACHE_BUS bo'yicha shina: redis | sqlite | none | auto.
+
+    auto: Redis ulangan bo'lsa redis; WEB_CONCURRENCY > 1 (bir nechta gunicorn
+    worker) bo'lsa sqlite; aks holda shina kerak emas (bitta jarayon).
+    """
+    mode = (Config.CACHE_BUS or "auto").lower()
+    if mode == "auto":
+        if redis_client is not None:
+            mode = "redis"
+        else:
+            try:
+                workers = int(os.environ.get("WEB_CONCURRENCY") or 1)
+            except ValueError:
+                workers = 1
+            mode = "sqlite" if workers > 1 else "none"
+    if mode == "redis" and redis_client is not None:
+        return RedisInvalidationBus(redis_client)
+    if mode == "sqlite":
+        return SQLiteInvalidationBus(Config.CACHE_BUS_PATH, Config.CACHE_BUS_POLL_INTERVAL)
+    return None
+
+
+class CacheManager:
+    """Ikki qavatli kesh: jarayon ichidagi L1 (TTL + LRU) va Redis L2.
+
+    L1: kalitlar hash bo'yicha bo'laklarga (stripe) taqsimlanadi - har bir
+    bo'lakda o'z lock i va OrderedDict i bor, shuning uchun LRU yangilash va
+    chiqarish O(1), turli bo'lakdagi kalitlar bir-birini kutmaydi. Yozuvlar
+    soni va taxminiy bayt hajmi chegaralari bo'laklarga teng bo'linadi.
+    Hit/miss/eviction hisoblagichlari kalit prefiksi bo'yicha yuritiladi
+    ("cart_count_12" -> "cart_count").
+
+    L2 (REDIS_URL berilgan bo'lsa): L1 da yo'q kalit Redis dan o'qilib L1 ga
+    ko'chiriladi; Redis bilan L1 yozuvlari Config.CACHE_L1_TTL dan uzoq
+    yashamaydi.
+
+    Teglar ("menu", "menu_item:5", "cart:user:3", "news", "settings"):
+    set(..., tags=...) yozuvga teglarning joriy versiyalarini yozib qo'yadi,
+    invalidate_tags() esa versiyani oshiradi - eski versiyali yozuvlar
+    keyingi get() da miss bo'ladi. Kalitlarni sanab chiqish shart emas.
+    L1 versiyalari jarayon ichida, L2 versiyalari Redis hisoblagichlarida.
+
+    delete(), invalidate_tags() va clear() boshqa workerlarga shina orqali
+    yuboriladi (make_invalidation_bus): ular o'z L1 ini tozalaydi.
+
+    get_or_compute() qimmat hisoblashlarni birlashtiradi (single-flight):
+    bir kalitni bir vaqtda faqat bitta thread hisoblaydi, qolganlari uning
+    natijasini kutadi yoki stale_ttl oynasida eski qiymatni oladi.
+    """
+
+    COUNTERS = (
+        "hits",
+        "misses",
+        "sets",
+        "evictions",
+        "expired",
+        "invalidated",
+        "stale",
+        "coalesced",
+        "l2_hits",
+    )
+    ENTRY_OVERHEAD = 64
+    # Teg versiyalari lug'ati shundan oshsa tozalanadi (epoch bilan)
+    MAX_TAGS = 50000
+
+    def __init__(
+        self,
+        max_entries=None,
+        max_bytes=None,
+        stripes=None,
+        default_ttl=300,
+        redis_client=None,
+        bus=None,
+        l1_ttl=None,
+    ):
+        stripes = max(1, stripes or Config.CACHE_STRIPES)
+        self.max_entries = max_entries or Config.CACHE_MAX_ENTRIES
+        self.max_bytes = max_bytes or Config.CACHE_MAX_BYTES
+        self.default_ttl = default_ttl
+        self.stripes = [_CacheStripe() for _ in range(stripes)]
+        self.stripe_max_entries = max(1, self.max_entries // stripes)
+        self.stripe_max_bytes = max(1, self.max_bytes // stripes)
+        self._tag_lock = threading.Lock()
+        self._tag_versions = {}
+        self._tag_epoch = 0
+        # Har bir mahalliy teg o'zgarishida oshadi (L2 -> L1 ko'chirish uchun)
+        self._tag_generation = 0
+        self._tag_invalidations = defaultdict(int)
+        self._flight_lock = threading.Lock()
+        self._flights = {}
+        self.redis_client = redis_client
+        if redis_client is None:
+            self._init_redis()
+        self.l1_ttl = Config.CACHE_L1_TTL if l1_ttl is None else l1_ttl
+        self.instance_id = secrets.token_hex(8)
+        self.bus = bus if bus is not None else make_invalidation_bus(self.redis_client)
+        if self.bus is not None:
+            self.bus.start(self._on_bus_message)
+            if hasattr(os, "register_at_fork"):
+                # gunicorn --preload: tinglovchi thread fork dan keyin qayta ishga tushadi
+                os.register_at_fork(after_in_child=self._after_fork)
+
+    def _stripe(self, key):
+        return self.stripes[hash(key) % len(self.stripes)]
+
+    @staticmethod
+    def key_prefix(key):
+        "Statistika guruhi: 'fn:{...}' -> 'fn', 'cart_count_12' -> 'cart_count'"
+        key = str(key)
+        if ":" in key:
+            return key.split(":", 1)[0] or "other"
+        head, sep, tail = key.rpartition("_")
+        # Oxirgi bo'lak id/session bo'lsa (raqamli yoki None) u guruhga kirmaydi
+        if sep and head and (tail == "None" or any(ch.isdigit() for ch in tail)):
+            return head
+        return key or "other"
+
+    @classmethod
+    def approx_size(cls, key, value, payload=None):
+        "Yozuvning taxminiy hajmi (bayt) - JSON ko'rinishi uzunligi bo'yicha"
+        if payload is not None:
+            size = len(payload)
+        elif isinstance(value, (str, bytes, bytearray)):
+            size = len(value)
+        else:
+            try:
+                size = len(json.dumps(value, default=_json_fallback))
+            except Exception:
+                size = sys.getsizeof(value)
+        return size + len(str(key)) + cls.ENTRY_OVERHEAD
 
     def _init_redis(self):
         "Redis connection (agar mavjud bo'lsa)"
@@ -494,64 +834,437 @@ class CacheManager:
                 pass
             self.redis_client = None
 
+    def _after_fork(self):
+        "Bola jarayon: yangi instance_id (xabarlarni ajratish uchun) va tinglovchi"
+        self.instance_id = secrets.token_hex(8)
+        self._tag_lock = threading.Lock()
+        self._flight_lock = threading.Lock()
+        self._flights = {}
+        try:
+            self.bus.start(self._on_bus_message)
+        except Exception as e:
+            app_logger.warning(f"Cache bus restart after fork failed: {str(e)}")
+
+    def _broadcast(self, message):
+        "Invalidatsiyani boshqa workerlarga yuborish (shina bo'lsa)"
+        if self.bus is None:
+            return
+        try:
+            self.bus.publish(dict(message, origin=self.instance_id))
+        except Exception as e:
+            app_logger.warning(f"Cache bus publish error: {str(e)}")
+
+    def _on_bus_message(self, message):
+        "Boshqa workerdan kelgan invalidatsiya - faqat L1 ga qo'llanadi"
+        if message.get("origin") == self.instance_id:
+            return
+        op = message.get("op")
+        if op == "delete":
+            for key in message.get("keys") or ():
+                self._l1_delete(key)
+        elif op == "tags":
+            self._bump_tags(message.get("tags") or ())
+        elif op == "clear":
+            self._l1_clear()
+
+    def tag_stamp(self, tags):
+        """(epoch, teglar, L1 versiyalar, L2 versiyalar) - teglarning joriy holati.
+
+        Qiymatni hisoblashdan *oldin* olinib set(stamp=...) ga berilsa,
+        hisoblash davomida bo'lgan invalidatsiya ham hisobga olinadi.
+        """
+        tags = tuple(tags)
+        epoch = self._tag_epoch
+        versions = self._tag_versions
+        local = tuple(versions.get(t, 0) for t in tags)
+        return (epoch, tags, local, self._l2_versions(tags))
+
+    def _stamp_valid(self, stamp):
+        "L1 yozuvi teglari hali bekor qilinmaganmi (faqat jarayon ichidagi versiyalar)"
+        if not stamp:
+            return True
+        epoch, tags, versions = stamp[:3]
+        current = self._tag_versions
+        return epoch == self._tag_epoch and tuple(versions) == tuple(
+            current.get(t, 0) for t in tags
+        )
+
+    def is_current(self, stamp):
+        "tag_stamp() holati hali bekor qilinmaganmi (keshdan tashqari saqlangan qiymatlar uchun)"
+        return self._stamp_valid(stamp)
+
+    def _l2_versions(self, tags):
+        "Teglarning Redis dagi versiyalari (L2 yo'q yoki teg yo'q bo'lsa None)"
+        if not self.redis_client or not tags:
+            return None
+        try:
+            values = self.redis_client.mget([f"restaurant:tag:{t}" for t in tags])
+            return tuple(int(v or 0) for v in values)
+        except Exception:
+            return None
+
+    def _bump_tags(self, tags):
+        with self._tag_lock:
+            if len(self._tag_versions) + len(tags) > self.MAX_TAGS:
+                # Yangi epoch - barcha teglangan yozuvlar bir marta eskiradi
+                self._tag_versions = {}
+                self._tag_epoch += 1
+            for tag in tags:
+                self._tag_versions[tag] = self._tag_versions.get(tag, 0) + 1
+            self._tag_generation += 1
+
+    def invalidate_tags(self, *tags):
+        "Shu teglar bilan saqlangan barcha yozuvlarni eskirgan deb belgilash"
+        tags = [t for t in tags if t]
+        if not tags:
+            return
+        self._bump_tags(tags)
+        with self._tag_lock:
+            for tag in tags:
+                self._tag_invalidations[tag.split(":", 1)[0]] += 1
+        if self.redis_client:
+            try:
+                pipe = self.redis_client.pipeline()
+                for tag in tags:
+                    pipe.incr(f"restaurant:tag:{tag}")
+                pipe.execute()
+            except Exception as e:
+                app_logger.warning(f"Cache tag invalidation (redis) error: {str(e)}")
+        self._broadcast({"op": "tags", "tags": tags})
+
+    def _l2_get(self, key):
+        "L2 dagi (qiymat, teglar) - teg versiyalari mos kelsa, aks holda None"
+        raw = self.redis_client.get(f"restaurant:{key}")
+        if not raw:
+            return None
+        data = json.loads(raw.decode() if isinstance(raw, bytes) else raw)
+        if isinstance(data, dict) and "__tags__" in data:
+            try:
+                tags, versions = data["__tags__"]
+            except (TypeError, ValueError):
+                return None
+            tags = tuple(tags)
+            if self._l2_versions(tags) != tuple(versions):
+                return None
+            return data["value"], tags
+        return data, ()
+
+    def _l2_fetch(self, stripe, key, prefix):
+        "L1 miss: L2 dan o'qish va L1 ga ko'chirish; topilmasa None"
+        generation = self._tag_generation
+        try:
+            found = self._l2_get(key)
+        except Exception as e:
+            app_logger.error(f"Cache get error: {str(e)}")
+            return None
+        if found is None:
+            return None
+        value, tags = found
+        # O'qish paytida mahalliy invalidatsiya kelgan bo'lsa L1 ga yozilmaydi
+        if generation == self._tag_generation:
+            stamp = (
+                (self._tag_epoch, tags, tuple(self._tag_versions.get(t, 0) for t in tags))
+                if tags
+                else None
+            )
+            self._store_l1(stripe, key, value, self.l1_ttl, stamp, count_set=False)
+        with stripe.lock:
+            stripe.counters[(prefix, "hits")] += 1
+            stripe.counters[(prefix, "l2_hits")] += 1
+        return value
+
+    def _lookup(self, stripe, key, prefix):
+        """L1 dagi yozuv holati: ("fresh" | "stale" | "miss", qiymat).
+
+        stripe.lock ostida chaqiriladi. "stale" - muddati o'tgan, lekin
+        stale_until gacha yangilanish paytida berilishi mumkin bo'lgan yozuv.
+        Teg bo'yicha bekor qilingan yozuv hech qachon stale berilmaydi.
+        """
+        entry = stripe.entries.get(key)
+        if entry is None:
+            return "miss", None
+        value, expires_at, _, stamp, stale_until = entry
+        now = time.monotonic()
+        if not self._stamp_valid(stamp):
+            stripe.remove(key)
+            stripe.counters[(prefix, "invalidated")] += 1
+            return "miss", None
+        if expires_at <= now:
+            if stale_until > now:
+                return "stale", value
+            stripe.remove(key)
+            stripe.counters[(prefix, "expired")] += 1
+            return "miss", None
+        stripe.entries.move_to_end(key)
+        return "fresh", value
+
     def get(self, key, default=None):
-        "Cache dan ma'lumot olish"
+        "Cache dan ma'lumot olish: avval L1, keyin L2"
         try:
+            stripe = self._stripe(key)
+            prefix = self.key_prefix(key)
+            with stripe.lock:
+                state, value = self._lookup(stripe, key, prefix)
+                if state == "fresh":
+                    stripe.counters[(prefix, "hits")] += 1
+                    return value
+
             if self.redis_client:
-                value = self.redis_client.get(f"restaurant:{key}")
-                if value:
-                    return json.loads(value.decode())
-
-            # Memory cache dan olish
-            with self.cache_lock:
-                if key in self.memory_cache:
-                    timestamp = self.cache_timestamps.get(key, 0)
-                    if time.time() - timestamp < 300:  # 5 daqiqa
-                        return self.memory_cache[key]
-                    else:
-                        del self.memory_cache[key]
-                        del self.cache_timestamps[key]
+                value = self._l2_fetch(stripe, key, prefix)
+                if value is not None:
+                    return value
+
+            with stripe.lock:
+                stripe.counters[(prefix, "misses")] += 1
         except Exception as e:
             app_logger.error(f"Cache get error: {str(e)}")
 
         return default
 
-    def set(self, key, value, ttl=300):
-        "Cache ga ma'lumot saqlash"
+    def get_or_compute(
+        self, key, compute, ttl=None, tags=(), stale_ttl=0, background=False, timeout=None
+    ):
+        """Keshdan olish, yo'q bo'lsa compute() ni bitta thread da bajarish.
+
+        - yangi yozuv - darhol qaytariladi;
+        - muddati o'tgan, lekin stale_ttl oynasidagi yozuv - eski qiymat
+          qaytariladi va bitta thread uni yangilaydi: background=True bo'lsa
+          fonda (safe_submit), aks holda shu kalitni birinchi so'ragan thread
+          o'zi hisoblaydi, qolganlari kutmasdan eski qiymatni oladi;
+        - yozuv yo'q - birinchi thread hisoblaydi, qolganlari uning natijasini
+          kutadi (timeout, default Config.CACHE_FLIGHT_TIMEOUT).
+        compute() None qaytarsa natija keshlanmaydi; kutayotganlar bu holda
+        (yoki timeout da) compute() ni o'zlari chaqiradi.
+        background=True faqat so'rov kontekstiga bog'liq bo'lmagan compute uchun.
+        """
+        stripe = self._stripe(key)
+        prefix = self.key_prefix(key)
+        with stripe.lock:
+            state, value = self._lookup(stripe, key, prefix)
+            if state == "fresh":
+                stripe.counters[(prefix, "hits")] += 1
+                return value
+
+        if self.redis_client:
+            data = self._l2_fetch(stripe, key, prefix)
+            if data is not None:
+                return data
+
+        with stripe.lock:
+            stripe.counters[(prefix, "stale" if state == "stale" else "misses")] += 1
+
+        with self._flight_lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+
+        if state == "stale":
+            if not leader:
+                return value
+            if background:
+                safe_submit(self._refresh, key, flight, compute, ttl, tags, stale_ttl)
+                return value
+            try:
+                fresh = self._run_flight(key, flight, compute, ttl, tags, stale_ttl)
+            except Exception as e:
+                app_logger.warning(f"Cache refresh error ({prefix}): {str(e)}")
+                return value
+            return value if fresh is None else fresh
+
+        if leader:
+            # Oldingi hisoblash shu orada tugagan bo'lishi mumkin
+            with stripe.lock:
+                state, value = self._lookup(stripe, key, prefix)
+            if state == "fresh":
+                self._finish_flight(key, flight)
+                return value
+            return self._run_flight(key, flight, compute, ttl, tags, stale_ttl)
+
+        with stripe.lock:
+            stripe.counters[(prefix, "coalesced")] += 1
+        flight.done.wait(Config.CACHE_FLIGHT_TIMEOUT if timeout is None else timeout)
+        if flight.value is not None:
+            return flight.value
+        return compute()
+
+    def _run_flight(self, key, flight, compute, ttl, tags, stale_ttl):
+        "compute() ni bajarib natijani keshlash va kutayotganlarga berish"
         try:
-            if self.redis_client:
-                self.redis_client.setex(
-                    f"restaurant:{key}", ttl, json.dumps(value, default=str)
-                )
+            # Teg versiyalari hisoblashdan oldin olinadi (parallel invalidatsiya uchun)
+            stamp = self.tag_stamp(tags) if tags else None
+            value = compute()
+            if value is not None:
+                self.set(key, value, ttl, tags=tags, stamp=stamp, stale_ttl=stale_ttl)
+            flight.value = value
+            return value
+        finally:
+            self._finish_flight(key, flight)
+
+    def _finish_flight(self, key, flight):
+        with self._flight_lock:
+            if self._flights.get(key) is flight:
+                del self._flights[key]
+        flight.done.set()
 
-            # Memory cache ga ham saqlash
-            with self.cache_lock:
-                self.memory_cache[key] = value
-                self.cache_timestamps[key] = time.time()
+    def _refresh(self, key, flight, compute, ttl, tags, stale_ttl):
+        "Fondagi yangilash - xatolik eski qiymatni o'chirmaydi, faqat loglanadi"
+        try:
+            self._run_flight(key, flight, compute, ttl, tags, stale_ttl)
+        except Exception as e:
+            app_logger.warning(
+                f"Cache background refresh error ({self.key_prefix(key)}): {str(e)}"
+            )
 
-                # Memory cache ni tozalash (maksimal 1000 ta element)
-                if len(self.memory_cache) > 1000:
-                    oldest_key = min(
-                        self.cache_timestamps.keys(),
-                        key=lambda k: self.cache_timestamps[k],
+    def set(self, key, value, ttl=None, tags=(), stamp=None, stale_ttl=0):
+        """Cache ga ma'lumot saqlash (ttl soniyada; berilmasa default_ttl).
+
+        stale_ttl - muddati o'tgandan keyin get_or_compute() yozuvni yana
+        shuncha soniya eski qiymat sifatida berishi mumkin. Redis bilan L1
+        nusxa CACHE_L1_TTL dan uzoq yashamaydi, L2 esa to'liq ttl.
+        """
+        try:
+            ttl = self.default_ttl if ttl is None else ttl
+            if stamp is None and tags:
+                stamp = self.tag_stamp(tags)
+            if stamp and not self._stamp_valid(stamp):
+                # Hisoblash paytida teg bekor qilindi - eskirgan qiymat yozilmaydi
+                return
+            payload = None
+            if self.redis_client and ttl > 0:
+                if stamp:
+                    l2_versions = stamp[3] if len(stamp) > 3 else None
+                    if l2_versions is None:
+                        l2_versions = self._l2_versions(stamp[1]) or ()
+                    payload = json.dumps(
+                        {"__tags__": [list(stamp[1]), list(l2_versions)], "value": value},
+                        default=_json_fallback,
                     )
-                    del self.memory_cache[oldest_key]
-                    del self.cache_timestamps[oldest_key]
+                else:
+                    payload = json.dumps(value, default=_json_fallback)
+                self.redis_client.setex(
+                    f"restaurant:{key}", max(1, int(math.ceil(ttl))), payload
+                )
+                ttl = min(ttl, self.l1_ttl)
+
+            stripe = self._stripe(key)
+            self._store_l1(
+                stripe,
+                key,
+                value,
+                ttl,
+                stamp,
+                stale_ttl=stale_ttl,
+                size=self.approx_size(key, value, payload),
+            )
         except Exception as e:
             app_logger.error(f"Cache set error: {str(e)}")
 
+    def _store_l1(self, stripe, key, value, ttl, stamp, stale_ttl=0, size=None, count_set=True):
+        "L1 ga yozish va LRU/bayt chegarasi bo'yicha eski yozuvlarni chiqarish"
+        if size is None:
+            size = self.approx_size(key, value)
+        with stripe.lock:
+            stripe.remove(key)
+            if ttl <= 0 or size > self.stripe_max_bytes:
+                # Bo'lakka sig'maydigan qiymat keshlanmaydi
+                return
+            expires_at = time.monotonic() + ttl
+            stripe.entries[key] = (
+                value,
+                expires_at,
+                size,
+                stamp,
+                expires_at + max(0, stale_ttl),
+            )
+            stripe.bytes += size
+            if count_set:
+                stripe.counters[(self.key_prefix(key), "sets")] += 1
+
+            # LRU: eng eski ishlatilgan yozuvlar boshida turadi
+            while (
+                len(stripe.entries) > self.stripe_max_entries
+                or stripe.bytes > self.stripe_max_bytes
+            ):
+                old_key, old_entry = stripe.entries.popitem(last=False)
+                stripe.bytes -= old_entry[2]
+                counter = (
+                    "expired" if old_entry[1] <= time.monotonic() else "evictions"
+                )
+                stripe.counters[(self.key_prefix(old_key), counter)] += 1
+
+    def _l1_delete(self, key):
+        stripe = self._stripe(key)
+        with stripe.lock:
+            stripe.remove(key)
+
+    def _l1_clear(self):
+        for stripe in self.stripes:
+            with stripe.lock:
+                stripe.entries.clear()
+                stripe.bytes = 0
+
     def delete(self, key):
-        "Cache dan o'chirish"
+        "Cache dan o'chirish (L1, L2 va boshqa workerlarning L1 i)"
         try:
             if self.redis_client:
                 self.redis_client.delete(f"restaurant:{key}")
-
-            with self.cache_lock:
-                self.memory_cache.pop(key, None)
-                self.cache_timestamps.pop(key, None)
+            self._l1_delete(key)
+            self._broadcast({"op": "delete", "keys": [key]})
         except Exception as e:
             app_logger.error(f"Cache delete error: {str(e)}")
 
+    def clear(self):
+        "Barcha yozuvlarni o'chirish (hisoblagichlar va teg versiyalari saqlanadi)"
+        self._l1_clear()
+        if self.redis_client:
+            try:
+                for name in self.redis_client.scan_iter(match="restaurant:*", count=500):
+                    text = name.decode() if isinstance(name, bytes) else name
+                    # Teg hisoblagichlari qolsin - aks holda eski L2 yozuvlar qaytadi
+                    if not text.startswith("restaurant:tag:"):
+                        self.redis_client.delete(name)
+            except Exception as e:
+                app_logger.warning(f"Cache clear (redis) error: {str(e)}")
+        self._broadcast({"op": "clear"})
+
+    def stats(self):
+        "Kesh metrikalari: umumiy va prefiks bo'yicha hit/miss/eviction"
+        prefixes = defaultdict(lambda: dict.fromkeys(self.COUNTERS, 0))
+        entries = used_bytes = 0
+        for stripe in self.stripes:
+            with stripe.lock:
+                entries += len(stripe.entries)
+                used_bytes += stripe.bytes
+                counters = list(stripe.counters.items())
+            for (prefix, name), count in counters:
+                prefixes[prefix][name] += count
+
+        totals = dict.fromkeys(self.COUNTERS, 0)
+        for counters in prefixes.values():
+            for name in self.COUNTERS:
+                totals[name] += counters[name]
+            counters["hit_rate"] = self._hit_rate(counters)
+        return {
+            "backend": "redis+memory" if self.redis_client else "memory",
+            "bus": self.bus.name if self.bus is not None else None,
+            "l1_ttl": self.l1_ttl if self.redis_client else None,
+            "entries": entries,
+            "bytes": used_bytes,
+            "max_entries": self.max_entries,
+            "max_bytes": self.max_bytes,
+            "stripes": len(self.stripes),
+            **totals,
+            "hit_rate": self._hit_rate(totals),
+            "prefixes": dict(sorted(prefixes.items())),
+            "tag_invalidations": dict(sorted(self._tag_invalidations.items())),
+        }
+
+    @staticmethod
+    def _hit_rate(counters):
+        lookups = counters["hits"] + counters["misses"]
+        return round(counters["hits"] / lookups * 100, 1) if lookups else 0.0
+
 
 # Global cache manager (lazy-init to avoid blocking imports)
 cache_manager = None
@@ -568,6 +1281,32 @@ def get_cache_manager():
     return cache_manager
 
 
+def get_cache_stats():
+    "Kesh metrikalari (super admin tizim sahifasi uchun)"
+    cm = cache_manager or get_cache_manager()
+    return cm.stats() if cm else {}
+
+
+def invalidate_cache(*tags):
+    "Teglar bo'yicha keshni bekor qilish - xatolik so'rovni buzmaydi"
+    try:
+        cm = cache_manager or get_cache_manager()
+        if cm:
+            cm.invalidate_tags(*tags)
+    except Exception as e:
+        app_logger.warning(f"Cache invalidation error: {str(e)}")
+
+
+def cart_tags(user_id=None, session_id=None):
+    "Savatcha egasi teglari: cart:user:<id>, cart:session:<sid>"
+    tags = []
+    if user_id:
+        tags.append(f"cart:user:{user_id}")
+    if session_id:
+        tags.append(f"cart:session:{session_id}")
+    return tags
+
+
 # Ensure a global cache_manager instance exists so code that references
 # `cache_manager` directly (older decorators/routes) doesn't hit None.
 try:
@@ -623,15 +1362,78 @@ def role_required(role):
 
 
 # Simple caching decorator for API endpoints (uses cache_manager)
-def cached(ttl=30, key_func=None):
+# Keshdagi javobga ko'chirilmaydigan sarlavhalar (qayta hisoblanadi yoki so'rovga xos)
+_UNCACHED_HEADERS = {"content-length", "etag", "date"}
+
+
+def _cacheable_response(result):
+    """View natijasini keshga yoziladigan ko'rinishga keltirish.
+
+    Faqat 200 li JSON javoblar: tayyor body matni, sarlavhalar va kuchli
+    ETag saqlanadi - hitda jsonify qayta chaqirilmaydi. Cookie o'rnatadigan
+    yoki stream javoblar keshlanmaydi (None).
+    """
+    response = app.make_response(result)
+    if (
+        response.status_code != 200
+        or not response.is_json
+        or response.is_streamed
+        or "Set-Cookie" in response.headers
+    ):
+        return None
+    body = response.get_data()
+    return {
+        "body": body.decode("utf-8"),
+        "headers": [
+            (k, v)
+            for k, v in response.headers.items()
+            if k.lower() not in _UNCACHED_HEADERS
+        ],
+        "etag": hashlib.sha256(body).hexdigest()[:32],
+    }
+
+
+def _etag_matches(etag):
+    "If-None-Match shu ETag ga mosmi (Flask-Compress qo'shadigan ':gzip' bilan ham)"
+    if_none_match = request.if_none_match
+    if not if_none_match:
+        return False
+    if if_none_match.star_tag:
+        return True
+    return any(
+        tag == etag or tag.startswith(etag + ":")
+        for tag in if_none_match.as_set(include_weak=True)
+    )
+
+
+def _cached_response(entry):
+    "Keshdagi yozuvdan javob: mos If-None-Match bo'lsa body siz 304"
+    if _etag_matches(entry["etag"]):
+        response = Response(status=304)
+    else:
+        response = Response(
+            entry["body"], status=200, headers=[(k, v) for k, v in entry["headers"]]
+        )
+    response.set_etag(entry["etag"])
+    return response
+
+
+def cached(ttl=30, key_func=None, tags=(), stale_ttl=0):
     """Cache API JSON responses for `ttl` seconds using CacheManager.
 
     key_func(request, *args, **kwargs) -> str optional
+    tags: tuple of cache tags, or tags(request, *args, **kwargs) -> list
+    stale_ttl: muddati o'tgan javob yangilanayotganda shuncha soniya beriladi
+
+    Bir kalit bo'yicha parallel misslarda view faqat bir marta bajariladi
+    (CacheManager.get_or_compute), qolgan so'rovlar uning javobini oladi.
+    Javob tayyor body + ETag sifatida saqlanadi; If-None-Match mos kelsa 304.
     """
 
     def decorator(fn):
         @wraps(fn)
         def wrapper(*args, **kwargs):
+            computed = []
             try:
                 cm = get_cache_manager()
                 if not cm:
@@ -640,42 +1442,131 @@ def cached(ttl=30, key_func=None):
                 if key_func and callable(key_func):
                     cache_key = key_func(request, *args, **kwargs)
                 else:
-                    # Default key: function name + sorted query params
+                    # Default key: function name + view args + sorted query params
                     params = dict(request.args) if request.args else {}
-                    cache_key = f"{fn.__name__}:{json.dumps(params, sort_keys=True)}"
-
-                cached_val = cm.get(cache_key)
-                if cached_val is not None:
-                    # If the view normally returns a dict/json for API endpoints
-                    if request.path.startswith("/api/"):
-                        return jsonify(cached_val)
-                    return cached_val
+                    cache_key = f"{fn.__name__}:{json.dumps([kwargs, params], sort_keys=True, default=str)}"
+                entry_tags = tags(request, *args, **kwargs) if callable(tags) else tags
 
-                result = fn(*args, **kwargs)
+                # Only JSON API responses are cached
+                if not request.path.startswith("/api/"):
+                    return fn(*args, **kwargs)
 
-                # Only cache JSON-able dicts for API endpoints
-                if request.path.startswith("/api/"):
-                    try:
-                        if isinstance(result, tuple):
-                            data = result[0]
-                        else:
-                            data = result
-                        # Only cache when response looks like a JSON-able dict
-                        if isinstance(data, dict):
-                            cm.set(cache_key, data, ttl=ttl)
-                    except Exception:
-                        pass
+                def compute():
+                    result = fn(*args, **kwargs)
+                    computed.append(result)
+                    return _cacheable_response(result)
 
-                return result
+                entry = cm.get_or_compute(
+                    cache_key, compute, ttl, tags=entry_tags, stale_ttl=stale_ttl
+                )
+                if entry is not None:
+                    return _cached_response(entry)
+                if computed:
+                    return computed[0]
+                return fn(*args, **kwargs)
             except Exception as e:
                 app_logger.warning(f"cached decorator error: {str(e)}")
+                if computed:
+                    return computed[0]
+                return fn(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def invalidates(*tags):
+    """View bajarilgandan keyin kesh teglarini bekor qilish.
+
+    Har bir teg satr yoki tag(request, **view_kwargs) -> str | list callable:
+        @invalidates("menu", lambda req, item_id: f"menu_item:{item_id}")
+    Teglar faqat view bazaga yozuvni commit qilgan bo'lsa bekor qilinadi (javob
+    statusidan qat'i nazar - admin formalari muvaffaqiyatda ham redirect qiladi).
+    Rad etilgan so'rov (401/403, CSRF, validatsiya) keshni tozalamaydi va busga
+    chiqmaydi. @role_required/@csrf_protect dan pastda qo'yiladi.
+    """
+
+    def decorator(fn):
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            g.db_write_committed = False
+            try:
                 return fn(*args, **kwargs)
+            finally:
+                if g.get("db_write_committed"):
+                    resolved = []
+                    for tag in tags:
+                        try:
+                            value = tag(request, **kwargs) if callable(tag) else tag
+                        except Exception:
+                            continue
+                        if isinstance(value, (list, tuple)):
+                            resolved.extend(value)
+                        elif value:
+                            resolved.append(value)
+                    invalidate_cache(*resolved)
 
         return wrapper
 
     return decorator
 
 
+def refreshes_catalog(fn):
+    """Admin o'zgarishidan keyin katalogni shu so'rovning o'zida qayta qurish.
+
+    @invalidates dan yuqorida qo'yiladi - teglar bekor qilingandan keyin ishlaydi,
+    shu workerdagi keyingi so'rovlar yangi snapshotni kutmasdan oladi. Boshqa
+    workerlar "menu" invalidatsiyasini bus orqali olib o'zi qayta quradi.
+    @invalidates kabi faqat view yozuvni commit qilganda qayta quradi - huquqsiz
+    yoki rad etilgan so'rov katalogni qayta yuklatmaydi.
+    """
+
+    @wraps(fn)
+    def wrapper(*args, **kwargs):
+        g.db_write_committed = False
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            if g.get("db_write_committed"):
+                try:
+                    refresh_catalog_snapshot()
+                except Exception as e:
+                    app_logger.warning(f"Catalog snapshot refresh error: {str(e)}")
+
+    return wrapper
+
+
+def catalog_etag(fn):
+    """Katalog javoblari uchun ETag = snapshot versiyasi.
+
+    If-None-Match mos kelsa view (va kesh) chaqirilmaydi - darhol 304.
+    """
+
+    @wraps(fn)
+    def wrapper(*args, **kwargs):
+        try:
+            etag = f"catalog-{get_catalog_snapshot().version}"
+        except Exception as e:
+            app_logger.warning(f"Catalog ETag error: {str(e)}")
+            return fn(*args, **kwargs)
+        if _etag_matches(etag):
+            response = Response(status=304)
+        else:
+            response = app.make_response(fn(*args, **kwargs))
+            if response.status_code != 200:
+                return response
+        response.set_etag(etag)
+        return response
+
+    return wrapper
+
+
+def _json_menu_item_tag(req, **_):
+    "So'rov tanasidagi menu_item_id uchun teg"
+    item_id = (req.get_json(silent=True) or {}).get("menu_item_id")
+    return f"menu_item:{item_id}" if item_id is not None else None
+
+
 # CSRF helpers - define early so decorators are available before use
 def generate_csrf_token():
     """Generate or return existing CSRF token stored in session."""
@@ -877,6 +1768,44 @@ def secure_session_login(session_type, session_data):
         return False
 
 
+def request_memoized(f):
+    """Natijani joriy so'rov (g) davomida argumentlar bo'yicha eslab qolish.
+
+    Bitta render ichida qayta-qayta chaqiriladigan o'qish funksiyalari uchun.
+    So'rovdan tashqarida (fon vazifalari) har safar qayta hisoblanadi. So'rovda
+    yozuv commit qilinsa eslab qolinganlar tashlanadi; har bir chaqiruvchi
+    natijaning o'z nusxasini oladi.
+    """
+
+    @wraps(f)
+    def wrapper(*args):
+        if not has_request_context():
+            return f(*args)
+        memo = g.setdefault("request_memo", {})
+        key = (f.__name__, args)
+        if key not in memo:
+            memo[key] = f(*args)
+        return copy.deepcopy(memo[key])
+
+    return wrapper
+
+
+@request_memoized
+def count_unread_notifications(user_id):
+    "Foydalanuvchining o'qilmagan bildirishnomalari soni (navbar uchun)"
+    try:
+        # notifications table stores recipient as (recipient_type, recipient_id)
+        # and the read flag column is named 'read_flag'. Use those columns.
+        res = execute_query(
+            "SELECT COUNT(1) FROM notifications WHERE recipient_type = 'user' AND recipient_id = ? AND read_flag = 0",
+            (user_id,),
+            fetch_one=True,
+        )
+        return int(res[0]) if res else 0
+    except Exception:
+        return 0
+
+
 @app.context_processor
 def inject_navbar_context():
     """Provide template variables to decide which navbar to render.
@@ -909,23 +1838,8 @@ def inject_navbar_context():
                 "email": session.get("user_email") or None,
             }
 
-            # Try to get unread notifications count (best-effort, silent on error)
-            try:
-                if session.get("user_id"):
-                    # notifications table stores recipient as (recipient_type, recipient_id)
-                    # and the read flag column is named 'read_flag'. Use those columns.
-                    res = execute_query(
-                        "SELECT COUNT(1) FROM notifications WHERE recipient_type = 'user' AND recipient_id = ? AND read_flag = 0",
-                        (session.get("user_id"),),
-                        fetch_one=True,
-                    )
-                    if res:
-                        try:
-                            notifications_count = int(res[0])
-                        except Exception:
-                            notifications_count = 0
-            except Exception:
-                notifications_count = 0
+            # Unread notifications count (best-effort, bitta so'rovda bir marta)
+            notifications_count = count_unread_notifications(session.get("user_id"))
 
         return {
             "is_user": is_user and not elevated,
@@ -943,6 +1857,7 @@ def inject_navbar_context():
         return {}
 
 
+@request_memoized
 def is_international_delivery_enabled():
     """Check if international delivery is enabled."""
     try:
@@ -988,6 +1903,7 @@ def accepts_orders_from_country(country_name):
         return True  # Default to accepting if error occurs
 
 
+@request_memoized
 def get_main_branch():
     """Get the main branch information."""
     try:
@@ -1096,29 +2012,206 @@ def safe_submit(fn, *args, **kwargs):
 
 
 # Rate limiting
-class RateLimiter:
+# Siyosatlar jadvali: nom -> ((limit, period_soniya), ...). "default" har bir
+# so'rovga qo'llanadi, qolganlari @rate_limit("nom") yoki rate_limiter.hit()
+# orqali. Bitta siyosatning hamma qoidalari birga tekshiriladi.
+RATE_LIMIT_POLICIES = {
+    "default": (
+        (Config.RATE_LIMIT_DAILY, 86400),
+        (Config.RATE_LIMIT_HOURLY, 3600),
+        (Config.RATE_LIMIT_MINUTE, 60),
+    ),
+    "menu": ((HighPerformanceConfig.MENU_RATE_LIMIT, 60),),
+    "api": ((HighPerformanceConfig.API_RATE_LIMIT, 60),),
+    "cart": ((HighPerformanceConfig.CART_RATE_LIMIT, 60),),
+    "order": ((HighPerformanceConfig.ORDER_RATE_LIMIT, 60),),
+}
+
+
+class _LimiterStripe:
+    "RateLimiter bo'lagi: o'z qulfi, TAT lug'ati va hisoblagichlari"
+
+    __slots__ = ("lock", "tats", "counters", "last_sweep")
+
     def __init__(self):
-        self.requests = defaultdict(list)
         self.lock = threading.Lock()
+        self.tats = {}
+        self.counters = defaultdict(int)
+        self.last_sweep = time.monotonic()
 
-    def is_allowed(self, identifier, max_requests=100, window=3600):
-        "Rate limiting tekshiruvi"
-        current_time = time.time()
 
-        with self.lock:
-            # Eski so'rovlarni tozalash
-            self.requests[identifier] = [
-                req_time
-                for req_time in self.requests[identifier]
-                if current_time - req_time < window
-            ]
+class RateLimiter:
+    """GCRA (generic cell rate algorithm) rate limiter.
+
+    Har bir (identifier, siyosat, qoida) uchun bitta float - "theoretical
+    arrival time" (TAT) saqlanadi, tekshiruv O(1). "limit / period" qoidasida
+    so'rovlar oralig'i period/limit: bo'sh kalit limit ta so'rovni birdaniga
+    o'tkazadi, keyin har period/limit soniyada bittadan (sliding window bilan
+    bir xil chegara, lekin vaqt ro'yxatisiz).
+
+    TAT i o'tib ketgan kalit bo'sh kalitdan farq qilmaydi, shuning uchun bunday
+    kalitlar har sweep_interval da o'chiriladi. Redis mavjud bo'lsa hisob Lua
+    skript orqali Redis da yuritiladi va limit barcha workerlar uchun umumiy;
+    Redis xatosida vaqtincha xotiradagi hisobga o'tiladi.
+    """
 
-            # Yangi so'rovni qo'shish
-            if len(self.requests[identifier]) < max_requests:
-                self.requests[identifier].append(current_time)
-                return True
+    REDIS_PREFIX = "restaurant:rl:"
+    REDIS_RETRY_AFTER = 30
+
+    # KEYS - qoidalar kalitlari; ARGV - now, keyin har qoida uchun oraliq va period
+    REDIS_SCRIPT = """
+local now = tonumber(ARGV[1])
+local tats = {}
+local retry = 0
+for i = 1, #KEYS do
+    local interval = tonumber(ARGV[i * 2])
+    local period = tonumber(ARGV[i * 2 + 1])
+    local tat = tonumber(redis.call('GET', KEYS[i]) or now)
+    if tat < now then tat = now end
+    tats[i] = tat + interval
+    if tats[i] - period > now then
+        retry = math.max(retry, tats[i] - period - now)
+    end
+end
+if retry > 0 then return tostring(retry) end
+for i = 1, #KEYS do
+    redis.call('SET', KEYS[i], tostring(tats[i]), 'PX', math.ceil((tats[i] - now) * 1000))
+end
+return '0'
+"""
+
+    def __init__(
+        self,
+        policies=None,
+        stripes=None,
+        sweep_interval=None,
+        redis_client=None,
+        backend=None,
+    ):
+        self.policies = dict(RATE_LIMIT_POLICIES if policies is None else policies)
+        self.stripes = [
+            _LimiterStripe() for _ in range(max(1, stripes or Config.RATE_LIMIT_STRIPES))
+        ]
+        self.sweep_interval = (
+            Config.RATE_LIMIT_SWEEP_INTERVAL if sweep_interval is None else sweep_interval
+        )
+        self.backend = backend or Config.RATE_LIMIT_BACKEND
+        self.enabled = True
+        self.redis_client = redis_client
+        self._redis_resolved = redis_client is not None or self.backend == "memory"
+        self._redis_script = None
+        self._redis_down_until = 0.0
 
-            return False
+    def _stripe(self, identifier):
+        return self.stripes[hash(identifier) % len(self.stripes)]
+
+    def _rules(self, policy):
+        try:
+            return self.policies[policy]
+        except KeyError:
+            raise ValueError(f"Unknown rate limit policy: {policy}")
+
+    def hit(self, identifier, policy="default"):
+        """So'rovni hisobga olish: (allowed, retry_after_soniya).
+
+        Rad etilgan so'rov hisobga yozilmaydi.
+        """
+        rules = self._rules(policy)
+        if not self.enabled:
+            return True, 0.0
+        identifier = str(identifier or "unknown")
+        retry_after = None
+        client = self._shared_client()
+        if client is not None:
+            retry_after = self._redis_hit(client, identifier, policy, rules)
+        if retry_after is None:
+            retry_after = self._local_hit(identifier, policy, rules)
+
+        allowed = retry_after <= 0
+        stripe = self._stripe(identifier)
+        with stripe.lock:
+            stripe.counters[(policy, "allowed" if allowed else "rejected")] += 1
+        return allowed, max(0.0, retry_after)
+
+    def is_allowed(self, identifier, policy="default"):
+        return self.hit(identifier, policy)[0]
+
+    def _local_hit(self, identifier, policy, rules):
+        now = time.monotonic()
+        stripe = self._stripe(identifier)
+        with stripe.lock:
+            if now - stripe.last_sweep >= self.sweep_interval:
+                self._sweep(stripe, now)
+            new_tats = []
+            retry_after = 0.0
+            for limit, period in rules:
+                key = (identifier, policy, limit, period)
+                tat = max(stripe.tats.get(key, now), now) + period / limit
+                if tat - period > now:
+                    retry_after = max(retry_after, tat - period - now)
+                new_tats.append((key, tat))
+            if retry_after <= 0:
+                stripe.tats.update(new_tats)
+            return retry_after
+
+    @staticmethod
+    def _sweep(stripe, now):
+        "TAT i o'tgan (to'liq tiklangan) kalitlarni o'chirish"
+        stripe.tats = {key: tat for key, tat in stripe.tats.items() if tat > now}
+        stripe.last_sweep = now
+
+    def _shared_client(self):
+        if not self._redis_resolved:
+            self._redis_resolved = True
+            try:
+                self.redis_client = get_cache_manager().redis_client
+            except Exception:
+                self.redis_client = None
+        if self.redis_client is None or time.monotonic() < self._redis_down_until:
+            return None
+        return self.redis_client
+
+    def _redis_hit(self, client, identifier, policy, rules):
+        "Redis dagi umumiy hisob; xatoda None (xotiradagi hisob ishlatiladi)"
+        try:
+            if self._redis_script is None:
+                self._redis_script = client.register_script(self.REDIS_SCRIPT)
+            keys = [
+                f"{self.REDIS_PREFIX}{policy}:{limit}/{period}:{identifier}"
+                for limit, period in rules
+            ]
+            args = [time.time()]
+            for limit, period in rules:
+                args.extend((period / limit, period))
+            result = self._redis_script(keys=keys, args=args)
+            return float(result.decode() if isinstance(result, bytes) else result)
+        except Exception as e:
+            self._redis_down_until = time.monotonic() + self.REDIS_RETRY_AFTER
+            app_logger.warning(f"Rate limiter Redis error, using local counters: {e}")
+            return None
+
+    def reset(self):
+        for stripe in self.stripes:
+            with stripe.lock:
+                stripe.tats.clear()
+                stripe.counters.clear()
+
+    def stats(self):
+        "Siyosatlar bo'yicha o'tkazilgan/rad etilgan so'rovlar"
+        policies = {name: {"allowed": 0, "rejected": 0} for name in self.policies}
+        keys = 0
+        for stripe in self.stripes:
+            with stripe.lock:
+                keys += len(stripe.tats)
+                counters = list(stripe.counters.items())
+            for (policy, name), count in counters:
+                policies.setdefault(policy, {"allowed": 0, "rejected": 0})[name] += count
+        return {
+            "backend": "redis" if self._shared_client() is not None else "memory",
+            "enabled": self.enabled,
+            "keys": keys,
+            "policies": policies,
+        }
 
 
 rate_limiter = RateLimiter()
@@ -1136,6 +2229,76 @@ if not os.environ.get("SKIP_DB_INIT"):
 # Database fayl yo'lini to'g'rilash
 DB_PATH = os.path.join(os.path.dirname(__file__), "database.sqlite3")
 
+# Tez-tez yoziladigan jadvallar alohida fayllarda (migrations/0004):
+# messaging - notifications, chats, chat_members, chat_messages, messages
+# activity - sessions
+# Har bir connectionga shu schema nomi bilan ATTACH qilinadi, shuning uchun
+# SQL dagi jadval nomlari o'zgarmaydi, lekin har bir fayl o'z WAL yozuv
+# qulfiga ega - buyurtmalar chat/sessiya yozuvlari ortida navbat kutmaydi.
+SIDE_DB_PATHS = {
+    "messaging": os.environ.get("MESSAGING_DB_PATH")
+    or os.path.join(os.path.dirname(DB_PATH), "messaging.sqlite3"),
+    "activity": os.environ.get("ACTIVITY_DB_PATH")
+    or os.path.join(os.path.dirname(DB_PATH), "activity.sqlite3"),
+}
+SIDE_TABLES = {
+    "chats": "messaging",
+    "chat_members": "messaging",
+    "chat_messages": "messaging",
+    "messages": "messaging",
+    "notifications": "messaging",
+    "sessions": "activity",
+}
+SIDE_DATABASES_MIGRATION = 4
+_side_storage = None
+
+
+def side_storage_enabled():
+    "Jadvallar alohida fayllarga ko'chirilganmi (user_version >= 4)"
+    global _side_storage
+    if _side_storage is None:
+        version = 0
+        if os.path.exists(DB_PATH):
+            try:
+                conn = sqlite3.connect(DB_PATH)
+                try:
+                    version = conn.execute("PRAGMA user_version").fetchone()[0]
+                finally:
+                    conn.close()
+            except Exception:
+                version = 0
+        _side_storage = version >= SIDE_DATABASES_MIGRATION
+    return _side_storage
+
+
+def side_table(name):
+    """CREATE TABLE/INDEX uchun to'liq jadval nomi ("messaging.notifications").
+
+    Schema ko'rsatilmagan CREATE har doim asosiy bazada yangi jadval ochib,
+    ATTACH qilingan jadvalni yashirib qo'yadi - shuning uchun kerak.
+    """
+    schema = SIDE_TABLES.get(name)
+    if schema and side_storage_enabled():
+        return f"{schema}.{name}"
+    return name
+
+
+def attach_side_databases(conn, read_only=False):
+    "Alohida fayllarni connectionga ATTACH qilish (migratsiyadan oldin hech narsa qilmaydi)"
+    if not side_storage_enabled():
+        return conn
+    for schema, path in SIDE_DB_PATHS.items():
+        if read_only:
+            if not os.path.exists(path):
+                continue
+            target = f"file:{urllib.parse.quote(os.path.abspath(path))}?mode=ro"
+        else:
+            target = path
+        conn.execute(f"ATTACH DATABASE ? AS {schema}", (target,))
+        if not read_only:
+            conn.execute(f"PRAGMA {schema}.synchronous=NORMAL")
+    return conn
+
 import logging
 from logging.handlers import RotatingFileHandler, SMTPHandler
 
@@ -1324,7 +2487,7 @@ class PerformanceMonitor:
         self.success_count = 0
         self.last_cleanup = time.time()
 
-    def record_request(self, duration, endpoint, status_code=200):
+    def record_request(self, duration, endpoint, status_code=200, db_connections=0):
         with self.lock:
             try:
                 self.request_times.append(
@@ -1333,6 +2496,7 @@ class PerformanceMonitor:
                         "endpoint": endpoint,
                         "timestamp": time.time(),
                         "status_code": status_code,
+                        "db_connections": db_connections,
                     }
                 )
 
@@ -1366,11 +2530,17 @@ class PerformanceMonitor:
                 return {}
 
             durations = [req["duration"] for req in self.request_times]
+            db_connections = [
+                req.get("db_connections", 0) for req in self.request_times
+            ]
             return {
                 "avg_response_time": sum(durations) / len(durations),
                 "max_response_time": max(durations),
                 "min_response_time": min(durations),
                 "total_requests": len(durations),
+                "avg_db_connections_per_request": sum(db_connections)
+                / len(db_connections),
+                "max_db_connections_per_request": max(db_connections),
             }
 
 
@@ -1383,7 +2553,7 @@ except Exception as e:
 
     # Fallback performance monitor yaratish
     class DummyPerformanceMonitor:
-        def record_request(self, duration, endpoint, status_code=200):
+        def record_request(self, duration, endpoint, status_code=200, db_connections=0):
             pass
 
         def get_stats(self):
@@ -1392,30 +2562,95 @@ except Exception as e:
     performance_monitor = DummyPerformanceMonitor()
 
 
+# ---- YENGIL SO'ROV YO'LLARI ----
+# static - static fayllar; probe - health check/monitoring;
+# poll - frontend setInterval bilan so'raydigan JSON endpointlar.
+# static/probe uchun session umuman ochilmaydi, flashlar va performance
+# yozuvi o'tkazib yuboriladi; poll uchun session yaratilmaydi va flashlar
+# tegilmaydi (JSON javobda ular baribir ko'rsatilmaydi).
+ROUTE_CLASSES = ("static", "probe", "poll")
+SESSIONLESS_ROUTE_CLASSES = ("static", "probe")
+
+# Decorator qo'yib bo'lmaydigan endpointlar (Flask ning o'z static route i)
+ROUTE_CLASS_RULES = {"static": "static"}
+
+
+def route_class(kind):
+    "View funksiyani yengil yo'l sinfiga belgilash: @route_class('poll')"
+    if kind not in ROUTE_CLASSES:
+        raise ValueError(f"Unknown route class: {kind}")
+
+    def decorator(f):
+        f.route_class = kind
+        return f
+
+    return decorator
+
+
+def classify_request():
+    "Joriy so'rov endpointining sinfi (None - oddiy so'rov)"
+    endpoint = request.endpoint
+    if endpoint is None:
+        return None
+    kind = ROUTE_CLASS_RULES.get(endpoint)
+    if kind is None:
+        kind = getattr(app.view_functions.get(endpoint), "route_class", None)
+    return kind
+
+
+class LightRouteSessionInterface(SecureCookieSessionInterface):
+    "static/probe javoblarida session cookie qayta imzolanib yuborilmaydi"
+
+    def should_set_cookie(self, app, session):
+        if getattr(g, "route_class", None) in SESSIONLESS_ROUTE_CLASSES:
+            return False
+        return super().should_set_cookie(app, session)
+
+
+app.session_interface = LightRouteSessionInterface()
+
+
+@app.before_request
+def enforce_rate_limits():
+    "Har bir so'rovga RATE_LIMIT_POLICIES['default'] qoidalari (static/probe dan tashqari)"
+    # before_request dan oldin ishlaydi - g.route_class hali o'rnatilmagan
+    if classify_request() in SESSIONLESS_ROUTE_CLASSES:
+        return None
+    try:
+        allowed, retry_after = rate_limiter.hit(request.remote_addr, "default")
+    except Exception as e:
+        app_logger.error(f"Rate limiter error: {str(e)}")
+        return None
+    if not allowed:
+        return rate_limit_response(retry_after)
+    return None
+
+
 @app.before_request
 def before_request():
     "So'rov boshlanishida xavfsiz pre-processing"
     try:
         # Request time tracking - g obyektiga saqlash
         g.start_time = time.time()
+        g.route_class = classify_request()
 
-        # Session ni tekshirish va tuzatish
-        if not session.get("session_id") or session.get("session_id") == "None":
-            session["session_id"] = get_session_id()
+        # So'rov uchun connection hisoblagichi (connection kerak bo'lganda ochiladi)
+        g.db_connections_opened = 0
 
-        # Database connection test
-        if not hasattr(g, "db_test_done"):
-            try:
-                test_conn = get_db()
-                test_conn.execute("SELECT 1")
-                test_conn.close()  # Connectionni yopamiz
-                g.db_test_done = True
-            except Exception as db_error:
-                app_logger.error(f"Database connection test failed: {str(db_error)}")
+        if g.route_class in SESSIONLESS_ROUTE_CLASSES:
+            return
+
+        # Session ni tekshirish va tuzatish (poll so'rovlari yangi session ochmaydi)
+        if g.route_class != "poll" and (
+            not session.get("session_id") or session.get("session_id") == "None"
+        ):
+            session["session_id"] = get_session_id()
 
         # Record session presence to sessions table for active session tracking
         try:
-            sid = session.get("session_id") or get_session_id()
+            sid = session.get("session_id")
+            if not sid:
+                return
             # IP and User-Agent
             ip = request.headers.get("X-Forwarded-For", request.remote_addr)
             ua = request.headers.get("User-Agent", "")
@@ -1441,12 +2676,18 @@ def after_request(response):
 
         # Performance monitoring - fixed to use function call
         try:
+            # static/probe so'rovlari statistikani buzmasligi uchun yozilmaydi
+            if getattr(g, "route_class", None) in SESSIONLESS_ROUTE_CLASSES:
+                pass
             # Check if performance_monitor has the record_request method
-            if hasattr(performance_monitor, "record_request") and callable(
+            elif hasattr(performance_monitor, "record_request") and callable(
                 performance_monitor.record_request
             ):
                 performance_monitor.record_request(
-                    duration, request.endpoint or "unknown", response.status_code
+                    duration,
+                    request.endpoint or "unknown",
+                    response.status_code,
+                    getattr(g, "db_connections_opened", 0),
                 )
             else:
                 # Log a warning if the method is missing or not callable
@@ -1456,6 +2697,12 @@ def after_request(response):
         except Exception as pm_error:
             app_logger.warning(f"Performance monitoring error: {str(pm_error)}")
 
+        # Development rejimida so'rovdagi connectionlar sonini ko'rsatish
+        if Config.IS_DEVELOPMENT:
+            response.headers["X-DB-Connections"] = str(
+                getattr(g, "db_connections_opened", 0)
+            )
+
         # Security headers
         response.headers["X-Content-Type-Options"] = "nosniff"
         response.headers["X-Frame-Options"] = "DENY"
@@ -1463,9 +2710,13 @@ def after_request(response):
 
         # Cache headers faqat static files uchun emas
         if not request.path.startswith("/static/"):
-            response.headers["Cache-Control"] = "no-cache, no-store, must-revalidate"
-            response.headers["Pragma"] = "no-cache"
-            response.headers["Expires"] = "0"
+            if "ETag" in response.headers:
+                # ETag li javobni brauzer saqlab, If-None-Match bilan tekshiradi (304)
+                response.headers["Cache-Control"] = "private, no-cache"
+            else:
+                response.headers["Cache-Control"] = "no-cache, no-store, must-revalidate"
+                response.headers["Pragma"] = "no-cache"
+                response.headers["Expires"] = "0"
 
         if Config.IS_PRODUCTION:
             response.headers["Strict-Transport-Security"] = (
@@ -1497,28 +2748,109 @@ def get_current_time():
     return datetime.datetime.now(TASHKENT_TZ)
 
 
+def date_to_epoch(value):
+    """'YYYY-MM-DD' (yoki date) -> shu kun boshining UTC epoch soniyasi.
+
+    created_ts ustunlari bilan solishtirish uchun; chegaralar DATE(created_at)
+    bilan bir xil (UTC kun).
+    """
+    if isinstance(value, str):
+        value = datetime.datetime.strptime(value[:10], "%Y-%m-%d").date()
+    return calendar.timegm(value.timetuple())
+
+
+def epoch_day_range(start_date, end_date=None):
+    """[start_date, end_date] kunlari uchun (start_ts, end_ts) - end_ts kirmaydi.
+
+    `DATE(created_at) >= ? AND DATE(created_at) <= ?` o'rniga
+    `created_ts >= ? AND created_ts < ?` bilan ishlatiladi.
+    """
+    start_ts = date_to_epoch(start_date)
+    end_ts = date_to_epoch(end_date or start_date) + 86400
+    return start_ts, end_ts
+
+
+def epoch_month_range(month):
+    """'YYYY-MM' oyi uchun (start_ts, end_ts) - end_ts kirmaydi."""
+    year, mon = (int(part) for part in month[:7].split("-"))
+    next_year, next_mon = (year + 1, 1) if mon == 12 else (year, mon + 1)
+    return (
+        calendar.timegm((year, mon, 1, 0, 0, 0)),
+        calendar.timegm((next_year, next_mon, 1, 0, 0, 0)),
+    )
+
+
 # Database connection pool
 class DatabasePool:
-    def __init__(self, db_path, max_connections=10):
+    """SQLite connection pool.
+
+    Bo'sh connection bo'lmasa so'rovlar threading.Condition da navbat bilan
+    (FIFO) kutadi - polling yo'q. Connection faqat uzoq bo'sh turgandan keyin
+    SELECT 1 bilan tekshiriladi. stats() pool o'lchamini tanlash uchun
+    metrikalarni qaytaradi.
+    """
+
+    # Kutish vaqti gistogrammasi chegaralari (millisekund)
+    WAIT_BUCKETS_MS = (1, 5, 10, 50, 100, 500, 1000, 5000)
+
+    def __init__(
+        self,
+        db_path,
+        max_connections=10,
+        read_only=False,
+        checkout_timeout=None,
+        healthcheck_idle=None,
+    ):
         self.db_path = db_path
         self.max_connections = max_connections
-        self.connections = []
+        self.read_only = read_only
+        self.checkout_timeout = (
+            Config.DB_POOL_CHECKOUT_TIMEOUT
+            if checkout_timeout is None
+            else checkout_timeout
+        )
+        self.healthcheck_idle = (
+            Config.DB_POOL_HEALTHCHECK_IDLE
+            if healthcheck_idle is None
+            else healthcheck_idle
+        )
         self.lock = threading.Lock()
-        self.connection_count = 0
+        self._available = threading.Condition(self.lock)
+        self._idle = deque()  # (conn, bo'shagan vaqti) - oxirgisi eng "issiq"
+        self._waiters = deque()  # FIFO navbat
+        self._total = 0  # ochiq connectionlar soni (idle + in_use)
+        self._in_use = 0
+        self.metrics = {
+            "checkouts": 0,
+            "created": 0,
+            "closed": 0,
+            "timeouts": 0,
+            "health_check_failures": 0,
+            "waits": 0,
+            "wait_time_total": 0.0,
+            "wait_time_max": 0.0,
+            "peak_in_use": 0,
+            "wait_histogram": [0] * (len(self.WAIT_BUCKETS_MS) + 1),
+        }
         self._init_pool()
 
     def _init_pool(self):
         "Connection pool ni ishga tushirish"
-        for _ in range(3):  # Boshlang'ich 3 ta connection (kamaytirildi)
+        for _ in range(min(3, self.max_connections)):  # Boshlang'ich 3 ta connection
             conn = self._create_connection()
             if conn:
-                self.connections.append(conn)
+                self._idle.append((conn, time.monotonic()))
+                self._total += 1
+                self.metrics["created"] += 1
 
     def _create_connection(self):
         "Yangi database connection yaratish - timeout fix bilan"
         max_retries = 5
         for attempt in range(max_retries):
             try:
+                if self.read_only:
+                    return self._create_read_only_connection()
+
                 # Timeout ni oshirish va retry logic yaxshilash
                 conn = sqlite3.connect(
                     self.db_path,
@@ -1541,6 +2873,8 @@ class DatabasePool:
                 except Exception as pragma_error:
                     app_logger.warning(f"PRAGMA settings failed: {str(pragma_error)}")
 
+                attach_side_databases(conn)
+
                 # Connection test with timeout
                 conn.execute("SELECT 1").fetchone()
                 return conn
@@ -1573,91 +2907,215 @@ class DatabasePool:
 
         return None
 
-    @contextmanager
-    def get_connection(self):
-        "Context manager orqali connection olish - improved error handling"
-        conn = None
-        start_time = time.time()
-
+    def _create_read_only_connection(self):
+        "Faqat o'qish uchun connection (mode=ro URI + query_only)"
+        uri = f"file:{urllib.parse.quote(os.path.abspath(self.db_path))}?mode=ro"
+        conn = sqlite3.connect(
+            uri,
+            uri=True,
+            check_same_thread=False,
+            timeout=60.0,
+            isolation_level=None,
+        )
+        conn.row_factory = sqlite3.Row
         try:
-            # Connection olish - timeout bilan
-            timeout_duration = 30  # 30 soniya timeout
-
-            while time.time() - start_time < timeout_duration:
-                with self.lock:
-                    if self.connections:
-                        conn = self.connections.pop()
-                        break
-                    elif self.connection_count < self.max_connections:
-                        self.connection_count += 1
-                        break
+            conn.execute("PRAGMA query_only=ON")
+            conn.execute("PRAGMA cache_size=10000")
+            conn.execute("PRAGMA temp_store=MEMORY")
+            conn.execute("PRAGMA busy_timeout=30000")
+        except Exception as pragma_error:
+            app_logger.warning(f"Read-only PRAGMA settings failed: {str(pragma_error)}")
+        attach_side_databases(conn, read_only=True)
+        conn.execute("SELECT 1").fetchone()
+        return conn
 
-                # Agar connection mavjud bo'lmasa, biroz kutish
-                time.sleep(0.1)
+    def _record_wait(self, waited):
+        "Kutish vaqtini metrikalarga yozish (lock ichida chaqiriladi)"
+        m = self.metrics
+        m["waits"] += 1
+        m["wait_time_total"] += waited
+        m["wait_time_max"] = max(m["wait_time_max"], waited)
+        waited_ms = waited * 1000
+        for i, bound in enumerate(self.WAIT_BUCKETS_MS):
+            if waited_ms <= bound:
+                m["wait_histogram"][i] += 1
+                break
+        else:
+            m["wait_histogram"][-1] += 1
 
-            if not conn:
-                # Yangi connection yaratish
-                conn = self._create_connection()
-                if not conn:
-                    raise Exception(
-                        "Database connection timeout - yangi connection yaratib bo'lmadi"
-                    )
+    def _acquire(self):
+        """Navbat bilan connection olish.
 
-            # Connection ni test qilish - safe method
+        Returns: (conn, idle_since) - yangi connection yaratish kerak bo'lsa conn None.
+        """
+        deadline = time.monotonic() + self.checkout_timeout
+        with self._available:
+            ticket = object()
+            self._waiters.append(ticket)
+            start = time.monotonic()
+            waited = False
             try:
-                test_result = conn.execute("SELECT 1").fetchone()
-                if test_result is None:
-                    raise Exception("Connection test returned None")
-            except Exception as test_error:
-                app_logger.warning(
-                    f"Connection test failed, creating new one: {str(test_error)}"
-                )
+                while True:
+                    if self._waiters[0] is ticket:
+                        if self._idle:
+                            conn, idle_since = self._idle.pop()
+                            break
+                        if self._total < self.max_connections:
+                            # Joy band qilinadi, connection lock tashqarisida yaratiladi
+                            self._total += 1
+                            conn, idle_since = None, None
+                            break
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self.metrics["timeouts"] += 1
+                        raise Exception(
+                            "Database connection timeout - pool band "
+                            f"({self.max_connections} ta connection ishlatilmoqda)"
+                        )
+                    waited = True
+                    self._available.wait(remaining)
+            finally:
+                self._waiters.remove(ticket)
+                # Navbatdagi keyingi kutuvchi o'z holatini tekshirsin
+                self._available.notify_all()
+
+            self._in_use += 1
+            self.metrics["checkouts"] += 1
+            self.metrics["peak_in_use"] = max(self.metrics["peak_in_use"], self._in_use)
+            if waited:
+                self._record_wait(time.monotonic() - start)
+            return conn, idle_since
+
+    def _discard(self, conn):
+        "Connection ni yopish va joyini bo'shatish"
+        if conn is not None:
+            try:
+                conn.close()
+            except Exception:
+                pass
+        with self._available:
+            self._total -= 1
+            self._in_use -= 1
+            if conn is not None:
+                self.metrics["closed"] += 1
+            self._available.notify_all()
+
+    def _release(self, conn):
+        with self._available:
+            self._in_use -= 1
+            self._idle.append((conn, time.monotonic()))
+            self._available.notify_all()
+
+    def close_idle(self):
+        "Bo'sh turgan connectionlarni yopish - keyingi checkout yangisini ochadi"
+        with self._available:
+            idle = list(self._idle)
+            self._idle.clear()
+            self._total -= len(idle)
+            self.metrics["closed"] += len(idle)
+            self._available.notify_all()
+        for conn, _ in idle:
+            try:
+                conn.close()
+            except Exception:
+                pass
+
+    def _open(self):
+        "Band qilingan joy uchun yangi connection yaratish"
+        conn = self._create_connection()
+        if not conn:
+            raise Exception(
+                "Database connection timeout - yangi connection yaratib bo'lmadi"
+            )
+        with self.lock:
+            self.metrics["created"] += 1
+        return conn
+
+    @contextmanager
+    def get_connection(self):
+        "Context manager orqali connection olish - improved error handling"
+        conn, idle_since = self._acquire()
+        try:
+            if conn is None:
+                conn = self._open()
+            elif time.monotonic() - idle_since > self.healthcheck_idle:
+                # Uzoq bo'sh turgan connectionni tekshirish
                 try:
-                    conn.close()
-                except:
-                    pass
-                conn = self._create_connection()
-                if not conn:
-                    raise Exception("Database connection timeout")
+                    conn.execute("SELECT 1").fetchone()
+                except Exception as test_error:
+                    app_logger.warning(
+                        f"Connection test failed, creating new one: {str(test_error)}"
+                    )
+                    try:
+                        conn.close()
+                    except Exception:
+                        pass
+                    with self.lock:
+                        self.metrics["health_check_failures"] += 1
+                        self.metrics["closed"] += 1
+                    conn = self._create_connection()
+                    if not conn:
+                        raise Exception("Database connection timeout")
+                    with self.lock:
+                        self.metrics["created"] += 1
+        except Exception:
+            self._discard(None)
+            raise
 
+        try:
             yield conn
-
         except sqlite3.OperationalError as e:
+            self._rollback(conn)
             if "timeout" in str(e).lower() or "locked" in str(e).lower():
                 app_logger.error(f"Database timeout error: {str(e)}")
                 raise Exception("Database connection timeout")
-            else:
-                raise e
+            raise
         except Exception as e:
-            if conn:
-                try:
-                    conn.rollback()
-                except:
-                    pass
+            self._rollback(conn)
             app_logger.error(f"Database pool error: {str(e)}")
-            raise e
+            raise
         finally:
-            if conn:
-                try:
-                    with self.lock:
-                        if len(self.connections) < self.max_connections:
-                            self.connections.append(conn)
-                        else:
-                            try:
-                                conn.close()
-                            except:
-                                pass
-                        if self.connection_count > 0:
-                            self.connection_count -= 1
-                except Exception as cleanup_error:
-                    app_logger.warning(
-                        f"Connection cleanup error: {str(cleanup_error)}"
+            if conn.in_transaction:
+                # Yopilmagan tranzaksiya keyingi foydalanuvchiga o'tmasin
+                self._rollback(conn)
+            self._release(conn)
+
+    @staticmethod
+    def _rollback(conn):
+        try:
+            conn.rollback()
+        except Exception:
+            pass
+
+    def stats(self):
+        "Pool metrikalari (super admin tizim sahifasi uchun)"
+        with self.lock:
+            m = dict(self.metrics)
+            m["wait_histogram"] = {
+                **{
+                    f"<={bound}ms": count
+                    for bound, count in zip(
+                        self.WAIT_BUCKETS_MS, self.metrics["wait_histogram"]
                     )
-                    try:
-                        if conn:
-                            conn.close()
-                    except:
-                        pass
+                },
+                f">{self.WAIT_BUCKETS_MS[-1]}ms": self.metrics["wait_histogram"][-1],
+            }
+            m.update(
+                {
+                    "max_connections": self.max_connections,
+                    "open": self._total,
+                    "in_use": self._in_use,
+                    "idle": len(self._idle),
+                    "waiting": len(self._waiters),
+                    "read_only": self.read_only,
+                }
+            )
+        m["wait_time_avg_ms"] = (
+            round(m["wait_time_total"] / m["waits"] * 1000, 2) if m["waits"] else 0.0
+        )
+        m["wait_time_max_ms"] = round(m.pop("wait_time_max") * 1000, 2)
+        m.pop("wait_time_total")
+        return m
 
 
 # Global database pool with configurable max connections (lazy-init)
@@ -1675,79 +3133,557 @@ def get_db_pool():
     return db_pool
 
 
-def get_db():
-    "Legacy support uchun - timeout fix bilan"
-    try:
+# Faqat o'qish uchun pool (lazy-init)
+read_pool = None
+
+
+def get_read_pool():
+    """Read-only poolni qaytarish; DB fayli hali yo'q bo'lsa asosiy pool ishlatiladi."""
+    global read_pool
+    if read_pool is None:
+        if not os.path.exists(DB_PATH):
+            return get_db_pool()
+        read_pool = DatabasePool(
+            DB_PATH, Config.DB_READ_POOL_MAX_CONNECTIONS, read_only=True
+        )
+    return read_pool
+
+
+def get_db_pool_stats():
+    "Yaratilgan poollar metrikalari: {'main': {...}, 'read': {...}}"
+    pools = {}
+    if db_pool is not None:
+        pools["main"] = db_pool.stats()
+    if read_pool is not None and read_pool is not db_pool:
+        pools["read"] = read_pool.stats()
+    return pools
+
+
+def reset_db_pools():
+    """Migratsiyalardan keyin poollarni qayta yaratish.
+
+    Bootstrap paytida ochilgan connectionlarda alohida baza fayllari hali
+    ATTACH qilinmagan bo'ladi; keyingi so'rovlar yangi connection oladi.
+    """
+    global db_pool, read_pool, _side_storage
+    for pool in (db_pool, read_pool):
+        if pool is not None:
+            pool.close_idle()
+    db_pool = None
+    read_pool = None
+    _side_storage = None
+
+
+def is_read_query(query):
+    "So'rov faqat o'qish uchunmi (SELECT/WITH) - read poolga yo'naltirish uchun"
+    head = query.lstrip().lstrip("(").lstrip()[:6].upper()
+    return head.startswith("SELECT") or head.startswith("WITH")
+
+
+def _is_readonly_error(error):
+    return "readonly" in str(error).lower() or "read-only" in str(error).lower()
+
+
+# Yagona yozuvchi thread (single-writer queue)
+class DatabaseWriter:
+    """Barcha navbatdagi yozuvlarni bitta connection orqali bajaruvchi thread.
+
+    Har bir ish `job(conn)` ko'rinishidagi funksiya bo'lib, Future orqali natija
+    qaytaradi. Navbatda to'plangan ishlar bitta tranzaksiyada (group commit)
+    commit qilinadi; har bir ish alohida SAVEPOINT ichida bajariladi, shuning
+    uchun bittasidagi xatolik boshqalarini bekor qilmaydi.
+
+    `schema` berilsa fayl shu nom bilan ATTACH qilinadi (asosiy schema bo'sh
+    xotira bazasi) - BEGIN IMMEDIATE faqat shu faylni qulflaydi va ish ichidagi
+    SQL "messaging.notifications" kabi nomlarni ham, oddiy nomlarni ham ko'radi.
+    """
+
+    def __init__(self, db_path, max_batch=64, schema=None):
+        self.db_path = db_path
+        self.schema = schema
+        self.max_batch = max_batch
+        self.jobs = queue.Queue()
+        self.lock = threading.Lock()
+        self.thread = None
+        self.conn = None
+        self.stats = {"jobs": 0, "batches": 0, "failed": 0, "max_batch_size": 0}
+
+    def _ensure_started(self):
+        if self.thread is not None and self.thread.is_alive():
+            return
+        with self.lock:
+            if self.thread is None or not self.thread.is_alive():
+                self.thread = threading.Thread(
+                    target=self._run,
+                    name=f"db-writer-{self.schema or 'main'}",
+                    daemon=True,
+                )
+                self.thread.start()
+
+    def submit(self, job):
+        "Yozuv ishini navbatga qo'yish - Future qaytaradi"
+        future = Future()
+        self._ensure_started()
+        self.jobs.put((job, future))
+        return future
+
+    def _connect(self):
         conn = sqlite3.connect(
-            DB_PATH, check_same_thread=False, timeout=60.0  # 60 soniya timeout
+            ":memory:" if self.schema else self.db_path,
+            check_same_thread=False,
+            timeout=60.0,
+            isolation_level=None,
         )
         conn.row_factory = sqlite3.Row
-
-        # Ensure foreign keys are enforced for legacy connections and set sensible pragmas
+        prefix = ""
+        if self.schema:
+            conn.execute(f"ATTACH DATABASE ? AS {self.schema}", (self.db_path,))
+            prefix = f"{self.schema}."
         try:
+            conn.execute(f"PRAGMA {prefix}journal_mode=WAL")
+            conn.execute(f"PRAGMA {prefix}synchronous=NORMAL")
             conn.execute("PRAGMA foreign_keys=ON")
             conn.execute("PRAGMA busy_timeout=30000")
-            conn.execute("PRAGMA journal_mode=WAL")
-        except Exception as pragma_err:
-            app_logger.warning(f"get_db PRAGMA setup failed: {str(pragma_err)}")
-
-        # Basic connection test
-        conn.execute("SELECT 1").fetchone()
+        except Exception as pragma_error:
+            app_logger.warning(f"Writer PRAGMA settings failed: {str(pragma_error)}")
         return conn
-    except Exception as e:
-        app_logger.error(f"get_db connection error: {str(e)}")
-        raise Exception("Database connection timeout")
-
 
-def _now_iso():
-    return datetime.datetime.utcnow().strftime("%Y-%m-%d %H:%M:%S")
+    def _run(self):
+        while True:
+            batch = [self.jobs.get()]
+            # Commit davomida yig'ilgan barcha ishlarni bitta tranzaksiyaga olish
+            while len(batch) < self.max_batch:
+                try:
+                    batch.append(self.jobs.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                self._process(batch)
+            except Exception as e:
+                app_logger.error(f"Database writer batch error: {str(e)}")
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
 
+    def _process(self, batch):
+        if self.conn is None:
+            self.conn = self._connect()
+        conn = self.conn
 
-def record_session_entry(session_id, user_id=None, ip=None, user_agent=None):
-    """Create or update a sessions table entry for the given session_id."""
-    try:
-        conn = sqlite3.connect(DB_PATH, check_same_thread=False)
-        cur = conn.cursor()
-        now = _now_iso()
+        pending = []
         try:
-            cur.execute("SELECT id FROM sessions WHERE session_id = ?", (session_id,))
-        except sqlite3.OperationalError as oe:
-            # Table probably doesn't exist yet; create it and retry once
-            if "no such table" in str(oe).lower():
-                cur.execute(
-                    """
-                    CREATE TABLE IF NOT EXISTS sessions (
-                        id INTEGER PRIMARY KEY AUTOINCREMENT,
-                        session_id TEXT UNIQUE NOT NULL,
-                        user_id INTEGER,
-                        ip TEXT,
-                        user_agent TEXT,
-                        created_at TEXT NOT NULL,
-                        last_seen TEXT NOT NULL
-                    );
-                    """
-                )
-                conn.commit()
-                # retry select
-                cur.execute(
-                    "SELECT id FROM sessions WHERE session_id = ?", (session_id,)
-                )
-            else:
-                raise
-
-        row = cur.fetchone()
-        if row:
-            cur.execute(
-                "UPDATE sessions SET user_id = ?, ip = ?, user_agent = ?, last_seen = ? WHERE session_id = ?",
-                (user_id, ip, user_agent, now, session_id),
+            conn.execute("BEGIN IMMEDIATE")
+            for job, future in batch:
+                if not future.set_running_or_notify_cancel():
+                    continue
+                try:
+                    conn.execute("SAVEPOINT writer_job")
+                    result = job(conn)
+                    conn.execute("RELEASE SAVEPOINT writer_job")
+                    pending.append((future, result, None))
+                except Exception as job_error:
+                    try:
+                        conn.execute("ROLLBACK TO SAVEPOINT writer_job")
+                        conn.execute("RELEASE SAVEPOINT writer_job")
+                    except Exception:
+                        pass
+                    pending.append((future, None, job_error))
+            conn.execute("COMMIT")
+        except Exception:
+            try:
+                conn.execute("ROLLBACK")
+            except Exception:
+                # Connection yaroqsiz bo'lsa keyingi batch uchun qayta ochiladi
+                try:
+                    conn.close()
+                except Exception:
+                    pass
+                self.conn = None
+            with self.lock:
+                self.stats["failed"] += len(batch)
+            raise
+
+        with self.lock:
+            self.stats["jobs"] += len(pending)
+            self.stats["batches"] += 1
+            self.stats["max_batch_size"] = max(
+                self.stats["max_batch_size"], len(pending)
             )
-        else:
-            cur.execute(
-                "INSERT INTO sessions (session_id, user_id, ip, user_agent, created_at, last_seen) VALUES (?,?,?,?,?,?)",
-                (session_id, user_id, ip, user_agent, now, now),
+
+        for future, result, job_error in pending:
+            if job_error is not None:
+                future.set_exception(job_error)
+            else:
+                future.set_result(result)
+
+
+# Har bir baza fayli uchun alohida yozuvchi: {"main": ..., "messaging": ...}
+db_writers = {}
+_db_writer_lock = threading.Lock()
+
+
+def get_db_writer(database="main"):
+    "Baza fayli yozuvchisi; jadvallar hali ko'chirilmagan bo'lsa asosiy yozuvchi"
+    if database != "main" and not side_storage_enabled():
+        database = "main"
+    writer = db_writers.get(database)
+    if writer is None:
+        with _db_writer_lock:
+            writer = db_writers.get(database)
+            if writer is None:
+                if database == "main":
+                    writer = DatabaseWriter(DB_PATH)
+                else:
+                    writer = DatabaseWriter(SIDE_DB_PATHS[database], schema=database)
+                db_writers[database] = writer
+    return writer
+
+
+def run_write(job, timeout=30, database="main"):
+    """`job(conn)` ni yozuvchi threadda bajarish va natijasini kutish.
+
+    job ichida conn.commit()/rollback() chaqirilmasligi kerak - tranzaksiyani
+    yozuvchi thread boshqaradi. Chat va bildirishnoma yozuvlari
+    database="messaging" bilan o'z faylining yozuvchisiga yuboriladi.
+
+    timeout o'tsa ish navbatdan olib tashlanadi (hech qachon bajarilmaydi) va
+    TimeoutError ko'tariladi. Ish allaqachon boshlangan bo'lsa uning haqiqiy
+    natijasi (commit yoki xatolik) kutiladi - aks holda chaqiruvchi "xato"
+    deb javob berib, yozuv baribir commit bo'lardi.
+    """
+    future = get_db_writer(database).submit(job)
+    try:
+        result = future.result(timeout=timeout)
+    except FutureTimeoutError:
+        if future.cancel():
+            raise
+        app_logger.warning(
+            f"Writer job {timeout}s dan oshdi, lekin boshlangan - natijasi kutilmoqda"
+        )
+        result = future.result()
+    _mark_request_write()
+    return result
+
+
+def execute_write(query, params=None, timeout=30):
+    "Bitta yozuv so'rovini yozuvchi thread orqali bajarish - lastrowid qaytaradi"
+    return run_write(lambda conn: conn.execute(query, params or ()).lastrowid, timeout)
+
+
+def _count_db_connection():
+    "Joriy so'rovda ochilgan/olingan connectionlar sonini hisoblash"
+    try:
+        if has_request_context():
+            g.db_connections_opened = getattr(g, "db_connections_opened", 0) + 1
+    except Exception:
+        pass
+
+
+class RequestConnection:
+    """So'rov davomida umumiy ishlatiladigan connection uchun wrapper.
+
+    Helperlar odatdagidek `conn.close()` chaqirishi mumkin - haqiqiy connection
+    faqat teardown_appcontext da poolga qaytariladi. Connection so'rovdagi
+    barcha chaqiruvchilar uchun umumiy: row_factory kabi sozlamalar cursor
+    darajasida o'rnatiladi. Ochiq (commit qilinmagan) tranzaksiya bo'lsa
+    execute_query yozuvi unga qo'shiladi va uni commit qilmaydi - tranzaksiyani
+    ochgan helper commit() yoki rollback() qiladi.
+    """
+
+    __slots__ = ("_conn",)
+
+    def __init__(self, conn):
+        object.__setattr__(self, "_conn", conn)
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+    def __setattr__(self, name, value):
+        setattr(self._conn, name, value)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return self._conn.__exit__(exc_type, exc, tb)
+
+    def close(self):
+        # Teardown gacha yopilmaydi
+        pass
+
+    def commit(self):
+        wrote = self._conn.in_transaction
+        self._conn.commit()
+        if wrote:
+            _mark_request_write()
+
+
+def _mark_request_write():
+    """Joriy so'rovda yozuv commit qilindi.
+
+    @invalidates shunga qarab teglarni bekor qiladi; request_memoized natijalari
+    (masalan, mark-read dan keyingi o'qilmagan bildirishnomalar soni) qayta o'qiladi.
+    """
+    if has_request_context():
+        g.db_write_committed = True
+        g.pop("request_memo", None)
+
+
+def _restore_autocommit(conn):
+    "Commit qilinmagan tranzaksiyani bekor qilib autocommit ga qaytarish"
+    try:
+        if conn.in_transaction:
+            conn.rollback()
+        # isolation_level = None ochiq tranzaksiyani commit qiladi - rollback dan keyin
+        conn.isolation_level = None
+    except Exception as e:
+        app_logger.warning(f"Request connection reset error: {str(e)}")
+
+
+def get_request_db(read_only=False):
+    """Joriy so'rov uchun yagona connectionni qaytarish (kerak bo'lganda ochiladi).
+
+    Connection pooldan bir marta olinadi va g da saqlanadi; keyingi barcha
+    execute_query/get_db chaqiruvlari shu connectionni qayta ishlatadi.
+    read_only=True bo'lsa alohida read-only pooldan olinadi.
+    """
+    attr = "_request_read_db" if read_only else "_request_db"
+    conn = getattr(g, attr, None)
+    if conn is None:
+        pool = get_read_pool() if read_only else get_db_pool()
+        stack = getattr(g, "_request_db_stack", None)
+        if stack is None:
+            stack = g._request_db_stack = ExitStack()
+        raw_conn = stack.enter_context(pool.get_connection())
+        if not read_only:
+            # Eski get_db() dagi kabi yashirin tranzaksiya: INSERT/UPDATE/DELETE
+            # oldidan BEGIN, commit() qilinmagan yozuvlar teardown da bekor qilinadi.
+            # Pool connectioni autocommit holatiga qaytib beriladi.
+            raw_conn.isolation_level = ""
+            stack.callback(_restore_autocommit, raw_conn)
+        conn = RequestConnection(raw_conn)
+        setattr(g, attr, conn)
+        _count_db_connection()
+    return conn
+
+
+@app.teardown_appcontext
+def release_request_db(exc=None):
+    "So'rov connectionlarini poolga qaytarish"
+    stack = g.pop("_request_db_stack", None)
+    g.pop("_request_db", None)
+    g.pop("_request_read_db", None)
+    if stack is not None:
+        try:
+            stack.close()
+        except Exception as e:
+            app_logger.warning(f"Request connection release error: {str(e)}")
+
+
+@contextmanager
+def db_connection(read_only=False):
+    """So'rov ichida umumiy connection, aks holda pool connection beradi."""
+    if has_request_context():
+        yield get_request_db(read_only)
+    else:
+        pool = get_read_pool() if read_only else get_db_pool()
+        with pool.get_connection() as conn:
+            _count_db_connection()
+            yield conn
+
+
+def get_read_db():
+    "Faqat o'qish uchun connection - og'ir hisobot/monitor sahifalari uchun"
+    if has_request_context():
+        return get_request_db(read_only=True)
+    return get_db()
+
+
+def get_db():
+    "Legacy support uchun - so'rov ichida umumiy connection qaytaradi"
+    if has_request_context():
+        return get_request_db()
+
+    try:
+        conn = sqlite3.connect(
+            DB_PATH, check_same_thread=False, timeout=60.0  # 60 soniya timeout
+        )
+        conn.row_factory = sqlite3.Row
+
+        # Ensure foreign keys are enforced for legacy connections and set sensible pragmas
+        try:
+            conn.execute("PRAGMA foreign_keys=ON")
+            conn.execute("PRAGMA busy_timeout=30000")
+            conn.execute("PRAGMA journal_mode=WAL")
+        except Exception as pragma_err:
+            app_logger.warning(f"get_db PRAGMA setup failed: {str(pragma_err)}")
+
+        attach_side_databases(conn)
+
+        # Basic connection test
+        conn.execute("SELECT 1").fetchone()
+        return conn
+    except Exception as e:
+        app_logger.error(f"get_db connection error: {str(e)}")
+        raise Exception("Database connection timeout")
+
+
+def _now_iso():
+    return datetime.datetime.utcnow().strftime("%Y-%m-%d %H:%M:%S")
+
+
+class SessionActivityTracker:
+    """sessions jadvali uchun write-behind bufer.
+
+    before_request faqat xotiradagi lug'atni yangilaydi (session_id bo'yicha
+    oxirgi qiymat qoladi); fon thread har `flush_interval` soniyada yig'ilgan
+    yozuvlarni bitta batch upsert bilan yozuvchi threadga yuboradi.
+    Flush va o'chirish ishlari lock ostida navbatga qo'yiladi, shuning uchun
+    yozuvchida ham shu tartibda bajariladi - o'chirilgan sessiya qayta tirilmaydi.
+    """
+
+    UPSERT_SQL = (
+        "INSERT INTO sessions (session_id, user_id, ip, user_agent, created_at, last_seen) "
+        "VALUES (?,?,?,?,?,?) ON CONFLICT(session_id) DO UPDATE SET "
+        "user_id = excluded.user_id, ip = excluded.ip, "
+        "user_agent = excluded.user_agent, last_seen = excluded.last_seen"
+    )
+
+    def __init__(self, flush_interval=5.0, max_pending=5000, submit=None):
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        # submit(job) -> Future; standart - activity bazasi yozuvchisi
+        self._submit = submit or (lambda job: get_db_writer("activity").submit(job))
+        self.lock = threading.Lock()
+        self._pending = {}
+        self._wake = threading.Event()
+        self.thread = None
+        self.stats = {"touches": 0, "flushes": 0, "rows_flushed": 0, "failed": 0}
+
+    def touch(self, session_id, user_id=None, ip=None, user_agent=None):
+        "Sessiya faolligini buferga yozish (DB ga murojaat yo'q)"
+        now = _now_iso()
+        with self.lock:
+            entry = self._pending.get(session_id)
+            created = entry["created_at"] if entry else now
+            self._pending[session_id] = {
+                "user_id": user_id,
+                "ip": ip,
+                "user_agent": user_agent,
+                "created_at": created,
+                "last_seen": now,
+            }
+            self.stats["touches"] += 1
+            overflow = len(self._pending) >= self.max_pending
+        self._ensure_started()
+        if overflow:
+            self._wake.set()
+
+    def pending(self):
+        "Hali yozilmagan yozuvlar nusxasi: {session_id: {...}}"
+        with self.lock:
+            return {sid: dict(entry) for sid, entry in self._pending.items()}
+
+    def _ensure_started(self):
+        if self.thread is not None and self.thread.is_alive():
+            return
+        with self.lock:
+            if self.thread is None or not self.thread.is_alive():
+                self.thread = threading.Thread(
+                    target=self._run, name="session-flush", daemon=True
+                )
+                self.thread.start()
+
+    def _run(self):
+        while True:
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                app_logger.error(f"Session activity flush error: {str(e)}")
+
+    def flush(self, timeout=30):
+        "Buferdagi yozuvlarni bitta tranzaksiyada yozish"
+        with self.lock:
+            if not self._pending:
+                return 0
+            batch = self._pending
+            self._pending = {}
+            rows = [
+                (
+                    sid,
+                    e["user_id"],
+                    e["ip"],
+                    e["user_agent"],
+                    e["created_at"],
+                    e["last_seen"],
+                )
+                for sid, e in batch.items()
+            ]
+            future = self._submit(lambda conn: self._write(conn, rows))
+        try:
+            future.result(timeout=timeout)
+        except Exception:
+            with self.lock:
+                # Keyingi flushda qayta urinish (yangiroq yozuvlar ustun)
+                for sid, entry in batch.items():
+                    self._pending.setdefault(sid, entry)
+                self.stats["failed"] += 1
+            raise
+        with self.lock:
+            self.stats["flushes"] += 1
+            self.stats["rows_flushed"] += len(rows)
+        return len(rows)
+
+    @classmethod
+    def _write(cls, conn, rows):
+        conn.execute(
+            f"""
+            CREATE TABLE IF NOT EXISTS {side_table('sessions')} (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                session_id TEXT UNIQUE NOT NULL,
+                user_id INTEGER,
+                ip TEXT,
+                user_agent TEXT,
+                created_at TEXT NOT NULL,
+                last_seen TEXT NOT NULL
             )
-        conn.commit()
-        conn.close()
+            """
+        )
+        conn.executemany(cls.UPSERT_SQL, rows)
+
+    def forget(self, session_id, timeout=30):
+        "Sessiyani buferdan va jadvaldan o'chirish"
+        with self.lock:
+            self._pending.pop(session_id, None)
+            future = self._submit(
+                lambda conn: conn.execute(
+                    "DELETE FROM sessions WHERE session_id = ?", (session_id,)
+                )
+            )
+        future.result(timeout=timeout)
+
+
+session_tracker = SessionActivityTracker(
+    flush_interval=Config.SESSION_FLUSH_INTERVAL,
+    max_pending=Config.SESSION_FLUSH_MAX_PENDING,
+)
+
+
+@atexit.register
+def _flush_sessions_at_exit():
+    "To'xtashda buferda qolgan faollikni yozib qo'yish"
+    try:
+        session_tracker.flush(timeout=5)
+    except Exception:
+        pass
+
+
+def record_session_entry(session_id, user_id=None, ip=None, user_agent=None):
+    """Record session presence; written to the sessions table by the background flush."""
+    try:
+        session_tracker.touch(session_id, user_id, ip, user_agent)
     except Exception as e:
         try:
             app_logger.error(f"record_session_entry error: {e}")
@@ -1758,8 +3694,7 @@ def record_session_entry(session_id, user_id=None, ip=None, user_agent=None):
 def get_user_sessions(user_id):
     """Return list of active sessions for a user ordered by last_seen desc."""
     try:
-        conn = sqlite3.connect(DB_PATH, check_same_thread=False)
-        conn.row_factory = sqlite3.Row
+        conn = get_db()
         cur = conn.cursor()
         try:
             cur.execute(
@@ -1768,11 +3703,11 @@ def get_user_sessions(user_id):
             )
         except sqlite3.OperationalError as oe:
             if "no such table" in str(oe).lower():
-                return []
+                return _merge_pending_sessions(user_id, [])
             raise
         rows = cur.fetchall() or []
         conn.close()
-        return [dict(r) for r in rows]
+        return _merge_pending_sessions(user_id, [dict(r) for r in rows])
     except Exception as e:
         try:
             app_logger.error(f"get_user_sessions error: {e}")
@@ -1781,25 +3716,34 @@ def get_user_sessions(user_id):
         return []
 
 
+def _merge_pending_sessions(user_id, rows):
+    "Jadvaldagi sessiyalarga hali flush qilinmagan faollikni qo'shish"
+    merged = {r["session_id"]: r for r in rows}
+    for sid, entry in session_tracker.pending().items():
+        if entry["user_id"] == user_id:
+            existing = merged.get(sid)
+            merged[sid] = {
+                "session_id": sid,
+                "ip": entry["ip"],
+                "user_agent": entry["user_agent"],
+                "created_at": existing["created_at"] if existing else entry["created_at"],
+                "last_seen": entry["last_seen"],
+            }
+        elif sid in merged:
+            # Sessiya boshqa foydalanuvchiga o'tgan (logout/login)
+            del merged[sid]
+    return sorted(merged.values(), key=lambda r: r["last_seen"] or "", reverse=True)
+
+
 def terminate_session(session_id_to_kill, current_session_id=None):
     """Remove a session record and clear flask session if it's the current session."""
     try:
-        conn = sqlite3.connect(DB_PATH, check_same_thread=False)
-        cur = conn.cursor()
         try:
-            cur.execute(
-                "DELETE FROM sessions WHERE session_id = ?", (session_id_to_kill,)
-            )
-            conn.commit()
+            session_tracker.forget(session_id_to_kill)
         except sqlite3.OperationalError as oe:
-            if "no such table" in str(oe).lower():
-                # nothing to delete
-                conn.close()
-                if current_session_id and session_id_to_kill == current_session_id:
-                    session.clear()
-                return True
-            raise
-        conn.close()
+            if "no such table" not in str(oe).lower():
+                raise
+            # nothing to delete
         if current_session_id and session_id_to_kill == current_session_id:
             session.clear()
         return True
@@ -1811,36 +3755,6 @@ def terminate_session(session_id_to_kill, current_session_id=None):
         return False
 
 
-# Ensure database schema exists before first request (safe registration)
-def ensure_db_schema():
-    try:
-        init_db()
-        app_logger.info("Database initialized/check complete")
-    except Exception as e:
-        try:
-            app_logger.warning(f"init_db warning: {str(e)}")
-        except:
-            pass
-
-
-# Try to register using Flask API if available, else call immediately
-try:
-    if hasattr(app, "before_first_request") and callable(
-        getattr(app, "before_first_request")
-    ):
-        app.before_first_request(ensure_db_schema)
-    else:
-        # Fallback: run once now only if not explicitly skipping DB init
-        if not os.environ.get("SKIP_DB_INIT"):
-            ensure_db_schema()
-except Exception:
-    try:
-        if not os.environ.get("SKIP_DB_INIT"):
-            ensure_db_schema()
-    except Exception:
-        pass
-
-
 def check_database_health():
     "Database connection holatini tekshirish"
     try:
@@ -1882,6 +3796,7 @@ def api_set_settings():
         try:
             with open("superadmin_settings.json", "w", encoding="utf-8") as f:
                 json.dump(data, f, ensure_ascii=False, indent=2)
+            invalidate_cache("settings")
             return jsonify({"success": True, "message": "System settings saved"})
         except Exception as e:
             app_logger.error(f"Failed to save system settings: {str(e)}")
@@ -1939,104 +3854,361 @@ def api_set_settings():
 
 
 # Optimized database operations with timeout handling
-def execute_query(query, params=None, fetch_one=False, fetch_all=False, max_retries=3):
-    "Optimizatsiya qilingan database so'rovi - improved None handling"
-    last_error = None
+class DbRow(MutableMapping):
+    """execute_query natijasi qatori: row[0] va row['col'] ikkalasi ham ishlaydi.
 
-    for attempt in range(max_retries):
+    Qiymatlar tuple sifatida saqlanadi, ustun nomi -> indeks xaritasi esa
+    butun natija to'plami uchun bitta. dict faqat qator o'zgartirilganda
+    (row['x'] = ...) yoki as_dict() chaqirilganda yaratiladi.
+    """
+
+    __slots__ = ("_values", "_index", "_dict")
+
+    def __init__(self, values, index):
+        self._values = values
+        self._index = index
+        self._dict = None
+
+    def __getitem__(self, key):
+        if isinstance(key, (int, slice)):
+            return self._values[key]
+        if self._dict is not None:
+            return self._dict[key]
+        return self._values[self._index[key]]
+
+    def __setitem__(self, key, value):
+        self.as_dict()[key] = value
+
+    def __delitem__(self, key):
+        del self.as_dict()[key]
+
+    def __iter__(self):
+        return iter(self._dict if self._dict is not None else self._index)
+
+    def __len__(self):
+        return len(self._dict if self._dict is not None else self._index)
+
+    def __contains__(self, key):
+        return key in (self._dict if self._dict is not None else self._index)
+
+    def get(self, key, default=None):
         try:
-            pool = get_db_pool()
-            with pool.get_connection() as conn:
-                if conn is None:
-                    raise Exception("Connection is None")
+            return self[key]
+        except (KeyError, IndexError):
+            return default
 
-                cur = conn.cursor()
+    def as_dict(self):
+        if self._dict is None:
+            values = self._values
+            self._dict = {name: values[i] for name, i in self._index.items()}
+        return self._dict
 
-                # Query ni timeout bilan bajarish
-                if params:
-                    cur.execute(query, params)
-                else:
-                    cur.execute(query)
+    def copy(self):
+        return dict(self.as_dict())
 
-                if fetch_one:
-                    result = cur.fetchone()
-                    if result is None:
-                        return None
+    def __eq__(self, other):
+        if isinstance(other, Mapping):
+            return self.as_dict() == dict(other)
+        return NotImplemented
 
-                    # Build a small proxy that supports both dict-like access (.get('col'))
-                    # and integer indexing (result[0]) because callers expect both.
-                    cols = [c[0] for c in (cur.description or [])]
+    __hash__ = None
 
-                    class RowProxy(dict):
-                        def __init__(self, columns, values):
-                            # Map column name -> value
-                            super().__init__(zip(columns, values) if columns else {})
-                            self._values = tuple(values)
-                            self._columns = list(columns)
+    def __repr__(self):
+        return f"DbRow({self.as_dict()!r})"
 
-                        def __getitem__(self, key):
-                            if isinstance(key, int):
-                                return self._values[key]
-                            return super().__getitem__(key)
 
-                        def get(self, key, default=None):
-                            return super().get(key, default)
+def _column_index(description):
+    "cursor.description -> {ustun: indeks}; takrorlangan nomda oxirgisi (dict kabi)"
+    return {col[0]: i for i, col in enumerate(description or ())}
 
-                        def keys(self):
-                            return super().keys()
 
-                    return RowProxy(cols, result)
+# jsonify/tojson DbRow ni oddiy obyekt sifatida chiqarishi uchun
+try:
+    _base_json_default = app.json.default
 
-                elif fetch_all:
-                    all_results = cur.fetchall() or []
-                    if not all_results:
-                        return []
+    def _json_default(o):
+        if isinstance(o, DbRow):
+            return o.as_dict()
+        return _base_json_default(o)
 
-                    cols = [c[0] for c in (cur.description or [])]
+    app.json.default = _json_default
+except AttributeError:
+    pass
 
-                    class RowProxy(dict):
-                        def __init__(self, columns, values):
-                            super().__init__(zip(columns, values) if columns else {})
-                            self._values = tuple(values)
-                            self._columns = list(columns)
 
-                        def __getitem__(self, key):
-                            if isinstance(key, int):
-                                return self._values[key]
-                            return super().__getitem__(key)
+def fetch_dicts(query, params=None):
+    """SELECT natijasini oddiy dict ro'yxati sifatida qaytarish (tez yo'l).
 
-                        def get(self, key, default=None):
-                            return super().get(key, default)
+    Natija darhol dict(row) ga aylantiriladigan yoki JSON qilinadigan joylar
+    uchun - oraliq DbRow obyektlari yaratilmaydi.
+    """
+    with db_connection(is_read_query(query)) as conn:
+        cur = conn.cursor()
+        cur.row_factory = None
+        started = time.perf_counter()
+        cur.execute(query, params or ())
+        rows = cur.fetchall()
+        if query_profiler.enabled:
+            query_profiler.record(
+                query, time.perf_counter() - started, len(rows), conn, params
+            )
+        cols = [c[0] for c in (cur.description or ())]
+        return [dict(zip(cols, r)) for r in rows]
 
-                        def keys(self):
-                            return super().keys()
 
-                    proxy_rows = []
-                    for r in all_results:
-                        try:
-                            proxy_rows.append(RowProxy(cols, r))
-                        except Exception:
-                            # Fallback to raw row if proxy creation fails
-                            proxy_rows.append(r)
-                    return proxy_rows
-                else:
-                    conn.commit()
-                    # Safe lastrowid return
-                    try:
-                        return cur.lastrowid
-                    except (AttributeError, TypeError):
-                        return None
+class QueryProfiler:
+    """So'rovlar statistikasi: normallashtirilgan SQL bo'yicha vaqt, qatorlar, endpointlar.
 
-        except sqlite3.OperationalError as e:
-            last_error = e
-            if "timeout" in str(e).lower() or "locked" in str(e).lower():
-                if attempt < max_retries - 1:
-                    wait_time = 0.5 * (2**attempt)  # Exponential backoff
-                    app_logger.warning(
-                        f"Database timeout, retrying in {wait_time}s (attempt {attempt + 1})"
+    Har bir statement uchun oxirgi `samples` ta davomiylik saqlanadi va
+    p50/p95/p99 shular asosida hisoblanadi. `slow_ms` dan sekin so'rovlar
+    EXPLAIN QUERY PLAN bilan alohida logga yoziladi.
+    """
+
+    _STRING_RE = re.compile(r"'(?:[^']|'')*'")
+    _NUMBER_RE = re.compile(r"\b\d+(?:\.\d+)?\b")
+    _IN_LIST_RE = re.compile(r"\(\s*\?(?:\s*,\s*\?)+\s*\)")
+    _SPACE_RE = re.compile(r"\s+")
+
+    # top(sort=...) qiymatlari
+    SORT_KEYS = {
+        "total_time": "total_time_ms",
+        "count": "count",
+        "avg": "avg_ms",
+        "p95": "p95_ms",
+        "p99": "p99_ms",
+        "max": "max_ms",
+        "rows": "rows",
+    }
+
+    def __init__(self, enabled=False, slow_ms=200.0, samples=256, max_statements=500):
+        self.enabled = enabled
+        self.slow_ms = slow_ms
+        self.samples = samples
+        self.max_statements = max_statements
+        self.lock = threading.Lock()
+        self.statements = {}
+        self._slow_logger = None
+
+    @classmethod
+    @lru_cache(maxsize=2048)
+    def normalize(cls, sql):
+        "Literal qiymatlarni ? ga almashtirish - bir xil shakldagi so'rovlar birlashadi"
+        text = cls._STRING_RE.sub("?", sql)
+        text = cls._NUMBER_RE.sub("?", text)
+        text = cls._IN_LIST_RE.sub("(?...)", text)
+        return cls._SPACE_RE.sub(" ", text).strip()
+
+    def record(self, sql, duration, rows=0, conn=None, params=None):
+        key = self.normalize(sql)
+        endpoint = "<background>"
+        if has_request_context():
+            endpoint = request.endpoint or request.path
+        with self.lock:
+            stat = self.statements.get(key)
+            if stat is None:
+                if len(self.statements) >= self.max_statements:
+                    # Eng kam ishlatilgan statementni chiqarib tashlash
+                    coldest = min(self.statements, key=lambda k: self.statements[k]["count"])
+                    del self.statements[coldest]
+                stat = self.statements[key] = {
+                    "count": 0,
+                    "total_time": 0.0,
+                    "max_time": 0.0,
+                    "rows": 0,
+                    "slow": 0,
+                    "durations": deque(maxlen=self.samples),
+                    "endpoints": defaultdict(int),
+                }
+            stat["count"] += 1
+            stat["total_time"] += duration
+            stat["max_time"] = max(stat["max_time"], duration)
+            stat["rows"] += rows
+            stat["durations"].append(duration)
+            stat["endpoints"][endpoint] += 1
+            is_slow = duration * 1000 >= self.slow_ms
+            if is_slow:
+                stat["slow"] += 1
+        if is_slow:
+            self._log_slow(key, sql, duration, rows, endpoint, conn, params)
+
+    def _get_slow_logger(self):
+        if self._slow_logger is None:
+            logger = logging.getLogger("restaurant_app.slow_sql")
+            if RotatingFileHandler is not None and not logger.handlers:
+                try:
+                    handler = RotatingFileHandler(
+                        Config.SLOW_QUERY_LOG,
+                        maxBytes=Config.LOG_FILE_MAX_SIZE,
+                        backupCount=Config.LOG_BACKUP_COUNT,
                     )
-                    time.sleep(wait_time)
-                    continue
+                    handler.setFormatter(logging.Formatter("%(asctime)s | %(message)s"))
+                    logger.addHandler(handler)
+                    logger.setLevel(logging.INFO)
+                    logger.propagate = False
+                except Exception as e:
+                    app_logger.warning(f"Slow query log ochilmadi: {str(e)}")
+            self._slow_logger = logger
+        return self._slow_logger
+
+    def _log_slow(self, key, sql, duration, rows, endpoint, conn, params):
+        plan = []
+        if conn is not None:
+            try:
+                plan = [
+                    r[-1]
+                    for r in conn.execute(f"EXPLAIN QUERY PLAN {sql}", params or ())
+                ]
+            except Exception as e:
+                plan = [f"EXPLAIN failed: {str(e)}"]
+        self._get_slow_logger().warning(
+            json.dumps(
+                {
+                    "duration_ms": round(duration * 1000, 2),
+                    "rows": rows,
+                    "endpoint": endpoint,
+                    "sql": key,
+                    "plan": plan,
+                },
+                ensure_ascii=False,
+            )
+        )
+
+    @staticmethod
+    def _percentile(sorted_values, pct):
+        if not sorted_values:
+            return 0.0
+        idx = min(len(sorted_values) - 1, int(round(pct / 100 * (len(sorted_values) - 1))))
+        return sorted_values[idx]
+
+    def top(self, limit=20, sort="total_time"):
+        "Eng og'ir statementlar (default: umumiy vaqt bo'yicha)"
+        with self.lock:
+            snapshot = [
+                (key, dict(stat, durations=sorted(stat["durations"]), endpoints=dict(stat["endpoints"])))
+                for key, stat in self.statements.items()
+            ]
+        result = []
+        for key, stat in snapshot:
+            durations = stat["durations"]
+            endpoints = sorted(stat["endpoints"].items(), key=lambda kv: -kv[1])[:5]
+            result.append(
+                {
+                    "sql": key,
+                    "count": stat["count"],
+                    "total_time_ms": round(stat["total_time"] * 1000, 2),
+                    "avg_ms": round(stat["total_time"] / stat["count"] * 1000, 3),
+                    "p50_ms": round(self._percentile(durations, 50) * 1000, 3),
+                    "p95_ms": round(self._percentile(durations, 95) * 1000, 3),
+                    "p99_ms": round(self._percentile(durations, 99) * 1000, 3),
+                    "max_ms": round(stat["max_time"] * 1000, 3),
+                    "rows": stat["rows"],
+                    "avg_rows": round(stat["rows"] / stat["count"], 1),
+                    "slow": stat["slow"],
+                    "endpoints": dict(endpoints),
+                }
+            )
+        result.sort(
+            key=lambda item: item[self.SORT_KEYS.get(sort, "total_time_ms")],
+            reverse=True,
+        )
+        return result[:limit]
+
+    def reset(self):
+        with self.lock:
+            self.statements.clear()
+
+
+query_profiler = QueryProfiler(
+    enabled=Config.SQL_PROFILING, slow_ms=Config.SLOW_QUERY_MS
+)
+
+
+def execute_query(query, params=None, fetch_one=False, fetch_all=False, max_retries=3):
+    "Optimizatsiya qilingan database so'rovi - improved None handling"
+    last_error = None
+    # fetch_one/fetch_all bilan SELECT so'rovlari read-only poolga yo'naltiriladi
+    read_only = (fetch_one or fetch_all) and is_read_query(query)
+
+    for attempt in range(max_retries):
+        try:
+            with db_connection(read_only) as conn:
+                if conn is None:
+                    raise Exception("Connection is None")
+
+                cur = conn.cursor()
+                # Oddiy tuple qatorlar - DbRow ularni o'zi o'raydi
+                cur.row_factory = None
+                # So'rovdagi boshqa helperning commit qilinmagan ishi - uni commit qilmaymiz
+                joined = not read_only and conn.in_transaction
+
+                # Query ni timeout bilan bajarish
+                started = time.perf_counter()
+                if params:
+                    cur.execute(query, params)
+                else:
+                    cur.execute(query)
+
+                if fetch_one:
+                    result = cur.fetchone()
+                    if query_profiler.enabled:
+                        query_profiler.record(
+                            query,
+                            time.perf_counter() - started,
+                            0 if result is None else 1,
+                            conn,
+                            params,
+                        )
+                    if result is None:
+                        return None
+                    # Callers expect both result[0] and result.get('col')
+                    return DbRow(tuple(result), _column_index(cur.description))
+
+                elif fetch_all:
+                    all_results = cur.fetchall() or []
+                    if query_profiler.enabled:
+                        query_profiler.record(
+                            query,
+                            time.perf_counter() - started,
+                            len(all_results),
+                            conn,
+                            params,
+                        )
+                    if not all_results:
+                        return []
+                    # Bitta ustun xaritasi butun natija uchun umumiy
+                    index = _column_index(cur.description)
+                    return [DbRow(tuple(r), index) for r in all_results]
+                else:
+                    if not joined:
+                        conn.commit()
+                    if query_profiler.enabled:
+                        query_profiler.record(
+                            query,
+                            time.perf_counter() - started,
+                            max(cur.rowcount, 0),
+                            conn,
+                            params,
+                        )
+                    # Safe lastrowid return
+                    try:
+                        return cur.lastrowid
+                    except (AttributeError, TypeError):
+                        return None
+
+        except sqlite3.OperationalError as e:
+            last_error = e
+            if read_only and _is_readonly_error(e):
+                # SELECT ichida yozuv (masalan, funksiya orqali) - asosiy poolda qayta urinish
+                read_only = False
+                continue
+            if "timeout" in str(e).lower() or "locked" in str(e).lower():
+                if attempt < max_retries - 1:
+                    wait_time = 0.5 * (2**attempt)  # Exponential backoff
+                    app_logger.warning(
+                        f"Database timeout, retrying in {wait_time}s (attempt {attempt + 1})"
+                    )
+                    time.sleep(wait_time)
+                    continue
                 else:
                     app_logger.error(
                         f"Database timeout after {max_retries} attempts: {str(e)}"
@@ -2068,7 +4240,7 @@ def execute_query(query, params=None, fetch_one=False, fetch_all=False, max_retr
 
 def execute_many(query, params_list):
     "Bulk operations uchun optimizatsiya"
-    with db_pool.get_connection() as conn:
+    with db_connection() as conn:
         try:
             cur = conn.cursor()
             cur.executemany(query, params_list)
@@ -2821,8 +4993,8 @@ def init_db():
     conn = get_db()
     cur = conn.cursor()
     cur.execute(
-        """
-        CREATE TABLE IF NOT EXISTS sessions (
+        f"""
+        CREATE TABLE IF NOT EXISTS {side_table('sessions')} (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
             session_id TEXT UNIQUE NOT NULL,
             user_id INTEGER,
@@ -2840,8 +5012,8 @@ def init_db():
     conn = get_db()
     cur = conn.cursor()
     cur.execute(
-        """
-        CREATE TABLE IF NOT EXISTS chats (
+        f"""
+        CREATE TABLE IF NOT EXISTS {side_table('chats')} (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
             name TEXT,
             is_group BOOLEAN DEFAULT 0,
@@ -2850,8 +5022,8 @@ def init_db():
     """
     )
     cur.execute(
-        """
-        CREATE TABLE IF NOT EXISTS chat_members (
+        f"""
+        CREATE TABLE IF NOT EXISTS {side_table('chat_members')} (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
             chat_id INTEGER NOT NULL,
             member_type TEXT NOT NULL, -- 'user'|'staff'|'courier'|'super'
@@ -2861,8 +5033,8 @@ def init_db():
     """
     )
     cur.execute(
-        """
-        CREATE TABLE IF NOT EXISTS chat_messages (
+        f"""
+        CREATE TABLE IF NOT EXISTS {side_table('chat_messages')} (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
             chat_id INTEGER NOT NULL,
             sender_type TEXT NOT NULL,
@@ -2874,8 +5046,8 @@ def init_db():
     """
     )
     cur.execute(
-        """
-        CREATE TABLE IF NOT EXISTS notifications (
+        f"""
+        CREATE TABLE IF NOT EXISTS {side_table('notifications')} (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
             recipient_type TEXT NOT NULL,
             recipient_id INTEGER,
@@ -3337,11 +5509,11 @@ def cleanup_expired_orders():
     "Waiting holatidagi, 30 daqiqadan oshgan buyurtmalarni cancelled ga o'tkazadi."
     try:
         # Connection pool dan connection olish
-        with db_pool.get_connection() as conn:
+        with db_connection() as conn:
             cur = conn.cursor()
-            cutoff = (get_current_time() - datetime.timedelta(minutes=30)).isoformat()
+            cutoff = int(time.time()) - 30 * 60
             cur.execute(
-                "UPDATE orders SET status='cancelled' WHERE status='waiting' AND created_at < ?",
+                "UPDATE orders SET status='cancelled' WHERE status='waiting' AND created_ts < ?",
                 (cutoff,),
             )
             conn.commit()
@@ -3358,7 +5530,7 @@ def send_birthday_notifications(run_date=None):
         run_date = run_date or get_current_time().date()
         month_day = run_date.strftime("-%m-%d")
 
-        with db_pool.get_connection() as conn:
+        with db_connection() as conn:
             cur = conn.cursor()
 
             # users
@@ -3385,10 +5557,12 @@ def send_birthday_notifications(run_date=None):
             # helper to insert targeted notification if not already sent today
             def _insert_if_not_sent(recipient_type, recipient_id, title, body):
                 try:
-                    today_iso = run_date.isoformat()
+                    day_start, day_end = epoch_day_range(run_date)
                     # Check duplicates: same recipient, same title, same day
-                    q = "SELECT id FROM notifications WHERE recipient_type=? AND recipient_id=? AND DATE(created_at)=? AND title=?"
-                    cur.execute(q, (recipient_type, recipient_id, today_iso, title))
+                    q = "SELECT id FROM notifications WHERE recipient_type=? AND recipient_id=? AND created_ts >= ? AND created_ts < ? AND title=?"
+                    cur.execute(
+                        q, (recipient_type, recipient_id, day_start, day_end, title)
+                    )
                     if cur.fetchone():
                         return
                     cur.execute(
@@ -3691,7 +5865,8 @@ def safe_init_database():
             return False
 
 
-if not os.environ.get("SKIP_DB_INIT"):
+def legacy_schema_bootstrap():
+    """Avvalgi startup tekshiruvlari - endi faqat 0001 migratsiyasi orqali ishlaydi."""
     # Ensure columns exist on startup
     ensure_orders_columns()
     ensure_cart_items_columns()
@@ -3706,6 +5881,7 @@ if not os.environ.get("SKIP_DB_INIT"):
     fix_courier_table()
     fix_news_table()
     ensure_receipts_columns()
+    ensure_avatar_columns()
 
     # Database ni xavfsiz ishga tushirish
     with app.app_context():
@@ -3914,6 +6090,9 @@ def localize_flashes():
     MSG_KEY_MAP and translate(). This lets us keep existing flash(...) calls
     and have their text localized automatically.
     """
+    if getattr(g, "route_class", None):
+        # static/probe/poll javoblarida flash ko'rsatilmaydi - sessionga tegmaslik
+        return
     try:
         # get current flashed messages (consumes them)
         messages = get_flashed_messages(with_categories=True)
@@ -4337,10 +6516,133 @@ def auto_calculate_courier_delivery_price(distance_km):
     return round(final_price), delivery_time
 
 
+# ---- RATING AGGREGATES ----
+# migrations/0007_rating_aggregates.py: har bir mahsulot (filial uchun
+# -branch_id) bo'yicha bitta qator - ratings triggerlari uni bahoni yozgan
+# tranzaksiyaning o'zida yangilaydi, o'qishlar ratings ni skan qilmaydi.
+RATING_STARS = range(1, 6)
+RATING_AGGREGATE_COLUMNS = ("rating_sum", "rating_count") + tuple(
+    f"stars_{n}" for n in RATING_STARS
+)
+RATING_SUBJECT_SQL = (
+    "CASE WHEN branch_id IS NOT NULL THEN -branch_id ELSE menu_item_id END"
+)
+RATING_AGGREGATE_SELECT = f"""
+    SELECT {RATING_SUBJECT_SQL} AS subject_id, SUM(rating), COUNT(*),
+           {", ".join(f"SUM(rating = {n})" for n in RATING_STARS)}
+    FROM ratings
+    WHERE {RATING_SUBJECT_SQL} IS NOT NULL AND rating IS NOT NULL
+    GROUP BY subject_id
+"""
+
+
+def rating_aggregates_available():
+    return sqlite_table_exists("rating_aggregates")
+
+
+def rating_summary(row):
+    "rating_aggregates qatori (yoki None) -> o'rtacha, soni va yulduzlar taqsimoti"
+    count = int(row["rating_count"] or 0) if row else 0
+    return {
+        "average_rating": round(row["rating_sum"] / count, 1) if count else 0.0,
+        "total_ratings": count,
+        "distribution": {
+            str(n): int(row[f"stars_{n}"] or 0) if row else 0 for n in RATING_STARS
+        },
+    }
+
+
+def get_rating_summary(subject_id):
+    "Mahsulot (yoki -branch_id) bahosi - bitta PRIMARY KEY o'qishi"
+    row = execute_query(
+        f"SELECT {', '.join(RATING_AGGREGATE_COLUMNS)} FROM rating_aggregates WHERE subject_id = ?",
+        (subject_id,),
+        fetch_one=True,
+    )
+    return rating_summary(row)
+
+
+def _reconcile_rating_aggregates(conn):
+    expected = {
+        row[0]: tuple(row[1:]) for row in conn.execute(RATING_AGGREGATE_SELECT)
+    }
+    current = {
+        row[0]: tuple(row[1:])
+        for row in conn.execute(
+            f"SELECT subject_id, {', '.join(RATING_AGGREGATE_COLUMNS)} FROM rating_aggregates"
+        )
+    }
+    fixed = []
+    for subject_id, values in expected.items():
+        if current.get(subject_id) != values:
+            conn.execute(
+                f"INSERT OR REPLACE INTO rating_aggregates "
+                f"(subject_id, {', '.join(RATING_AGGREGATE_COLUMNS)}) "
+                f"VALUES ({', '.join('?' * (len(RATING_AGGREGATE_COLUMNS) + 1))})",
+                (subject_id,) + values,
+            )
+            fixed.append(subject_id)
+    # Bahosi qolmagan subjectlar: nol qator normal holat, boshqasi - drift
+    for subject_id in current.keys() - expected.keys():
+        if any(current[subject_id]):
+            fixed.append(subject_id)
+        conn.execute("DELETE FROM rating_aggregates WHERE subject_id = ?", (subject_id,))
+    return fixed
+
+
+def reconcile_rating_aggregates(timeout=120):
+    """rating_aggregates ni ratings dan qayta hisoblab farqlarni tuzatish.
+
+    Triggerlar chetlab o'tilgan yozuvlar (qo'lda SQL, eski nusxadan tiklash)
+    uchun. Bitta yozuv tranzaksiyasida ishlaydi; tuzatilgan subject_id lar
+    ro'yxatini qaytaradi.
+    """
+    if not rating_aggregates_available():
+        return []
+    fixed = run_write(_reconcile_rating_aggregates, timeout=timeout)
+    if fixed:
+        app_logger.warning(
+            f"rating_aggregates drift tuzatildi: {len(fixed)} ta subject ({fixed[:20]})"
+        )
+        invalidate_cache("ratings")
+    return fixed
+
+
+def _rating_reconcile_loop(interval):
+    while True:
+        time.sleep(interval)
+        try:
+            reconcile_rating_aggregates()
+        except Exception as e:
+            app_logger.error(f"Rating reconcile error: {str(e)}")
+
+
+def start_rating_reconciler(interval=None):
+    "Fon threadida davriy tekshiruv (interval <= 0 - o'chirilgan)"
+    interval = Config.RATING_RECONCILE_INTERVAL if interval is None else interval
+    if interval <= 0:
+        return None
+    thread = threading.Thread(
+        target=_rating_reconcile_loop,
+        args=(interval,),
+        name="rating-reconcile",
+        daemon=True,
+    )
+    thread.start()
+    return thread
+
+
 def get_branch_average_rating(branch_id):
     "Filial uchun o'rtacha bahoni hisoblash"
     try:
-        with db_pool.get_connection() as conn:
+        if rating_aggregates_available():
+            summary = get_rating_summary(-branch_id)
+            return {
+                "average_rating": summary["average_rating"],
+                "total_ratings": summary["total_ratings"],
+            }
+
+        with db_connection(read_only=True) as conn:
             cur = conn.cursor()
 
             # Filial uchun berilgan baholarni olish (menu_item_id = -branch_id)
@@ -4515,9 +6817,9 @@ def get_cart_items(conn, session_id, user_id=None):
     else:
         close_conn = False
 
-    # Make rows accessible by column name
-    conn.row_factory = sqlite3.Row
+    # Make rows accessible by column name (connection umumiy - faqat cursor da)
     cur = conn.cursor()
+    cur.row_factory = sqlite3.Row
 
     try:
         # Validate parameters
@@ -4527,19 +6829,11 @@ def get_cart_items(conn, session_id, user_id=None):
             )
             return []
 
-        # Prepare and run the query (include ci.size and ci.color)
+        # Savatcha qatorlari; nomi, narxi va chegirmasi katalog snapshotidan
         query = """
-            SELECT ci.id, ci.menu_item_id, mi.name, mi.price, ci.quantity,
-                   ci.size, ci.color,
-                   COALESCE(mi.discount_percentage, 0) as discount_percentage,
-                   CASE
-                       WHEN COALESCE(mi.discount_percentage, 0) > 0
-                       THEN (mi.price * (100 - COALESCE(mi.discount_percentage, 0)) / 100) * ci.quantity
-                       ELSE mi.price * ci.quantity
-                   END as total
+            SELECT ci.id, ci.menu_item_id, ci.quantity, ci.size, ci.color
             FROM cart_items ci
-            JOIN menu_items mi ON ci.menu_item_id = mi.id
-            WHERE {where_clause} AND mi.available = 1
+            WHERE {where_clause}
             ORDER BY ci.created_at DESC
         """
 
@@ -4553,53 +6847,33 @@ def get_cart_items(conn, session_id, user_id=None):
         if not results:
             return []
 
+        catalog = get_catalog_snapshot()
         cart_items = []
         for row in results:
+            item_id = row["menu_item_id"]
+            # Faqat mavjud (available = 1) mahsulotlar
+            if item_id not in catalog.available:
+                continue
+            discount = catalog.value(item_id, "discount_percentage")
             try:
-                item_dict = {
-                    "id": row["id"],
-                    "menu_item_id": row["menu_item_id"],
-                    "name": row["name"],
-                    "price": row["price"],
-                    "quantity": row["quantity"],
-                    "discount_percentage": (
-                        row["discount_percentage"]
-                        if row["discount_percentage"] is not None
-                        else 0
-                    ),
-                    "size": row["size"] if "size" in row.keys() else None,
-                    "color": row["color"] if "color" in row.keys() else None,
-                    "total": (
-                        row["total"]
-                        if row["total"] is not None
-                        else (row["price"] * row["quantity"])
-                    ),
-                }
-                cart_items.append(item_dict)
-            except Exception as row_error:
-                app_logger.error(f"Savatcha element o'qishda xatolik: {str(row_error)}")
-                # Fallback: try tuple access with conservative indices
-                try:
-                    item_dict = {
-                        "id": row[0] if len(row) > 0 else 0,
-                        "menu_item_id": row[1] if len(row) > 1 else 0,
-                        "name": row[2] if len(row) > 2 else "",
-                        "price": row[3] if len(row) > 3 else 0,
-                        "quantity": row[4] if len(row) > 4 else 1,
-                        "size": row[5] if len(row) > 5 else None,
-                        "color": row[6] if len(row) > 6 else None,
+                cart_items.append(
+                    {
+                        "id": row["id"],
+                        "menu_item_id": item_id,
+                        "name": catalog.value(item_id, "name"),
+                        "price": catalog.value(item_id, "price"),
+                        "quantity": row["quantity"],
                         "discount_percentage": (
-                            row[7] if len(row) > 7 and row[7] is not None else 0
-                        ),
-                        "total": (
-                            row[8]
-                            if len(row) > 8 and row[8] is not None
-                            else (row[3] * row[4])
+                            discount if discount is not None else 0
                         ),
+                        "size": row["size"],
+                        "color": row["color"],
+                        "total": catalog.line_total(item_id, row["quantity"]),
                     }
-                    cart_items.append(item_dict)
-                except Exception:
-                    continue
+                )
+            except Exception as row_error:
+                app_logger.error(f"Savatcha element o'qishda xatolik: {str(row_error)}")
+                continue
 
         return cart_items
 
@@ -4612,56 +6886,17 @@ def get_cart_items(conn, session_id, user_id=None):
 
 
 def get_cart_total(conn, session_id, user_id=None):
-    "Savatchaning umumiy summasini hisoblash"
-    # If no connection passed, create new one
-    if conn is None:
-        conn = get_db()
-        close_conn = True
-    else:
-        close_conn = False
+    """Savatchaning umumiy summasini hisoblash.
 
+    get_cart_items bilan bir manba (katalog snapshoti) - ko'rsatilgan qatorlar
+    va jami summa har doim mos keladi. Buyurtma summasi place_order da yozuvchi
+    tranzaksiyasi ichida bazadan qayta hisoblanadi.
+    """
     try:
-        cur = conn.cursor()
-        if user_id:
-            cur.execute(
-                """
-                SELECT SUM(
-                    CASE
-                        WHEN COALESCE(mi.discount_percentage, 0) > 0
-                        THEN (mi.price * (100 - COALESCE(mi.discount_percentage, 0)) / 100) * ci.quantity
-                        ELSE mi.price * ci.quantity
-                    END
-                )
-                FROM cart_items ci
-                JOIN menu_items mi ON ci.menu_item_id = mi.id
-                WHERE ci.user_id = ?
-            """,
-                (user_id,),
-            )
-        else:
-            cur.execute(
-                """
-                SELECT SUM(
-                    CASE
-                        WHEN COALESCE(mi.discount_percentage, 0) > 0
-                        THEN (mi.price * (100 - COALESCE(mi.discount_percentage, 0)) / 100) * ci.quantity
-                        ELSE mi.price * ci.quantity
-                    END
-                )
-                FROM cart_items ci
-                JOIN menu_items mi ON ci.menu_item_id = mi.id
-                WHERE ci.session_id = ?
-            """,
-                (session_id,),
-            )
-        result = cur.fetchone()
-        return result[0] if result and result[0] is not None else 0
+        return sum(item["total"] for item in get_cart_items(conn, session_id, user_id))
     except Exception as e:
         app_logger.error(f"Get cart total error: {str(e)}")
         return 0
-    finally:
-        if close_conn and conn:
-            conn.close()
 
 
 def clear_cart(conn, session_id, user_id=None):
@@ -4673,6 +6908,7 @@ def clear_cart(conn, session_id, user_id=None):
         else:
             cur.execute("DELETE FROM cart_items WHERE session_id = ?", (session_id,))
         conn.commit()
+        invalidate_cache(*cart_tags(user_id, session_id))
     except Exception as e:
         app_logger.error(f"Clear cart error: {str(e)}")
 
@@ -4836,40 +7072,34 @@ def post_chat_message(chat_id, sender_type, sender_id, text):
             app_logger.error(f"post_chat_message: Invalid input parameters")
             return False
 
-        conn = get_db()
-        cur = conn.cursor()
         created = _now_iso_short()
 
-        # Ensure chat_messages table exists
-        cur.execute(
+        def _write_message(conn):
+            # Ensure chat_messages table exists
+            conn.execute(
+                f"""
+                CREATE TABLE IF NOT EXISTS {side_table('chat_messages')} (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    chat_id INTEGER NOT NULL,
+                    sender_type TEXT NOT NULL,
+                    sender_id INTEGER,
+                    text TEXT NOT NULL,
+                    created_at TEXT NOT NULL
+                )
             """
-            CREATE TABLE IF NOT EXISTS chat_messages (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                chat_id INTEGER NOT NULL,
-                sender_type TEXT NOT NULL,
-                sender_id INTEGER,
-                text TEXT NOT NULL,
-                created_at TEXT NOT NULL
             )
-        """
-        )
+            conn.execute(
+                "INSERT INTO chat_messages (chat_id,sender_type,sender_id,text,created_at) VALUES (?,?,?,?,?)",
+                (chat_id, sender_type, sender_id, text.strip(), created),
+            )
 
-        cur.execute(
-            "INSERT INTO chat_messages (chat_id,sender_type,sender_id,text,created_at) VALUES (?,?,?,?,?)",
-            (chat_id, sender_type, sender_id, text.strip(), created),
-        )
-        conn.commit()
-        conn.close()
+        run_write(_write_message, database="messaging")
         app_logger.info(
             f"Chat message posted successfully: chat_id={chat_id}, sender={sender_type}"
         )
         return True
     except Exception as e:
         app_logger.error(f"post_chat_message error: {e}")
-        try:
-            conn.close()
-        except:
-            pass
         return False
 
 
@@ -4984,56 +7214,56 @@ def send_notification(
         except Exception:
             recipient_id = None
 
-        conn = get_db()
-        cur = conn.cursor()
         created = _now_iso_short()
 
-        # Ensure notifications table exists with all required columns
-        cur.execute(
+        def _write_notification(conn):
+            cur = conn.cursor()
+            # Ensure notifications table exists with all required columns
+            cur.execute(
+                f"""
+                CREATE TABLE IF NOT EXISTS {side_table('notifications')} (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    recipient_type TEXT NOT NULL,
+                    recipient_id INTEGER,
+                    sender_type TEXT DEFAULT 'system',
+                    sender_id INTEGER,
+                    title TEXT NOT NULL,
+                    body TEXT NOT NULL,
+                    created_at TEXT NOT NULL,
+                    read_flag INTEGER DEFAULT 0,
+                    notification_type TEXT DEFAULT 'general'
+                )
             """
-            CREATE TABLE IF NOT EXISTS notifications (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                recipient_type TEXT NOT NULL,
-                recipient_id INTEGER,
-                sender_type TEXT DEFAULT 'system',
-                sender_id INTEGER,
-                title TEXT NOT NULL,
-                body TEXT NOT NULL,
-                created_at TEXT NOT NULL,
-                read_flag INTEGER DEFAULT 0,
-                notification_type TEXT DEFAULT 'general'
             )
-        """
-        )
 
-        # Add missing columns if they don't exist (guarded by PRAGMA)
-        cur.execute("PRAGMA table_info(notifications)")
-        cols = [r[1] for r in cur.fetchall() or []]
-        if "sender_type" not in cols:
-            cur.execute(
-                "ALTER TABLE notifications ADD COLUMN sender_type TEXT DEFAULT 'system'"
-            )
-        if "sender_id" not in cols:
-            cur.execute("ALTER TABLE notifications ADD COLUMN sender_id INTEGER")
-        if "notification_type" not in cols:
+            # Add missing columns if they don't exist (guarded by PRAGMA)
+            cur.execute("PRAGMA table_info(notifications)")
+            cols = [r[1] for r in cur.fetchall() or []]
+            if "sender_type" not in cols:
+                cur.execute(
+                    "ALTER TABLE notifications ADD COLUMN sender_type TEXT DEFAULT 'system'"
+                )
+            if "sender_id" not in cols:
+                cur.execute("ALTER TABLE notifications ADD COLUMN sender_id INTEGER")
+            if "notification_type" not in cols:
+                cur.execute(
+                    "ALTER TABLE notifications ADD COLUMN notification_type TEXT DEFAULT 'general'"
+                )
+
             cur.execute(
-                "ALTER TABLE notifications ADD COLUMN notification_type TEXT DEFAULT 'general'"
+                "INSERT INTO notifications (recipient_type, recipient_id, sender_type, sender_id, title, body, created_at, read_flag) VALUES (?,?,?,?,?,?,?,0)",
+                (
+                    recipient_type,
+                    recipient_id,
+                    sender_type,
+                    sender_id,
+                    title,
+                    body,
+                    created,
+                ),
             )
 
-        cur.execute(
-            "INSERT INTO notifications (recipient_type, recipient_id, sender_type, sender_id, title, body, created_at, read_flag) VALUES (?,?,?,?,?,?,?,0)",
-            (
-                recipient_type,
-                recipient_id,
-                sender_type,
-                sender_id,
-                title,
-                body,
-                created,
-            ),
-        )
-        conn.commit()
-        conn.close()
+        run_write(_write_notification, database="messaging")
         return True
     except Exception as e:
         app_logger.error(f"send_notification error: {e}")
@@ -5084,7 +7314,7 @@ def send_order_notifications(order_id, order_status, customer_name, total_amount
             staff_members = execute_query("SELECT id FROM staff", fetch_all=True)
             if staff_members:
                 for staff in staff_members:
-                    staff_id = staff["id"] if isinstance(staff, dict) else staff[0]
+                    staff_id = staff["id"] if isinstance(staff, Mapping) else staff[0]
                     send_automatic_notification(
                         notification_type="new_order",
                         recipient_type="staff",
@@ -5099,7 +7329,7 @@ def send_order_notifications(order_id, order_status, customer_name, total_amount
             if couriers:
                 for courier in couriers:
                     courier_id = (
-                        courier["id"] if isinstance(courier, dict) else courier[0]
+                        courier["id"] if isinstance(courier, Mapping) else courier[0]
                     )
                     send_automatic_notification(
                         notification_type="order_ready",
@@ -5145,14 +7375,14 @@ def send_system_notifications():
         )
         if low_inventory_items:
             for item in low_inventory_items:
-                item_name = item.get("name") if isinstance(item, dict) else item[0]
-                quantity = item.get("quantity") if isinstance(item, dict) else item[1]
+                item_name = item.get("name") if isinstance(item, Mapping) else item[0]
+                quantity = item.get("quantity") if isinstance(item, Mapping) else item[1]
 
                 # Notify staff
                 staff_members = execute_query("SELECT id FROM staff", fetch_all=True)
                 if staff_members:
                     for staff in staff_members:
-                        staff_id = staff["id"] if isinstance(staff, dict) else staff[0]
+                        staff_id = staff["id"] if isinstance(staff, Mapping) else staff[0]
                         send_automatic_notification(
                             notification_type="low_inventory",
                             recipient_type="staff",
@@ -5163,24 +7393,25 @@ def send_system_notifications():
 
         # Check for pending orders older than 30 minutes
         old_pending_orders = execute_query(
-            "SELECT id, customer_name, total_amount FROM orders WHERE status = 'pending' AND created_at < datetime('now', '-30 minutes')",
+            "SELECT o.id, o.customer_name, COALESCE(r.total_amount, 0) FROM orders o LEFT JOIN receipts r ON r.order_id = o.id WHERE o.status = 'pending' AND o.created_ts < ?",
+            (int(time.time()) - 30 * 60,),
             fetch_all=True,
         )
         if old_pending_orders:
             for order in old_pending_orders:
-                order_id = order.get("id") if isinstance(order, dict) else order[0]
+                order_id = order.get("id") if isinstance(order, Mapping) else order[0]
                 customer_name = (
-                    order.get("customer_name") if isinstance(order, dict) else order[1]
+                    order.get("customer_name") if isinstance(order, Mapping) else order[1]
                 )
                 total_amount = (
-                    order.get("total_amount") if isinstance(order, dict) else order[2]
+                    order.get("total_amount") if isinstance(order, Mapping) else order[2]
                 )
 
                 # Notify staff about old pending orders
                 staff_members = execute_query("SELECT id FROM staff", fetch_all=True)
                 if staff_members:
                     for staff in staff_members:
-                        staff_id = staff["id"] if isinstance(staff, dict) else staff[0]
+                        staff_id = staff["id"] if isinstance(staff, Mapping) else staff[0]
                         send_automatic_notification(
                             notification_type="old_order",
                             recipient_type="staff",
@@ -5214,6 +7445,7 @@ def get_notifications_for_user(current_user):
         rows = cur.fetchall()
         conn.close()
 
+        sender_names = get_sender_names((r[5], r[6]) for r in rows if r[5] and r[6])
         notes = []
         for r in rows:
             notification = {
@@ -5230,8 +7462,7 @@ def get_notifications_for_user(current_user):
 
             # Add sender name if available
             if r[5] and r[6]:
-                sender_name = get_sender_name(r[5], r[6])
-                notification["sender_name"] = sender_name
+                notification["sender_name"] = sender_names[(r[5], r[6])]
 
             notes.append(notification)
 
@@ -5241,53 +7472,62 @@ def get_notifications_for_user(current_user):
         return []
 
 
-def get_sender_name(sender_type, sender_id):
-    """Get sender name for notification display."""
-    try:
-        if sender_type == "super_admin":
-            return "Super Admin"
-        elif sender_type == "staff":
-            staff = execute_query(
-                "SELECT first_name, last_name FROM staff WHERE id = ?",
-                (sender_id,),
-                fetch_one=True,
-            )
-            if staff:
-                name = f"{staff.get('first_name', '')} {staff.get('last_name', '')}".strip()
-                return name or f"Staff #{sender_id}"
-        elif sender_type == "courier":
-            courier = execute_query(
-                "SELECT first_name, last_name FROM couriers WHERE id = ?",
-                (sender_id,),
-                fetch_one=True,
-            )
-            if courier:
-                name = f"{courier.get('first_name', '')} {courier.get('last_name', '')}".strip()
-                return name or f"Courier #{sender_id}"
-        elif sender_type == "users":
-            user = execute_query(
-                "SELECT first_name, last_name FROM users WHERE id = ?",
-                (sender_id,),
-                fetch_one=True,
-            )
-            if user:
-                name = (
-                    f"{user.get('first_name', '')} {user.get('last_name', '')}".strip()
-                )
-                return name or f"User #{sender_id}"
-        elif sender_type == "system":
-            return "Tizim"
+# sender_type -> (jadval, ism topilmasa yorliq)
+SENDER_NAME_TABLES = {
+    "staff": ("staff", "Staff"),
+    "courier": ("couriers", "Courier"),
+    "users": ("users", "User"),
+}
+SENDER_FIXED_NAMES = {"super_admin": "Super Admin", "system": "Tizim"}
 
-        return "Noma'lum"
-    except Exception as e:
-        app_logger.error(f"get_sender_name error: {e}")
-        return "Noma'lum"
 
+def get_sender_names(senders):
+    """(sender_type, sender_id) juftlari -> yuboruvchi ismi.
 
-def get_time_ago(timestamp):
-    """Convert timestamp to human readable time ago format."""
-    try:
-        from datetime import datetime, timezone
+    Har bir tur (staff/courier/users) uchun bitta IN (...) so'rovi.
+    """
+    names = {}
+    wanted = defaultdict(set)
+    for sender_type, sender_id in senders:
+        if sender_type in SENDER_FIXED_NAMES:
+            names[(sender_type, sender_id)] = SENDER_FIXED_NAMES[sender_type]
+        elif sender_type in SENDER_NAME_TABLES and sender_id is not None:
+            wanted[sender_type].add(sender_id)
+        else:
+            names[(sender_type, sender_id)] = "Noma'lum"
+
+    for sender_type, ids in wanted.items():
+        table, label = SENDER_NAME_TABLES[sender_type]
+        ids = list(ids)
+        found = {}
+        try:
+            # SQLite parametrlar soni chegarasi uchun bo'laklab
+            for i in range(0, len(ids), 500):
+                chunk = ids[i : i + 500]
+                rows = execute_query(
+                    f"SELECT id, first_name, last_name FROM {table} WHERE id IN ({', '.join('?' * len(chunk))})",
+                    tuple(chunk),
+                    fetch_all=True,
+                )
+                for row in rows or []:
+                    name = f"{row[1] or ''} {row[2] or ''}".strip()
+                    found[row[0]] = name or f"{label} #{row[0]}"
+        except Exception as e:
+            app_logger.error(f"get_sender_names error ({sender_type}): {e}")
+        for sender_id in ids:
+            names[(sender_type, sender_id)] = found.get(sender_id, "Noma'lum")
+    return names
+
+
+def get_sender_name(sender_type, sender_id):
+    """Get sender name for notification display."""
+    return get_sender_names([(sender_type, sender_id)])[(sender_type, sender_id)]
+
+
+def get_time_ago(timestamp):
+    """Convert timestamp to human readable time ago format."""
+    try:
+        from datetime import datetime, timezone
 
         # Always compare aware datetimes
         now = datetime.now(timezone.utc)
@@ -5457,6 +7697,7 @@ def superadmin_redirect():
 
 
 @app.route("/api/super-admin/reports")
+@cached(ttl=60, stale_ttl=Config.CACHE_STALE_TTL)
 def api_super_admin_reports():
     try:
         start_date = request.args.get("start_date")
@@ -5484,13 +7725,16 @@ def api_super_admin_reports():
                 start_date = (today - datetime.timedelta(days=29)).strftime("%Y-%m-%d")
                 end_date = today.strftime("%Y-%m-%d")
 
-        with db_pool.get_connection() as conn:
+        # created_ts diapazoni - indeks bo'yicha o'qiladi, butun tarix emas
+        start_ts, end_ts = epoch_day_range(start_date, end_date)
+
+        with db_connection(read_only=True) as conn:
             cur = conn.cursor()
 
             # Buyurtmalar va daromad (use receipts.total_amount)
             cur.execute(
-                "SELECT COUNT(*), COALESCE(SUM(r.total_amount), 0) FROM orders o LEFT JOIN receipts r ON o.id = r.order_id WHERE DATE(o.created_at) >= ? AND DATE(o.created_at) <= ?",
-                (start_date, end_date),
+                "SELECT COUNT(*), COALESCE(SUM(r.total_amount), 0) FROM orders o LEFT JOIN receipts r ON o.id = r.order_id WHERE o.created_ts >= ? AND o.created_ts < ?",
+                (start_ts, end_ts),
             )
             result = cur.fetchone() or (0, 0)
             total_orders = int(result[0]) if result[0] is not None else 0
@@ -5499,8 +7743,8 @@ def api_super_admin_reports():
 
             # Yangi mijozlar (ro'yxatdan o'tganlar)
             cur.execute(
-                "SELECT COUNT(*) FROM users WHERE DATE(created_at) >= ? AND DATE(created_at) <= ?",
-                (start_date, end_date),
+                "SELECT COUNT(*) FROM users WHERE created_ts >= ? AND created_ts < ?",
+                (start_ts, end_ts),
             )
             nc_res = cur.fetchone()
             new_customers = int(nc_res[0]) if nc_res and nc_res[0] is not None else 0
@@ -5519,8 +7763,8 @@ def api_super_admin_reports():
                     "%Y-%m-%d"
                 )
                 cur.execute(
-                    "SELECT COUNT(*) FROM orders WHERE DATE(created_at) >= ? AND DATE(created_at) <= ?",
-                    (prev_start, prev_end),
+                    "SELECT COUNT(*) FROM orders WHERE created_ts >= ? AND created_ts < ?",
+                    epoch_day_range(prev_start, prev_end),
                 )
                 po = cur.fetchone()
                 prev_orders = int(po[0]) if po and po[0] is not None else 0
@@ -5538,8 +7782,8 @@ def api_super_admin_reports():
 
             # Sotuvlar (kunlik)
             cur.execute(
-                "SELECT DATE(o.created_at) as date, COUNT(*) as orders_count, COALESCE(SUM(r.total_amount),0) as revenue FROM orders o LEFT JOIN receipts r ON o.id = r.order_id WHERE DATE(o.created_at) >= ? AND DATE(o.created_at) <= ? GROUP BY DATE(o.created_at) ORDER BY date ASC",
-                (start_date, end_date),
+                "SELECT DATE(o.created_ts, 'unixepoch') as date, COUNT(*) as orders_count, COALESCE(SUM(r.total_amount),0) as revenue FROM orders o LEFT JOIN receipts r ON o.id = r.order_id WHERE o.created_ts >= ? AND o.created_ts < ? GROUP BY date ORDER BY date ASC",
+                (start_ts, end_ts),
             )
             sales = []
             rows = cur.fetchall() or []
@@ -5651,12 +7895,12 @@ def api_super_admin_export_report():
                     # extract headers
                     headers = set()
                     for row in sales:
-                        headers.update(row.keys() if isinstance(row, dict) else [])
+                        headers.update(row.keys() if isinstance(row, Mapping) else [])
                     headers = list(headers)
                     text.append(",".join(headers))
                     for row in sales:
                         row_vals = [
-                            str(row.get(h, "")) if isinstance(row, dict) else ""
+                            str(row.get(h, "")) if isinstance(row, Mapping) else ""
                             for h in headers
                         ]
                         text.append(",".join(row_vals))
@@ -5942,7 +8186,7 @@ def admin_monitor():
     cleanup_expired_orders()
 
     try:
-        conn = get_db()
+        conn = get_read_db()
         cur = conn.cursor()
 
         # Waiting orders - kutayotgan buyurtmalar
@@ -6013,6 +8257,7 @@ def admin_monitor():
 # Admin utility: delete all products and seed 4 test products (super_admin only)
 @app.route('/admin/delete_all_products_and_seed', methods=['POST'])
 @role_required('super_admin')
+@invalidates("menu", "cart")
 def admin_delete_all_products_and_seed():
     """Dangerous admin endpoint: deletes all menu items, product_media, ratings,
     favorites, cart items (best-effort), then inserts 4 simple test products.
@@ -6079,14 +8324,6 @@ def admin_delete_all_products_and_seed():
         conn.commit()
         conn.close()
 
-        # Clear menu cache if any
-        try:
-            cm = cache_manager or get_cache_manager()
-            if cm:
-                cm.delete("menu_items_active")
-        except Exception:
-            pass
-
         return jsonify({"success": True, "message": "Menu wiped and 4 test products seeded"})
     except Exception as e:
         app_logger.error(f"admin_delete_all_products_and_seed error: {e}")
@@ -6108,16 +8345,27 @@ def login_required(f):
     return wrapper
 
 
-def rate_limit(max_requests=100, window=3600):
-    "Rate limiting decorator"
+def rate_limit_response(retry_after):
+    "429 javobi (rate_limit_error) + Retry-After sarlavhasi"
+    response = app.make_response(rate_limit_error(None))
+    response.headers["Retry-After"] = str(max(1, math.ceil(retry_after)))
+    return response
+
+
+def rate_limit(policy):
+    "Rate limiting decorator (policy - RATE_LIMIT_POLICIES dagi nom)"
+    rate_limiter._rules(policy)  # noto'g'ri nom import paytida aniqlansin
 
     def decorator(f):
         @wraps(f)
         def wrapper(*args, **kwargs):
-            identifier = request.remote_addr
-            if not rate_limiter.is_allowed(identifier, max_requests, window):
+            allowed, retry_after = rate_limiter.hit(request.remote_addr, policy)
+            if not allowed:
                 if request.is_json:
-                    return jsonify({"error": "Rate limit exceeded"}), 429
+                    response = jsonify({"error": "Rate limit exceeded"})
+                    response.status_code = 429
+                    response.headers["Retry-After"] = str(max(1, math.ceil(retry_after)))
+                    return response
                 flash("Juda ko'p so'rov yuborildi. Biroz kuting.", "error")
                 return redirect(url_for("index"))
             return f(*args, **kwargs)
@@ -6127,8 +8375,11 @@ def rate_limit(max_requests=100, window=3600):
     return decorator
 
 
-def cache_result(ttl=300):
-    "Result caching decorator"
+def cache_result(ttl=300, tags=(), stale_ttl=0):
+    """Result caching decorator (tags - CacheManager.invalidate_tags uchun).
+
+    stale_ttl > 0 bo'lsa muddati o'tgan natija yangilanish paytida beriladi.
+    """
 
     def decorator(f):
         @wraps(f)
@@ -6142,25 +8393,151 @@ def cache_result(ttl=300):
             except Exception:
                 cm = None
 
-            if cm:
-                try:
-                    cached_result = cm.get(cache_key)
-                    if cached_result is not None:
-                        return cached_result
-                except Exception:
-                    # Fallthrough to compute result
-                    pass
+            if not cm:
+                return f(*args, **kwargs)
 
-            # Yangi natija hisoblash va cache ga saqlash
-            result = f(*args, **kwargs)
+            # Yangi natijani faqat bitta thread hisoblaydi (single-flight)
+            return cm.get_or_compute(
+                cache_key,
+                lambda: f(*args, **kwargs),
+                ttl,
+                tags=tags,
+                stale_ttl=stale_ttl,
+            )
 
-            if cm:
-                try:
-                    cm.set(cache_key, result, ttl)
-                except Exception:
-                    pass
+        return wrapper
+
+    return decorator
+
+
+# ---- SAHIFA KESHI ----
+# Shaxsiy qiymatlar shell sahifada marker bilan render qilinadi va har bir
+# so'rovda joriy sessiyadagi qiymat bilan almashtiriladi
+PAGE_FRAGMENT_FIELDS = ("user_name", "user_first_name", "user_email", "user_avatar")
+# user_id shablonda tojson bilan ham chiqadi - shuning uchun raqamli marker
+PAGE_USER_ID_MARKER = 987650000000001
+_PAGE_MARKER_RE = re.compile(r"__page_fragment_([a-z_]+?)__")
+
+
+def _page_marker(name):
+    return f"__page_fragment_{name}__"
+
+
+def page_cache_variant():
+    """Sahifa keshi kalitining vary o'lchamlari yoki None (keshlanmaydi).
+
+    Til, mavzu, shrift o'lchami, rol va qaysi shaxsiy maydonlar to'ldirilgani
+    (shablondagi `or` / default qiymatlar shunga qarab tanlanadi). Xodim,
+    kuryer va super admin sahifalari hamda flash xabari bor so'rovlar
+    keshlanmaydi.
+    """
+    if session.get("staff_id") or session.get("courier_id") or session.get("super_admin"):
+        return None
+    if session.get("_flashes"):
+        return None
+    user_id = session.get("user_id")
+    if user_id and not isinstance(user_id, int):
+        return None
+    return (
+        session.get("interface_language", "uz"),
+        session.get("dark_theme"),
+        session.get("font_size", "medium"),
+        "user" if user_id else "anonymous",
+        [field for field in PAGE_FRAGMENT_FIELDS if session.get(field)],
+    )
+
+
+def page_shell_context():
+    """page_cache shell renderida shaxsiy qiymatlar o'rniga markerlar.
+
+    View render_template ga shu contextni qo'shadi; oddiy renderda {}.
+    Aniq berilgan context processor qiymatlaridan ustun turadi.
+    """
+    if not g.get("page_shell"):
+        return {}
+    g.page_shell_used = True
+    shell_session = dict(session)
+    for field in PAGE_FRAGMENT_FIELDS:
+        if session.get(field):
+            shell_session[field] = _page_marker(field)
+    user_profile = {}
+    if session.get("user_id"):
+        shell_session["user_id"] = PAGE_USER_ID_MARKER
+        # inject_navbar_context bilan bir xil tuzilma
+        user_profile = {
+            "name": shell_session.get("user_name")
+            or shell_session.get("user_first_name")
+            or "",
+            "avatar": shell_session.get("user_avatar") or None,
+            "email": shell_session.get("user_email") or None,
+        }
+    return {
+        "session": shell_session,
+        "csrf_token": _page_marker("csrf_token"),
+        "user_profile": user_profile,
+    }
+
+
+def fill_page_fragments(html):
+    "Shell sahifadagi markerlarni joriy sessiya qiymatlari bilan almashtirish"
+    values = {"csrf_token": generate_csrf_token()}
+    for field in PAGE_FRAGMENT_FIELDS:
+        values[field] = session.get(field) or ""
+    if session.get("user_id"):
+        html = html.replace(str(PAGE_USER_ID_MARKER), str(int(session["user_id"])))
+    return _PAGE_MARKER_RE.sub(
+        lambda m: str(escape(values.get(m.group(1), ""))), html
+    )
+
+
+def page_cache(ttl=None, tags=(), stale_ttl=None, prepare=None):
+    """Sahifa (HTML) keshi: har bir vary varianti bir marta render qilinadi.
+
+    Anonim mehmonlar to'liq sahifa hit oladi; oddiy foydalanuvchilar umumiy
+    shell + ism/email/avatar/user_id/CSRF fragmentlari. View natijasi faqat
+    u page_shell_context() bilan render qilingan satr bo'lsa keshlanadi.
+    prepare() har so'rovda kesh tekshiruvidan oldin chaqiriladi.
+    """
+    ttl = Config.PAGE_CACHE_TTL if ttl is None else ttl
+    stale_ttl = Config.CACHE_STALE_TTL if stale_ttl is None else stale_ttl
+
+    def decorator(fn):
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            if prepare:
+                prepare()
+            try:
+                cm = cache_manager or get_cache_manager()
+            except Exception:
+                cm = None
+            variant = page_cache_variant()
+            if not cm or variant is None:
+                return fn(*args, **kwargs)
 
-            return result
+            cache_key = f"page:{fn.__name__}:{json.dumps([kwargs, variant], sort_keys=True, default=str)}"
+            computed = []
+
+            def compute():
+                g.page_shell = True
+                g.page_shell_used = False
+                try:
+                    result = fn(*args, **kwargs)
+                finally:
+                    g.page_shell = False
+                if g.pop("page_shell_used", False) and isinstance(result, str):
+                    return result
+                # Oddiy (real sessiya bilan) render yoki redirect - keshlanmaydi
+                computed.append(result)
+                return None
+
+            shell = cm.get_or_compute(
+                cache_key, compute, ttl, tags=tags, stale_ttl=stale_ttl
+            )
+            if shell is not None:
+                return fill_page_fragments(shell)
+            if computed:
+                return computed[0]
+            return fn(*args, **kwargs)
 
         return wrapper
 
@@ -6206,163 +8583,100 @@ def validate_json(required_fields=None):
 
 
 # ---- MENU ----
-@app.route("/menu")
-@rate_limit(max_requests=10000, window=60)  # Очень высокий лимит для меню
-@cache_result(ttl=120)
-def menu():
-    "Optimized menu endpoint"
+def load_menu_user_profile():
+    "Menyu sahifasi uchun foydalanuvchi profilini sessiyaga yuklash (navbar uchun)"
+    user_id = session.get("user_id")
+    # Load basic user profile into session so templates can display profile info
+    # (menu is a commonly visited page and templates expect session.* fields)
     try:
-        # Cache dan menu ma'lumotlarini olish (lazy-get)
-        try:
-            cm = cache_manager or get_cache_manager()
-        except Exception:
-            cm = None
-
-        cached_menu = None
-        if cm:
-            try:
-                cached_menu = cm.get("menu_items_active")
-            except Exception:
-                cached_menu = None
-
-        if not cached_menu:
-            menu_items_raw = execute_query(
-                """SELECT m.*, COALESCE(AVG(r.rating), 0) as avg_rating, COUNT(r.rating) as rating_count
-                   FROM menu_items m
-                   LEFT JOIN ratings r ON m.id = r.menu_item_id
-                   WHERE m.available = 1
-                   GROUP BY m.id
-                   ORDER BY m.category, m.orders_count DESC, m.name""",
-                fetch_all=True,
+        if (
+            user_id
+            and not session.get("staff_id")
+            and not session.get("courier_id")
+            and not session.get("super_admin")
+        ):
+            user_profile = execute_query(
+                "SELECT phone, address, address_latitude, address_longitude, first_name, last_name, email, card_number FROM users WHERE id = ?",
+                (user_id,),
+                fetch_one=True,
             )
-            # Convert rows to dictionaries safely
-            menu_items = []
-            for row in menu_items_raw:
+            if user_profile:
+                # user_profile may be None or a tuple; handle both safely
                 try:
-                    menu_items.append(dict(row))
-                except Exception as e:
-                    app_logger.warning(f"Menu item row processing error: {str(e)}")
-                    continue  # Skip problematic row
-
-            # Cache ga saqlash (safe)
-            if cm:
+                    session["user_phone"] = user_profile.get("phone", "") or ""
+                    session["user_address"] = user_profile.get("address", "") or ""
+                    session["user_address_latitude"] = user_profile.get(
+                        "address_latitude"
+                    )
+                    session["user_address_longitude"] = user_profile.get(
+                        "address_longitude"
+                    )
+                    session["user_first_name"] = (
+                        user_profile.get("first_name", "") or ""
+                    )
+                    session["user_last_name"] = (
+                        user_profile.get("last_name", "") or ""
+                    )
+                except Exception:
+                    # tuple-style access fallback
+                    try:
+                        session["user_phone"] = user_profile[0] or ""
+                    except Exception:
+                        session["user_phone"] = ""
+                    try:
+                        session["user_address"] = user_profile[1] or ""
+                    except Exception:
+                        session["user_address"] = ""
+                    # best-effort for remaining fields
+                    session.setdefault("user_address_latitude", None)
+                    session.setdefault("user_address_longitude", None)
+                    session.setdefault("user_first_name", "")
+                    session.setdefault("user_last_name", "")
+                # Expose combined display name for templates
                 try:
-                    cm.set("menu_items_active", menu_items, 120)
+                    fn = session.get("user_first_name", "") or ""
+                    ln = session.get("user_last_name", "") or ""
+                    session["user_name"] = (
+                        (fn + " " + ln).strip()
+                        if (fn or ln)
+                        else session.get("user_name", "")
+                    )
                 except Exception:
-                    pass
-        else:
-            menu_items = cached_menu
+                    session["user_name"] = session.get("user_name", "")
+                session["user_email"] = user_profile.get("email", "") or ""
+                session["user_card_number"] = (
+                    user_profile.get("card_number", "") or ""
+                )
+    except Exception as profile_load_err:
+        app_logger.warning(
+            f"Failed to load user profile into session for menu: {str(profile_load_err)}"
+        )
+
+
+@app.route("/menu")
+@rate_limit("menu")
+@page_cache(tags=("menu", "ratings"), prepare=load_menu_user_profile)
+def menu():
+    "Optimized menu endpoint"
+    try:
+        # Katalog snapshotidan (DB ga murojaat yo'q); menyu o'zgarsa "menu"
+        # tegi uni bekor qiladi va bitta thread yangisini quradi, yangi baho
+        # ("ratings") faqat baholar qatlamini almashtiradi
+        menu_items = get_catalog_snapshot().menu_items()
 
         # Treat menu_items as product catalogue (shoe shop) - men only.
         # All products are now categorized as men's shoes.
         men = menu_items  # All items are for men
         women = []  # No women's items
 
-        # Foydalanuvchi sevimlilarini olish
-        favorites = []
-        user_id = session.get("user_id")
-        if user_id:
-            try:
-                favorites_raw = execute_query(
-                    "SELECT menu_item_id FROM favorites WHERE user_id = ?",
-                    (user_id,),
-                    fetch_all=True,
-                )
-                if not favorites_raw:
-                    favorites = []
-                else:
-                    try:
-                        favorites = [
-                            fav["menu_item_id"] for fav in favorites_raw if fav
-                        ]
-                    except Exception:
-                        # fallback for tuple rows
-                        favs = []
-                        for fav in favorites_raw:
-                            try:
-                                if isinstance(fav, (list, tuple)) and len(fav) > 0:
-                                    favs.append(fav[0])
-                            except Exception:
-                                continue
-                        favorites = favs
-            except Exception as fav_error:
-                app_logger.error(f"Favorites fetching error: {str(fav_error)}")
-                favorites = []
-
-        # Load basic user profile into session so templates can display profile info
-        # (menu is a commonly visited page and templates expect session.* fields)
-        try:
-            if (
-                user_id
-                and not session.get("staff_id")
-                and not session.get("courier_id")
-                and not session.get("super_admin")
-            ):
-                user_profile = execute_query(
-                    "SELECT phone, address, address_latitude, address_longitude, first_name, last_name, email, card_number FROM users WHERE id = ?",
-                    (user_id,),
-                    fetch_one=True,
-                )
-                if user_profile:
-                    # user_profile may be None or a tuple; handle both safely
-                    try:
-                        session["user_phone"] = user_profile.get("phone", "") or ""
-                        session["user_address"] = user_profile.get("address", "") or ""
-                        session["user_address_latitude"] = user_profile.get(
-                            "address_latitude"
-                        )
-                        session["user_address_longitude"] = user_profile.get(
-                            "address_longitude"
-                        )
-                        session["user_first_name"] = (
-                            user_profile.get("first_name", "") or ""
-                        )
-                        session["user_last_name"] = (
-                            user_profile.get("last_name", "") or ""
-                        )
-                    except Exception:
-                        # tuple-style access fallback
-                        try:
-                            session["user_phone"] = user_profile[0] or ""
-                        except Exception:
-                            session["user_phone"] = ""
-                        try:
-                            session["user_address"] = user_profile[1] or ""
-                        except Exception:
-                            session["user_address"] = ""
-                        # best-effort for remaining fields
-                        session.setdefault("user_address_latitude", None)
-                        session.setdefault("user_address_longitude", None)
-                        session.setdefault("user_first_name", "")
-                        session.setdefault("user_last_name", "")
-                    # Expose combined display name for templates
-                    try:
-                        fn = session.get("user_first_name", "") or ""
-                        ln = session.get("user_last_name", "") or ""
-                        session["user_name"] = (
-                            (fn + " " + ln).strip()
-                            if (fn or ln)
-                            else session.get("user_name", "")
-                        )
-                    except Exception:
-                        session["user_name"] = session.get("user_name", "")
-                    session["user_email"] = user_profile.get("email", "") or ""
-                    session["user_card_number"] = (
-                        user_profile.get("card_number", "") or ""
-                    )
-        except Exception as profile_load_err:
-            app_logger.warning(
-                f"Failed to load user profile into session for menu: {str(profile_load_err)}"
-            )
-
         # Render menu using clothing store categories (women/men)
-        return render_template(
-            "menu.html",
-            women=women,
-            men=men,
-            favorites=favorites,
-            current_page="menu",
-        )
+        context = {
+            "women": women,
+            "men": men,
+            "current_page": "menu",
+        }
+        context.update(page_shell_context())
+        return render_template("menu.html", **context)
 
     except Exception as e:
         app_logger.error(f"Menu endpoint error: {str(e)}")
@@ -6385,22 +8699,169 @@ def menu():
             return redirect(url_for("index"))
 
 
+def load_product_media(item_ids=None):
+    """menu_item_id -> galereya ro'yxati, bitta IN (...) so'rovida.
+
+    Har bir ro'yxat is_main DESC, display_order ASC tartibida (mahsulot sahifasi
+    bilan bir xil). Media yo'q mahsulotlar uchun bo'sh ro'yxat. item_ids None -
+    barcha mahsulotlar bitta so'rovda (katalog snapshoti uchun).
+    """
+    query = f"SELECT menu_item_id, {', '.join(CATALOG_MEDIA_FIELDS)} FROM product_media"
+    order = "ORDER BY menu_item_id, is_main DESC, display_order ASC, id ASC"
+    if item_ids is None:
+        chunks = [None]
+        media = {}
+    else:
+        ids = list(dict.fromkeys(i for i in item_ids if i is not None))
+        # SQLite parametrlar soni chegarasi uchun bo'laklab
+        chunks = [ids[i : i + 500] for i in range(0, len(ids), 500)]
+        media = {item_id: [] for item_id in ids}
+    for chunk in chunks:
+        if chunk is None:
+            rows = execute_query(f"{query} {order}", fetch_all=True)
+        else:
+            rows = execute_query(
+                f"{query} WHERE menu_item_id IN ({', '.join('?' * len(chunk))}) {order}",
+                tuple(chunk),
+                fetch_all=True,
+            )
+        for row in rows or []:
+            entry = dict(row)
+            media.setdefault(entry.pop("menu_item_id"), []).append(entry)
+    return media
+
+
+# FTS5 qidiruvi (migrations/0005_menu_search_fts.py)
+MENU_FTS_TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+MENU_FTS_MAX_TOKENS = 10
+# bm25 ustun og'irliklari: name, description, category, colors
+MENU_FTS_WEIGHTS = (10.0, 2.0, 4.0, 1.0)
+# highlight() belgilari - HTML escape dan keyin <mark> ga almashtiriladi
+MENU_FTS_MARK = ("\x02", "\x03")
+
+# Migratsiyalar yaratadigan ixtiyoriy jadvallar: nom -> mavjudmi
+_schema_tables = {}
+
+
+def sqlite_table_exists(name):
+    "Jadval mavjudmi (birinchi chaqiruvda bir marta tekshiriladi)"
+    if name not in _schema_tables:
+        try:
+            row = execute_query(
+                "SELECT 1 FROM sqlite_master WHERE type='table' AND name=?",
+                (name,),
+                fetch_one=True,
+            )
+        except Exception:
+            return False
+        _schema_tables[name] = bool(row)
+    return _schema_tables[name]
+
+
+def menu_search_fts_available():
+    return sqlite_table_exists("menu_items_fts")
+
+
+def build_menu_fts_query(q):
+    """Foydalanuvchi matni -> FTS5 MATCH ifodasi.
+
+    Har bir so'z qo'shtirnoq ichida prefiks sifatida ("qor"* -> qora, qoraqo'tir),
+    so'zlar orasida AND. FTS5 operatorlari (OR, NEAR, *, ^) oddiy matn bo'lib qoladi.
+    """
+    tokens = MENU_FTS_TOKEN_RE.findall(q)[:MENU_FTS_MAX_TOKENS]
+    return " ".join(f'"{token}"*' for token in tokens)
+
+
+def _menu_fts_highlight(text):
+    "highlight()/snippet() natijasi: HTML escape + belgilar -> <mark>"
+    if not text:
+        return text
+    start, end = MENU_FTS_MARK
+    return str(escape(text)).replace(start, "<mark>").replace(end, "</mark>")
+
+
+def search_menu_fts(match, where_clauses, params, order_by=None):
+    """menu_items_fts bo'yicha qidiruv (BM25 tartib); xatoda None - LIKE ga qaytiladi."""
+    start, end = MENU_FTS_MARK
+    weights = ", ".join(str(w) for w in MENU_FTS_WEIGHTS)
+    sql = f"""
+        SELECT m.*,
+               highlight(menu_items_fts, 0, ?, ?) AS fts_name,
+               snippet(menu_items_fts, 1, ?, ?, '…', 16) AS fts_description
+        FROM menu_items_fts JOIN menu_items m ON m.id = menu_items_fts.rowid
+        WHERE menu_items_fts MATCH ? AND {" AND ".join(where_clauses)}
+        {order_by or f"ORDER BY bm25(menu_items_fts, {weights}), m.id"}
+        LIMIT 200
+    """
+    try:
+        rows = execute_query(
+            sql, [start, end, start, end, match, *params], fetch_all=True
+        )
+    except Exception as e:
+        app_logger.warning(f"FTS menu search failed, using LIKE: {str(e)}")
+        if "no such table" in str(e):
+            _schema_tables.pop("menu_items_fts", None)
+        return None
+
+    items = []
+    for row in rows or []:
+        item = dict(row)
+        item["highlight"] = {
+            "name": _menu_fts_highlight(item.pop("fts_name")),
+            "description": _menu_fts_highlight(item.pop("fts_description")),
+        }
+        items.append(item)
+    return items
+
+
+# menu_items ustuni -> (facet jadvali, qiymat ustuni) - migrations/0006_menu_facets.py
+MENU_FACET_TABLES = {
+    "sizes": ("menu_item_sizes", "size"),
+    "colors": ("menu_item_colors", "color"),
+}
+
+
+def menu_option_filter(source, value):
+    """sizes/colors bo'yicha WHERE sharti: (sql, params).
+
+    Facet jadvali bo'lsa indeks bo'yicha aniq moslik, aks holda CSV ichida LIKE.
+    """
+    table, column = MENU_FACET_TABLES[source]
+    if sqlite_table_exists(table):
+        return f"m.id IN (SELECT menu_item_id FROM {table} WHERE {column} = ?)", [value]
+    # Use LIKE to match value inside CSV (e.g., '36,37,38')
+    return (
+        f"(m.{source} LIKE ? OR m.{source} LIKE ? OR m.{source} LIKE ? OR m.{source} = ?)",
+        [f"%,{value},%", f"{value},%", f"%,{value}", value],
+    )
+
+
 @app.route("/api/menu-search", methods=["GET"])
-@rate_limit(max_requests=5000, window=60)  # Высокий лимит для API
+@rate_limit("api")
+@catalog_etag
 @cached(
-    ttl=30,
-    key_func=lambda req, *a, **k: f"menu_search:{json.dumps(dict(req.args), sort_keys=True)}",
+    ttl=Config.CACHE_TAGGED_TTL,
+    key_func=lambda req, *a, **k: (
+        f"menu_search:{get_catalog_snapshot().version}:"
+        f"{json.dumps(dict(req.args), sort_keys=True)}"
+    ),
+    tags=("menu",),
 )
 def api_menu_search():
     """API: Search and filter menu items.
 
     Query params supported:
-      - q: full-text search on name and description
+      - q: full-text search on name, description, category and colors
+        (FTS5: BM25 bo'yicha tartib, har bir so'z prefiks sifatida; FTS5
+        bo'lmasa name/description LIKE)
       - category: exact match (e.g., 'product', 'food', 'drink')
       - min_price, max_price: numeric bounds
       - size, color: comma-separated single values to match inside sizes/colors fields
       - sort: 'price_asc', 'price_desc', 'popularity', 'rating'
-    Returns JSON: { success: True, items: [...] }
+        (q berilganda va sort bo'lmasa - relevance)
+    Returns JSON: { success: True, items: [...] }; FTS natijalarida har bir
+    item da highlight: {name, description} (<mark> bilan, HTML-escape qilingan).
+    q siz so'rovlar katalog snapshotidan (facet indeksi) - DB ga murojaat yo'q.
     """
     try:
         q = (request.args.get("q") or "").strip()
@@ -6411,92 +8872,572 @@ def api_menu_search():
         color = (request.args.get("color") or "").strip()
         sort = (request.args.get("sort") or "").strip()
 
-        where_clauses = ["available = 1"]
+        where_clauses = ["m.available = 1"]
         params = []
-
-        if q:
-            # simple LIKE search on name and description
-            where_clauses.append("(name LIKE ? OR description LIKE ?)")
-            like_q = f"%{q}%"
-            params.extend([like_q, like_q])
+        price_bounds = {}
 
         if category:
-            where_clauses.append("category = ?")
+            where_clauses.append("m.category = ?")
             params.append(category)
 
         if min_price:
             try:
                 mp = float(min_price)
-                where_clauses.append("price >= ?")
+                where_clauses.append("m.price >= ?")
                 params.append(mp)
+                price_bounds["min_price"] = mp
             except Exception:
                 pass
 
         if max_price:
             try:
                 mp = float(max_price)
-                where_clauses.append("price <= ?")
+                where_clauses.append("m.price <= ?")
                 params.append(mp)
+                price_bounds["max_price"] = mp
             except Exception:
                 pass
 
-        # Size and color are stored as CSV or JSON in sizes/colors columns
-        if size:
-            # Use LIKE to match value inside CSV (e.g., '36,37,38')
-            where_clauses.append(
-                "(sizes LIKE ? OR sizes LIKE ? OR sizes LIKE ? OR sizes = ?)"
-            )
-            params.extend([f"%,{size},%", f"{size},%", f"%,{size}", size])
+        # Size and color: facet jadvallari bo'yicha (CSV/JSON sizes/colors ustunlari)
+        for source, value in (("sizes", size), ("colors", color)):
+            if value:
+                clause, clause_params = menu_option_filter(source, value)
+                where_clauses.append(clause)
+                params.extend(clause_params)
+
+        order_by = None
+        if sort == "price_asc":
+            order_by = "ORDER BY m.price ASC"
+        elif sort == "price_desc":
+            order_by = "ORDER BY m.price DESC"
+        elif sort == "popularity":
+            order_by = "ORDER BY m.orders_count DESC"
+        elif sort == "rating":
+            order_by = "ORDER BY m.rating DESC"
+
+        catalog = get_catalog_snapshot()
+        items = None
+        match = build_menu_fts_query(q) if q else ""
+        if match and menu_search_fts_available():
+            items = search_menu_fts(match, where_clauses, params, order_by)
+        elif not q:
+            items = catalog.search(
+                sort=sort,
+                category=category or None,
+                size=size or None,
+                color=color or None,
+                **price_bounds,
+            )
+
+        if items is None:
+            if q:
+                # simple LIKE search on name and description
+                where_clauses.append("(m.name LIKE ? OR m.description LIKE ?)")
+                like_q = f"%{q}%"
+                params.extend([like_q, like_q])
+            where_sql = " AND ".join(where_clauses)
+            sql = (
+                f"SELECT m.* FROM menu_items m WHERE {where_sql} "
+                f"{order_by or 'ORDER BY m.category, m.name'} LIMIT 200"
+            )
+            items_raw = execute_query(sql, params, fetch_all=True)
+            items = [dict(r) for r in items_raw or []]
+
+        # Attach media gallery for the items (images/videos) - snapshotdan
+        for item in items:
+            item["media"] = catalog.item_media(item["id"])
+
+        return jsonify({"success": True, "items": items})
+    except Exception as e:
+        app_logger.error(f"api_menu_search error: {str(e)}")
+        return jsonify({"success": False, "message": "Search failed"}), 500
+
+
+# Narx facet chegaralari (so'm): <50k, 50k-100k, ..., 500k+
+MENU_PRICE_BUCKETS = (50000, 100000, 200000, 500000)
+
+
+class MenuFacetIndex:
+    """Mavjud (available = 1) mahsulotlar bo'yicha teskari indeks.
+
+    Har bir facet qiymati -> mahsulot id lari to'plami; facet sonlari filtr
+    to'plamlarining kesishmasi bilan hisoblanadi (jadval skanisiz). Har bir
+    facet uchun o'z filtri hisobga olinmaydi - UI boshqa variantlar sonini ham
+    ko'rsata oladi.
+    """
+
+    def __init__(self, items, sizes=(), colors=()):
+        self.ids = set()
+        self.category = defaultdict(set)
+        self.price_bucket = defaultdict(set)
+        self.size = defaultdict(set)
+        self.color = defaultdict(set)
+        prices = []
+        for item_id, category, price in items:
+            self.ids.add(item_id)
+            if category:
+                self.category[category].add(item_id)
+            price = float(price or 0)
+            prices.append((price, item_id))
+            self.price_bucket[bisect.bisect_right(MENU_PRICE_BUCKETS, price)].add(item_id)
+        self.prices = sorted(prices)
+        self._price_keys = [p for p, _ in self.prices]
+        for postings, pairs in ((self.size, sizes), (self.color, colors)):
+            for item_id, value in pairs:
+                if item_id in self.ids:
+                    postings[value].add(item_id)
+
+    @staticmethod
+    def load_options():
+        "O'lcham va ranglar: {'sizes': [(menu_item_id, qiymat)], 'colors': [...]}"
+        facets = {}
+        for source, (table, column) in MENU_FACET_TABLES.items():
+            if sqlite_table_exists(table):
+                rows = execute_query(
+                    f"SELECT menu_item_id, {column} FROM {table}", fetch_all=True
+                )
+            else:
+                # Facet jadvali yo'q - CSV ni Python da ajratish
+                rows = [
+                    (r[0], value.strip())
+                    for r in execute_query(
+                        f"SELECT id, {source} FROM menu_items WHERE available = 1",
+                        fetch_all=True,
+                    )
+                    or []
+                    for value in str(r[1] or "").split(",")
+                    if value.strip()
+                ]
+            facets[source] = [(r[0], r[1]) for r in rows or []]
+        return facets
+
+    @staticmethod
+    def _matching(postings, value):
+        "Katta-kichik harfga qaramasdan (NOCASE jadval bilan bir xil)"
+        if value in postings:
+            return postings[value]
+        folded = value.casefold()
+        found = set()
+        for key, ids in postings.items():
+            if key.casefold() == folded:
+                found |= ids
+        return found
+
+    def price_range(self, min_price=None, max_price=None):
+        lo = 0 if min_price is None else bisect.bisect_left(self._price_keys, min_price)
+        hi = (
+            len(self.prices)
+            if max_price is None
+            else bisect.bisect_right(self._price_keys, max_price)
+        )
+        return {item_id for _, item_id in self.prices[lo:hi]}
+
+    def _filters(self, ids=None, category=None, size=None, color=None, min_price=None, max_price=None):
+        "filtr nomi -> mos id lar to'plami (None - filtr yo'q)"
+        filters = {"q": ids}
+        if category:
+            filters["category"] = self.category.get(category, set())
+        if size:
+            filters["size"] = self._matching(self.size, size)
+        if color:
+            filters["color"] = self._matching(self.color, color)
+        if min_price is not None or max_price is not None:
+            filters["price"] = self.price_range(min_price, max_price)
+        return filters
+
+    def _intersect(self, filters, exclude=None):
+        sets = sorted(
+            (v for k, v in filters.items() if v is not None and k != exclude), key=len
+        )
+        if not sets:
+            return self.ids
+        result = self.ids.intersection(sets[0])
+        for other in sets[1:]:
+            result &= other
+        return result
+
+    def matching(self, ids=None, category=None, size=None, color=None, min_price=None, max_price=None):
+        "Barcha filtrlarga mos mahsulot id lari"
+        return self._intersect(
+            self._filters(ids, category, size, color, min_price, max_price)
+        )
+
+    def counts(self, ids=None, category=None, size=None, color=None, min_price=None, max_price=None):
+        """Joriy filtr uchun facet sonlari.
+
+        ids - qidiruv (q) natijasi id lari yoki None.
+        """
+        filters = self._filters(ids, category, size, color, min_price, max_price)
+
+        def matching(exclude=None):
+            return self._intersect(filters, exclude)
+
+        def count(postings, exclude):
+            base = matching(exclude)
+            counted = {key: len(ids & base) for key, ids in sorted(postings.items())}
+            return {key: n for key, n in counted.items() if n}
+
+        price_base = matching("price")
+        bounds = (0,) + MENU_PRICE_BUCKETS
+        price = [
+            {
+                "min": bounds[i],
+                "max": MENU_PRICE_BUCKETS[i] if i < len(MENU_PRICE_BUCKETS) else None,
+                "count": len(self.price_bucket.get(i, set()) & price_base),
+            }
+            for i in range(len(bounds))
+        ]
+        return {
+            "total": len(matching()),
+            "category": count(self.category, "category"),
+            "size": count(self.size, "size"),
+            "color": count(self.color, "color"),
+            "price": price,
+        }
+
+
+# product_media ustunlari (load_product_media tartibida)
+CATALOG_MEDIA_FIELDS = ("id", "media_type", "media_url", "display_order", "is_main")
+# /api/menu-search sort -> (ustun, kamayish bo'yicha)
+CATALOG_SORTS = {
+    "price_asc": ("price", False),
+    "price_desc": ("price", True),
+    "popularity": ("orders_count", True),
+    "rating": ("rating", True),
+}
+
+
+class CatalogSnapshot:
+    """Katalogning o'zgarmas nusxasi: mahsulotlar, media, baholar, facet indeksi.
+
+    Qatorlar tuple sifatida saqlanadi (ustun nomlari bitta umumiy tuple da),
+    o'quvchilar har safar yangi dict nusxasini oladi - snapshot o'zgartirilmaydi,
+    yangisi quriladi va bitta havola almashtiriladi. version - tarkib hash i
+    (bir xil ma'lumot uchun barcha workerlarda bir xil), katalog javoblarining ETag i.
+
+    Baholar alohida qatlam ("ratings" tegi): har bir bahoda katalog qayta
+    yuklanmaydi, with_ratings() faqat shu qatlamni almashtirgan nusxa beradi.
+    catalog_version - baholarsiz tarkib hash i.
+    """
+
+    def __init__(self, columns, rows, menu_order=(), ratings=None, media=None, sizes=(), colors=()):
+        self.columns = tuple(columns)
+        self._index = {name: i for i, name in enumerate(self.columns)}
+        # "ORDER BY category, name" tartibida, barcha mahsulotlar
+        self.rows = {row[self._index["id"]]: tuple(row) for row in rows}
+        self.order = tuple(self.rows)
+        available = self._index.get("available")
+        self.available = frozenset(
+            item_id
+            for item_id, row in self.rows.items()
+            if available is None or row[available]
+        )
+        # /menu tartibi: category, orders_count DESC, name
+        self.menu_order = tuple(i for i in menu_order if i in self.available)
+        self.media = {
+            item_id: tuple(tuple(entry) for entry in entries)
+            for item_id, entries in (media or {}).items()
+            if item_id in self.rows and entries
+        }
+        self.facets = MenuFacetIndex(
+            [
+                (item_id, self.value(item_id, "category"), self.value(item_id, "price"))
+                for item_id in self.order
+                if item_id in self.available
+            ],
+            sizes,
+            colors,
+        )
+        digest = hashlib.sha256()
+        for part in (
+            self.columns,
+            [self.rows[i] for i in self.order],
+            self.menu_order,
+            sorted(self.media.items()),
+            sorted(sizes),
+            sorted(colors),
+        ):
+            digest.update(repr(part).encode("utf-8"))
+        self.catalog_version = digest.hexdigest()[:20]
+        self.built_at = time.time()
+        self._set_ratings(ratings)
+
+    def _set_ratings(self, ratings):
+        # menu_item_id -> (menu_items.rating, rating_sum, rating_count)
+        self.ratings = {i: tuple(v) for i, v in (ratings or {}).items() if i in self.rows}
+        digest = hashlib.sha256(self.catalog_version.encode("utf-8"))
+        digest.update(repr(sorted(self.ratings.items())).encode("utf-8"))
+        self.version = digest.hexdigest()[:20]
+        self.ratings_loaded_at = time.time()
+
+    def with_ratings(self, ratings):
+        "Mahsulotlar, media va facetlar umumiy, faqat baholar qatlami yangi nusxa"
+        snapshot = copy.copy(self)
+        snapshot._set_ratings(ratings)
+        return snapshot
+
+    def load_ratings(self):
+        "Baholar qatlami: menu_items.rating va yig'indi (sum, count) - bitta so'rov"
+        rating = "m.rating" if "rating" in self._index else "NULL"
+        if rating_aggregates_available():
+            rows = execute_query(
+                f"""SELECT m.id, {rating}, a.rating_sum, a.rating_count FROM menu_items m
+                    LEFT JOIN rating_aggregates a ON a.subject_id = m.id""",
+                fetch_all=True,
+            )
+        else:
+            rows = execute_query(
+                f"""SELECT m.id, {rating}, SUM(r.rating), COUNT(r.rating) FROM menu_items m
+                    LEFT JOIN ratings r ON r.menu_item_id = m.id GROUP BY m.id""",
+                fetch_all=True,
+            )
+        return {r[0]: (r[1], r[2] or 0, r[3] or 0) for r in rows or []}
+
+    @classmethod
+    def load(cls):
+        "Mahsulotlar, /menu tartibi, media, facetlar va baholar - har biri bitta so'rov"
+        rows = execute_query(
+            "SELECT * FROM menu_items ORDER BY category, name", fetch_all=True
+        ) or []
+        columns = tuple(rows[0].keys()) if rows else ("id",)
+        menu_order = execute_query(
+            "SELECT id FROM menu_items WHERE available = 1 "
+            "ORDER BY category, orders_count DESC, name",
+            fetch_all=True,
+        )
+        media = {
+            item_id: [tuple(entry[f] for f in CATALOG_MEDIA_FIELDS) for entry in entries]
+            for item_id, entries in load_product_media().items()
+        }
+        options = MenuFacetIndex.load_options()
+        snapshot = cls(
+            columns,
+            [tuple(r[i] for i in range(len(columns))) for r in rows],
+            [r[0] for r in menu_order or []],
+            None,
+            media,
+            options["sizes"],
+            options["colors"],
+        )
+        snapshot._set_ratings(snapshot.load_ratings())
+        return snapshot
+
+    def value(self, item_id, column):
+        if column == "rating" and item_id in self.ratings:
+            return self.ratings[item_id][0]
+        index = self._index.get(column)
+        row = self.rows.get(item_id)
+        return row[index] if row is not None and index is not None else None
+
+    def _item_dict(self, item_id):
+        item = dict(zip(self.columns, self.rows[item_id]))
+        rating = self.ratings.get(item_id)
+        if rating is not None and "rating" in item:
+            item["rating"] = rating[0]
+        return item
+
+    def item(self, item_id):
+        "Mahsulot dict nusxasi (yo'q bo'lsa None)"
+        return self._item_dict(item_id) if item_id in self.rows else None
+
+    def items(self, ids=None):
+        "Mahsulotlar (category, name tartibida); ids berilsa faqat shular"
+        return [self._item_dict(i) for i in self.order if ids is None or i in ids]
+
+    def item_media(self, item_id):
+        "Galereya dict nusxalari (load_product_media bilan bir xil ko'rinish)"
+        return [dict(zip(CATALOG_MEDIA_FIELDS, m)) for m in self.media.get(item_id, ())]
+
+    def menu_items(self):
+        "Mavjud mahsulotlar /menu tartibida, avg_rating va rating_count bilan"
+        result = []
+        for item_id in self.menu_order:
+            item = self._item_dict(item_id)
+            _, rating_sum, rating_count = self.ratings.get(item_id, (None, 0, 0))
+            item["avg_rating"] = rating_sum / rating_count if rating_count else 0
+            item["rating_count"] = rating_count
+            result.append(item)
+        return result
+
+    def search(self, sort=None, limit=200, **filters):
+        """Mavjud mahsulotlarni facet indeksi bo'yicha filtrlash va tartiblash.
+
+        filters - MenuFacetIndex.matching() argumentlari; sort - CATALOG_SORTS
+        kaliti (bo'lmasa category, name). Teng qiymatlarda category, name tartibi.
+        """
+        ids = self.facets.matching(**filters)
+        ordered = [i for i in self.order if i in ids]
+        if sort in CATALOG_SORTS:
+            column, descending = CATALOG_SORTS[sort]
+            if column in self._index:
+                # SQLite kabi: NULL eng kichik qiymat
+                ordered.sort(
+                    key=lambda i: (self.value(i, column) is not None, self.value(i, column) or 0),
+                    reverse=descending,
+                )
+        return [self._item_dict(i) for i in ordered[:limit]]
+
+    def line_total(self, item_id, quantity):
+        "Savatcha qatori summasi - chegirma place_order dagi kabi hisoblanadi"
+        price = self.value(item_id, "price") or 0
+        discount = self.value(item_id, "discount_percentage") or 0
+        if discount > 0:
+            return (price * (100 - discount) / 100) * quantity
+        return price * quantity
+
+    def stats(self):
+        return {
+            "version": self.version,
+            "catalog_version": self.catalog_version,
+            "items": len(self.rows),
+            "available": len(self.available),
+            "built_at": datetime.datetime.fromtimestamp(self.built_at).isoformat(timespec="seconds"),
+            "ratings_loaded_at": datetime.datetime.fromtimestamp(self.ratings_loaded_at).isoformat(
+                timespec="seconds"
+            ),
+        }
+
+
+# Jarayon ichidagi katalog: (menu teg holati, yaratilgan vaqt, snapshot,
+# ratings teg holati). O'quvchilar lock olmaydi - bitta havolani o'qiydi.
+# "menu" tegi bekor qilinganda (boshqa workerlarda ham) yoki CACHE_TAGGED_TTL
+# o'tganda bitta thread yangisini quradi, shu paytda qolganlar eski nusxani
+# oladi. Faqat "ratings" bekor qilinsa baholar qatlami almashtiriladi.
+_catalog_snapshot = None
+_catalog_lock = threading.Lock()
+
+
+def _catalog_current(held, cm):
+    "Mahsulotlar qismi joriymi (baholardan tashqari)"
+    return (
+        held is not None
+        and cm.is_current(held[0])
+        and time.monotonic() - held[1] < Config.CACHE_TAGGED_TTL
+    )
+
+
+def _catalog_fresh(held, cm):
+    return _catalog_current(held, cm) and cm.is_current(held[3])
+
+
+def _build_catalog_snapshot(cm, held=None):
+    "_catalog_lock ostida chaqiriladi; held mahsulotlari joriy bo'lsa faqat baholar yuklanadi"
+    global _catalog_snapshot
+    ratings_stamp = cm.tag_stamp(("ratings",))
+    if _catalog_current(held, cm):
+        snapshot = held[2].with_ratings(held[2].load_ratings())
+        _catalog_snapshot = (held[0], held[1], snapshot, ratings_stamp)
+        return snapshot
+    stamp = cm.tag_stamp(("menu",))
+    snapshot = CatalogSnapshot.load()
+    _catalog_snapshot = (stamp, time.monotonic(), snapshot, ratings_stamp)
+    return snapshot
+
+
+def get_catalog_snapshot():
+    cm = get_cache_manager()
+    held = _catalog_snapshot
+    if _catalog_fresh(held, cm):
+        return held[2]
+    # Boshqa thread qurayotgan bo'lsa kutmasdan eski nusxa
+    if not _catalog_lock.acquire(blocking=held is None):
+        return held[2]
+    try:
+        held = _catalog_snapshot
+        if _catalog_fresh(held, cm):
+            return held[2]
+        try:
+            return _build_catalog_snapshot(cm, held)
+        except Exception as e:
+            if held is None:
+                raise
+            app_logger.error(f"Catalog snapshot build error, eski nusxa ishlatiladi: {str(e)}")
+            return held[2]
+    finally:
+        _catalog_lock.release()
+
+
+def refresh_catalog_snapshot():
+    "Snapshotni darhol qayta qurish va almashtirish"
+    with _catalog_lock:
+        return _build_catalog_snapshot(get_cache_manager())
+
 
-        if color:
-            where_clauses.append(
-                "(colors LIKE ? OR colors LIKE ? OR colors LIKE ? OR colors = ?)"
-            )
-            params.extend([f"%,{color},%", f"{color},%", f"%,{color}", color])
+def catalog_snapshot_stats():
+    "Joriy snapshot haqida (qurilmagan bo'lsa None) - qurishni boshlamaydi"
+    held = _catalog_snapshot
+    return held[2].stats() if held else None
 
-        order_by = "ORDER BY category, name"
-        if sort == "price_asc":
-            order_by = "ORDER BY price ASC"
-        elif sort == "price_desc":
-            order_by = "ORDER BY price DESC"
-        elif sort == "popularity":
-            order_by = "ORDER BY orders_count DESC"
-        elif sort == "rating":
-            order_by = "ORDER BY rating DESC"
 
-        where_sql = " AND ".join(where_clauses) if where_clauses else "1"
-        sql = f"SELECT * FROM menu_items WHERE {where_sql} {order_by} LIMIT 200"
+def get_menu_facet_index():
+    return get_catalog_snapshot().facets
 
-        items_raw = execute_query(sql, params, fetch_all=True)
-        items = []
-        if items_raw:
-            for r in items_raw:
-                try:
-                    item = dict(r)
-                except Exception:
-                    item = r
 
-                # Attach media gallery for the item (images/videos)
-                try:
-                    media_rows = execute_query(
-                        "SELECT id, media_type, media_url, display_order, is_main FROM product_media WHERE menu_item_id = ? ORDER BY is_main DESC, display_order ASC",
-                        (item.get("id") if hasattr(item, 'get') else item[0],),
-                        fetch_all=True,
-                    )
-                    item_media = [dict(m) for m in media_rows] if media_rows else []
-                    item["media"] = item_media
-                except Exception:
-                    item["media"] = []
+def menu_search_ids(q):
+    "q ga mos mahsulot id lari (FTS5, bo'lmasa LIKE)"
+    match = build_menu_fts_query(q)
+    if match and menu_search_fts_available():
+        try:
+            rows = execute_query(
+                "SELECT rowid FROM menu_items_fts WHERE menu_items_fts MATCH ?",
+                (match,),
+                fetch_all=True,
+            )
+            return {r[0] for r in rows or []}
+        except Exception as e:
+            app_logger.warning(f"FTS facet search failed, using LIKE: {str(e)}")
+    like_q = f"%{q}%"
+    rows = execute_query(
+        "SELECT id FROM menu_items WHERE name LIKE ? OR description LIKE ?",
+        (like_q, like_q),
+        fetch_all=True,
+    )
+    return {r[0] for r in rows or []}
 
-                items.append(item)
 
-        return jsonify({"success": True, "items": items})
+@app.route("/api/menu-facets", methods=["GET"])
+@rate_limit("api")
+@catalog_etag
+@cached(
+    ttl=Config.CACHE_TAGGED_TTL,
+    key_func=lambda req, *a, **k: (
+        f"menu_facets:{get_catalog_snapshot().catalog_version}:"
+        f"{json.dumps(dict(req.args), sort_keys=True)}"
+    ),
+    tags=("menu",),
+)
+def api_menu_facets():
+    """API: /api/menu-search filtrlari uchun facet sonlari.
+
+    Query params: q, category, min_price, max_price, size, color (menu-search bilan bir xil).
+    Returns JSON: { success: True, total, facets: {category, size, color, price} }
+    """
+    try:
+        q = (request.args.get("q") or "").strip()
+
+        def price_arg(name):
+            try:
+                return float(request.args.get(name))
+            except (TypeError, ValueError):
+                return None
+
+        facets = get_menu_facet_index().counts(
+            ids=menu_search_ids(q) if q else None,
+            category=(request.args.get("category") or "").strip() or None,
+            size=(request.args.get("size") or "").strip() or None,
+            color=(request.args.get("color") or "").strip() or None,
+            min_price=price_arg("min_price"),
+            max_price=price_arg("max_price"),
+        )
+        total = facets.pop("total")
+        return jsonify({"success": True, "total": total, "facets": facets})
     except Exception as e:
-        app_logger.error(f"api_menu_search error: {str(e)}")
-        return jsonify({"success": False, "message": "Search failed"}), 500
+        app_logger.error(f"api_menu_facets error: {str(e)}")
+        return jsonify({"success": False, "message": "Facets failed"}), 500
 
 
 @app.route("/add_to_cart", methods=["POST"])
+@rate_limit("cart")
 def add_to_cart():
     try:
         # Check if request is JSON or form data
@@ -6684,38 +9625,31 @@ def add_to_cart():
         session_id = get_session_id()
         user_id = session.get("user_id")
 
-        # Check if item already exists in cart - treat same size/color as same line
-        if user_id:
-            existing_item = execute_query(
-                "SELECT id, quantity FROM cart_items WHERE user_id = ? AND menu_item_id = ? AND COALESCE(size,'') = COALESCE(?, '') AND COALESCE(color,'') = COALESCE(?, '')",
-                (user_id, menu_item_id, size or "", color or ""),
-                fetch_one=True,
-            )
-        else:
-            existing_item = execute_query(
-                "SELECT id, quantity FROM cart_items WHERE session_id = ? AND menu_item_id = ? AND COALESCE(size,'') = COALESCE(?, '') AND COALESCE(color,'') = COALESCE(?, '')",
-                (session_id, menu_item_id, size or "", color or ""),
-                fetch_one=True,
-            )
-
         now = get_current_time().isoformat()
 
-        if existing_item:
-            # Update existing item
-            existing_id = (
-                existing_item.get("id")
-                if isinstance(existing_item, dict)
-                else existing_item[0]
-            )
-            if existing_id:
-                execute_query(
-                    "UPDATE cart_items SET quantity = quantity + ? WHERE id = ?",
-                    (quantity, existing_id),
-                )
-        else:
-            # Add new item (persist chosen size/color)
+        def _write_cart_item(conn):
+            # Check if item already exists in cart - treat same size/color as same line
             if user_id:
-                execute_query(
+                existing_item = conn.execute(
+                    "SELECT id, quantity FROM cart_items WHERE user_id = ? AND menu_item_id = ? AND COALESCE(size,'') = COALESCE(?, '') AND COALESCE(color,'') = COALESCE(?, '')",
+                    (user_id, menu_item_id, size or "", color or ""),
+                ).fetchone()
+            else:
+                existing_item = conn.execute(
+                    "SELECT id, quantity FROM cart_items WHERE session_id = ? AND menu_item_id = ? AND COALESCE(size,'') = COALESCE(?, '') AND COALESCE(color,'') = COALESCE(?, '')",
+                    (session_id, menu_item_id, size or "", color or ""),
+                ).fetchone()
+
+            if existing_item:
+                # Update existing item
+                if existing_item[0]:
+                    conn.execute(
+                        "UPDATE cart_items SET quantity = quantity + ? WHERE id = ?",
+                        (quantity, existing_item[0]),
+                    )
+            elif user_id:
+                # Add new item (persist chosen size/color)
+                conn.execute(
                     "INSERT INTO cart_items (user_id, session_id, menu_item_id, quantity, size, color, created_at) VALUES (?, ?, ?, ?, ?, ?, ?)",
                     (
                         user_id,
@@ -6728,7 +9662,7 @@ def add_to_cart():
                     ),
                 )
             else:
-                execute_query(
+                conn.execute(
                     "INSERT INTO cart_items (session_id, menu_item_id, quantity, size, color, created_at) VALUES (?, ?, ?, ?, ?, ?)",
                     (
                         session_id,
@@ -6740,6 +9674,8 @@ def add_to_cart():
                     ),
                 )
 
+        run_write(_write_cart_item)
+
         # Get updated cart count - safe handling
         try:
             if user_id:
@@ -6764,19 +9700,8 @@ def add_to_cart():
             app_logger.warning(f"Cart count error: {str(count_error)}")
             cart_count = 0
 
-        # Clear cache for cart count (safe)
-        try:
-            cm2 = cache_manager or get_cache_manager()
-        except Exception:
-            cm2 = None
-        if cm2:
-            try:
-                if user_id:
-                    cm2.delete(f"cart_count_{user_id}")
-                else:
-                    cm2.delete(f"cart_count_{session_id}")
-            except Exception:
-                pass
+        # Savatcha keshini bekor qilish (cart_count va boshqalar)
+        invalidate_cache(*cart_tags(user_id, session_id))
 
         if request.is_json:
             return jsonify(
@@ -6859,6 +9784,7 @@ def view_cart():
 
 
 @app.route("/remove_from_cart/<int:cart_item_id>", methods=["POST"])
+@rate_limit("cart")
 def remove_from_cart(cart_item_id):
     session_id = get_session_id()
     user_id = session.get("user_id")
@@ -6875,11 +9801,8 @@ def remove_from_cart(cart_item_id):
                 (cart_item_id, session_id),
             )
 
-        # Clear cache for cart count
-        if user_id:
-            cache_manager.delete(f"cart_count_{user_id}")
-        else:
-            cache_manager.delete(f"cart_count_{session_id}")
+        # Savatcha keshini bekor qilish
+        invalidate_cache(*cart_tags(user_id, session_id))
 
         flash("Mahsulot savatchadan olib tashlandi.", "success")
     except Exception as e:
@@ -7332,7 +10255,7 @@ def update_profile():
             for c in raw:
                 try:
                     # row may be dict-like or tuple
-                    if isinstance(c, dict) and "name" in c:
+                    if isinstance(c, Mapping) and "name" in c:
                         cols.append(c["name"])
                     elif isinstance(c, (list, tuple)) and len(c) >= 2:
                         cols.append(c[1])
@@ -7762,6 +10685,7 @@ def general_settings_post():
                         ensure_ascii=False,
                         indent=2,
                     )
+                invalidate_cache("settings")
             except Exception as e:
                 app_logger.warning(f"Could not persist super admin settings file: {e}")
 
@@ -7864,8 +10788,7 @@ def place_order():
     "Buyurtma berish funksiyasi - to'liq qayta ishlangan"
     try:
         # Rate limiting
-        identifier = request.remote_addr
-        if not rate_limiter.is_allowed(identifier, 500, 60):  # 500 заказов в минуту
+        if not rate_limiter.is_allowed(request.remote_addr, "order"):
             flash("Juda ko'p buyurtma. Biroz kuting.", "error")
             return redirect(url_for("cart"))
 
@@ -7882,7 +10805,7 @@ def place_order():
             return redirect(url_for("login_page"))
 
         # Ma'lumotlar bazasi bilan ishash
-        with db_pool.get_connection() as conn:
+        with db_connection() as conn:
             cur = conn.cursor()
 
             # Foydalanuvchi profilidan ma'lumotlarni olish
@@ -7945,12 +10868,10 @@ def place_order():
                 )
                 session["user_card_number"] = card_number_new
 
-            # Buyurtma raqami va vaqt hisoblash
-            tno = next_ticket_no(conn)
+            # Buyurtma vaqtini hisoblash (ticket raqami yozuvchi threadda olinadi)
             eta_minutes = calc_eta_minutes(conn)
             now = get_current_time()
             eta_time = now + datetime.timedelta(minutes=eta_minutes)
-            total = get_cart_total(conn, session_id, user_id)
 
             # Delivery uchun qo'shimcha ma'lumotlar
             delivery_latitude = request.form.get("delivery_latitude", "")
@@ -7993,129 +10914,152 @@ def place_order():
             except (ValueError, TypeError):
                 branch_id = 1
 
-            # Buyurtma yaratish
-            order_id = execute_query(
-                """
-                INSERT INTO orders (user_id, customer_name, ticket_no, order_type, status, delivery_address, delivery_distance, delivery_latitude, delivery_longitude, delivery_map_url, customer_note, customer_phone, card_number, branch_id, created_at, eta_time)
-                VALUES (?, ?, ?, ?, 'pending', ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?);
-            """,
-                (
-                    user_id,
-                    name,
-                    tno,
-                    order_type,
-                    delivery_address,
-                    delivery_distance,
-                    delivery_latitude or None,
-                    delivery_longitude or None,
-                    delivery_map_url,
-                    customer_note,
-                    customer_phone,
-                    card_number,
-                    branch_id,
-                    now.isoformat(),
-                    eta_time.isoformat(),
-                ),
-            )
+            cashback_percentage = 1.0  # Default cashback
 
-            if not order_id:
-                raise Exception("Buyurtma yaratilmadi.")
+            def _write_order(wconn):
+                # Narx va chegirma shu tranzaksiyada bazadan olinadi - katalog
+                # snapshoti faqat savatchani ko'rsatish uchun, buyurtma undagi
+                # eskirgan narx bilan hisoblanmaydi
+                item_ids = sorted({item["menu_item_id"] for item in cart_items})
+                placeholders = ",".join("?" * len(item_ids))
+                prices = {
+                    row[0]: (row[1], row[2], row[3])
+                    for row in wconn.execute(
+                        "SELECT id, name, price, discount_percentage FROM menu_items "
+                        f"WHERE available = 1 AND id IN ({placeholders})",
+                        item_ids,
+                    )
+                }
 
-            # Log yangi buyurtma yaratilganini
-            app_logger.info(
-                f"Yangi buyurtma yaratildi: ID={order_id}, Ticket={tno}, User={name}, Type={order_type}, Status=waiting"
-            )
+                # Savatchadagi mahsulotlardan order_details qatorlarini tayyorlash
+                order_items_for_json = []
+                order_detail_rows = []
+                total_amount = 0
 
-            # Savatchadagi mahsulotlarni order_details ga ko'chirish
-            order_items_for_json = []
-            total_amount = 0
+                for item in cart_items:
+                    if item["menu_item_id"] not in prices:
+                        continue  # Shu orada sotuvdan olingan
+                    item_name, price, discount_percentage = prices[item["menu_item_id"]]
+                    price = price or 0
+                    discount_percentage = discount_percentage or 0
 
-            for item in cart_items:
-                # Skidka narxini hisoblash
-                discount_percentage = item.get("discount_percentage", 0) or 0
-                final_price = item["price"]
-                if discount_percentage > 0:
-                    try:
-                        final_price = item["price"] * (100 - discount_percentage) / 100
-                    except:  # Handle potential errors in calculation
-                        final_price = item["price"]
+                    # Skidka narxini hisoblash
+                    final_price = price
+                    if discount_percentage > 0:
+                        final_price = price * (100 - discount_percentage) / 100
 
-                item_total = final_price * item["quantity"]
-                total_amount += item_total
+                    item_total = final_price * item["quantity"]
+                    total_amount += item_total
 
-                # Try to include size and color if columns exist; fallback otherwise
-                try:
-                    execute_query(
-                        """
-                        INSERT INTO order_details (order_id, menu_item_id, quantity, price, size, color)
-                        VALUES (?, ?, ?, ?, ?, ?)
-                    """,
+                    order_detail_rows.append(
                         (
-                            order_id,
                             item["menu_item_id"],
                             item["quantity"],
                             final_price,
                             item.get("size"),
                             item.get("color"),
-                        ),
+                        )
                     )
-                except Exception:
-                    # Older schema fallback
-                    execute_query(
-                        """
-                        INSERT INTO order_details (order_id, menu_item_id, quantity, price)
-                        VALUES (?, ?, ?, ?)
-                    """,
-                        (order_id, item["menu_item_id"], item["quantity"], final_price),
+
+                    # JSON uchun mahsulot ma'lumotlarini to'plash
+                    order_items_for_json.append(
+                        {
+                            "nomi": item_name or "N/A",
+                            "miqdori": item["quantity"],
+                            "asl_narxi": price,
+                            "skidka_foizi": discount_percentage,
+                            "jami": item_total,
+                        }
                     )
 
-                # JSON uchun mahsulot ma'lumotlarini to'plash
-                order_items_for_json.append(
-                    {
-                        "nomi": item.get("name", "N/A"),
-                        "miqdori": item["quantity"],
-                        "asl_narxi": item["price"],
-                        "skidka_foizi": discount_percentage,
-                        "jami": item_total,
-                    }
+                if not order_detail_rows:
+                    raise Exception("Savatchadagi mahsulotlar sotuvda yo'q.")
+                cashback_amount = total_amount * (cashback_percentage / 100)
+
+                # Buyurtma, tafsilotlar, chek va savatchani tozalash - bitta tranzaksiyada
+                ticket_no = next_ticket_no(wconn)
+                new_order_id = wconn.execute(
+                    """
+                    INSERT INTO orders (user_id, customer_name, ticket_no, order_type, status, delivery_address, delivery_distance, delivery_latitude, delivery_longitude, delivery_map_url, customer_note, customer_phone, card_number, branch_id, created_at, eta_time)
+                    VALUES (?, ?, ?, ?, 'pending', ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?);
+                """,
+                    (
+                        user_id,
+                        name,
+                        ticket_no,
+                        order_type,
+                        delivery_address,
+                        delivery_distance,
+                        delivery_latitude or None,
+                        delivery_longitude or None,
+                        delivery_map_url,
+                        customer_note,
+                        customer_phone,
+                        card_number,
+                        branch_id,
+                        now.isoformat(),
+                        eta_time.isoformat(),
+                    ),
+                ).lastrowid
+
+                if not new_order_id:
+                    raise Exception("Buyurtma yaratilmadi.")
+
+                for menu_item_id, quantity, price, size, color in order_detail_rows:
+                    # Try to include size and color if columns exist; fallback otherwise
+                    try:
+                        wconn.execute(
+                            """
+                            INSERT INTO order_details (order_id, menu_item_id, quantity, price, size, color)
+                            VALUES (?, ?, ?, ?, ?, ?)
+                        """,
+                            (new_order_id, menu_item_id, quantity, price, size, color),
+                        )
+                    except sqlite3.OperationalError:
+                        # Older schema fallback
+                        wconn.execute(
+                            """
+                            INSERT INTO order_details (order_id, menu_item_id, quantity, price)
+                            VALUES (?, ?, ?, ?)
+                        """,
+                            (new_order_id, menu_item_id, quantity, price),
+                        )
+
+                # Chek yaratish
+                wconn.execute(
+                    """
+                    INSERT INTO receipts (order_id, receipt_number, total_amount, cashback_amount, cashback_percentage, created_at)
+                    VALUES (?, ?, ?, ?, ?, ?);
+                """,
+                    (
+                        new_order_id,
+                        f"R{ticket_no}{now.strftime('%H%M%S')}",
+                        total_amount,
+                        cashback_amount,
+                        cashback_percentage,
+                        now.isoformat(),
+                    ),
                 )
 
-            # Chek yaratish
-            receipt_number = f"R{tno}{now.strftime('%H%M%S')}"
-            cashback_percentage = 1.0  # Default cashback
-            cashback_amount = total_amount * (cashback_percentage / 100)
+                # Savatchani tozalash
+                if user_id:
+                    wconn.execute("DELETE FROM cart_items WHERE user_id = ?", (user_id,))
+                else:
+                    wconn.execute(
+                        "DELETE FROM cart_items WHERE session_id = ?", (session_id,)
+                    )
 
-            execute_query(
-                """
-                INSERT INTO receipts (order_id, receipt_number, total_amount, cashback_amount, cashback_percentage, created_at)
-                VALUES (?, ?, ?, ?, ?, ?);
-            """,
-                (
-                    order_id,
-                    receipt_number,
-                    total_amount,
-                    cashback_amount,
-                    cashback_percentage,
-                    now.isoformat(),
-                ),
-            )
+                return new_order_id, ticket_no, total_amount, order_items_for_json
 
-            # Savatchani tozalash
-            clear_cart(conn, session_id, user_id)
+            order_id, tno, total_amount, order_items_for_json = run_write(_write_order)
 
-            # Cache ni tozalash (safe)
-            try:
-                cm3 = cache_manager or get_cache_manager()
-            except Exception:
-                cm3 = None
-            if cm3:
-                try:
-                    if user_id:
-                        cm3.delete(f"cart_count_{user_id}")
-                    else:
-                        cm3.delete(f"cart_count_{session_id}")
-                except Exception:
-                    pass
+            # Log yangi buyurtma yaratilganini
+            app_logger.info(
+                f"Yangi buyurtma yaratildi: ID={order_id}, Ticket={tno}, User={name}, Type={order_type}, Status=waiting"
+            )
+
+            # Savatcha bo'shatildi - keshni bekor qilish
+            invalidate_cache(*cart_tags(user_id, session_id))
 
             # Foydalanuvchini JSON fayliga saqlash (async)
             # Use safe_submit to avoid None executor issues and ensure background task runs or falls back
@@ -8943,7 +11887,7 @@ def admin_orders_json():
         return jsonify({"error": "Authentication required"}), 401
 
     try:
-        orders_raw = execute_query(
+        orders = fetch_dicts(
             """
             SELECT o.*,
                    GROUP_CONCAT(mi.name || ' x' || od.quantity) as order_items
@@ -8953,12 +11897,9 @@ def admin_orders_json():
             GROUP BY o.id
             ORDER BY o.created_at DESC
             LIMIT 100
-        """,
-            fetch_all=True,
+        """
         )
 
-        orders = [dict(row) for row in orders_raw] if orders_raw else []
-
         return jsonify({"success": True, "orders": orders, "total": len(orders)})
     except Exception as e:
         app_logger.error(f"Admin orders JSON error: {str(e)}")
@@ -8966,6 +11907,8 @@ def admin_orders_json():
 
 
 @app.route("/admin/add_menu_item", methods=["POST"])
+@refreshes_catalog
+@invalidates("menu")
 def admin_add_menu_item():
     "Add new menu item"
     if not session.get("staff_id") and not session.get("super_admin"):
@@ -9122,6 +12065,8 @@ def admin_add_menu_item():
 
 
 @app.route("/admin/edit_menu_item/<int:item_id>", methods=["POST"])
+@refreshes_catalog
+@invalidates("menu", lambda req, item_id: f"menu_item:{item_id}")
 def admin_edit_menu_item(item_id):
     "Edit menu item"
     if not session.get("staff_id") and not session.get("super_admin"):
@@ -9318,6 +12263,7 @@ def api_get_product_media(item_id):
 
 @app.route("/api/product-media/<int:media_id>/set-main", methods=["POST"])
 @role_required("staff")
+@invalidates("menu")
 def api_set_main_media(media_id):
     """Media faylni asosiy qilib belgilash"""
     try:
@@ -9365,6 +12311,7 @@ def api_set_main_media(media_id):
 
 @app.route("/api/product-media/<int:media_id>/delete", methods=["DELETE"])
 @role_required("staff")
+@invalidates("menu")
 def api_delete_product_media(media_id):
     """Media faylni o'chirish"""
     try:
@@ -9426,6 +12373,7 @@ def api_delete_product_media(media_id):
 
 @app.route("/api/product-media/reorder", methods=["POST"])
 @role_required("staff")
+@invalidates("menu")
 def api_reorder_product_media():
     """Media fayllar tartibini o'zgartirish"""
     try:
@@ -9481,6 +12429,8 @@ def api_reorder_product_media():
 
 
 @app.route("/admin/toggle_menu_item/<int:item_id>", methods=["POST"])
+@refreshes_catalog
+@invalidates("menu", lambda req, item_id: f"menu_item:{item_id}")
 def admin_toggle_menu_item(item_id):
     "Toggle menu item availability"
     if not session.get("staff_id") and not session.get("super_admin"):
@@ -9510,6 +12460,8 @@ def admin_toggle_menu_item(item_id):
 
 
 @app.route("/admin/delete_menu_item/<int:item_id>", methods=["POST"])
+@refreshes_catalog
+@invalidates("menu", "cart", lambda req, item_id: f"menu_item:{item_id}")
 def admin_delete_menu_item(item_id):
     "Admin menu item ni butunlay o'chirish"
     if not session.get("staff_id") and not session.get("super_admin"):
@@ -9582,6 +12534,7 @@ def admin_delete_menu_item(item_id):
 
 
 @app.route('/admin/reset_menu_for_tests', methods=['POST'])
+@invalidates("menu", "cart")
 def admin_reset_menu_for_tests():
     """Developer/testing helper: remove all existing products and insert 4 test products.
     Protected: only staff or super_admin can call this. Meant for local/dev use only.
@@ -9652,6 +12605,10 @@ def api_home():
 
 
 @app.route("/api/get-menu-ratings/<int:menu_item_id>")
+@cached(
+    ttl=Config.CACHE_TAGGED_TTL,
+    tags=lambda req, menu_item_id: ["menu", "ratings", f"menu_item:{menu_item_id}"],
+)
 def api_get_menu_ratings(menu_item_id):
     "Get ratings for a specific menu item"
     try:
@@ -9672,21 +12629,17 @@ def api_get_menu_ratings(menu_item_id):
 
         ratings = [dict(row) for row in ratings_raw] if ratings_raw else []
 
-        # Calculate average rating
-        if ratings:
-            total_rating = sum(r["rating"] for r in ratings)
-            average_rating = round(total_rating / len(ratings), 1)
+        if rating_aggregates_available():
+            # O'rtacha barcha baholar bo'yicha (faqat oxirgi 20 tasi emas)
+            summary = get_rating_summary(menu_item_id)
         else:
-            average_rating = 0.0
-
-        return jsonify(
-            {
-                "success": True,
-                "ratings": ratings,
-                "average_rating": average_rating,
+            total_rating = sum(r["rating"] for r in ratings)
+            summary = {
+                "average_rating": round(total_rating / len(ratings), 1) if ratings else 0.0,
                 "total_ratings": len(ratings),
             }
-        )
+
+        return jsonify({"success": True, "ratings": ratings, **summary})
 
     except Exception as e:
         app_logger.error(f"Get menu ratings error: {str(e)}")
@@ -9703,6 +12656,7 @@ def api_get_menu_ratings(menu_item_id):
 
 @app.route("/api/submit-rating", methods=["POST"])
 @csrf_protect
+@invalidates("ratings", _json_menu_item_tag)
 def api_submit_rating():
     """Accept rating submissions for menu items or branches.
     Expected JSON: { menu_item_id: int, rating: int (1-5), comment: str }
@@ -9784,20 +12738,46 @@ def api_submit_rating():
             app_logger.error(f"Submit rating parent check failed: {str(e)}")
             return jsonify({"success": False, "message": "Server error"}), 500
 
-        try:
+        use_aggregates = rating_aggregates_available()
+
+        def _write_rating(conn):
+            # Baho, rating_aggregates (trigger) va menu_items.rating bitta tranzaksiyada
             if menu_item_id_int < 0:
-                branch_id = -menu_item_id_int
                 # Insert branch rating (menu_item_id NULL)
-                execute_query(
+                conn.execute(
                     "INSERT INTO ratings (menu_item_id, branch_id, user_id, rating, comment, created_at) VALUES (NULL, ?, ?, ?, ?, ?)",
-                    (branch_id, user_id, rating, comment, now),
+                    (-menu_item_id_int, user_id, rating, comment, now),
                 )
+                return None
+            # Insert menu item rating (branch_id NULL)
+            conn.execute(
+                "INSERT INTO ratings (menu_item_id, branch_id, user_id, rating, comment, created_at) VALUES (?, NULL, ?, ?, ?, ?)",
+                (menu_item_id_int, user_id, rating, comment, now),
+            )
+            if use_aggregates:
+                stats = conn.execute(
+                    "SELECT rating_sum, rating_count FROM rating_aggregates WHERE subject_id = ?",
+                    (menu_item_id_int,),
+                ).fetchone()
             else:
-                # Insert menu item rating (branch_id NULL)
-                execute_query(
-                    "INSERT INTO ratings (menu_item_id, branch_id, user_id, rating, comment, created_at) VALUES (?, NULL, ?, ?, ?, ?)",
-                    (menu_item_id_int, user_id, rating, comment, now),
+                stats = conn.execute(
+                    "SELECT SUM(rating), COUNT(*) FROM ratings WHERE menu_item_id = ?",
+                    (menu_item_id_int,),
+                ).fetchone()
+            total, cnt = (stats[0] or 0, stats[1] or 0) if stats else (0, 0)
+            avg = total / cnt if cnt else 0.0
+            # Also update menu_items.rating with latest average (best-effort)
+            try:
+                conn.execute(
+                    "UPDATE menu_items SET rating = ? WHERE id = ?",
+                    (round(avg, 1), menu_item_id_int),
                 )
+            except sqlite3.OperationalError:
+                pass
+            return avg, cnt
+
+        try:
+            stats = run_write(_write_rating)
         except Exception as e:
             # If FK still fails here, log full context for debugging
             if "FOREIGN KEY constraint failed" in str(e):
@@ -9813,24 +12793,10 @@ def api_submit_rating():
             app_logger.error(f"Submit rating insert failed: {str(e)}")
             return jsonify({"success": False, "message": "Server error"}), 500
 
-        # If this was a menu item rating, recalc average and count to return to client
-        try:
-            if menu_item_id_int >= 0:
-                stats = execute_query(
-                    "SELECT AVG(rating) as avg_rating, COUNT(*) as cnt FROM ratings WHERE menu_item_id = ?",
-                    (menu_item_id_int,),
-                    fetch_one=True,
-                )
-                avg = float(stats.get('avg_rating') or 0.0) if hasattr(stats, 'get') else float(stats[0] or 0.0)
-                cnt = int(stats.get('cnt') or 0) if hasattr(stats, 'get') else int(stats[1] or 0)
-                # Also update menu_items.rating with latest average (best-effort)
-                try:
-                    execute_query('UPDATE menu_items SET rating = ? WHERE id = ?', (round(avg, 1), menu_item_id_int))
-                except Exception:
-                    pass
-                return jsonify({"success": True, "message": "Rahmat! Baho qabul qilindi.", "new_rating": round(avg,1), "total_ratings": cnt})
-        except Exception:
-            pass
+        # Menu item rating: new average and count for the client
+        if stats is not None:
+            avg, cnt = stats
+            return jsonify({"success": True, "message": "Rahmat! Baho qabul qilindi.", "new_rating": round(avg, 1), "total_ratings": cnt})
 
         return jsonify({"success": True, "message": "Rahmat! Baho qabul qilindi."})
     except Exception as e:
@@ -9847,6 +12813,7 @@ def api_status():
 
 
 @app.route("/api/news/active", methods=["GET"])
+@cached(ttl=Config.CACHE_TAGGED_TTL, tags=("news",))
 def api_get_active_news():
     """Get active news for ticker display"""
     try:
@@ -10352,6 +13319,7 @@ def api_find_nearest_branch():
 
 
 @app.route("/api/health")
+@route_class("probe")
 def api_health():
     "Health check endpoint"
     try:
@@ -10380,6 +13348,7 @@ def api_health():
 
 @app.route("/get_cart_count")
 @app.route("/api/cart-count")
+@route_class("poll")
 def api_cart_count():
     "Savatchadagi mahsulotlar sonini qaytarish - API endpoint"
     try:
@@ -10388,11 +13357,15 @@ def api_cart_count():
 
         # Cache dan olishga harakat qilish (lazy-init cache_manager)
         cache_key = f"cart_count_{user_id}_{session_id}"
+        # "cart" - ko'p savatchaga tegadigan o'zgarishlar uchun (mahsulot o'chirilishi)
+        owner_tags = ["cart", *cart_tags(user_id, session_id)]
         cm = get_cache_manager()
         cached_count = None
+        stamp = None
         try:
             if cm is not None:
                 cached_count = cm.get(cache_key)
+                stamp = cm.tag_stamp(owner_tags)
         except Exception as cache_err:
             app_logger.warning(f"Cache get error in api_cart_count: {str(cache_err)}")
 
@@ -10401,6 +13374,7 @@ def api_cart_count():
 
         # Hisoblash
         cart_count = 0
+        count_ok = False
 
         try:
             if user_id:
@@ -10418,7 +13392,7 @@ def api_cart_count():
 
             # Extract count from result - handle both dict and tuple formats
             if cart_count_result:
-                if isinstance(cart_count_result, dict):
+                if isinstance(cart_count_result, Mapping):
                     cart_count = cart_count_result.get("total_count", 0) or 0
                 elif (
                     isinstance(cart_count_result, (list, tuple))
@@ -10432,15 +13406,22 @@ def api_cart_count():
 
             # Type validation
             cart_count = max(0, int(cart_count)) if cart_count is not None else 0
+            count_ok = True
 
         except Exception as query_error:
             app_logger.error(f"Cart count query error: {str(query_error)}")
             cart_count = 0
 
-        # Cache ga saqlash
+        # Cache ga saqlash - savatcha o'zgarganda cart:* teglari bekor qiladi
         try:
-            if cm is not None:
-                cm.set(cache_key, cart_count, ttl=60)
+            if cm is not None and count_ok:
+                cm.set(
+                    cache_key,
+                    cart_count,
+                    ttl=Config.CACHE_TAGGED_TTL,
+                    tags=owner_tags,
+                    stamp=stamp,
+                )
         except Exception as cache_err:
             app_logger.warning(f"Cache set error in api_cart_count: {str(cache_err)}")
 
@@ -10499,6 +13480,7 @@ def courier_panel_redirect():
 
 # ---- STATIC FILE HANDLING ----
 @app.route("/static/<path:filename>")
+@route_class("static")
 def static_files(filename):
     "Static fayllar uchun xavfsiz route"
     try:
@@ -10647,11 +13629,31 @@ SUPERADMIN_SETTINGS_PATH = os.path.join(
 
 
 def load_superadmin_settings():
+    # Fayl har so'rovda o'qilmasin; yozilganda "settings" tegi bekor qiladi.
+    # Chaqiruvchilar natijani o'zgartirishi mumkin - shuning uchun nusxa.
+    cm = cache_manager or get_cache_manager()
+    try:
+        cached_settings = cm.get("superadmin_settings") if cm else None
+        if cached_settings is not None:
+            return copy.deepcopy(cached_settings)
+    except Exception:
+        pass
     try:
+        stamp = cm.tag_stamp(("settings",)) if cm else None
         if os.path.exists(SUPERADMIN_SETTINGS_PATH):
             with open(SUPERADMIN_SETTINGS_PATH, "r", encoding="utf-8") as f:
                 data = json.load(f) or {}
-                return data
+        else:
+            data = {}
+        if cm:
+            cm.set(
+                "superadmin_settings",
+                copy.deepcopy(data),
+                Config.CACHE_TAGGED_TTL,
+                tags=("settings",),
+                stamp=stamp,
+            )
+        return data
     except Exception as e:
         try:
             app_logger.error(f"Failed to load superadmin settings: {e}")
@@ -10670,6 +13672,7 @@ def save_superadmin_settings(data: dict):
         with open(tmp, "w", encoding="utf-8") as f:
             json.dump(data, f, ensure_ascii=False, indent=2)
         os.replace(tmp, SUPERADMIN_SETTINGS_PATH)
+        invalidate_cache("settings")
         return True
     except Exception as e:
         try:
@@ -10770,7 +13773,7 @@ def news_page():
         # Normalize rows to dicts
         news_items = []
         for r in rows:
-            if isinstance(r, dict):
+            if isinstance(r, Mapping):
                 item = r
             else:
                 # tuple ordering per SELECT above
@@ -10814,7 +13817,7 @@ def super_admin_news_list():
 
         news_items = []
         for r in rows:
-            if isinstance(r, dict):
+            if isinstance(r, Mapping):
                 item = r
             else:
                 item = {
@@ -10847,6 +13850,7 @@ def super_admin_news_list():
 
 @app.route("/super-admin/news/add", methods=["POST"])
 @role_required("super_admin")
+@invalidates("news")
 def super_admin_add_news():
     try:
         title = request.form.get("title", "").strip()
@@ -10927,7 +13931,7 @@ def super_admin_add_news():
             # Convert rows to serializable dicts
             items = []
             for r in rows:
-                if isinstance(r, dict):
+                if isinstance(r, Mapping):
                     item = dict(r)
                 else:
                     item = {
@@ -10964,6 +13968,7 @@ def super_admin_add_news():
 
 @app.route("/super-admin/news/delete/<int:news_id>", methods=["POST"])
 @role_required("super_admin")
+@invalidates("news")
 def super_admin_delete_news(news_id):
     try:
         # Try to delete from DB first
@@ -10985,7 +13990,7 @@ def super_admin_delete_news(news_id):
                     )
                     items = []
                     for r in rows:
-                        if isinstance(r, dict):
+                        if isinstance(r, Mapping):
                             item = dict(r)
                         else:
                             item = {
@@ -11236,7 +14241,7 @@ def super_admin_get_orders():
         return jsonify({"error": "Super admin huquqi kerak"}), 401
 
     try:
-        orders_raw = execute_query(
+        orders = fetch_dicts(
             """
             SELECT o.*,
                    GROUP_CONCAT(mi.name || ' x' || od.quantity) as order_items
@@ -11246,11 +14251,8 @@ def super_admin_get_orders():
             GROUP BY o.id
             ORDER BY o.created_at DESC
             LIMIT 100
-        """,
-            fetch_all=True,
+        """
         )
-
-        orders = [dict(row) for row in orders_raw] if orders_raw else []
         return jsonify(orders)
     except Exception as e:
         app_logger.error(f"Super admin get orders error: {str(e)}")
@@ -11259,17 +14261,14 @@ def super_admin_get_orders():
 
 @app.route("/super-admin/get-menu")
 @role_required("super_admin")
+@catalog_etag
 def super_admin_get_menu():
     if not session.get("super_admin"):
         return jsonify({"error": "Super admin huquqi kerak"}), 401
         return jsonify({"error": "Super admin huquqi kerak"}), 401
 
     try:
-        menu_raw = execute_query(
-            "SELECT * FROM menu_items ORDER BY category, name", fetch_all=True
-        )
-        menu = [dict(row) for row in menu_raw] if menu_raw else []
-        return jsonify(menu)
+        return jsonify(get_catalog_snapshot().items())
     except Exception as e:
         app_logger.error(f"Super admin get menu error: {str(e)}")
         return jsonify([])
@@ -11345,6 +14344,7 @@ def super_admin_get_ratings():
 
 @app.route("/super-admin/add-menu-item", methods=["POST"])
 @role_required("super_admin")
+@invalidates("menu")
 def super_admin_add_menu_item():
     if not session.get("super_admin"):
         return redirect(url_for("super_admin_login"))
@@ -11459,6 +14459,7 @@ def super_admin_delete_branch(branch_id):
 
 @app.route("/super-admin/delete-user-db/<int:user_id>", methods=["POST"])
 @role_required("super_admin")
+@invalidates("menu", lambda req, user_id: f"cart:user:{user_id}")
 def super_admin_delete_user_db(user_id):
     if not session.get("super_admin"):
         return redirect(url_for("super_admin_login"))
@@ -11768,7 +14769,7 @@ def super_admin_send_notification():
 
                 if users:
                     for user in users:
-                        user_id = user["id"] if isinstance(user, dict) else user[0]
+                        user_id = user["id"] if isinstance(user, Mapping) else user[0]
                         if send_notification(
                             recipient_type=user_type,
                             recipient_id=user_id,
@@ -11798,6 +14799,7 @@ def super_admin_send_notification():
 
 
 @app.route("/api/notifications")
+@route_class("poll")
 def api_get_notifications():
     """Get notifications for current session (user/staff/courier) or all for super_admin."""
     try:
@@ -11904,8 +14906,8 @@ def ensure_chat_tables_and_groups():
     try:
         # Tables with proper constraints and indexes
         execute_query(
-            """
-            CREATE TABLE IF NOT EXISTS chats (
+            f"""
+            CREATE TABLE IF NOT EXISTS {side_table('chats')} (
                 id INTEGER PRIMARY KEY AUTOINCREMENT,
                 name TEXT NOT NULL,
                 is_group INTEGER DEFAULT 0,
@@ -11914,8 +14916,8 @@ def ensure_chat_tables_and_groups():
             """
         )
         execute_query(
-            """
-            CREATE TABLE IF NOT EXISTS chat_members (
+            f"""
+            CREATE TABLE IF NOT EXISTS {side_table('chat_members')} (
                 id INTEGER PRIMARY KEY AUTOINCREMENT,
                 chat_id INTEGER NOT NULL,
                 member_type TEXT NOT NULL,
@@ -11925,8 +14927,8 @@ def ensure_chat_tables_and_groups():
             """
         )
         execute_query(
-            """
-            CREATE TABLE IF NOT EXISTS messages (
+            f"""
+            CREATE TABLE IF NOT EXISTS {side_table('messages')} (
                 id INTEGER PRIMARY KEY AUTOINCREMENT,
                 chat_id INTEGER NOT NULL,
                 sender_type TEXT NOT NULL,
@@ -11941,8 +14943,8 @@ def ensure_chat_tables_and_groups():
         # Backwards-compatibility: some older code references `chat_messages` table name.
         # Create it if missing so queries like SELECT FROM chat_messages don't fail.
         execute_query(
-            """
-            CREATE TABLE IF NOT EXISTS chat_messages (
+            f"""
+            CREATE TABLE IF NOT EXISTS {side_table('chat_messages')} (
                 id INTEGER PRIMARY KEY AUTOINCREMENT,
                 chat_id INTEGER NOT NULL,
                 sender_type TEXT NOT NULL,
@@ -11956,8 +14958,8 @@ def ensure_chat_tables_and_groups():
 
         # Ensure notifications table exists as well (some code paths insert/query it)
         execute_query(
-            """
-            CREATE TABLE IF NOT EXISTS notifications (
+            f"""
+            CREATE TABLE IF NOT EXISTS {side_table('notifications')} (
                 id INTEGER PRIMARY KEY AUTOINCREMENT,
                 recipient_type TEXT,
                 recipient_id INTEGER,
@@ -12045,7 +15047,7 @@ def ensure_chat_tables_and_groups():
                                         group_id,
                                         (
                                             staff["id"]
-                                            if isinstance(staff, dict)
+                                            if isinstance(staff, Mapping)
                                             else staff[0]
                                         ),
                                     ),
@@ -12062,7 +15064,7 @@ def ensure_chat_tables_and_groups():
                                         group_id,
                                         (
                                             courier["id"]
-                                            if isinstance(courier, dict)
+                                            if isinstance(courier, Mapping)
                                             else courier[0]
                                         ),
                                     ),
@@ -12085,7 +15087,7 @@ def ensure_chat_tables_and_groups():
                                         group_id,
                                         (
                                             staff["id"]
-                                            if isinstance(staff, dict)
+                                            if isinstance(staff, Mapping)
                                             else staff[0]
                                         ),
                                     ),
@@ -12108,7 +15110,7 @@ def ensure_chat_tables_and_groups():
                                         group_id,
                                         (
                                             courier["id"]
-                                            if isinstance(courier, dict)
+                                            if isinstance(courier, Mapping)
                                             else courier[0]
                                         ),
                                     ),
@@ -12129,7 +15131,7 @@ def ensure_avatar_columns():
                 cols = []
                 for c in raw:
                     try:
-                        if isinstance(c, dict) and "name" in c:
+                        if isinstance(c, Mapping) and "name" in c:
                             cols.append(c["name"])
                         elif isinstance(c, (list, tuple)) and len(c) >= 2:
                             cols.append(c[1])
@@ -12148,13 +15150,6 @@ def ensure_avatar_columns():
         app_logger.error(f"ensure_avatar_columns error: {str(e)}")
 
 
-# Ensure avatar columns at startup (best-effort)
-try:
-    ensure_avatar_columns()
-except Exception:
-    pass
-
-
 @app.route("/api/chats", methods=["GET", "POST"])
 def api_chats():
     """GET: list chats for session; POST: create private chat with another member."""
@@ -12423,7 +15418,7 @@ def api_chats():
                     if existing:
                         existing_id = (
                             existing["id"]
-                            if isinstance(existing, dict)
+                            if isinstance(existing, Mapping)
                             else existing[0]
                         )
                         return jsonify(
@@ -12496,6 +15491,7 @@ def api_chats():
 
 
 @app.route("/api/chats/<chat_id>/messages", methods=["GET", "POST"])
+@route_class("poll")
 def api_chat_messages(chat_id):
     """GET messages (limit param) and POST new message to chat."""
     try:
@@ -12542,7 +15538,7 @@ def api_chat_messages(chat_id):
                 if group_chat:
                     actual_chat_id = (
                         group_chat["id"]
-                        if isinstance(group_chat, dict)
+                        if isinstance(group_chat, Mapping)
                         else group_chat[0]
                     )
                 else:
@@ -12733,7 +15729,7 @@ def debug_chats_info():
                 try:
                     cid = (
                         cm.get("chat_id")
-                        if isinstance(cm, dict)
+                        if isinstance(cm, Mapping)
                         else (cm[0] if len(cm) > 0 else None)
                     )
                     if cid and cid not in chat_ids:
@@ -12786,7 +15782,7 @@ def debug_chats_info():
                 or []
             )
             resp["distinct_member_types"] = [
-                r[0] if not isinstance(r, dict) else next(iter(r.values())) for r in dm
+                r[0] if not isinstance(r, Mapping) else next(iter(r.values())) for r in dm
             ]
         except Exception as e:
             resp["distinct_member_types_error"] = str(e)
@@ -12799,7 +15795,7 @@ def debug_chats_info():
                 or []
             )
             resp["distinct_recipient_types"] = [
-                r[0] if not isinstance(r, dict) else next(iter(r.values())) for r in dr
+                r[0] if not isinstance(r, Mapping) else next(iter(r.values())) for r in dr
             ]
         except Exception as e:
             resp["distinct_recipient_types_error"] = str(e)
@@ -12860,7 +15856,7 @@ def debug_notifications_info():
                 or []
             )
             resp["distinct_recipient_types"] = [
-                r[0] if not isinstance(r, dict) else next(iter(r.values())) for r in dr
+                r[0] if not isinstance(r, Mapping) else next(iter(r.values())) for r in dr
             ]
         except Exception as e:
             resp["distinct_recipient_types_error"] = str(e)
@@ -12925,16 +15921,16 @@ def api_private_chats():
                 for staff in other_staff:
                     private_chats.append(
                         {
-                            "id": f"staff_{staff['id'] if isinstance(staff, dict) else staff[0]}",
-                            "name": f"{staff.get('first_name', '') if isinstance(staff, dict) else staff[1]} {staff.get('last_name', '') if isinstance(staff, dict) else staff[2]}".strip(),
+                            "id": f"staff_{staff['id'] if isinstance(staff, Mapping) else staff[0]}",
+                            "name": f"{staff.get('first_name', '') if isinstance(staff, Mapping) else staff[1]} {staff.get('last_name', '') if isinstance(staff, Mapping) else staff[2]}".strip(),
                             "avatar": (
                                 staff.get("avatar")
-                                if isinstance(staff, dict)
+                                if isinstance(staff, Mapping)
                                 else staff[3]
                             ),
                             "type": "staff",
                             "user_id": (
-                                staff["id"] if isinstance(staff, dict) else staff[0]
+                                staff["id"] if isinstance(staff, Mapping) else staff[0]
                             ),
                         }
                     )
@@ -12947,17 +15943,17 @@ def api_private_chats():
                 for courier in couriers:
                     private_chats.append(
                         {
-                            "id": f"courier_{courier['id'] if isinstance(courier, dict) else courier[0]}",
-                            "name": f"{courier.get('first_name', '') if isinstance(courier, dict) else courier[1]} {courier.get('last_name', '') if isinstance(courier, dict) else courier[2]}".strip(),
+                            "id": f"courier_{courier['id'] if isinstance(courier, Mapping) else courier[0]}",
+                            "name": f"{courier.get('first_name', '') if isinstance(courier, Mapping) else courier[1]} {courier.get('last_name', '') if isinstance(courier, Mapping) else courier[2]}".strip(),
                             "avatar": (
                                 courier.get("avatar")
-                                if isinstance(courier, dict)
+                                if isinstance(courier, Mapping)
                                 else courier[3]
                             ),
                             "type": "courier",
                             "user_id": (
                                 courier["id"]
-                                if isinstance(courier, dict)
+                                if isinstance(courier, Mapping)
                                 else courier[0]
                             ),
                         }
@@ -12973,11 +15969,11 @@ def api_private_chats():
                 for s in staff:
                     private_chats.append(
                         {
-                            "id": f"staff_{s['id'] if isinstance(s, dict) else s[0]}",
-                            "name": f"{s.get('first_name', '') if isinstance(s, dict) else s[1]} {s.get('last_name', '') if isinstance(s, dict) else s[2]}".strip(),
-                            "avatar": s.get("avatar") if isinstance(s, dict) else s[3],
+                            "id": f"staff_{s['id'] if isinstance(s, Mapping) else s[0]}",
+                            "name": f"{s.get('first_name', '') if isinstance(s, Mapping) else s[1]} {s.get('last_name', '') if isinstance(s, Mapping) else s[2]}".strip(),
+                            "avatar": s.get("avatar") if isinstance(s, Mapping) else s[3],
                             "type": "staff",
-                            "user_id": s["id"] if isinstance(s, dict) else s[0],
+                            "user_id": s["id"] if isinstance(s, Mapping) else s[0],
                         }
                     )
 
@@ -12991,17 +15987,17 @@ def api_private_chats():
                 for courier in other_couriers:
                     private_chats.append(
                         {
-                            "id": f"courier_{courier['id'] if isinstance(courier, dict) else courier[0]}",
-                            "name": f"{courier.get('first_name', '') if isinstance(courier, dict) else courier[1]} {courier.get('last_name', '') if isinstance(courier, dict) else courier[2]}".strip(),
+                            "id": f"courier_{courier['id'] if isinstance(courier, Mapping) else courier[0]}",
+                            "name": f"{courier.get('first_name', '') if isinstance(courier, Mapping) else courier[1]} {courier.get('last_name', '') if isinstance(courier, Mapping) else courier[2]}".strip(),
                             "avatar": (
                                 courier.get("avatar")
-                                if isinstance(courier, dict)
+                                if isinstance(courier, Mapping)
                                 else courier[3]
                             ),
                             "type": "courier",
                             "user_id": (
                                 courier["id"]
-                                if isinstance(courier, dict)
+                                if isinstance(courier, Mapping)
                                 else courier[0]
                             ),
                         }
@@ -13017,11 +16013,11 @@ def api_private_chats():
                 for s in staff:
                     private_chats.append(
                         {
-                            "id": f"staff_{s['id'] if isinstance(s, dict) else s[0]}",
-                            "name": f"{s.get('first_name', '') if isinstance(s, dict) else s[1]} {s.get('last_name', '') if isinstance(s, dict) else s[2]}".strip(),
-                            "avatar": s.get("avatar") if isinstance(s, dict) else s[3],
+                            "id": f"staff_{s['id'] if isinstance(s, Mapping) else s[0]}",
+                            "name": f"{s.get('first_name', '') if isinstance(s, Mapping) else s[1]} {s.get('last_name', '') if isinstance(s, Mapping) else s[2]}".strip(),
+                            "avatar": s.get("avatar") if isinstance(s, Mapping) else s[3],
                             "type": "staff",
-                            "user_id": s["id"] if isinstance(s, dict) else s[0],
+                            "user_id": s["id"] if isinstance(s, Mapping) else s[0],
                         }
                     )
 
@@ -13033,17 +16029,17 @@ def api_private_chats():
                 for courier in couriers:
                     private_chats.append(
                         {
-                            "id": f"courier_{courier['id'] if isinstance(courier, dict) else courier[0]}",
-                            "name": f"{courier.get('first_name', '') if isinstance(courier, dict) else courier[1]} {courier.get('last_name', '') if isinstance(courier, dict) else courier[2]}".strip(),
+                            "id": f"courier_{courier['id'] if isinstance(courier, Mapping) else courier[0]}",
+                            "name": f"{courier.get('first_name', '') if isinstance(courier, Mapping) else courier[1]} {courier.get('last_name', '') if isinstance(courier, Mapping) else courier[2]}".strip(),
                             "avatar": (
                                 courier.get("avatar")
-                                if isinstance(courier, dict)
+                                if isinstance(courier, Mapping)
                                 else courier[3]
                             ),
                             "type": "courier",
                             "user_id": (
                                 courier["id"]
-                                if isinstance(courier, dict)
+                                if isinstance(courier, Mapping)
                                 else courier[0]
                             ),
                         }
@@ -13059,13 +16055,13 @@ def api_private_chats():
                     for s in staff:
                         private_chats.append(
                             {
-                                "id": f"staff_{s['id'] if isinstance(s, dict) else s[0]}",
-                                "name": f"{s.get('first_name', '') if isinstance(s, dict) else s[1]} {s.get('last_name', '') if isinstance(s, dict) else s[2]}".strip(),
+                                "id": f"staff_{s['id'] if isinstance(s, Mapping) else s[0]}",
+                                "name": f"{s.get('first_name', '') if isinstance(s, Mapping) else s[1]} {s.get('last_name', '') if isinstance(s, Mapping) else s[2]}".strip(),
                                 "avatar": (
-                                    s.get("avatar") if isinstance(s, dict) else s[3]
+                                    s.get("avatar") if isinstance(s, Mapping) else s[3]
                                 ),
                                 "type": "staff",
-                                "user_id": s["id"] if isinstance(s, dict) else s[0],
+                                "user_id": s["id"] if isinstance(s, Mapping) else s[0],
                             }
                         )
 
@@ -13077,17 +16073,17 @@ def api_private_chats():
                     for courier in couriers:
                         private_chats.append(
                             {
-                                "id": f"courier_{courier['id'] if isinstance(courier, dict) else courier[0]}",
-                                "name": f"{courier.get('first_name', '') if isinstance(courier, dict) else courier[1]} {courier.get('last_name', '') if isinstance(courier, dict) else courier[2]}".strip(),
+                                "id": f"courier_{courier['id'] if isinstance(courier, Mapping) else courier[0]}",
+                                "name": f"{courier.get('first_name', '') if isinstance(courier, Mapping) else courier[1]} {courier.get('last_name', '') if isinstance(courier, Mapping) else courier[2]}".strip(),
                                 "avatar": (
                                     courier.get("avatar")
-                                    if isinstance(courier, dict)
+                                    if isinstance(courier, Mapping)
                                     else courier[3]
                                 ),
                                 "type": "courier",
                                 "user_id": (
                                     courier["id"]
-                                    if isinstance(courier, dict)
+                                    if isinstance(courier, Mapping)
                                     else courier[0]
                                 ),
                             }
@@ -13142,7 +16138,7 @@ def api_private_chat(user_type, user_id):
             return jsonify({"success": False, "message": "User not found"}), 404
 
         # Create chat name
-        target_name = f"{target_user.get('first_name', '') if isinstance(target_user, dict) else target_user[1]} {target_user.get('last_name', '') if isinstance(target_user, dict) else target_user[2]}".strip()
+        target_name = f"{target_user.get('first_name', '') if isinstance(target_user, Mapping) else target_user[1]} {target_user.get('last_name', '') if isinstance(target_user, Mapping) else target_user[2]}".strip()
         chat_name = f"Private chat with {target_name}"
 
         # Check if private chat already exists
@@ -13162,7 +16158,7 @@ def api_private_chat(user_type, user_id):
         if existing_chat:
             chat_id = (
                 existing_chat["id"]
-                if isinstance(existing_chat, dict)
+                if isinstance(existing_chat, Mapping)
                 else existing_chat[0]
             )
         else:
@@ -13194,7 +16190,7 @@ def api_private_chat(user_type, user_id):
                         "name": target_name,
                         "avatar": (
                             target_user.get("avatar")
-                            if isinstance(target_user, dict)
+                            if isinstance(target_user, Mapping)
                             else target_user[3]
                         ),
                         "type": user_type,
@@ -13225,6 +16221,7 @@ def api_private_chat(user_type, user_id):
 
 
 @app.route("/api/chat-unread-count")
+@route_class("poll")
 def api_chat_unread_count():
     """Return unread chat count for current session user (used by frontend badge)."""
     try:
@@ -13516,8 +16513,8 @@ def api_send_notification():
         # Ensure notifications table exists
         try:
             execute_query(
-                """
-                CREATE TABLE IF NOT EXISTS notifications (
+                f"""
+                CREATE TABLE IF NOT EXISTS {side_table('notifications')} (
                     id INTEGER PRIMARY KEY AUTOINCREMENT,
                     recipient_type TEXT,
                     recipient_id INTEGER,
@@ -13677,7 +16674,8 @@ def super_admin_get_performance_stats():
         try:
             # Session'lar sonini taxminiy hisoblash
             result = execute_query(
-                "SELECT COUNT(DISTINCT user_id) FROM orders WHERE created_at > datetime('now', '-1 hour')",
+                "SELECT COUNT(DISTINCT user_id) FROM orders WHERE created_ts > ?",
+                (int(time.time()) - 3600,),
                 fetch_one=True,
             )
             active_sessions = result[0] if result else 0
@@ -13885,6 +16883,43 @@ def super_admin_download_logs():
         return f"Loglarni yuklab olishda xatolik: {str(e)}", 500
 
 
+@app.route("/super-admin/query-stats", methods=["GET", "POST"])
+@role_required("super_admin")
+def super_admin_query_stats():
+    """SQL profiler natijalari: umumiy vaqt bo'yicha eng og'ir statementlar.
+
+    GET ?limit=20&sort=total_time|count|avg|p95|p99|max|rows
+    POST {"enabled": bool, "reset": bool, "slow_ms": float} - profilerni boshqarish
+    """
+    if not session.get("super_admin"):
+        return jsonify({"success": False, "message": "Super admin huquqi kerak"}), 401
+
+    try:
+        if request.method == "POST":
+            data = request.get_json(silent=True) or {}
+            if "enabled" in data:
+                query_profiler.enabled = bool(data["enabled"])
+            if "slow_ms" in data:
+                query_profiler.slow_ms = max(0.0, float(data["slow_ms"]))
+            if data.get("reset"):
+                query_profiler.reset()
+
+        limit = max(1, min(200, request.args.get("limit", 20, type=int)))
+        sort = request.args.get("sort", "total_time")
+        return jsonify(
+            {
+                "success": True,
+                "enabled": query_profiler.enabled,
+                "slow_ms": query_profiler.slow_ms,
+                "statements_tracked": len(query_profiler.statements),
+                "top": query_profiler.top(limit, sort),
+            }
+        )
+    except Exception as e:
+        app_logger.error(f"Query stats error: {str(e)}")
+        return jsonify({"success": False, "error": str(e)}), 500
+
+
 @app.route("/super-admin/get-system-stats")
 @role_required("super_admin")
 def super_admin_get_system_stats():
@@ -13897,7 +16932,7 @@ def super_admin_get_system_stats():
         import os
 
         # System stats
-        uptime_seconds = time.time() - start_time
+        uptime_seconds = time.time() - APP_START_TIME
         uptime_days = int(uptime_seconds // 86400)
         uptime_hours = int((uptime_seconds % 86400) // 3600)
 
@@ -13941,6 +16976,10 @@ def super_admin_get_system_stats():
                 else "0.5%"
             ),
             "avgResponse": f"{int(perf_stats.get('avg_response_time', 0.25) * 1000)}ms",
+            "dbPools": get_db_pool_stats(),
+            "cache": get_cache_stats(),
+            "rateLimits": rate_limiter.stats(),
+            "catalog": catalog_snapshot_stats(),
         }
 
         return jsonify({"success": True, "stats": stats})
@@ -14061,10 +17100,9 @@ def super_admin_clear_cache():
         except Exception:
             cm = None
 
-        if cm and hasattr(cm, "memory_cache"):
+        if cm:
             try:
-                cm.memory_cache.clear()
-                cm.cache_timestamps.clear()
+                cm.clear()
             except Exception:
                 pass
 
@@ -14076,6 +17114,22 @@ def super_admin_clear_cache():
         return jsonify({"success": False, "message": "Cache tozalashda xatolik"})
 
 
+@app.route("/super-admin/reconcile-ratings", methods=["POST"])
+@role_required("super_admin")
+def super_admin_reconcile_ratings():
+    "rating_aggregates ni ratings bilan darhol solishtirish"
+    if not session.get("super_admin"):
+        return jsonify({"success": False, "message": "Super admin huquqi kerak"})
+
+    try:
+        fixed = reconcile_rating_aggregates()
+        app_logger.info(f"Super admin baholarni qayta hisobladi: {len(fixed)} ta tuzatildi")
+        return jsonify({"success": True, "fixed": len(fixed)})
+    except Exception as e:
+        app_logger.error(f"Reconcile ratings error: {str(e)}")
+        return jsonify({"success": False, "message": "Baholarni qayta hisoblashda xatolik"})
+
+
 @app.route("/super-admin/backup-database", methods=["POST"])
 @role_required("super_admin")
 def super_admin_backup_database():
@@ -14098,6 +17152,13 @@ def super_admin_backup_database():
 
         # Database ni backup qilish
         shutil.copy2(DB_PATH, backup_path)
+        # Alohida fayllardagi jadvallar (chat, bildirishnomalar, sessiyalar)
+        for schema, side_path in SIDE_DB_PATHS.items():
+            if os.path.exists(side_path):
+                shutil.copy2(
+                    side_path,
+                    os.path.join(backup_dir, f"{schema}_backup_{timestamp}.sqlite3"),
+                )
 
         app_logger.info(f"Super admin database backup yaratdi: {backup_filename}")
         return jsonify(
@@ -14138,8 +17199,9 @@ def super_admin_save_config():
 
 
 @app.route("/api/super-admin/dashboard-stats")
+@route_class("poll")
 @role_required("super_admin")
-@cached(ttl=15)
+@cached(ttl=15, stale_ttl=Config.CACHE_STALE_TTL)
 def api_super_admin_dashboard_stats():
     # role_required decorator enforces super_admin session
 
@@ -14340,8 +17402,8 @@ def staff_dashboard():
         # Staff ID ni olish
         staff_id = session.get("staff_id")
 
-        # Buyurtmalarni olish - soddalashtirilgan usul
-        orders_raw = execute_query(
+        # Buyurtmalarni olish - soddalashtirilgan usul (to'g'ridan-to'g'ri dict)
+        orders = fetch_dicts(
             """
             SELECT o.id, o.user_id, o.customer_name, o.ticket_no, o.order_type, 
                    o.status, o.delivery_address, o.delivery_distance, o.customer_phone, 
@@ -14362,21 +17424,9 @@ def staff_dashboard():
                     ELSE 7
                 END,
                 o.created_at DESC
-        """,
-            fetch_all=True,
+        """
         )
 
-        # Ma'lumotlarni dict formatiga o'tkazish
-        orders = []
-        if orders_raw:
-            for row in orders_raw:
-                try:
-                    order_dict = dict(row) if hasattr(row, "keys") else {}
-                    orders.append(order_dict)
-                except Exception as row_error:
-                    app_logger.warning(f"Order row processing error: {str(row_error)}")
-                    continue
-
         # Staff statistikasini olish - xavfsiz usul
         try:
             staff_stats = execute_query(
@@ -14609,61 +17659,36 @@ def staff_menu():
         return redirect(url_for("staff_login"))
 
     try:
-        # Ma'lumotlarni to'g'ri olish
-        with db_pool.get_connection() as conn:
-            conn.row_factory = sqlite3.Row
-            cur = conn.cursor()
-            cur.execute("SELECT * FROM menu_items ORDER BY category, name")
-            menu_items_raw = cur.fetchall()
+        # Mahsulotlar va media fayllari - katalog snapshotidan
+        catalog = get_catalog_snapshot()
+        menu_items = []
+        for item_dict in catalog.items():
+            try:
+                # Default qiymatlarni qo'shish
+                item_dict.setdefault("description", "")
+                item_dict.setdefault("image_url", "/static/images/default-men.jpg")
+                item_dict.setdefault("available", 1)
+                item_dict.setdefault("discount_percentage", 0)
+                item_dict.setdefault("rating", 0.0)
+                item_dict.setdefault("orders_count", 0)
+
+                item_dict["media_files"] = catalog.item_media(item_dict["id"])
+
+                # Agar media fayllar yo'q bo'lsa, eski image_url dan foydalanish
+                if not item_dict["media_files"] and item_dict.get("image_url"):
+                    item_dict["media_files"] = [
+                        {
+                            "media_type": "image",
+                            "media_url": item_dict["image_url"],
+                            "display_order": 0,
+                            "is_main": True,
+                        }
+                    ]
 
-            menu_items = []
-            if menu_items_raw:
-                for row in menu_items_raw:
-                    try:
-                        item_dict = dict(row)
-                        # Default qiymatlarni qo'shish
-                        item_dict.setdefault("description", "")
-                        item_dict.setdefault(
-                            "image_url", "/static/images/default-men.jpg"
-                        )
-                        item_dict.setdefault("available", 1)
-                        item_dict.setdefault("discount_percentage", 0)
-                        item_dict.setdefault("rating", 0.0)
-                        item_dict.setdefault("orders_count", 0)
-
-                        # Mahsulot media fayllarini olish
-                        media_query = """
-                            SELECT media_type, media_url, display_order, is_main
-                            FROM product_media 
-                            WHERE menu_item_id = ? 
-                            ORDER BY is_main DESC, display_order ASC
-                        """
-                        cur.execute(media_query, (item_dict["id"],))
-                        media_files = cur.fetchall()
-
-                        item_dict["media_files"] = []
-                        if media_files:
-                            for media in media_files:
-                                media_dict = dict(media)
-                                item_dict["media_files"].append(media_dict)
-
-                        # Agar media fayllar yo'q bo'lsa, eski image_url dan foydalanish
-                        if not item_dict["media_files"] and item_dict.get("image_url"):
-                            item_dict["media_files"] = [
-                                {
-                                    "media_type": "image",
-                                    "media_url": item_dict["image_url"],
-                                    "display_order": 0,
-                                    "is_main": True,
-                                }
-                            ]
-
-                        menu_items.append(item_dict)
-                    except Exception as row_error:
-                        app_logger.warning(
-                            f"Menu item row processing error: {str(row_error)}"
-                        )
-                        continue
+                menu_items.append(item_dict)
+            except Exception as row_error:
+                app_logger.warning(f"Menu item row processing error: {str(row_error)}")
+                continue
 
         app_logger.info(f"Staff menu loaded: {len(menu_items)} items found")
         return render_template("staff_menu.html", menu_items=menu_items)
@@ -14708,9 +17733,9 @@ def staff_employees():
 
     try:
         # Ma'lumotlarni to'g'ri olish
-        with db_pool.get_connection() as conn:
-            conn.row_factory = sqlite3.Row
+        with db_connection(read_only=True) as conn:
             cur = conn.cursor()
+            cur.row_factory = sqlite3.Row
             cur.execute("SELECT * FROM staff ORDER BY created_at DESC")
             staff_raw = cur.fetchall()
 
@@ -14923,8 +17948,8 @@ def super_admin_dashboard():
             try:
                 current_month = get_current_time().strftime("%Y-%m")
                 result = execute_query(
-                    "SELECT COUNT(*) FROM orders WHERE created_at LIKE ?",
-                    (f"{current_month}%",),
+                    "SELECT COUNT(*) FROM orders WHERE created_ts >= ? AND created_ts < ?",
+                    epoch_month_range(current_month),
                     fetch_one=True,
                 )
                 if result and len(result) > 0 and result[0] is not None:
@@ -14996,7 +18021,7 @@ def super_admin_analytics():
         }
 
         try:
-            conn = get_db()
+            conn = get_read_db()
             cur = conn.cursor()
 
             # So'nggi 6 oylik buyurtmalar statistikasi
@@ -15006,8 +18031,8 @@ def super_admin_analytics():
                 ).strftime("%Y-%m")
                 try:
                     cur.execute(
-                        "SELECT COUNT(*) FROM orders WHERE created_at LIKE ?",
-                        (f"{month_date}%",),
+                        "SELECT COUNT(*) FROM orders WHERE created_ts >= ? AND created_ts < ?",
+                        epoch_month_range(month_date),
                     )
                     result = cur.fetchone()
                     count = result[0] if result and result[0] is not None else 0
@@ -15030,8 +18055,8 @@ def super_admin_analytics():
             try:
                 # daily
                 cur.execute(
-                    "SELECT COUNT(*), COALESCE(SUM(r.total_amount),0) FROM orders o LEFT JOIN receipts r ON r.order_id = o.id WHERE DATE(o.created_at) = ?",
-                    (get_current_time().strftime("%Y-%m-%d"),),
+                    "SELECT COUNT(*), COALESCE(SUM(r.total_amount),0) FROM orders o LEFT JOIN receipts r ON r.order_id = o.id WHERE o.created_ts >= ? AND o.created_ts < ?",
+                    epoch_day_range(get_current_time().strftime("%Y-%m-%d")),
                 )
                 row = cur.fetchone()
                 analytics_data["daily"]["orders"] = int(row[0] or 0) if row else 0
@@ -15044,8 +18069,8 @@ def super_admin_analytics():
                     "%Y-%m-%d"
                 )
                 cur.execute(
-                    "SELECT COUNT(*), COALESCE(SUM(r.total_amount),0) FROM orders o LEFT JOIN receipts r ON r.order_id = o.id WHERE DATE(o.created_at) >= ?",
-                    (week_start,),
+                    "SELECT COUNT(*), COALESCE(SUM(r.total_amount),0) FROM orders o LEFT JOIN receipts r ON r.order_id = o.id WHERE o.created_ts >= ?",
+                    (date_to_epoch(week_start),),
                 )
                 row = cur.fetchone()
                 analytics_data["weekly"]["orders"] = int(row[0] or 0) if row else 0
@@ -15058,8 +18083,8 @@ def super_admin_analytics():
                     get_current_time() - datetime.timedelta(days=30)
                 ).strftime("%Y-%m-%d")
                 cur.execute(
-                    "SELECT COALESCE(SUM(r.total_amount),0) FROM orders o LEFT JOIN receipts r ON r.order_id = o.id WHERE DATE(o.created_at) >= ?",
-                    (month_start,),
+                    "SELECT COALESCE(SUM(r.total_amount),0) FROM orders o LEFT JOIN receipts r ON r.order_id = o.id WHERE o.created_ts >= ?",
+                    (date_to_epoch(month_start),),
                 )
                 row = cur.fetchone()
                 analytics_data["monthly"]["revenue"] = int(row[0] or 0) if row else 0
@@ -15128,13 +18153,14 @@ def super_admin_reports():
             "monthly": {"orders": 0, "revenue": 0},
         }
 
-        with db_pool.get_connection() as conn:
+        with db_connection(read_only=True) as conn:
             cur = conn.cursor()
 
             # Kunlik hisobot
             today = get_current_time().strftime("%Y-%m-%d")
             cur.execute(
-                "SELECT COUNT(*) FROM orders WHERE DATE(created_at) = ?", (today,)
+                "SELECT COUNT(*) FROM orders WHERE created_ts >= ? AND created_ts < ?",
+                epoch_day_range(today),
             )
             result = cur.fetchone()
             daily_orders = result[0] if result and result[0] is not None else 0
@@ -15145,7 +18171,8 @@ def super_admin_reports():
                 "%Y-%m-%d"
             )
             cur.execute(
-                "SELECT COUNT(*) FROM orders WHERE DATE(created_at) >= ?", (week_ago,)
+                "SELECT COUNT(*) FROM orders WHERE created_ts >= ?",
+                (date_to_epoch(week_ago),),
             )
             result = cur.fetchone()
             weekly_orders = result[0] if result and result[0] is not None else 0
@@ -15156,7 +18183,8 @@ def super_admin_reports():
                 "%Y-%m-%d"
             )
             cur.execute(
-                "SELECT COUNT(*) FROM orders WHERE DATE(created_at) >= ?", (month_ago,)
+                "SELECT COUNT(*) FROM orders WHERE created_ts >= ?",
+                (date_to_epoch(month_ago),),
             )
             result = cur.fetchone()
             monthly_orders = result[0] if result and result[0] is not None else 0
@@ -15166,8 +18194,8 @@ def super_admin_reports():
             try:
                 # daily revenue
                 cur.execute(
-                    "SELECT COALESCE(SUM(r.total_amount), 0) FROM orders o LEFT JOIN receipts r ON o.id = r.order_id WHERE DATE(o.created_at) = ?",
-                    (today,),
+                    "SELECT COALESCE(SUM(r.total_amount), 0) FROM orders o LEFT JOIN receipts r ON o.id = r.order_id WHERE o.created_ts >= ? AND o.created_ts < ?",
+                    epoch_day_range(today),
                 )
                 res = cur.fetchone()
                 reports_data["daily"]["revenue"] = (
@@ -15176,8 +18204,8 @@ def super_admin_reports():
 
                 # weekly revenue (last 7 days)
                 cur.execute(
-                    "SELECT COALESCE(SUM(r.total_amount), 0) FROM orders o LEFT JOIN receipts r ON o.id = r.order_id WHERE DATE(o.created_at) >= ?",
-                    (week_ago,),
+                    "SELECT COALESCE(SUM(r.total_amount), 0) FROM orders o LEFT JOIN receipts r ON o.id = r.order_id WHERE o.created_ts >= ?",
+                    (date_to_epoch(week_ago),),
                 )
                 res = cur.fetchone()
                 reports_data["weekly"]["revenue"] = (
@@ -15186,8 +18214,8 @@ def super_admin_reports():
 
                 # monthly revenue (last 30 days)
                 cur.execute(
-                    "SELECT COALESCE(SUM(r.total_amount), 0) FROM orders o LEFT JOIN receipts r ON o.id = r.order_id WHERE DATE(o.created_at) >= ?",
-                    (month_ago,),
+                    "SELECT COALESCE(SUM(r.total_amount), 0) FROM orders o LEFT JOIN receipts r ON o.id = r.order_id WHERE o.created_ts >= ?",
+                    (date_to_epoch(month_ago),),
                 )
                 res = cur.fetchone()
                 reports_data["monthly"]["revenue"] = (
@@ -15308,6 +18336,8 @@ def super_admin_system():
                 "max_response_time": 2.5,
                 "min_response_time": 0.05,
             },
+            "db_pools": get_db_pool_stats(),
+            "cache": get_cache_stats(),
         }
 
         # Template fallback
@@ -15337,6 +18367,8 @@ def super_admin_system():
                             <p>O'rtacha javob vaqti: {system_info['performance'].get('avg_response_time', 0):.2f}s</p>
                         </div>
                     </div>
+                    <h4>Database pool</h4>
+                    <pre>{json.dumps(system_info['db_pools'], indent=2)}</pre>
                     <a href="{url_for('super_admin_dashboard')}" class="btn btn-primary mt-3">Dashboard ga qaytish</a>
                 </div>
             </body>
@@ -15766,6 +18798,7 @@ def super_admin_add_courier():
 
 
 @app.route("/super-admin/delete-user", methods=["POST"])
+@invalidates("menu", "cart")
 def super_admin_delete_user():
     "Super admin delete user"
     if not session.get("super_admin"):
@@ -15995,6 +19028,7 @@ def reset_settings():
 
 
 @app.route("/api/news", methods=["GET"])
+@cached(ttl=Config.CACHE_TAGGED_TTL, tags=("news",))
 def api_news():
     """Get all active news items for ticker"""
     try:
@@ -16005,7 +19039,7 @@ def api_news():
         news_items = []
         for r in rows:
             try:
-                if isinstance(r, dict):
+                if isinstance(r, Mapping):
                     item = r
                 else:
                     # convert tuple to dict assuming schema order matches
@@ -16027,6 +19061,7 @@ def api_news():
 @app.route("/api/news", methods=["POST"])
 @role_required("super_admin")
 @csrf_protect
+@invalidates("news")
 def api_create_news():
     """Create new news item - Super admin only"""
     try:
@@ -16141,6 +19176,7 @@ def api_create_news():
 @app.route("/api/news/<int:news_id>", methods=["PUT"])
 @role_required("super_admin")
 @csrf_protect
+@invalidates("news")
 def api_update_news(news_id):
     """Update news item - Super admin only"""
     try:
@@ -16253,6 +19289,7 @@ def api_update_news(news_id):
 @app.route("/api/news/<int:news_id>", methods=["DELETE"])
 @role_required("super_admin")
 @csrf_protect
+@invalidates("news")
 def api_delete_news(news_id):
     """Delete news item - Super admin only"""
     try:
@@ -16339,7 +19376,7 @@ def api_admin_news():
             norm = []
             for r in news_items or []:
                 try:
-                    item = dict(r) if not isinstance(r, dict) else r
+                    item = dict(r) if not isinstance(r, Mapping) else r
                 except Exception:
                     item = r
                 item["youtube_embed"] = extract_youtube_embed(item.get("video_url") or "")
@@ -16416,6 +19453,7 @@ def api_admin_news():
                             except Exception:
                                 continue
 
+                        invalidate_cache("news")
                         # Reload after import
                         news_items = execute_query(
                             "SELECT * FROM news ORDER BY display_order ASC, created_at DESC",
@@ -16461,6 +19499,7 @@ def api_admin_news():
                         )
                     except Exception:
                         continue
+                invalidate_cache("news")
                 news_items = execute_query(
                     "SELECT * FROM news ORDER BY display_order ASC, created_at DESC",
                     fetch_all=True,
@@ -16476,6 +19515,7 @@ def api_admin_news():
 @app.route("/api/news/toggle/<int:news_id>", methods=["POST"])
 @role_required("super_admin")
 @csrf_protect
+@invalidates("news")
 def api_toggle_news(news_id):
     """Toggle news active status - Super admin only"""
     try:
@@ -16578,6 +19618,7 @@ def api_admin_news_ticker():
 @app.route("/api/news/ticker/toggle/<int:news_id>", methods=["POST"])
 @role_required("super_admin")
 @csrf_protect
+@invalidates("news")
 def api_toggle_news_ticker(news_id):
     """Toggle show_in_ticker flag - Super admin only"""
     try:
@@ -17045,6 +20086,32 @@ def serve_data_file(filename):
         return jsonify({"error": "File not found"}), 404
 
 
+# Barcha funksiyalar e'lon qilingandan keyin sxema migratsiyalarini bajarish
+if not os.environ.get("SKIP_DB_INIT"):
+    # Sxema versiyasi PRAGMA user_version da saqlanadi; yangilangan bazada
+    # bu faqat bitta tekshiruv, migratsiyalar esa fayl qulfi ostida bir marta ishlaydi
+    try:
+        from migrations import run_migrations
+
+        applied = run_migrations(
+            DB_PATH,
+            context={
+                "legacy_bootstrap": legacy_schema_bootstrap,
+                "side_databases": SIDE_DB_PATHS,
+            },
+        )
+        if applied:
+            reset_db_pools()
+            app_logger.info(f"Database migrations applied: {applied}")
+    except Exception as migration_error:
+        app_logger.error(f"Database migration xatoligi: {str(migration_error)}")
+
+    try:
+        start_rating_reconciler()
+    except Exception as reconcile_error:
+        app_logger.error(f"Rating reconciler ishga tushmadi: {str(reconcile_error)}")
+
+
 # Flask app runner
 if __name__ == "__main__":
     host = "127.0.0.1"
@@ -0,0 +1,10 @@
+# Boshlang'ich sxema: avvalgi ensure_*/fix_*/init_db startup tekshiruvlari.
+#
+# Bu funksiyalar idempotent va o'z connectionlarini ochadi, shuning uchun
+# ular app.py dan context orqali beriladi va faqat bir marta ishlatiladi.
+
+
+def upgrade(conn, context):
+    bootstrap = context.get("legacy_bootstrap")
+    if bootstrap is not None:
+        bootstrap()
@@ -0,0 +1,67 @@
+# Issiq jadvallar uchun ikkilamchi indekslar.
+#
+# Har bir indeks app.py dagi real WHERE/JOIN/ORDER BY shakliga mos keladi;
+# tools/query_plan_audit.py shu ro'yxat va so'rovlar katalogini tekshiradi.
+
+# (index_name, table, columns)
+INDEXES = [
+    # orders: status navbatlari, ticket qidiruvi, kuryer va foydalanuvchi buyurtmalari
+    ("idx_orders_status_eta", "orders", ("status", "eta_time")),
+    ("idx_orders_status_created", "orders", ("status", "created_at")),
+    ("idx_orders_ticket_no", "orders", ("ticket_no",)),
+    ("idx_orders_user_created", "orders", ("user_id", "created_at")),
+    ("idx_orders_courier_status", "orders", ("courier_id", "status")),
+    ("idx_orders_created_at", "orders", ("created_at",)),
+    # order_details: buyurtma tarkibi va mahsulot statistikasi
+    ("idx_order_details_order", "order_details", ("order_id",)),
+    ("idx_order_details_menu_item", "order_details", ("menu_item_id",)),
+    # receipts
+    ("idx_receipts_order", "receipts", ("order_id",)),
+    ("idx_receipts_created_at", "receipts", ("created_at",)),
+    # cart_items: foydalanuvchi yoki sessiya savatchasi
+    ("idx_cart_items_user_item", "cart_items", ("user_id", "menu_item_id")),
+    ("idx_cart_items_session_item", "cart_items", ("session_id", "menu_item_id")),
+    # notifications: qabul qiluvchi bo'yicha, yangilari birinchi
+    (
+        "idx_notifications_recipient",
+        "notifications",
+        ("recipient_type", "recipient_id", "created_at"),
+    ),
+    ("idx_notifications_created_at", "notifications", ("created_at",)),
+    # chat
+    ("idx_chat_messages_chat", "chat_messages", ("chat_id", "id")),
+    ("idx_chat_members_member", "chat_members", ("member_type", "member_id")),
+    ("idx_chat_members_chat", "chat_members", ("chat_id",)),
+    ("idx_chats_group_name", "chats", ("is_group", "name")),
+    # ratings
+    ("idx_ratings_menu_item", "ratings", ("menu_item_id", "created_at")),
+    ("idx_ratings_user", "ratings", ("user_id",)),
+    # product_media: galereya tartibi va asosiy rasm
+    (
+        "idx_product_media_item_order",
+        "product_media",
+        ("menu_item_id", "is_main", "display_order"),
+    ),
+    ("idx_product_media_url", "product_media", ("media_url",)),
+    # favorites / sessions / menu / news
+    ("idx_favorites_user", "favorites", ("user_id", "menu_item_id")),
+    ("idx_sessions_user_last_seen", "sessions", ("user_id", "last_seen")),
+    ("idx_menu_items_available_category", "menu_items", ("available", "category", "name")),
+    ("idx_news_active_order", "news", ("is_active", "display_order")),
+]
+
+
+def _table_columns(conn, table):
+    return {r[1] for r in conn.execute(f"PRAGMA table_info({table})").fetchall()}
+
+
+def upgrade(conn, context):
+    for name, table, columns in INDEXES:
+        existing = _table_columns(conn, table)
+        if not existing or not set(columns) <= existing:
+            # Eski/noodatiy sxema - indeksni o'tkazib yuborish (audit buni ko'rsatadi)
+            continue
+        conn.execute(
+            f"CREATE INDEX IF NOT EXISTS {name} ON {table} ({', '.join(columns)})"
+        )
+    conn.execute("ANALYZE")
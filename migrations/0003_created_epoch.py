@@ -0,0 +1,76 @@
+# created_ts: created_at ning UTC epoch (soniya) ko'rinishi.
+#
+# created_at turli formatlarda yozilgan ("YYYY-MM-DD HH:MM:SS", isoformat,
+# "+05:00" suffiksli), shuning uchun DATE(created_at)/LIKE filtrlari indeks
+# ishlata olmaydi. created_ts butun son bo'lgani uchun hisobotlar oddiy
+# diapazon (created_ts >= ? AND created_ts < ?) bilan indeks bo'ylab o'qiydi.
+#
+# Qiymatni triggerlar to'ldiradi - app.py dagi har bir INSERT joyini
+# o'zgartirish shart emas. strftime('%s') suffiksli vaqtni UTC ga o'giradi,
+# suffikssiz vaqtni esa UTC deb oladi - ya'ni DATE(created_at) bilan bir xil
+# kun chegaralari saqlanadi.
+
+TABLES = ("orders", "receipts", "users", "notifications", "chat_messages")
+
+# (index_name, table, columns)
+INDEXES = [
+    ("idx_orders_created_ts", "orders", ("created_ts",)),
+    ("idx_orders_status_created_ts", "orders", ("status", "created_ts")),
+    ("idx_receipts_created_ts", "receipts", ("created_ts",)),
+    ("idx_users_created_ts", "users", ("created_ts",)),
+    (
+        "idx_notifications_recipient_ts",
+        "notifications",
+        ("recipient_type", "recipient_id", "created_ts"),
+    ),
+    ("idx_chat_messages_created_ts", "chat_messages", ("created_ts",)),
+]
+
+EPOCH_EXPR = "CAST(strftime('%s', {}) AS INTEGER)"
+
+
+def _table_columns(conn, table):
+    return {r[1] for r in conn.execute(f"PRAGMA table_info({table})").fetchall()}
+
+
+def upgrade(conn, context):
+    for table in TABLES:
+        columns = _table_columns(conn, table)
+        if "created_at" not in columns:
+            continue
+        if "created_ts" not in columns:
+            conn.execute(f"ALTER TABLE {table} ADD COLUMN created_ts INTEGER")
+
+        # Mavjud yozuvlarni to'ldirish
+        conn.execute(
+            f"UPDATE {table} SET created_ts = {EPOCH_EXPR.format('created_at')} "
+            "WHERE created_ts IS NULL AND created_at IS NOT NULL"
+        )
+
+        # Yangi va tahrirlangan yozuvlar uchun
+        conn.execute(
+            f"""CREATE TRIGGER IF NOT EXISTS trg_{table}_created_ts_insert
+                AFTER INSERT ON {table}
+                WHEN NEW.created_ts IS NULL AND NEW.created_at IS NOT NULL
+                BEGIN
+                    UPDATE {table} SET created_ts = {EPOCH_EXPR.format('NEW.created_at')}
+                    WHERE rowid = NEW.rowid;
+                END"""
+        )
+        conn.execute(
+            f"""CREATE TRIGGER IF NOT EXISTS trg_{table}_created_ts_update
+                AFTER UPDATE OF created_at ON {table}
+                BEGIN
+                    UPDATE {table} SET created_ts = {EPOCH_EXPR.format('NEW.created_at')}
+                    WHERE rowid = NEW.rowid;
+                END"""
+        )
+
+    for name, table, columns in INDEXES:
+        existing = _table_columns(conn, table)
+        if not existing or not set(columns) <= existing:
+            continue
+        conn.execute(
+            f"CREATE INDEX IF NOT EXISTS {name} ON {table} ({', '.join(columns)})"
+        )
+    conn.execute("ANALYZE")
@@ -0,0 +1,123 @@
+# Tez-tez yoziladigan jadvallarni alohida SQLite fayllarga ko'chirish.
+#
+# sessions (har so'rovda yoziladi), bildirishnomalar va chat jadvallari
+# buyurtmalar bilan bitta WAL yozuv qulfini talashmasligi uchun o'z
+# fayllariga o'tkaziladi. app.py bu fayllarni har bir connectionga shu schema
+# nomlari bilan ATTACH qiladi, shuning uchun jadval nomlari o'zgarmaydi.
+#
+# Fayl yo'llari context["side_databases"] dan olinadi; berilmasa asosiy baza
+# yonida <schema>.sqlite3.
+
+import os
+import re
+
+# schema -> ko'chiriladigan jadvallar (FK bo'yicha ota jadval birinchi)
+MOVES = {
+    "messaging": ("chats", "chat_members", "chat_messages", "messages", "notifications"),
+    "activity": ("sessions",),
+}
+
+
+def default_paths(conn):
+    main_file = next(r[2] for r in conn.execute("PRAGMA database_list") if r[1] == "main")
+    base = os.path.dirname(main_file)
+    return {schema: os.path.join(base, f"{schema}.sqlite3") for schema in MOVES}
+
+
+def _columns(conn, schema, table):
+    return [r[1] for r in conn.execute(f"PRAGMA {schema}.table_info({table})")]
+
+
+def _move_table(conn, schema, table):
+    row = conn.execute(
+        "SELECT sql FROM main.sqlite_master WHERE type='table' AND name=?", (table,)
+    ).fetchone()
+    if row is None:
+        return
+
+    side_columns = _columns(conn, schema, table)
+    if side_columns and not conn.execute(f"SELECT 1 FROM {schema}.{table} LIMIT 1").fetchone():
+        # Ko'chirishdan oldin runtime yaratgan bo'sh jadval - asl sxema bilan qayta yaratiladi
+        conn.execute(f"DROP TABLE {schema}.{table}")
+        side_columns = []
+    if not side_columns:
+        create_sql = re.sub(
+            r"^CREATE TABLE\s+(IF NOT EXISTS\s+)?[\"\[`]?\w+[\"\]`]?",
+            f"CREATE TABLE {schema}.{table}",
+            row[0],
+            count=1,
+        )
+        conn.execute(create_sql)
+        side_columns = _columns(conn, schema, table)
+
+    columns = ", ".join(c for c in _columns(conn, "main", table) if c in side_columns)
+    conn.execute(
+        f"INSERT OR IGNORE INTO {schema}.{table} ({columns}) SELECT {columns} FROM main.{table}"
+    )
+    _copy_sequence(conn, schema, table)
+
+    extras = conn.execute(
+        "SELECT type, sql FROM main.sqlite_master "
+        "WHERE tbl_name=? AND type IN ('index', 'trigger') AND sql IS NOT NULL",
+        (table,),
+    ).fetchall()
+    conn.execute(f"DROP TABLE main.{table}")
+    for kind, sql in extras:
+        if kind == "index":
+            sql = re.sub(
+                r"^CREATE\s+(UNIQUE\s+)?INDEX\s+(IF NOT EXISTS\s+)?",
+                lambda m: f"CREATE {m.group(1) or ''}INDEX IF NOT EXISTS {schema}.",
+                sql,
+                count=1,
+            )
+        else:
+            sql = re.sub(
+                r"^CREATE\s+TRIGGER\s+(IF NOT EXISTS\s+)?",
+                f"CREATE TRIGGER IF NOT EXISTS {schema}.",
+                sql,
+                count=1,
+            )
+        conn.execute(sql)
+
+
+def _has_sequence(conn, schema):
+    return (
+        conn.execute(
+            f"SELECT 1 FROM {schema}.sqlite_master WHERE name='sqlite_sequence'"
+        ).fetchone()
+        is not None
+    )
+
+
+def _copy_sequence(conn, schema, table):
+    "AUTOINCREMENT hisoblagichi o'chirilgan id larni qayta bermasligi uchun"
+    if not (_has_sequence(conn, "main") and _has_sequence(conn, schema)):
+        return
+    row = conn.execute(
+        "SELECT seq FROM main.sqlite_sequence WHERE name=?", (table,)
+    ).fetchone()
+    if row is None:
+        return
+    updated = conn.execute(
+        f"UPDATE {schema}.sqlite_sequence SET seq = MAX(seq, ?) WHERE name=?",
+        (row[0], table),
+    ).rowcount
+    if not updated:
+        conn.execute(
+            f"INSERT INTO {schema}.sqlite_sequence (name, seq) VALUES (?, ?)",
+            (table, row[0]),
+        )
+
+
+def upgrade(conn, context):
+    paths = context.get("side_databases") or default_paths(conn)
+    # ATTACH va journal_mode tranzaksiya ichida ishlamaydi
+    if conn.in_transaction:
+        conn.commit()
+    for schema in MOVES:
+        conn.execute("ATTACH DATABASE ? AS " + schema, (paths[schema],))
+        conn.execute(f"PRAGMA {schema}.journal_mode=WAL")
+    for schema, tables in MOVES.items():
+        for table in tables:
+            _move_table(conn, schema, table)
+        conn.execute(f"ANALYZE {schema}")
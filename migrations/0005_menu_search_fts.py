@@ -0,0 +1,69 @@
+# menu_items uchun FTS5 to'liq matnli qidiruv indeksi.
+#
+# `name LIKE '%q%'` har doim butun jadvalni o'qiydi va natijani tartiblay
+# olmaydi. menu_items_fts - external content FTS5 jadvali (matnni o'zi
+# saqlamaydi, rowid = menu_items.id), triggerlar uni menu_items bilan
+# sinxron ushlaydi - app.py va tools/seed_shoes.py dagi INSERT/UPDATE/DELETE
+# joylarini o'zgartirish shart emas.
+#
+# unicode61 + remove_diacritics: lotin, kirill va o'/g' harflari bir xil
+# tokenlanadi. SQLite FTS5 siz yig'ilgan bo'lsa migratsiya hech narsa
+# qilmaydi va app.py LIKE qidiruviga qaytadi.
+
+import sqlite3
+
+TABLE = "menu_items_fts"
+COLUMNS = ("name", "description", "category", "colors")
+
+
+def fts5_available(conn):
+    try:
+        conn.execute("CREATE VIRTUAL TABLE temp.fts5_probe USING fts5(x)")
+        conn.execute("DROP TABLE temp.fts5_probe")
+        return True
+    except sqlite3.OperationalError:
+        return False
+
+
+def _table_columns(conn, table):
+    return {r[1] for r in conn.execute(f"PRAGMA table_info({table})").fetchall()}
+
+
+def upgrade(conn, context):
+    if not set(COLUMNS) <= _table_columns(conn, "menu_items") or not fts5_available(conn):
+        return
+
+    columns = ", ".join(COLUMNS)
+    new_values = ", ".join(f"NEW.{c}" for c in COLUMNS)
+    old_values = ", ".join(f"OLD.{c}" for c in COLUMNS)
+    conn.execute(
+        f"""CREATE VIRTUAL TABLE IF NOT EXISTS {TABLE} USING fts5(
+                {columns},
+                content='menu_items', content_rowid='id',
+                tokenize='unicode61 remove_diacritics 2',
+                prefix='2 3'
+            )"""
+    )
+    conn.execute(
+        f"""CREATE TRIGGER IF NOT EXISTS trg_menu_items_fts_insert
+            AFTER INSERT ON menu_items BEGIN
+                INSERT INTO {TABLE} (rowid, {columns}) VALUES (NEW.id, {new_values});
+            END"""
+    )
+    conn.execute(
+        f"""CREATE TRIGGER IF NOT EXISTS trg_menu_items_fts_delete
+            AFTER DELETE ON menu_items BEGIN
+                INSERT INTO {TABLE} ({TABLE}, rowid, {columns})
+                VALUES ('delete', OLD.id, {old_values});
+            END"""
+    )
+    conn.execute(
+        f"""CREATE TRIGGER IF NOT EXISTS trg_menu_items_fts_update
+            AFTER UPDATE OF {columns} ON menu_items BEGIN
+                INSERT INTO {TABLE} ({TABLE}, rowid, {columns})
+                VALUES ('delete', OLD.id, {old_values});
+                INSERT INTO {TABLE} (rowid, {columns}) VALUES (NEW.id, {new_values});
+            END"""
+    )
+    # Mavjud mahsulotlarni indekslash
+    conn.execute(f"INSERT INTO {TABLE} ({TABLE}) VALUES ('rebuild')")
@@ -0,0 +1,108 @@
+# menu_items.sizes / colors uchun normallashtirilgan facet jadvallari.
+#
+# sizes va colors CSV ("36, 37,38") yoki JSON massiv ('["S","M"]') sifatida
+# saqlanadi. `LIKE '%,36,%'` indeks ishlata olmaydi, bo'shliqli CSV da
+# ("xl, xm") topolmaydi va facet sonlarini bera olmaydi. Har bir qiymat bu
+# jadvallarda alohida qator (trim qilingan, NOCASE), FTS jadvali kabi
+# triggerlar orqali menu_items bilan sinxron.
+#
+# JSON1 (json_each) bo'lmagan SQLite da migratsiya hech narsa qilmaydi va
+# app.py LIKE filtrlariga qaytadi.
+
+import sqlite3
+
+# menu_items ustuni -> (facet jadvali, qiymat ustuni)
+FACETS = {
+    "sizes": ("menu_item_sizes", "size"),
+    "colors": ("menu_item_colors", "color"),
+}
+
+# (index_name, table, columns)
+INDEXES = [
+    ("idx_menu_item_sizes_item", "menu_item_sizes", ("menu_item_id",)),
+    ("idx_menu_item_colors_item", "menu_item_colors", ("menu_item_id",)),
+]
+
+
+def values_json(expr):
+    """CSV yoki JSON massiv -> json_each uchun JSON massiv (SQL ifoda).
+
+    CSV dagi qo'shtirnoq/backslash escape qilinadi, boshqaruv belgilari
+    bo'shliqqa almashtiriladi - trigger hech qachon noto'g'ri JSON bermaydi.
+    """
+    csv = expr
+    for old, new in (("'\\'", "'\\\\'"), ("'\"'", "'\\\"'")):
+        csv = f"replace({csv}, {old}, {new})"
+    for char in (9, 10, 13):
+        csv = f"replace({csv}, char({char}), ' ')"
+    return (
+        f"CASE WHEN json_valid({expr}) AND json_type({expr}) = 'array' THEN {expr} "
+        f"ELSE '[\"' || replace(COALESCE({csv}, ''), ',', '\",\"') || '\"]' END"
+    )
+
+
+def json1_available(conn):
+    try:
+        conn.execute("SELECT value FROM json_each('[1]')").fetchall()
+        return True
+    except sqlite3.OperationalError:
+        return False
+
+
+def _table_columns(conn, table):
+    return {r[1] for r in conn.execute(f"PRAGMA table_info({table})").fetchall()}
+
+
+def upgrade(conn, context):
+    columns = _table_columns(conn, "menu_items")
+    if not json1_available(conn):
+        return
+
+    for source, (table, column) in FACETS.items():
+        if source not in columns:
+            continue
+        conn.execute(
+            f"""CREATE TABLE IF NOT EXISTS {table} (
+                    menu_item_id INTEGER NOT NULL REFERENCES menu_items(id) ON DELETE CASCADE,
+                    {column} TEXT NOT NULL COLLATE NOCASE,
+                    PRIMARY KEY ({column}, menu_item_id)
+                ) WITHOUT ROWID"""
+        )
+        fill = (
+            f"INSERT OR IGNORE INTO {table} (menu_item_id, {column}) "
+            f"SELECT {{id}}, trim(j.value) FROM json_each({values_json('{src}')}) j "
+            "WHERE trim(j.value) != ''"
+        )
+        conn.execute(
+            f"""CREATE TRIGGER IF NOT EXISTS trg_{table}_insert
+                AFTER INSERT ON menu_items BEGIN
+                    {fill.format(id="NEW.id", src=f"NEW.{source}")};
+                END"""
+        )
+        conn.execute(
+            f"""CREATE TRIGGER IF NOT EXISTS trg_{table}_update
+                AFTER UPDATE OF {source} ON menu_items BEGIN
+                    DELETE FROM {table} WHERE menu_item_id = OLD.id;
+                    {fill.format(id="NEW.id", src=f"NEW.{source}")};
+                END"""
+        )
+        conn.execute(
+            f"""CREATE TRIGGER IF NOT EXISTS trg_{table}_delete
+                AFTER DELETE ON menu_items BEGIN
+                    DELETE FROM {table} WHERE menu_item_id = OLD.id;
+                END"""
+        )
+        # Mavjud mahsulotlar
+        conn.execute(f"DELETE FROM {table}")
+        conn.execute(
+            f"INSERT OR IGNORE INTO {table} (menu_item_id, {column}) "
+            f"SELECT m.id, trim(j.value) FROM menu_items m, json_each({values_json(f'm.{source}')}) j "
+            "WHERE trim(j.value) != ''"
+        )
+
+    for name, table, index_columns in INDEXES:
+        if _table_columns(conn, table):
+            conn.execute(
+                f"CREATE INDEX IF NOT EXISTS {name} ON {table} ({', '.join(index_columns)})"
+            )
+    conn.execute("ANALYZE")
@@ -0,0 +1,92 @@
+# Baholar yig'indisi: har bir mahsulot (va filial) uchun sum/count/gistogramma.
+#
+# /menu har cache miss da butun ratings jadvalini LEFT JOIN ... GROUP BY
+# qilardi. rating_aggregates da har bir "subject" uchun bitta qator:
+# subject_id = menu_item_id, filial baholari uchun -branch_id (filial bahosi
+# branch_id ustunida yoki eski usulda manfiy menu_item_id da saqlanadi).
+# Triggerlar bahoni yozgan tranzaksiyaning o'zida yig'indini yangilaydi;
+# app.py dagi reconcile_rating_aggregates() uni ratings dan qayta tekshiradi.
+
+TABLE = "rating_aggregates"
+STARS = range(1, 6)
+
+SUBJECT_EXPR = (
+    "CASE WHEN {r}.branch_id IS NOT NULL THEN -{r}.branch_id ELSE {r}.menu_item_id END"
+)
+
+
+def _table_columns(conn, table):
+    return {r[1] for r in conn.execute(f"PRAGMA table_info({table})").fetchall()}
+
+
+def _apply(row, sign):
+    """row (NEW/OLD) bahosini yig'indiga qo'shish (sign=+1) yoki ayirish (-1).
+
+    NULL baho hisobga olinmaydi - aks holda NOT NULL ustunlarga NULL yozilib
+    bahoni saqlagan INSERT/UPDATE ham bekor bo'lardi.
+    """
+    subject = SUBJECT_EXPR.format(r=row)
+    op = "+" if sign > 0 else "-"
+    stars = ", ".join(f"stars_{n} = stars_{n} {op} ({row}.rating = {n})" for n in STARS)
+    ensure_row = (
+        f"INSERT INTO {TABLE} (subject_id) SELECT {subject} "
+        f"WHERE {subject} IS NOT NULL AND {row}.rating IS NOT NULL "
+        f"ON CONFLICT (subject_id) DO NOTHING;\n"
+        if sign > 0
+        else ""
+    )
+    return (
+        ensure_row
+        + f"UPDATE {TABLE} SET rating_sum = rating_sum {op} {row}.rating, "
+        f"rating_count = rating_count {op} 1, {stars} "
+        f"WHERE subject_id = {subject} AND {row}.rating IS NOT NULL;"
+    )
+
+
+def upgrade(conn, context):
+    columns = _table_columns(conn, "ratings")
+    if not {"menu_item_id", "rating"} <= columns:
+        return
+    if "branch_id" not in columns:
+        conn.execute("ALTER TABLE ratings ADD COLUMN branch_id INTEGER")
+
+    star_columns = ",\n".join(f"stars_{n} INTEGER NOT NULL DEFAULT 0" for n in STARS)
+    conn.execute(
+        f"""CREATE TABLE IF NOT EXISTS {TABLE} (
+                subject_id INTEGER PRIMARY KEY,
+                rating_sum INTEGER NOT NULL DEFAULT 0,
+                rating_count INTEGER NOT NULL DEFAULT 0,
+                {star_columns}
+            )"""
+    )
+    conn.execute(
+        f"""CREATE TRIGGER IF NOT EXISTS trg_ratings_aggregate_insert
+            AFTER INSERT ON ratings BEGIN
+                {_apply("NEW", +1)}
+            END"""
+    )
+    conn.execute(
+        f"""CREATE TRIGGER IF NOT EXISTS trg_ratings_aggregate_delete
+            AFTER DELETE ON ratings BEGIN
+                {_apply("OLD", -1)}
+            END"""
+    )
+    conn.execute(
+        f"""CREATE TRIGGER IF NOT EXISTS trg_ratings_aggregate_update
+            AFTER UPDATE OF rating, menu_item_id, branch_id ON ratings BEGIN
+                {_apply("OLD", -1)}
+                {_apply("NEW", +1)}
+            END"""
+    )
+
+    # Mavjud baholar
+    subject = SUBJECT_EXPR.format(r="ratings")
+    stars = ", ".join(f"SUM(rating = {n})" for n in STARS)
+    conn.execute(f"DELETE FROM {TABLE}")
+    conn.execute(
+        f"""INSERT INTO {TABLE} (subject_id, rating_sum, rating_count,
+                {", ".join(f"stars_{n}" for n in STARS)})
+            SELECT {subject} AS subject, SUM(rating), COUNT(*), {stars}
+            FROM ratings WHERE {subject} IS NOT NULL AND rating IS NOT NULL
+            GROUP BY subject"""
+    )
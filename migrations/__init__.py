@@ -0,0 +1,128 @@
+# Database schema migrations for Pro-Obuv
+# Ma'lumotlar bazasi sxemasi migratsiyalari
+#
+# Har bir migratsiya `NNNN_nomi.py` fayli bo'lib, `upgrade(conn, context)`
+# funksiyasini e'lon qiladi. Qo'llangan oxirgi versiya `PRAGMA user_version`
+# da saqlanadi, shuning uchun yangilangan bazada ishga tushirish bitta
+# butun son tekshiruvidan iborat bo'ladi.
+
+import importlib.util
+import logging
+import os
+import re
+import sqlite3
+
+MIGRATIONS_DIR = os.path.dirname(os.path.abspath(__file__))
+MIGRATION_FILE_RE = re.compile(r"^(\d{4})_(\w+)\.py$")
+
+logger = logging.getLogger("restaurant_app.migrations")
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+try:
+    import msvcrt
+except ImportError:
+    msvcrt = None
+
+
+class FileLock:
+    """Jarayonlar orasidagi oddiy fayl qulfi (gunicorn workerlari uchun)"""
+
+    def __init__(self, path):
+        self.path = path
+        self.handle = None
+
+    def __enter__(self):
+        self.handle = open(self.path, "a+")
+        if fcntl is not None:
+            fcntl.flock(self.handle.fileno(), fcntl.LOCK_EX)
+        elif msvcrt is not None:
+            self.handle.seek(0)
+            msvcrt.locking(self.handle.fileno(), msvcrt.LK_LOCK, 1)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        try:
+            if fcntl is not None:
+                fcntl.flock(self.handle.fileno(), fcntl.LOCK_UN)
+            elif msvcrt is not None:
+                self.handle.seek(0)
+                msvcrt.locking(self.handle.fileno(), msvcrt.LK_UNLCK, 1)
+        finally:
+            self.handle.close()
+            self.handle = None
+
+
+def discover_migrations(directory=MIGRATIONS_DIR):
+    """Katalogdagi migratsiyalarni versiya bo'yicha tartiblab qaytarish.
+
+    Returns: list of (version, name, upgrade_fn)
+    """
+    found = []
+    for filename in os.listdir(directory):
+        match = MIGRATION_FILE_RE.match(filename)
+        if not match:
+            continue
+        version = int(match.group(1))
+        module_path = os.path.join(directory, filename)
+        spec = importlib.util.spec_from_file_location(
+            f"migrations.m{match.group(1)}_{match.group(2)}", module_path
+        )
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+        found.append((version, match.group(2), module.upgrade))
+
+    found.sort(key=lambda m: m[0])
+    versions = [m[0] for m in found]
+    if len(versions) != len(set(versions)):
+        raise RuntimeError(f"Duplicate migration versions in {directory}")
+    return found
+
+
+def get_schema_version(conn):
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+def run_migrations(db_path, context=None, directory=MIGRATIONS_DIR):
+    """Qo'llanmagan migratsiyalarni bajarish.
+
+    Baza allaqachon oxirgi versiyada bo'lsa hech narsa qilinmaydi. Aks holda
+    fayl qulfi olinadi, versiya qayta tekshiriladi va qolgan migratsiyalar
+    navbat bilan bajariladi - shu sababli bir nechta worker bir vaqtda ishga
+    tushsa ham migratsiyalar faqat bir marta ishlaydi.
+
+    Returns: list of applied migration versions
+    """
+    if context is None:
+        context = {}
+    migrations = discover_migrations(directory)
+    latest = migrations[-1][0] if migrations else 0
+
+    conn = sqlite3.connect(db_path, timeout=60.0)
+    try:
+        if get_schema_version(conn) >= latest:
+            return []
+
+        applied = []
+        with FileLock(f"{db_path}.migrate.lock"):
+            current = get_schema_version(conn)
+            for version, name, upgrade in migrations:
+                if version <= current:
+                    continue
+                logger.info(f"Applying migration {version:04d}_{name}")
+                try:
+                    upgrade(conn, context)
+                    # PRAGMA parametr qabul qilmaydi - versiya butun son
+                    conn.execute(f"PRAGMA user_version = {int(version)}")
+                    conn.commit()
+                except Exception:
+                    conn.rollback()
+                    logger.exception(f"Migration {version:04d}_{name} failed")
+                    raise
+                applied.append(version)
+        return applied
+    finally:
+        conn.close()
@@ -37,7 +37,7 @@ try:
 except ImportError as e:
     print(f"❌ Ошибка импорта: {e}")
     print("\n🔧 Установите недостающие зависимости:")
-    print("pip install flask flask-cors flask-compress flask-limiter pandas openpyxl")
+    print("pip install flask flask-cors flask-compress pandas openpyxl")
     sys.exit(1)
     
 except Exception as e:
@@ -75,7 +75,7 @@ try:
 except ImportError as e:
     print(f"❌ Ошибка импорта: {e}")
     print("\n🔧 Установите недостающие зависимости:")
-    print("pip install flask flask-cors flask-compress flask-limiter")
+    print("pip install flask flask-cors flask-compress")
     sys.exit(1)
     
 except Exception as e:
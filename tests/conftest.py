@@ -0,0 +1,106 @@
+# Shared fixtures: tests never write the tracked database or log files
+import logging
+import os
+import shutil
+import sqlite3
+import sys
+from pathlib import Path
+
+import pytest
+
+# Ensure project root is on sys.path for imports when running from tests folder
+project_root = str(Path(__file__).resolve().parent.parent)
+if project_root not in sys.path:
+    sys.path.insert(0, project_root)
+
+# Prevent heavy DB init during import in app
+os.environ["SKIP_DB_INIT"] = "1"
+
+import app as app_module
+from app import get_cache_manager
+
+DB_FILES = ("database", "messaging", "activity")
+
+
+@pytest.fixture(scope="session", autouse=True)
+def app_data_dir(tmp_path_factory):
+    """database.sqlite3 (va alohida fayllar) nusxasi va loglar uchun papka.
+
+    Fayllar WAL/SHM bilan oddiy nusxalanadi - asl fayllar ochilmaydi. DB_PATH,
+    SIDE_DB_PATHS va log handlerlari shu papkaga yo'naltiriladi, poollar
+    qayta yaratiladi.
+    """
+    root = tmp_path_factory.mktemp("app-data")
+    for name in DB_FILES:
+        for suffix in ("", "-wal", "-shm"):
+            source = Path(project_root) / f"{name}.sqlite3{suffix}"
+            if source.exists():
+                shutil.copyfile(source, root / source.name)
+
+    patch = pytest.MonkeyPatch()
+    patch.setattr(app_module, "DB_PATH", str(root / "database.sqlite3"))
+    patch.setattr(
+        app_module,
+        "SIDE_DB_PATHS",
+        {schema: str(root / f"{schema}.sqlite3") for schema in app_module.SIDE_DB_PATHS},
+    )
+    patch.setattr(app_module.Config, "CACHE_BUS_PATH", str(root / "cache_bus.sqlite3"))
+    patch.setattr(app_module, "db_writers", {})
+    app_module.reset_db_pools()
+
+    handlers = {}
+    loggers = [logging.getLogger()] + [
+        logger for logger in logging.Logger.manager.loggerDict.values()
+        if isinstance(logger, logging.Logger)
+    ]
+    for logger in loggers:
+        for handler in logger.handlers:
+            if isinstance(handler, logging.FileHandler) and handler not in handlers:
+                handler.close()
+                handlers[handler] = handler.baseFilename
+                handler.baseFilename = str(root / os.path.basename(handler.baseFilename))
+
+    yield root
+
+    # Buferdagi sessiya faolligi atexit da asl bazaga yozilmasin
+    app_module.session_tracker.flush(timeout=5)
+    for handler, original in handlers.items():
+        handler.close()
+        handler.baseFilename = original
+    app_module.reset_db_pools()
+    patch.undo()
+
+
+class QueryDb(sqlite3.Connection):
+    "execute_query o'rnini bosuvchi test bazasi; queries - bajarilgan so'rovlar"
+
+    queries = None
+
+
+@pytest.fixture
+def query_db(tmp_path, monkeypatch):
+    """Sxemasi test ichida yaratiladigan SQLite fayl; execute_query shunga yo'naltiriladi.
+
+    Qatorlar execute_query dagi kabi DbRow; sxema keshlari (_schema_tables,
+    katalog snapshoti) va CacheManager har bir test uchun tozalanadi.
+    """
+    conn = sqlite3.connect(
+        str(tmp_path / "query.sqlite3"), check_same_thread=False, factory=QueryDb
+    )
+    conn.row_factory = sqlite3.Row
+    conn.queries = []
+
+    def fake_execute_query(query, params=None, fetch_one=False, fetch_all=False, **kwargs):
+        conn.queries.append(query)
+        cur = conn.execute(query, params or ())
+        index = app_module._column_index(cur.description)
+        rows = [app_module.DbRow(tuple(r), index) for r in cur.fetchall()]
+        return (rows[0] if rows else None) if fetch_one else rows
+
+    monkeypatch.setattr(app_module, "execute_query", fake_execute_query)
+    monkeypatch.setattr(app_module, "_schema_tables", {})
+    monkeypatch.setattr(app_module, "_catalog_snapshot", None)
+    get_cache_manager().clear()
+    yield conn
+    get_cache_manager().clear()
+    conn.close()
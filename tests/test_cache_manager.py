@@ -0,0 +1,234 @@
+# CacheManager tests (per-key TTL, O(1) LRU, byte cap, per-prefix stats, tags,
+# single-flight and stale-while-revalidate)
+import os
+import sys
+import threading
+import time
+from pathlib import Path
+
+# Ensure project root is on sys.path for imports when running from tests folder
+project_root = str(Path(__file__).resolve().parent.parent)
+if project_root not in sys.path:
+    sys.path.insert(0, project_root)
+
+# Prevent heavy DB init during import in app
+os.environ["SKIP_DB_INIT"] = "1"
+
+from flask import Flask, jsonify, request
+
+import app as app_module
+from app import CacheManager, app
+
+
+def test_ttl_passed_to_set_is_honoured():
+    cache = CacheManager(stripes=1)
+    cache.set("short", 1, ttl=0.05)
+    cache.set("long", 2, ttl=60)
+    assert cache.get("short") == 1
+    time.sleep(0.06)
+    assert cache.get("short") is None
+    assert cache.get("long") == 2
+    assert cache.stats()["prefixes"]["short"]["expired"] == 1
+
+
+def test_lru_evicts_least_recently_used_entry():
+    cache = CacheManager(max_entries=3, stripes=1)
+    for key in ("k_1", "k_2", "k_3"):
+        cache.set(key, key)
+    cache.get("k_1")  # k_2 endi eng eski
+    cache.set("k_4", "k_4")
+    assert cache.get("k_2") is None
+    assert [cache.get(k) for k in ("k_1", "k_3", "k_4")] == ["k_1", "k_3", "k_4"]
+    assert cache.stats()["prefixes"]["k"]["evictions"] == 1
+    assert cache.stats()["evictions"] == 1
+
+
+def test_byte_cap_bounds_total_size():
+    cache = CacheManager(max_bytes=2000, stripes=1)
+    for i in range(10):
+        cache.set(f"blob_{i}", "x" * 500)
+    stats = cache.stats()
+    assert stats["bytes"] <= 2000 and stats["entries"] == 3
+    # Bo'lakdan katta qiymat umuman saqlanmaydi
+    cache.set("huge", "x" * 5000)
+    assert cache.get("huge") is None
+
+
+def test_stats_are_grouped_by_key_prefix():
+    cache = CacheManager(stripes=4)
+    cache.set("cart_count_1", 3)
+    cache.get("cart_count_1")
+    cache.get("cart_count_6f1c2d9e-aa")
+    cache.get("api_menu:{}")
+    stats = cache.stats()
+    assert stats["prefixes"]["cart_count"] == {
+        "hits": 1,
+        "misses": 1,
+        "sets": 1,
+        "evictions": 0,
+        "expired": 0,
+        "invalidated": 0,
+        "stale": 0,
+        "coalesced": 0,
+        "l2_hits": 0,
+        "hit_rate": 50.0,
+    }
+    assert stats["prefixes"]["api_menu"]["misses"] == 1
+    assert CacheManager.key_prefix("menu_items_active") == "menu_items_active"
+    assert stats["hits"] == 1 and stats["misses"] == 2
+
+
+def test_system_page_shows_cache_stats():
+    client = app.test_client()
+    with client.session_transaction() as sess:
+        sess["super_admin"] = True
+    resp = client.get("/super-admin/system")
+    assert resp.status_code == 200
+    assert "Kesh (Cache)" in resp.get_data(as_text=True)
+
+
+def test_invalidated_tag_turns_entry_into_miss():
+    cache = CacheManager(stripes=1)
+    cache.set("menu_items_active", [1, 2], tags=("menu",))
+    cache.set("news_list", [3], tags=("news",))
+    cache.invalidate_tags("menu")
+    assert cache.get("menu_items_active") is None
+    assert cache.get("news_list") == [3]
+    stats = cache.stats()
+    assert stats["prefixes"]["menu_items_active"]["invalidated"] == 1
+    assert stats["tag_invalidations"] == {"menu": 1}
+
+
+def test_stamp_taken_before_invalidation_is_stale():
+    cache = CacheManager(stripes=1)
+    stamp = cache.tag_stamp(("cart:user:1",))
+    cache.invalidate_tags("cart:user:1")  # hisoblash paytida yozuv bo'ldi
+    cache.set("cart_count_1", 5, stamp=stamp)
+    assert cache.get("cart_count_1") is None
+
+
+def test_cached_json_view_is_invalidated_by_writer():
+    original = app_module.cache_manager
+    app_module.cache_manager = CacheManager(stripes=1)
+    calls = []
+    demo = Flask(__name__)
+
+    @demo.route("/api/items")
+    @app_module.cached(ttl=60, tags=("menu",))
+    def items():
+        calls.append(1)
+        return jsonify({"n": len(calls)})
+
+    @demo.route("/api/items", methods=["POST"])
+    @app_module.invalidates("menu")
+    def update_items():
+        if request.args.get("reject"):
+            return jsonify({"error": "Authentication required"}), 401
+        app_module._mark_request_write()
+        return jsonify({"ok": True})
+
+    try:
+        client = demo.test_client()
+        assert client.get("/api/items").get_json() == {"n": 1}
+        assert client.get("/api/items").get_json() == {"n": 1}
+        # Yozuv commit qilinmagan (rad etilgan) so'rov keshni tozalamaydi
+        client.post("/api/items?reject=1")
+        assert client.get("/api/items").get_json() == {"n": 1}
+        client.post("/api/items")
+        assert client.get("/api/items").get_json() == {"n": 2}
+        assert len(calls) == 2
+    finally:
+        app_module.cache_manager = original
+
+
+def test_concurrent_misses_compute_once():
+    cache = CacheManager(stripes=1)
+    calls = []
+    results = []
+    start = threading.Barrier(8)
+
+    def compute():
+        calls.append(1)
+        time.sleep(0.1)
+        return {"rows": 3}
+
+    def worker():
+        start.wait()
+        results.append(cache.get_or_compute("dashboard_stats", compute, ttl=60))
+
+    threads = [threading.Thread(target=worker) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join(5)
+
+    assert len(calls) == 1
+    assert results == [{"rows": 3}] * 8
+    assert cache.stats()["prefixes"]["dashboard_stats"]["coalesced"] == 7
+
+
+def test_expired_entry_is_served_stale_while_refreshing():
+    cache = CacheManager(stripes=1)
+    cache.set("menu_items_active", ["old"], ttl=0.01, stale_ttl=60)
+    time.sleep(0.02)
+    release = threading.Event()
+
+    def compute():
+        release.wait(5)
+        return ["new"]
+
+    assert cache.get("menu_items_active") is None  # oddiy get eskisini bermaydi
+    value = cache.get_or_compute(
+        "menu_items_active", compute, ttl=60, stale_ttl=60, background=True
+    )
+    assert value == ["old"]
+    # Yangilanish davom etayotganda boshqa so'rovlar ham kutmaydi
+    assert cache.get_or_compute("menu_items_active", lambda: ["x"], ttl=60) == ["old"]
+    release.set()
+    deadline = time.monotonic() + 5
+    while cache.get("menu_items_active") != ["new"] and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert cache.get("menu_items_active") == ["new"]
+    assert cache.stats()["prefixes"]["menu_items_active"]["stale"] == 2
+
+
+def test_invalidated_entry_is_never_served_stale():
+    cache = CacheManager(stripes=1)
+    cache.set("cart_count_1", 2, ttl=60, tags=("cart:user:1",), stale_ttl=60)
+    cache.invalidate_tags("cart:user:1")
+    assert cache.get_or_compute("cart_count_1", lambda: 3, ttl=60) == 3
+
+
+def test_cached_json_is_served_as_bytes_with_etag():
+    original = app_module.cache_manager
+    app_module.cache_manager = CacheManager(stripes=1)
+    calls = []
+    demo = Flask(__name__)
+
+    @demo.route("/api/stats")
+    @app_module.cached(ttl=60)
+    def stats():
+        calls.append(1)
+        resp = jsonify({"orders": 5})
+        resp.headers["X-Source"] = "db"
+        return resp
+
+    try:
+        client = demo.test_client()
+        first = client.get("/api/stats")
+        etag = first.headers["ETag"]
+        second = client.get("/api/stats")
+        assert second.data == first.data and second.headers["ETag"] == etag
+        assert second.headers["X-Source"] == "db"
+        assert second.mimetype == "application/json"
+
+        not_modified = client.get("/api/stats", headers={"If-None-Match": etag})
+        assert not_modified.status_code == 304 and not_modified.data == b""
+        # Flask-Compress gzip qilganda ETag ga ":gzip" qo'shadi
+        gzipped = client.get(
+            "/api/stats", headers={"If-None-Match": etag[:-1] + ':gzip"'}
+        )
+        assert gzipped.status_code == 304
+        assert len(calls) == 1
+    finally:
+        app_module.cache_manager = original
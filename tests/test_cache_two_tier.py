@@ -0,0 +1,186 @@
+# Two-tier cache tests (L1 + Redis L2, cross-worker invalidation buses)
+import os
+import queue
+import sys
+import threading
+import time
+from pathlib import Path
+
+# Ensure project root is on sys.path for imports when running from tests folder
+project_root = str(Path(__file__).resolve().parent.parent)
+if project_root not in sys.path:
+    sys.path.insert(0, project_root)
+
+# Prevent heavy DB init during import in app
+os.environ["SKIP_DB_INIT"] = "1"
+
+from app import CacheManager, SQLiteInvalidationBus
+
+
+class FakeRedis:
+    """Thread-safe in-memory stand-in for the redis-py calls CacheManager uses.
+
+    One instance is shared by several CacheManager objects, like worker
+    processes sharing one Redis server.
+    """
+
+    def __init__(self):
+        self.data = {}
+        self.lock = threading.Lock()
+        self.subscribers = []
+        self.commands = 0
+
+    def get(self, key):
+        with self.lock:
+            self.commands += 1
+            value = self.data.get(key)
+            if value is None:
+                return None
+            payload, expires_at = value
+            if expires_at is not None and expires_at <= time.monotonic():
+                del self.data[key]
+                return None
+            return payload
+
+    def setex(self, key, ttl, payload):
+        with self.lock:
+            self.commands += 1
+            self.data[key] = (payload.encode(), time.monotonic() + ttl)
+
+    def delete(self, *keys):
+        with self.lock:
+            self.commands += 1
+            for key in keys:
+                self.data.pop(key, None)
+
+    def mget(self, keys):
+        with self.lock:
+            self.commands += 1
+            return [self.data.get(k, (None, None))[0] for k in keys]
+
+    def incr(self, key):
+        with self.lock:
+            value = int(self.data.get(key, (b"0", None))[0]) + 1
+            self.data[key] = (str(value).encode(), None)
+            return value
+
+    def pipeline(self):
+        redis = self
+
+        class Pipeline:
+            def __init__(self):
+                self.ops = []
+
+            def incr(self, key):
+                self.ops.append(key)
+
+            def execute(self):
+                return [redis.incr(key) for key in self.ops]
+
+        return Pipeline()
+
+    def scan_iter(self, match="*", count=None):
+        prefix = match.rstrip("*")
+        with self.lock:
+            return [k.encode() for k in list(self.data) if k.startswith(prefix)]
+
+    def publish(self, channel, message):
+        for sub_channel, inbox in list(self.subscribers):
+            if sub_channel == channel:
+                inbox.put({"type": "message", "channel": channel, "data": message.encode()})
+
+    def pubsub(self, ignore_subscribe_messages=False):
+        redis = self
+
+        class PubSub:
+            def __init__(self):
+                self.inbox = queue.Queue()
+
+            def subscribe(self, channel):
+                redis.subscribers.append((channel, self.inbox))
+
+            def listen(self):
+                while True:
+                    yield self.inbox.get()
+
+        return PubSub()
+
+
+def _wait_for(predicate, timeout=2):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if predicate():
+            return True
+        time.sleep(0.005)
+    return predicate()
+
+
+def _workers(redis, n=2):
+    return [CacheManager(stripes=1, redis_client=redis) for _ in range(n)]
+
+
+def test_l2_is_shared_and_filled_into_l1():
+    redis = FakeRedis()
+    a, b = _workers(redis)
+    a.set("menu_items_active", [1, 2], ttl=600, tags=("menu",))
+
+    assert b.get("menu_items_active") == [1, 2]  # L2 dan
+    commands = redis.commands
+    assert b.get("menu_items_active") == [1, 2]  # endi L1 dan
+    assert redis.commands == commands
+    stats = b.stats()
+    assert stats["prefixes"]["menu_items_active"]["l2_hits"] == 1
+    assert stats["bus"] == "redis"
+
+
+def test_tag_invalidation_reaches_other_workers_l1():
+    redis = FakeRedis()
+    a, b = _workers(redis)
+    a.set("menu_items_active", [1], ttl=600, tags=("menu",))
+    assert b.get("menu_items_active") == [1]
+
+    a.invalidate_tags("menu")
+    assert _wait_for(lambda: b.get("menu_items_active") is None)
+    b.set("menu_items_active", [2], ttl=600, tags=("menu",))
+    assert a.get("menu_items_active") == [2]
+
+
+def test_delete_reaches_other_workers_l1():
+    redis = FakeRedis()
+    a, b = _workers(redis)
+    b.set("settings_blob", {"x": 1}, ttl=600)
+    assert a.get("settings_blob") == {"x": 1}
+
+    b.delete("settings_blob")
+    assert _wait_for(lambda: a.get("settings_blob") is None)
+
+
+def test_l1_copy_expires_before_l2():
+    redis = FakeRedis()
+    a = CacheManager(stripes=1, redis_client=redis, l1_ttl=0.05)
+    a.set("dashboard_stats", {"n": 1}, ttl=600)
+    redis.setex("restaurant:dashboard_stats", 600, '{"n": 2}')  # boshqa worker yozdi
+    assert a.get("dashboard_stats") == {"n": 1}
+    time.sleep(0.06)
+    assert a.get("dashboard_stats") == {"n": 2}
+
+
+def test_sqlite_bus_invalidates_without_redis(tmp_path):
+    path = str(tmp_path / "cache_bus.sqlite3")
+    a, b = (
+        CacheManager(stripes=1, bus=SQLiteInvalidationBus(path, poll_interval=0.01))
+        for _ in range(2)
+    )
+    try:
+        for worker in (a, b):
+            worker.set("cart_count_5", 3, ttl=600, tags=("cart:user:5",))
+            worker.set("news_list", [1], ttl=600)
+
+        a.invalidate_tags("cart:user:5")
+        a.delete("news_list")
+        assert _wait_for(lambda: b.get("cart_count_5") is None)
+        assert _wait_for(lambda: b.get("news_list") is None)
+        assert b.stats()["bus"] == "sqlite"
+    finally:
+        a.bus.close()
+        b.bus.close()
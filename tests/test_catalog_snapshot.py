@@ -0,0 +1,237 @@
+# Catalog snapshot tests (immutable copies, /menu order and ratings, search, cart pricing, ETag, swap)
+import os
+import sys
+from pathlib import Path
+
+import pytest
+
+# Ensure project root is on sys.path for imports when running from tests folder
+project_root = str(Path(__file__).resolve().parent.parent)
+if project_root not in sys.path:
+    sys.path.insert(0, project_root)
+
+# Prevent heavy DB init during import in app
+os.environ["SKIP_DB_INIT"] = "1"
+
+import app as app_module
+from app import app
+
+# name, category, price, discount, available, orders_count, rating, sizes
+ITEMS = [
+    ("Botinka", "specobuv", 300000.0, 10.0, 1, 5, 4.5, "40,41"),
+    ("Etik", "specobuv", 250000.0, 0.0, 1, 9, None, "41"),
+    ("Kurtka", "specodezhda", 200000.0, 0.0, 1, 1, 3.0, "M"),
+    ("Eski qo'lqop", "specodezhda", 10000.0, 0.0, 0, 0, 0.0, ""),
+]
+
+
+@pytest.fixture
+def catalog_db(query_db):
+    query_db.executescript(
+        """
+        CREATE TABLE menu_items (id INTEGER PRIMARY KEY, name TEXT, category TEXT,
+            price REAL, discount_percentage REAL, available INTEGER, orders_count INTEGER,
+            rating REAL, sizes TEXT, colors TEXT DEFAULT '');
+        CREATE TABLE product_media (id INTEGER PRIMARY KEY, menu_item_id INTEGER,
+            media_type TEXT, media_url TEXT, display_order INTEGER, is_main INTEGER);
+        CREATE TABLE ratings (id INTEGER PRIMARY KEY, user_id INTEGER, menu_item_id INTEGER,
+            branch_id INTEGER, rating INTEGER);
+        CREATE TABLE cart_items (id INTEGER PRIMARY KEY, user_id INTEGER, session_id TEXT,
+            menu_item_id INTEGER, quantity INTEGER, size TEXT, color TEXT, created_at TEXT);
+        """
+    )
+    query_db.executemany(
+        "INSERT INTO menu_items (name, category, price, discount_percentage, available, "
+        "orders_count, rating, sizes) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+        ITEMS,
+    )
+    query_db.executemany(
+        "INSERT INTO product_media (menu_item_id, media_type, media_url, display_order, is_main) "
+        "VALUES (?, ?, ?, ?, ?)",
+        [(1, "image", "/b.jpg", 1, 0), (1, "image", "/a.jpg", 2, 1)],
+    )
+    query_db.executemany(
+        "INSERT INTO ratings (user_id, menu_item_id, branch_id, rating) VALUES (?, ?, ?, ?)",
+        [(1, 1, None, 5), (2, 1, None, 4), (1, None, 1, 2)],
+    )
+    query_db.commit()
+    return query_db
+
+
+def test_menu_items_order_and_ratings(catalog_db):
+    snapshot = app_module.get_catalog_snapshot()
+    items = snapshot.menu_items()
+    # category, orders_count DESC, name; mavjud bo'lmagan (4) chiqmaydi
+    assert [i["id"] for i in items] == [2, 1, 3]
+    assert items[1]["avg_rating"] == 4.5 and items[1]["rating_count"] == 2
+    # Filial bahosi (branch_id) mahsulotga qo'shilmaydi
+    assert items[0]["avg_rating"] == 0 and items[0]["rating_count"] == 0
+    assert [i["id"] for i in snapshot.items()] == [1, 2, 4, 3]
+    assert [m["media_url"] for m in snapshot.item_media(1)] == ["/a.jpg", "/b.jpg"]
+
+
+def test_readers_get_copies(catalog_db):
+    snapshot = app_module.get_catalog_snapshot()
+    version = snapshot.version
+    item = snapshot.item(1)
+    item["price"] = 1
+    snapshot.item_media(1)[0]["media_url"] = "/x.jpg"
+    assert snapshot.item(1)["price"] == 300000.0
+    assert snapshot.item_media(1)[0]["media_url"] == "/a.jpg"
+    assert app_module.CatalogSnapshot.load().version == version
+
+
+def test_search_filters_and_sorts_in_memory(catalog_db):
+    snapshot = app_module.get_catalog_snapshot()
+
+    def ids(**kwargs):
+        return [i["id"] for i in snapshot.search(**kwargs)]
+
+    assert ids() == [1, 2, 3]
+    assert ids(size="41") == [1, 2]
+    assert ids(category="specobuv", sort="price_asc") == [2, 1]
+    assert ids(sort="popularity") == [2, 1, 3]
+    # NULL rating - SQLite dagi kabi DESC da oxirida
+    assert ids(sort="rating") == [1, 3, 2]
+    assert ids(min_price=210000.0, max_price=300000.0) == [1, 2]
+
+    resp = app.test_client().get("/api/menu-search", query_string={"size": "41"})
+    items = resp.get_json()["items"]
+    assert [i["name"] for i in items] == ["Botinka", "Etik"]
+    assert [m["media_url"] for m in items[0]["media"]] == ["/a.jpg", "/b.jpg"]
+
+
+def test_cart_prices_come_from_snapshot(catalog_db):
+    catalog_db.executemany(
+        "INSERT INTO cart_items (user_id, menu_item_id, quantity, created_at) VALUES (?, ?, ?, ?)",
+        [(7, 1, 2, "2024-01-02"), (7, 4, 1, "2024-01-03"), (7, 3, 3, "2024-01-01")],
+    )
+    items = app_module.get_cart_items(catalog_db, None, user_id=7)
+    # Mavjud bo'lmagan mahsulot (4) savatchada ko'rsatilmaydi
+    assert [(i["menu_item_id"], i["name"], i["total"]) for i in items] == [
+        (1, "Botinka", 540000.0),
+        (3, "Kurtka", 600000.0),
+    ]
+    assert items[0]["discount_percentage"] == 10.0
+    # Jami summa ham shu manbadan - ko'rsatilgan qatorlar bilan mos
+    assert app_module.get_cart_total(catalog_db, None, user_id=7) == 1140000.0
+
+
+def test_order_is_priced_from_database_not_snapshot(monkeypatch):
+    # conftest dagi baza nusxasi: buyurtma yozuvchi thread orqali yoziladi
+    monkeypatch.setattr(app_module, "_catalog_snapshot", None)
+    saved = []
+    monkeypatch.setattr(app_module, "save_user_to_json", lambda *args: saved.append(args[3]))
+    conn = app_module.sqlite3.connect(app_module.DB_PATH)
+    item_id, price = conn.execute(
+        "SELECT id, price FROM menu_items WHERE available = 1 ORDER BY id LIMIT 1"
+    ).fetchone()
+    user_id = conn.execute("SELECT id FROM users ORDER BY id LIMIT 1").fetchone()[0]
+    conn.execute("DELETE FROM cart_items WHERE user_id = ?", (user_id,))
+    conn.execute(
+        "INSERT INTO cart_items (user_id, session_id, menu_item_id, quantity, created_at) "
+        "VALUES (?, 'order-pricing-test', ?, 2, '2024-01-01')",
+        (user_id, item_id),
+    )
+    conn.commit()
+    try:
+        with app.test_request_context("/"):
+            assert app_module.get_catalog_snapshot().value(item_id, "price") == price
+        # Narx o'zgardi, snapshot hali eski (masalan boshqa worker, bus kechikdi)
+        conn.execute("UPDATE menu_items SET price = ?, discount_percentage = 0 WHERE id = ?",
+                     (price + 1000, item_id))
+        conn.commit()
+
+        client = app.test_client()
+        with client.session_transaction() as sess:
+            sess["user_id"] = user_id
+            sess["user_name"] = "Test"
+            sess["user_phone"] = "+998901234567"
+            sess["session_id"] = "order-pricing-test"
+        resp = client.post("/user", data={"delivery_address": "Toshkent", "payment_method": "cash"})
+        assert "/order" in resp.headers["Location"]
+
+        order_id = conn.execute("SELECT MAX(order_id) FROM order_details").fetchone()[0]
+        assert conn.execute(
+            "SELECT menu_item_id, quantity, price FROM order_details WHERE order_id = ?", (order_id,)
+        ).fetchall() == [(item_id, 2, price + 1000)]
+        assert conn.execute(
+            "SELECT total_amount FROM receipts WHERE order_id = ?", (order_id,)
+        ).fetchone()[0] == (price + 1000) * 2
+        assert [i["asl_narxi"] for i in saved[0]] == [price + 1000]
+    finally:
+        conn.execute("UPDATE menu_items SET price = ? WHERE id = ?", (price, item_id))
+        conn.commit()
+        conn.close()
+        app_module.get_cache_manager().clear()
+
+
+def test_catalog_etag_and_swap_after_invalidation(catalog_db):
+    client = app.test_client()
+    first = client.get("/api/menu-search")
+    etag = first.headers["ETag"]
+    assert etag == f'"catalog-{app_module.get_catalog_snapshot().version}"'
+    assert client.get("/api/menu-search", headers={"If-None-Match": etag}).status_code == 304
+
+    held = app_module.get_catalog_snapshot()
+    catalog_db.execute("UPDATE menu_items SET price = 280000 WHERE id = 2")
+    # Teg bekor qilinmaguncha o'quvchilar eski nusxani oladi
+    assert app_module.get_catalog_snapshot() is held
+
+    app_module.invalidate_cache("menu")
+    rebuilt = app_module.get_catalog_snapshot()
+    assert rebuilt is not held and rebuilt.value(2, "price") == 280000
+    assert held.value(2, "price") == 250000.0
+    resp = client.get("/api/menu-search", headers={"If-None-Match": etag})
+    assert resp.status_code == 200 and resp.headers["ETag"] != etag
+
+
+def test_stale_snapshot_served_while_rebuilding(catalog_db):
+    held = app_module.get_catalog_snapshot()
+    app_module.invalidate_cache("menu")
+    with app_module._catalog_lock:
+        # Boshqa thread qurayotgan payt - kutmasdan eski nusxa
+        assert app_module.get_catalog_snapshot() is held
+    assert app_module.get_catalog_snapshot() is not held
+
+
+def test_refreshes_catalog_swaps_after_view(catalog_db):
+    held = app_module.get_catalog_snapshot()
+
+    @app_module.refreshes_catalog
+    def edit(write):
+        if not write:
+            return "Xodim huquqi kerak", 401
+        catalog_db.execute("UPDATE menu_items SET available = 0 WHERE id = 1")
+        app_module._mark_request_write()
+        return "ok"
+
+    with app_module.app.test_request_context("/", method="POST"):
+        # Yozuvsiz (rad etilgan) so'rov katalogni qayta qurmaydi
+        edit(False)
+        assert app_module._catalog_snapshot[2] is held
+        assert edit(True) == "ok"
+    assert app_module._catalog_snapshot[2] is not held
+    assert 1 not in app_module.get_catalog_snapshot().available
+
+
+def test_new_rating_swaps_only_ratings_layer(catalog_db, monkeypatch):
+    held = app_module.get_catalog_snapshot()
+    catalog_db.execute("INSERT INTO ratings (user_id, menu_item_id, rating) VALUES (3, 2, 4)")
+    catalog_db.execute("UPDATE menu_items SET rating = 4.0 WHERE id = 2")
+
+    def full_reload():
+        raise AssertionError("katalog qayta yuklanmasligi kerak")
+
+    monkeypatch.setattr(app_module.CatalogSnapshot, "load", full_reload)
+    app_module.invalidate_cache("ratings")
+    current = app_module.get_catalog_snapshot()
+
+    # Mahsulotlar, media va facetlar umumiy - faqat baholar yangilangan
+    assert current is not held
+    assert current.rows is held.rows and current.facets is held.facets
+    assert current.catalog_version == held.catalog_version
+    assert current.version != held.version
+    assert current.menu_items()[0]["avg_rating"] == 4 and current.item(2)["rating"] == 4.0
+    assert [i["id"] for i in current.search(sort="rating")] == [1, 2, 3]
+    assert held.item(2)["rating"] is None and held.menu_items()[0]["rating_count"] == 0
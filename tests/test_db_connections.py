@@ -0,0 +1,137 @@
+# Request-scoped database connection tests using Flask test client
+import os
+import sys
+from pathlib import Path
+
+# Ensure project root is on sys.path for imports when running from tests folder
+project_root = str(Path(__file__).resolve().parent.parent)
+if project_root not in sys.path:
+    sys.path.insert(0, project_root)
+
+# Prevent heavy DB init during import in app
+os.environ["SKIP_DB_INIT"] = "1"
+
+import app as app_module
+from app import app
+
+
+def test_request_reuses_single_connection():
+    with app.test_request_context("/"):
+        app.preprocess_request()
+        first = app_module.get_db()
+        app_module.execute_query("SELECT 1", fetch_one=True)
+        with app_module.db_connection() as conn:
+            assert conn is first
+        first.close()  # no-op until teardown
+        assert app_module.execute_query("SELECT 1", fetch_one=True)[0] == 1
+        assert app_module.g.db_connections_opened <= 2
+
+
+def test_teardown_releases_connection():
+    ctx = app.test_request_context("/")
+    ctx.push()
+    app_module.get_db()
+    assert app_module.g.get("_request_db") is not None
+    ctx.pop()
+    with app.test_request_context("/"):
+        assert app_module.g.get("_request_db") is None
+
+
+def test_select_queries_use_read_only_connection():
+    with app.test_request_context("/"):
+        app_module.execute_query("SELECT 1", fetch_one=True)
+        read_conn = app_module.g.get("_request_read_db")
+        assert read_conn is not None
+        assert read_conn.execute("PRAGMA query_only").fetchone()[0] == 1
+        try:
+            read_conn.execute("CREATE TABLE _ro_probe (id INTEGER)")
+            assert False, "read-only connection must reject writes"
+        except app_module.sqlite3.OperationalError:
+            pass
+        # Pure reads never check out a read-write connection
+        assert app_module.g.get("_request_db") is None
+
+
+def test_execute_query_rows_support_index_and_key_access():
+    with app.test_request_context("/"):
+        rows = app_module.execute_query(
+            "SELECT 1 AS a, 'x' AS b UNION ALL SELECT 2, 'y'", fetch_all=True
+        )
+        assert rows[0][0] == 1 and rows[0]["b"] == "x" and rows[1].get("a") == 2
+        assert rows[0].get("missing") is None and "a" in rows[0] and 0 not in rows[0]
+        # Column map is shared by the whole result set
+        assert rows[0]._index is rows[1]._index
+        assert dict(rows[1]) == {"a": 2, "b": "y"}
+        rows[0]["extra"] = True  # materialises a dict lazily
+        assert rows[0]["extra"] is True and rows[0][1] == "x"
+        assert app_module.app.json.dumps(rows[1]) == '{"a": 2, "b": "y"}'
+        # dict o'rniga Mapping tekshiruvlari va kesh serializatsiyasi
+        assert isinstance(rows[1], app_module.Mapping)
+        assert app_module.json.dumps(rows[1:], default=app_module._json_fallback) == '[{"a": 2, "b": "y"}]'
+
+        assert app_module.fetch_dicts("SELECT 1 AS a") == [{"a": 1}]
+
+
+def test_request_connection_discards_uncommitted_writes(tmp_path, monkeypatch):
+    # Eski get_db() kabi: commit() gacha xatolik bo'lsa birinchi INSERT ham saqlanmaydi
+    db_path = str(tmp_path / "tx.sqlite3")
+    setup = app_module.sqlite3.connect(db_path)
+    setup.execute("CREATE TABLE chats (id INTEGER PRIMARY KEY, name TEXT NOT NULL)")
+    setup.execute("CREATE TABLE chat_members (chat_id INTEGER NOT NULL, member_id INTEGER NOT NULL)")
+    setup.commit()
+    setup.close()
+    pool = app_module.DatabasePool(db_path, 2)
+    monkeypatch.setattr(app_module, "db_pool", pool)
+
+    with app.test_request_context("/"):
+        conn = app_module.get_db()
+        cur = conn.cursor()
+        cur.execute("INSERT INTO chats (name) VALUES ('group')")
+        try:
+            cur.execute("INSERT INTO chat_members (chat_id, member_id) VALUES (1, NULL)")
+            conn.commit()
+        except app_module.sqlite3.IntegrityError:
+            pass
+
+    with app.test_request_context("/"):
+        conn = app_module.get_db()
+        assert conn.execute("SELECT COUNT(*) FROM chats").fetchone()[0] == 0
+        # Pool connectioni yana autocommit holatida
+        assert conn.isolation_level == ""
+        app_module.execute_query("INSERT INTO chats (name) VALUES ('ok')")
+
+    with pool.get_connection() as raw:
+        assert raw.isolation_level is None and not raw.in_transaction
+        assert raw.execute("SELECT name FROM chats").fetchall()[0][0] == "ok"
+
+
+def test_execute_query_write_joins_open_request_transaction(tmp_path, monkeypatch):
+    db_path = str(tmp_path / "join.sqlite3")
+    setup = app_module.sqlite3.connect(db_path)
+    setup.execute("CREATE TABLE chats (id INTEGER PRIMARY KEY, name TEXT NOT NULL)")
+    setup.commit()
+    setup.close()
+    pool = app_module.DatabasePool(db_path, 2)
+    monkeypatch.setattr(app_module, "db_pool", pool)
+    monkeypatch.setattr(app_module, "_side_storage", False)
+
+    # get_db() helperining commit qilinmagan ishi execute_query tomonidan commit qilinmaydi
+    with app.test_request_context("/"):
+        conn = app_module.get_db()
+        conn.execute("INSERT INTO chats (name) VALUES ('helper')")
+        app_module.execute_query("INSERT INTO chats (name) VALUES ('joined')")
+        assert conn.in_transaction
+        # Commit bo'lmagan - @invalidates teglarni bekor qilmaydi
+        assert not app_module.g.get("db_write_committed")
+
+    with app.test_request_context("/"):
+        conn = app_module.get_db()
+        conn.execute("INSERT INTO chats (name) VALUES ('helper')")
+        app_module.execute_query("INSERT INTO chats (name) VALUES ('joined')")
+        conn.commit()
+        assert app_module.g.db_write_committed
+        app_module.execute_query("INSERT INTO chats (name) VALUES ('alone')")
+
+    with pool.get_connection() as raw:
+        names = [r[0] for r in raw.execute("SELECT name FROM chats ORDER BY id")]
+        assert names == ["helper", "joined", "alone"]
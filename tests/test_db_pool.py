@@ -0,0 +1,74 @@
+# DatabasePool tests (FIFO waiting, checkout deadline, metrics)
+import os
+import sys
+import threading
+import time
+from pathlib import Path
+
+# Ensure project root is on sys.path for imports when running from tests folder
+project_root = str(Path(__file__).resolve().parent.parent)
+if project_root not in sys.path:
+    sys.path.insert(0, project_root)
+
+# Prevent heavy DB init during import in app
+os.environ["SKIP_DB_INIT"] = "1"
+
+from app import DatabasePool
+
+
+def _make_pool(tmp_path, **kwargs):
+    return DatabasePool(str(tmp_path / "pool.sqlite3"), **kwargs)
+
+
+def test_connections_are_reused_without_health_check(tmp_path):
+    pool = _make_pool(tmp_path, max_connections=2)
+    with pool.get_connection() as first:
+        pass
+    with pool.get_connection() as second:
+        assert second is first
+    stats = pool.stats()
+    assert stats["checkouts"] == 2
+    assert stats["in_use"] == 0 and stats["idle"] == stats["open"] == 2
+    assert stats["created"] == 2 and stats["waits"] == 0
+
+
+def test_waiters_are_served_in_fifo_order(tmp_path):
+    pool = _make_pool(tmp_path, max_connections=1)
+    order = []
+    started = []
+
+    def worker(n):
+        started.append(n)
+        with pool.get_connection():
+            order.append(n)
+
+    with pool.get_connection():
+        threads = []
+        for n in range(4):
+            t = threading.Thread(target=worker, args=(n,))
+            t.start()
+            threads.append(t)
+            # Navbatga kirish tartibini aniq qilish
+            while pool.stats()["waiting"] < n + 1:
+                time.sleep(0.001)
+    for t in threads:
+        t.join(5)
+
+    assert order == [0, 1, 2, 3]
+    stats = pool.stats()
+    assert stats["waits"] == 4 and stats["open"] == 1
+    assert sum(stats["wait_histogram"].values()) == 4
+
+
+def test_checkout_deadline_raises_and_counts_timeout(tmp_path):
+    pool = _make_pool(tmp_path, max_connections=1, checkout_timeout=0.05)
+    with pool.get_connection():
+        start = time.monotonic()
+        try:
+            with pool.get_connection():
+                assert False, "pool is exhausted"
+        except Exception as e:
+            assert "timeout" in str(e).lower()
+        assert time.monotonic() - start < 1
+    stats = pool.stats()
+    assert stats["timeouts"] == 1 and stats["in_use"] == 0 and stats["waiting"] == 0
@@ -0,0 +1,141 @@
+# Single-writer queue tests (group commit and per-job isolation)
+import os
+import sqlite3
+import sys
+import threading
+from pathlib import Path
+
+# Ensure project root is on sys.path for imports when running from tests folder
+project_root = str(Path(__file__).resolve().parent.parent)
+if project_root not in sys.path:
+    sys.path.insert(0, project_root)
+
+# Prevent heavy DB init during import in app
+os.environ["SKIP_DB_INIT"] = "1"
+
+from app import DatabaseWriter
+
+
+def _make_writer(tmp_path):
+    db_path = str(tmp_path / "writer.sqlite3")
+    conn = sqlite3.connect(db_path)
+    conn.execute("CREATE TABLE items (id INTEGER PRIMARY KEY, name TEXT NOT NULL)")
+    conn.commit()
+    conn.close()
+    return DatabaseWriter(db_path), db_path
+
+
+def test_concurrent_writes_are_group_committed(tmp_path):
+    writer, db_path = _make_writer(tmp_path)
+    gate = threading.Event()
+
+    # Hold the writer thread so that the following jobs pile up in the queue
+    blocker = writer.submit(lambda conn: gate.wait(5))
+    futures = [
+        writer.submit(
+            lambda conn, i=i: conn.execute(
+                "INSERT INTO items (name) VALUES (?)", (f"item-{i}",)
+            ).lastrowid
+        )
+        for i in range(20)
+    ]
+    gate.set()
+    blocker.result(timeout=5)
+    ids = [f.result(timeout=5) for f in futures]
+
+    assert len(set(ids)) == 20
+    assert writer.stats["max_batch_size"] > 1
+    conn = sqlite3.connect(db_path)
+    assert conn.execute("SELECT COUNT(*) FROM items").fetchone()[0] == 20
+    conn.close()
+
+
+def test_failing_job_does_not_roll_back_batch(tmp_path):
+    writer, db_path = _make_writer(tmp_path)
+    gate = threading.Event()
+    blocker = writer.submit(lambda conn: gate.wait(5))
+    ok = writer.submit(
+        lambda conn: conn.execute("INSERT INTO items (name) VALUES ('ok')")
+    )
+    bad = writer.submit(
+        lambda conn: conn.execute("INSERT INTO items (name) VALUES (NULL)")
+    )
+    gate.set()
+    blocker.result(timeout=5)
+    ok.result(timeout=5)
+    try:
+        bad.result(timeout=5)
+        assert False, "NOT NULL violation should be raised to the caller"
+    except sqlite3.IntegrityError:
+        pass
+
+    conn = sqlite3.connect(db_path)
+    assert conn.execute("SELECT name FROM items").fetchall() == [("ok",)]
+    conn.close()
+
+
+def test_side_writer_is_not_blocked_by_main_write_lock(tmp_path):
+    main_path = str(tmp_path / "main.sqlite3")
+    side_path = str(tmp_path / "messaging.sqlite3")
+    conn = sqlite3.connect(side_path)
+    conn.execute("CREATE TABLE notifications (id INTEGER PRIMARY KEY, title TEXT)")
+    conn.commit()
+    conn.close()
+
+    # Asosiy faylning yozuv qulfi band - masalan, uzoq davom etayotgan buyurtma
+    holder = sqlite3.connect(main_path, isolation_level=None)
+    holder.execute("CREATE TABLE orders (id INTEGER PRIMARY KEY)")
+    holder.execute("BEGIN IMMEDIATE")
+    try:
+        writer = DatabaseWriter(side_path, schema="messaging")
+        rowid = writer.submit(
+            lambda c: c.execute(
+                "INSERT INTO notifications (title) VALUES ('x')"
+            ).lastrowid
+        ).result(timeout=2)
+        assert rowid == 1
+    finally:
+        holder.execute("ROLLBACK")
+        holder.close()
+
+    check = sqlite3.connect(side_path)
+    assert check.execute("SELECT title FROM notifications").fetchall() == [("x",)]
+    check.close()
+
+
+def test_run_write_timeout_cancels_queued_job(tmp_path, monkeypatch):
+    import app as app_module
+
+    writer, db_path = _make_writer(tmp_path)
+    monkeypatch.setitem(app_module.db_writers, "main", writer)
+    gate = threading.Event()
+    blocker = writer.submit(lambda conn: gate.wait(5))
+
+    # Navbatda turgan ish timeout da bekor qilinadi - keyin commit bo'lmaydi
+    try:
+        app_module.run_write(
+            lambda conn: conn.execute("INSERT INTO items (name) VALUES ('late')"),
+            timeout=0.05,
+        )
+        assert False, "timeout expected"
+    except app_module.FutureTimeoutError:
+        pass
+    gate.set()
+    blocker.result(timeout=5)
+
+    # Boshlangan ish timeoutdan keyin ham o'z natijasini qaytaradi
+    started = threading.Event()
+
+    def slow(conn):
+        started.set()
+        gate2.wait(5)
+        return conn.execute("INSERT INTO items (name) VALUES ('slow')").lastrowid
+
+    gate2 = threading.Event()
+    threading.Timer(0.2, gate2.set).start()
+    assert app_module.run_write(slow, timeout=0.05) is not None
+    assert started.is_set()
+
+    conn = sqlite3.connect(db_path)
+    assert [r[0] for r in conn.execute("SELECT name FROM items")] == ["slow"]
+    conn.close()
@@ -0,0 +1,165 @@
+# Menu search tests (FTS5 ranking/prefix/highlight, size/color facet tables, /api/menu-facets)
+import importlib.util
+import os
+import sys
+from pathlib import Path
+
+import pytest
+
+# Ensure project root is on sys.path for imports when running from tests folder
+project_root = str(Path(__file__).resolve().parent.parent)
+if project_root not in sys.path:
+    sys.path.insert(0, project_root)
+
+# Prevent heavy DB init during import in app
+os.environ["SKIP_DB_INIT"] = "1"
+
+import app as app_module
+from app import app, build_menu_fts_query
+
+
+def _load_migration(filename):
+    spec = importlib.util.spec_from_file_location(
+        filename[:-3], str(Path(project_root) / "migrations" / filename)
+    )
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+fts_migration = _load_migration("0005_menu_search_fts.py")
+facets_migration = _load_migration("0006_menu_facets.py")
+
+ITEMS = [
+    ("Qora botinka", "Charm, qishki", "specobuv", "qora", "40, 41,42", 300000),
+    ("Ish kurtkasi", "Qora rangli, issiq", "specodezhda", "qora,yashil", '["M","L"]', 200000),
+    ("Ботинки рабочие", "Кожаные <b>ботинки</b>", "specobuv", "черный", "41", 250000),
+    ("Qo'lqop", "Paxta", "specodezhda", "oq", "", 30000),
+]
+
+
+@pytest.fixture
+def menu_db(query_db):
+    query_db.executescript(
+        """
+        CREATE TABLE menu_items (id INTEGER PRIMARY KEY, name TEXT, description TEXT,
+            category TEXT, colors TEXT, sizes TEXT, price REAL, available INTEGER DEFAULT 1,
+            orders_count INTEGER DEFAULT 0, rating REAL DEFAULT 0);
+        CREATE TABLE product_media (id INTEGER PRIMARY KEY, menu_item_id INTEGER,
+            media_type TEXT, media_url TEXT, display_order INTEGER, is_main INTEGER);
+        CREATE TABLE ratings (id INTEGER PRIMARY KEY, user_id INTEGER, menu_item_id INTEGER,
+            branch_id INTEGER, rating INTEGER);
+        """
+    )
+    query_db.executemany(
+        "INSERT INTO menu_items (name, description, category, colors, sizes, price) VALUES (?, ?, ?, ?, ?, ?)",
+        ITEMS,
+    )
+    fts_migration.upgrade(query_db, {})
+    facets_migration.upgrade(query_db, {})
+    query_db.commit()
+    return query_db
+
+
+def _search(**args):
+    resp = app.test_client().get("/api/menu-search", query_string=args)
+    assert resp.status_code == 200
+    return resp.get_json()["items"]
+
+
+def test_query_builder_quotes_words_as_prefixes():
+    assert build_menu_fts_query('qora "bot OR') == '"qora"* "bot"* "OR"*'
+    assert build_menu_fts_query("!!!") == ""
+
+
+def test_triggers_keep_index_in_sync(menu_db):
+    def ids(match):
+        return [r[0] for r in menu_db.execute(
+            "SELECT rowid FROM menu_items_fts WHERE menu_items_fts MATCH ? ORDER BY rowid", (match,)
+        )]
+
+    assert ids("qora") == [1, 2]
+    menu_db.execute("UPDATE menu_items SET colors = 'jigarrang' WHERE id = 1")
+    menu_db.execute("UPDATE menu_items SET name = 'Qora etik' WHERE id = 4")
+    menu_db.execute("DELETE FROM menu_items WHERE id = 2")
+    menu_db.execute("INSERT INTO menu_items (name, description, category, colors, price) "
+                    "VALUES ('Qora shlyapa', '', 'aksessuar', '', 10)")
+    assert ids("qora") == [1, 4, 5]
+    assert ids("jigarrang") == [1]
+    assert ids("paxta") == [4]
+
+
+def test_ranked_prefix_search_with_highlight(menu_db):
+    items = _search(q="qor")
+    # name dagi moslik description dagidan yuqori
+    assert [i["name"] for i in items] == ["Qora botinka", "Ish kurtkasi"]
+    assert items[0]["highlight"]["name"] == "<mark>Qora</mark> botinka"
+    assert "media" in items[0]
+
+    cyrillic = _search(q="ботин")
+    assert [i["name"] for i in cyrillic] == ["Ботинки рабочие"]
+    # Mahsulot matnidagi HTML escape qilinadi
+    assert cyrillic[0]["highlight"]["description"] == (
+        "Кожаные &lt;b&gt;<mark>ботинки</mark>&lt;/b&gt;"
+    )
+
+    assert [i["name"] for i in _search(q="qora ish")] == ["Ish kurtkasi"]
+    assert [i["name"] for i in _search(q="qora", sort="price_asc")] == [
+        "Ish kurtkasi",
+        "Qora botinka",
+    ]
+    assert [i["name"] for i in _search(q="qora", category="specobuv")] == ["Qora botinka"]
+
+
+def test_like_fallback_without_fts(menu_db, monkeypatch):
+    monkeypatch.setattr(app_module, "_schema_tables", {"menu_items_fts": False})
+    items = _search(q="Qora")
+    assert [i["name"] for i in items] == ["Qora botinka", "Ish kurtkasi"]
+    assert "highlight" not in items[0]
+
+
+def test_size_and_color_filters_use_facet_tables(menu_db):
+    # "40, 41,42" dagi bo'shliq LIKE '%,41,%' ni buzardi
+    assert [i["name"] for i in _search(size="41")] == ["Qora botinka", "Ботинки рабочие"]
+    assert [i["name"] for i in _search(size="m")] == ["Ish kurtkasi"]
+    assert [i["name"] for i in _search(color="yashil")] == ["Ish kurtkasi"]
+    assert _search(size="4") == []
+
+    menu_db.execute("UPDATE menu_items SET sizes = '39' WHERE id = 1")
+    assert [i["name"] for i in _search(size="39", q="qora")] == ["Qora botinka"]
+
+
+def test_facet_counts_follow_other_filters(menu_db):
+    client = app.test_client()
+    data = client.get("/api/menu-facets").get_json()
+    assert data["success"] and data["total"] == 4
+    facets = data["facets"]
+    assert facets["category"] == {"specobuv": 2, "specodezhda": 2}
+    assert facets["size"] == {"40": 1, "41": 2, "42": 1, "L": 1, "M": 1}
+    assert [(b["min"], b["max"], b["count"]) for b in facets["price"]] == [
+        (0, 50000, 1), (50000, 100000, 0), (100000, 200000, 0),
+        (200000, 500000, 3), (500000, None, 0),
+    ]
+
+    data = client.get(
+        "/api/menu-facets", query_string={"category": "specobuv", "size": "41"}
+    ).get_json()
+    assert data["total"] == 2
+    # O'z filtri hisobga olinmaydi: boshqa kategoriya/o'lchamlar soni ko'rinadi
+    assert data["facets"]["category"] == {"specobuv": 2}
+    assert data["facets"]["size"] == {"40": 1, "41": 2, "42": 1}
+    assert data["facets"]["color"] == {"qora": 1, "черный": 1}
+
+    data = client.get(
+        "/api/menu-facets", query_string={"q": "qora", "max_price": "250000"}
+    ).get_json()
+    assert data["total"] == 1 and data["facets"]["category"] == {"specodezhda": 1}
+
+
+def test_facet_index_is_rebuilt_after_menu_invalidation(menu_db):
+    index = app_module.get_menu_facet_index()
+    assert app_module.get_menu_facet_index() is index
+    menu_db.execute("UPDATE menu_items SET available = 0 WHERE id = 4")
+    app_module.invalidate_cache("menu")
+    rebuilt = app_module.get_menu_facet_index()
+    assert rebuilt is not index and rebuilt.ids == {1, 2, 3}
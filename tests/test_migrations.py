@@ -0,0 +1,161 @@
+# Schema migration runner tests (PRAGMA user_version bookkeeping)
+import sqlite3
+import sys
+from pathlib import Path
+
+# Ensure project root is on sys.path for imports when running from tests folder
+project_root = str(Path(__file__).resolve().parent.parent)
+if project_root not in sys.path:
+    sys.path.insert(0, project_root)
+
+from migrations import discover_migrations, run_migrations
+
+
+def _write_migrations(directory):
+    (directory / "0001_create_items.py").write_text(
+        "def upgrade(conn, context):\n"
+        "    conn.execute('CREATE TABLE items (id INTEGER PRIMARY KEY)')\n"
+        "    context.setdefault('calls', []).append(1)\n"
+    )
+    (directory / "0002_add_name.py").write_text(
+        "def upgrade(conn, context):\n"
+        "    conn.execute('ALTER TABLE items ADD COLUMN name TEXT')\n"
+        "    context.setdefault('calls', []).append(2)\n"
+    )
+
+
+def test_migrations_run_once_and_record_version(tmp_path):
+    mig_dir = tmp_path / "migs"
+    mig_dir.mkdir()
+    _write_migrations(mig_dir)
+    db_path = str(tmp_path / "app.sqlite3")
+
+    context = {}
+    assert run_migrations(db_path, context, directory=str(mig_dir)) == [1, 2]
+    assert context["calls"] == [1, 2]
+
+    # Up-to-date database: nothing runs
+    assert run_migrations(db_path, context, directory=str(mig_dir)) == []
+    assert context["calls"] == [1, 2]
+
+    conn = sqlite3.connect(db_path)
+    assert conn.execute("PRAGMA user_version").fetchone()[0] == 2
+    conn.close()
+
+
+def test_failed_migration_keeps_previous_version(tmp_path):
+    mig_dir = tmp_path / "migs"
+    mig_dir.mkdir()
+    _write_migrations(mig_dir)
+    (mig_dir / "0003_broken.py").write_text(
+        "def upgrade(conn, context):\n"
+        "    conn.execute('ALTER TABLE missing ADD COLUMN x TEXT')\n"
+    )
+    db_path = str(tmp_path / "app.sqlite3")
+
+    try:
+        run_migrations(db_path, directory=str(mig_dir))
+        assert False, "broken migration should raise"
+    except sqlite3.OperationalError:
+        pass
+
+    conn = sqlite3.connect(db_path)
+    assert conn.execute("PRAGMA user_version").fetchone()[0] == 2
+    conn.close()
+
+
+def test_repository_migrations_are_numbered():
+    versions = [m[0] for m in discover_migrations()]
+    assert versions == list(range(1, len(versions) + 1))
+
+
+def test_hot_indexes_cover_query_catalog(tmp_path, app_data_dir):
+    sys.path.insert(0, str(Path(project_root) / "tools"))
+    import query_plan_audit
+
+    # Ishga tushirilgan checkoutda 0004 jadvallarni messaging/activity fayllariga
+    # ko'chirgan bo'ladi - asosiy baza bilan birga ularni ham (WAL bilan) nusxalash.
+    # Manba - conftest dagi nusxa, kuzatiladigan fayllar ochilmaydi
+    db_path = str(tmp_path / "database.sqlite3")
+    for name in ("database", "messaging", "activity"):
+        source = app_data_dir / f"{name}.sqlite3"
+        if not source.exists():
+            continue
+        src = sqlite3.connect(str(source))
+        dst = sqlite3.connect(str(tmp_path / f"{name}.sqlite3"))
+        try:
+            src.backup(dst)
+        finally:
+            dst.close()
+            src.close()
+    # 0001 faqat eski bootstrapni chaqiradi - mavjud sxema nusxasida kerak emas
+    run_migrations(db_path, {"legacy_bootstrap": lambda: None})
+
+    conn = query_plan_audit.open_database(db_path)
+    try:
+        assert query_plan_audit.missing_indexes(conn) == []
+        assert query_plan_audit.audit(conn) == []
+    finally:
+        conn.close()
+
+
+def test_created_ts_backfill_and_trigger(tmp_path):
+    import importlib.util
+
+    spec = importlib.util.spec_from_file_location(
+        "created_epoch", str(Path(project_root) / "migrations" / "0003_created_epoch.py")
+    )
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+
+    conn = sqlite3.connect(str(tmp_path / "app.sqlite3"))
+    conn.execute("CREATE TABLE orders (id INTEGER PRIMARY KEY, status TEXT, created_at TEXT)")
+    conn.execute(
+        "INSERT INTO orders (status, created_at) VALUES ('waiting', '2025-01-01T05:00:00+05:00')"
+    )
+    module.upgrade(conn, {})
+    conn.execute(
+        "INSERT INTO orders (status, created_at) VALUES ('waiting', '2025-01-02 10:30:00')"
+    )
+    rows = conn.execute("SELECT created_ts FROM orders ORDER BY id").fetchall()
+    # Suffiksli vaqt UTC ga o'giriladi, suffikssiz vaqt UTC deb olinadi
+    assert rows == [(1735689600,), (1735813800,)]
+    conn.close()
+
+
+def test_split_side_databases_moves_tables(tmp_path):
+    import importlib.util
+
+    spec = importlib.util.spec_from_file_location(
+        "split_side", str(Path(project_root) / "migrations" / "0004_split_side_databases.py")
+    )
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+
+    conn = sqlite3.connect(str(tmp_path / "app.sqlite3"))
+    conn.execute("CREATE TABLE orders (id INTEGER PRIMARY KEY)")
+    conn.execute(
+        "CREATE TABLE sessions (id INTEGER PRIMARY KEY AUTOINCREMENT, session_id TEXT UNIQUE NOT NULL)"
+    )
+    conn.execute("CREATE INDEX idx_sessions_sid ON sessions (session_id)")
+    conn.executemany("INSERT INTO sessions (session_id) VALUES (?)", [("a",), ("b",)])
+    conn.execute("DELETE FROM sessions WHERE session_id = 'b'")
+    conn.commit()
+
+    module.upgrade(conn, {})
+    conn.commit()
+
+    main_tables = {
+        r[0] for r in conn.execute("SELECT name FROM main.sqlite_master WHERE type='table'")
+    }
+    assert "orders" in main_tables and "sessions" not in main_tables
+    # Jadval nomi o'zgarmaydi - ATTACH orqali topiladi
+    assert conn.execute("SELECT session_id FROM sessions").fetchall() == [("a",)]
+    assert conn.execute(
+        "SELECT 1 FROM activity.sqlite_master WHERE name='idx_sessions_sid'"
+    ).fetchone()
+    # AUTOINCREMENT hisoblagichi ko'chirilgan - o'chirilgan id qayta berilmaydi
+    conn.execute("INSERT INTO sessions (session_id) VALUES ('c')")
+    assert conn.execute("SELECT id FROM sessions WHERE session_id='c'").fetchone() == (3,)
+    assert (tmp_path / "activity.sqlite3").exists()
+    conn.close()
@@ -0,0 +1,88 @@
+# /menu page cache tests (vary dimensions, per-user fragments, bypass rules)
+import os
+import sys
+from pathlib import Path
+
+# Ensure project root is on sys.path for imports when running from tests folder
+project_root = str(Path(__file__).resolve().parent.parent)
+if project_root not in sys.path:
+    sys.path.insert(0, project_root)
+
+# Prevent heavy DB init during import in app
+os.environ["SKIP_DB_INIT"] = "1"
+
+import app as app_module
+from app import CacheManager, app
+
+
+def _get_menu(sess):
+    client = app.test_client()
+    with client.session_transaction() as s:
+        s.update(sess)
+    return client.get("/menu").get_data(as_text=True)
+
+
+def _with_fresh_cache(fn):
+    original = app_module.cache_manager
+    app_module.cache_manager = CacheManager(stripes=1)
+    try:
+        return fn(app_module.cache_manager)
+    finally:
+        app_module.cache_manager = original
+
+
+def test_anonymous_hit_matches_uncached_render():
+    sess = {"session_id": "anon-page-1", "csrf_token": "tok-anon"}
+
+    def run(cache):
+        original = app_module.page_cache_variant
+        app_module.page_cache_variant = lambda: None
+        try:
+            uncached = _get_menu(sess)
+        finally:
+            app_module.page_cache_variant = original
+        assert _get_menu(sess) == uncached  # shell render
+        assert _get_menu(sess) == uncached  # hit
+        assert cache.stats()["prefixes"]["page"]["hits"] == 1
+
+    _with_fresh_cache(run)
+
+
+def test_users_share_shell_but_get_their_own_fragments():
+    def run(cache):
+        first = _get_menu(
+            {"session_id": "u-a", "user_id": 41, "user_name": "Ali <b>", "csrf_token": "tok-a"}
+        )
+        second = _get_menu(
+            {"session_id": "u-b", "user_id": 42, "user_name": "Vali", "csrf_token": "tok-b"}
+        )
+        assert cache.stats()["prefixes"]["page"]["sets"] == 1
+        assert "Ali &lt;b&gt;" in first and "tok-a" in first
+        assert "Vali" in second and "tok-b" in second
+        assert "Ali" not in second and "tok-a" not in second
+        assert "__page_fragment_" not in second
+
+    _with_fresh_cache(run)
+
+
+def test_staff_and_flashed_requests_bypass_page_cache():
+    def run(cache):
+        _get_menu({"session_id": "s-1", "staff_id": 3})
+        _get_menu({"session_id": "f-1", "_flashes": [("info", "Salom")]})
+        assert "page" not in cache.stats()["prefixes"]
+
+    _with_fresh_cache(run)
+
+
+def test_fill_page_fragments_replaces_markers_per_request():
+    shell = (
+        f"const USER_ID = {app_module.PAGE_USER_ID_MARKER};"
+        '<img src="__page_fragment_user_avatar__">'
+        "'__page_fragment_csrf_token__'"
+    )
+    with app.test_request_context("/menu"):
+        app_module.session.update(
+            {"user_id": 7, "user_avatar": '/a"b.png', "csrf_token": "tok-7"}
+        )
+        html = app_module.fill_page_fragments(shell)
+    assert html == "const USER_ID = 7;<img src=\"/a&#34;b.png\">'tok-7'"
@@ -0,0 +1,48 @@
+# Batched product media loading (catalog snapshot galleries)
+import os
+import sys
+from pathlib import Path
+
+# Ensure project root is on sys.path for imports when running from tests folder
+project_root = str(Path(__file__).resolve().parent.parent)
+if project_root not in sys.path:
+    sys.path.insert(0, project_root)
+
+# Prevent heavy DB init during import in app
+os.environ["SKIP_DB_INIT"] = "1"
+
+from app import load_product_media
+
+
+def test_galleries_for_many_items_load_in_one_query(query_db):
+    conn = query_db
+    conn.execute(
+        "CREATE TABLE product_media (id INTEGER PRIMARY KEY, menu_item_id INTEGER, "
+        "media_type TEXT, media_url TEXT, display_order INTEGER, is_main INTEGER)"
+    )
+    for item_id in range(1, 201):
+        conn.executemany(
+            "INSERT INTO product_media (menu_item_id, media_type, media_url, display_order, is_main) "
+            "VALUES (?, ?, ?, ?, ?)",
+            [
+                (item_id, "video", f"/v{item_id}.mp4", 0, 0),
+                (item_id, "image", f"/b{item_id}.jpg", 1, 0),
+                (item_id, "image", f"/a{item_id}.jpg", 2, 1),
+            ],
+        )
+    queries = conn.queries
+
+    media = load_product_media(list(range(1, 201)) + [999, 5])
+    assert len(queries) == 1
+    assert len(media) == 201 and media[999] == []
+    assert [m["media_url"] for m in media[5]] == ["/a5.jpg", "/v5.mp4", "/b5.jpg"]
+    assert set(media[5][0]) == {"id", "media_type", "media_url", "display_order", "is_main"}
+
+    queries.clear()
+    assert load_product_media([]) == {} and queries == []
+
+    # None - katalog snapshoti: barcha mahsulotlar bitta so'rovda, IN (...) siz
+    media = load_product_media()
+    assert len(queries) == 1 and "IN (" not in queries[0]
+    assert len(media) == 200 and 999 not in media
+    assert [m["media_url"] for m in media[5]] == ["/a5.jpg", "/v5.mp4", "/b5.jpg"]
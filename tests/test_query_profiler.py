@@ -0,0 +1,82 @@
+# SQL profiler tests (normalization, percentiles, slow query log, endpoint)
+import json
+import logging
+import os
+import sqlite3
+import sys
+from pathlib import Path
+
+# Ensure project root is on sys.path for imports when running from tests folder
+project_root = str(Path(__file__).resolve().parent.parent)
+if project_root not in sys.path:
+    sys.path.insert(0, project_root)
+
+# Prevent heavy DB init during import in app
+os.environ["SKIP_DB_INIT"] = "1"
+
+import app as app_module
+from app import QueryProfiler, app
+
+
+class _ListHandler(logging.Handler):
+    def __init__(self):
+        super().__init__()
+        self.messages = []
+
+    def emit(self, record):
+        self.messages.append(record.getMessage())
+
+
+def test_normalize_collapses_literals():
+    sql = "SELECT * FROM orders  WHERE id = 42 AND status='waiting' AND x IN (?, ?, ?)"
+    assert QueryProfiler.normalize(sql) == (
+        "SELECT * FROM orders WHERE id = ? AND status=? AND x IN (?...)"
+    )
+
+
+def test_top_orders_by_total_time_with_percentiles():
+    profiler = QueryProfiler(enabled=True, slow_ms=10_000)
+    for ms in range(1, 101):
+        profiler.record("SELECT * FROM a WHERE id = 1", ms / 1000, rows=1)
+    profiler.record("SELECT * FROM b", 0.5, rows=10)
+
+    top = profiler.top(limit=2)
+    assert [t["sql"] for t in top] == ["SELECT * FROM a WHERE id = ?", "SELECT * FROM b"]
+    assert top[0]["count"] == 100 and top[0]["p50_ms"] == 51.0
+    assert top[0]["p99_ms"] == 99.0 and top[0]["endpoints"] == {"<background>": 100}
+    assert profiler.top(limit=1, sort="max")[0]["sql"] == "SELECT * FROM b"
+
+
+def test_slow_queries_are_logged_with_plan():
+    profiler = QueryProfiler(enabled=True, slow_ms=0)
+    handler = _ListHandler()
+    profiler._slow_logger = logging.getLogger("test_slow_sql")
+    profiler._slow_logger.addHandler(handler)
+
+    conn = sqlite3.connect(":memory:")
+    conn.execute("CREATE TABLE t (id INTEGER PRIMARY KEY, name TEXT)")
+    profiler.record("SELECT * FROM t WHERE name = ?", 0.01, 0, conn, ("x",))
+
+    entry = json.loads(handler.messages[-1])
+    assert entry["sql"] == "SELECT * FROM t WHERE name = ?"
+    assert any("SCAN t" in line for line in entry["plan"])
+    assert profiler.top()[0]["slow"] == 1
+
+
+def test_query_stats_endpoint_reports_request_queries():
+    client = app.test_client()
+    with client.session_transaction() as sess:
+        sess["super_admin"] = True
+    try:
+        resp = client.post(
+            "/super-admin/query-stats", json={"enabled": True, "reset": True}
+        )
+        assert resp.get_json()["enabled"] is True
+        with app.test_request_context("/"):
+            app_module.execute_query("SELECT 7 AS n", fetch_one=True)
+        data = client.get("/super-admin/query-stats?limit=5").get_json()
+        assert data["success"]
+        assert "SELECT ? AS n" in [t["sql"] for t in data["top"]]
+    finally:
+        app_module.query_profiler.enabled = False
+        app_module.query_profiler.reset()
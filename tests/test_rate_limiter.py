@@ -0,0 +1,107 @@
+# RateLimiter tests (GCRA policies, idle key sweep, 429 responses)
+import os
+import sys
+import time
+from pathlib import Path
+
+# Ensure project root is on sys.path for imports when running from tests folder
+project_root = str(Path(__file__).resolve().parent.parent)
+if project_root not in sys.path:
+    sys.path.insert(0, project_root)
+
+# Prevent heavy DB init during import in app
+os.environ["SKIP_DB_INIT"] = "1"
+
+import app as app_module
+from app import RateLimiter, app
+
+
+def _limiter(**policies):
+    return RateLimiter(policies=policies, stripes=2, backend="memory")
+
+
+def test_burst_up_to_limit_then_steady_rate():
+    limiter = _limiter(api=((3, 0.3),))
+    assert [limiter.is_allowed("1.1.1.1", "api") for _ in range(4)] == [True] * 3 + [False]
+
+    allowed, retry_after = limiter.hit("1.1.1.1", "api")
+    assert not allowed and 0 < retry_after <= 0.1
+    assert limiter.is_allowed("2.2.2.2", "api")  # boshqa IP ning hisobi alohida
+
+    time.sleep(retry_after + 0.01)
+    assert limiter.is_allowed("1.1.1.1", "api")
+    assert not limiter.is_allowed("1.1.1.1", "api")
+
+    stats = limiter.stats()
+    assert stats["backend"] == "memory"
+    assert stats["policies"]["api"] == {"allowed": 5, "rejected": 3}
+
+
+def test_rejected_request_does_not_consume_other_rules():
+    limiter = _limiter(default=((100, 60), (2, 60)))
+    assert limiter.is_allowed("ip", "default") and limiter.is_allowed("ip", "default")
+    for _ in range(50):
+        assert not limiter.is_allowed("ip", "default")
+    stripe = limiter._stripe("ip")
+    # 100/60 qoidasida faqat o'tgan ikki so'rov yozilgan
+    assert stripe.tats[("ip", "default", 100, 60)] - time.monotonic() < 2 * 60 / 100
+
+
+def test_idle_keys_are_swept():
+    limiter = RateLimiter(
+        policies={"cart": ((10, 0.05),)}, stripes=1, sweep_interval=0, backend="memory"
+    )
+    for n in range(20):
+        limiter.hit(f"10.0.0.{n}", "cart")
+    assert limiter.stats()["keys"] == 20
+    time.sleep(0.06)
+    limiter.hit("10.0.1.1", "cart")
+    assert limiter.stats()["keys"] == 1
+
+
+def test_redis_errors_fall_back_to_local_counts():
+    class BrokenRedis:
+        def register_script(self, script):
+            raise ConnectionError("redis down")
+
+    limiter = RateLimiter(policies={"order": ((1, 60),)}, redis_client=BrokenRedis())
+    assert limiter.is_allowed("ip", "order")
+    assert not limiter.is_allowed("ip", "order")
+    assert limiter.stats()["backend"] == "memory"
+
+
+def test_default_policy_returns_429_with_retry_after():
+    limiter = app_module.rate_limiter
+    original = limiter.policies["default"]
+    limiter.policies["default"] = ((2, 60),)
+    limiter.reset()
+    try:
+        client = app.test_client()
+        assert client.get("/api/no-such-endpoint").status_code == 404
+        assert client.get("/api/no-such-endpoint").status_code == 404
+        resp = client.get("/api/no-such-endpoint")
+        assert resp.status_code == 429
+        assert resp.get_json()["code"] == 429
+        assert int(resp.headers["Retry-After"]) == 30
+    finally:
+        limiter.policies["default"] = original
+        limiter.reset()
+
+
+def test_static_and_probe_requests_skip_default_policy():
+    limiter = app_module.rate_limiter
+    original = limiter.policies["default"]
+    limiter.policies["default"] = ((1, 60),)
+    limiter.reset()
+    try:
+        client = app.test_client()
+        static_file = next(Path(app.static_folder).rglob("*.*")).relative_to(app.static_folder)
+        for _ in range(3):
+            assert client.get(f"/static/{static_file.as_posix()}").status_code == 200
+            assert client.get("/api/health").status_code != 429
+        assert limiter.stats()["policies"].get("default", {}).get("allowed", 0) == 0
+        assert client.get("/api/no-such-endpoint").status_code == 404
+        assert client.get("/api/no-such-endpoint").status_code == 429
+    finally:
+        limiter.policies["default"] = original
+        limiter.reset()
@@ -0,0 +1,174 @@
+# rating_aggregates tests (migration triggers/backfill, reconciliation, read helpers)
+import importlib.util
+import os
+import sqlite3
+import sys
+from pathlib import Path
+
+import pytest
+
+# Ensure project root is on sys.path for imports when running from tests folder
+project_root = str(Path(__file__).resolve().parent.parent)
+if project_root not in sys.path:
+    sys.path.insert(0, project_root)
+
+# Prevent heavy DB init during import in app
+os.environ["SKIP_DB_INIT"] = "1"
+
+import app as app_module
+from app import DbRow, rating_summary
+
+
+def _load_migration(filename):
+    spec = importlib.util.spec_from_file_location(
+        filename[:-3], str(Path(project_root) / "migrations" / filename)
+    )
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+migration = _load_migration("0007_rating_aggregates.py")
+
+
+def _make_db(tmp_path, ratings=()):
+    conn = sqlite3.connect(str(tmp_path / "ratings.sqlite3"))
+    conn.row_factory = sqlite3.Row
+    conn.execute(
+        """CREATE TABLE ratings (
+               id INTEGER PRIMARY KEY AUTOINCREMENT,
+               user_id INTEGER NOT NULL,
+               menu_item_id INTEGER,
+               branch_id INTEGER,
+               rating INTEGER NOT NULL,
+               comment TEXT,
+               created_at TEXT
+           )"""
+    )
+    conn.executemany(
+        "INSERT INTO ratings (user_id, menu_item_id, branch_id, rating) VALUES (?, ?, ?, ?)",
+        ratings,
+    )
+    return conn
+
+
+def _aggregates(conn):
+    return {
+        row["subject_id"]: (row["rating_sum"], row["rating_count"])
+        + tuple(row[f"stars_{n}"] for n in range(1, 6))
+        for row in conn.execute("SELECT * FROM rating_aggregates")
+    }
+
+
+def test_migration_backfills_items_and_branches(tmp_path):
+    # menu item 1: 5, 4; branch 2 (branch_id ustuni) va eski usul (-3)
+    conn = _make_db(
+        tmp_path,
+        [(1, 1, None, 5), (2, 1, None, 4), (1, None, 2, 3), (1, -3, None, 1)],
+    )
+    migration.upgrade(conn, {})
+
+    assert _aggregates(conn) == {
+        1: (9, 2, 0, 0, 0, 1, 1),
+        -2: (3, 1, 0, 0, 1, 0, 0),
+        -3: (1, 1, 1, 0, 0, 0, 0),
+    }
+
+
+def test_triggers_follow_insert_update_delete(tmp_path):
+    conn = _make_db(tmp_path)
+    migration.upgrade(conn, {})
+
+    conn.execute("INSERT INTO ratings (user_id, menu_item_id, rating) VALUES (1, 7, 5)")
+    conn.execute("INSERT INTO ratings (user_id, menu_item_id, rating) VALUES (2, 7, 2)")
+    assert _aggregates(conn)[7] == (7, 2, 0, 1, 0, 0, 1)
+
+    conn.execute("UPDATE ratings SET rating = 4 WHERE user_id = 2")
+    assert _aggregates(conn)[7] == (9, 2, 0, 0, 0, 1, 1)
+
+    # Boshqa mahsulotga ko'chirish: eski subjectdan ayiriladi, yangisiga qo'shiladi
+    conn.execute("UPDATE ratings SET menu_item_id = 8 WHERE user_id = 1")
+    assert _aggregates(conn)[7] == (4, 1, 0, 0, 0, 1, 0)
+    assert _aggregates(conn)[8] == (5, 1, 0, 0, 0, 0, 1)
+
+    conn.execute("DELETE FROM ratings")
+    assert all(values == (0,) * 7 for values in _aggregates(conn).values())
+
+
+def test_reconcile_fixes_drift(tmp_path):
+    conn = _make_db(tmp_path, [(1, 1, None, 5), (2, 1, None, 3)])
+    migration.upgrade(conn, {})
+    conn.execute("INSERT INTO ratings (user_id, menu_item_id, rating) VALUES (3, 2, 2)")
+    conn.execute("DELETE FROM ratings WHERE menu_item_id = 2")
+
+    # Triggerni chetlab o'tgan o'zgarishlar
+    conn.execute("UPDATE rating_aggregates SET rating_sum = 100 WHERE subject_id = 1")
+    conn.execute("INSERT INTO rating_aggregates (subject_id, rating_sum, rating_count) VALUES (5, 4, 1)")
+
+    fixed = app_module._reconcile_rating_aggregates(conn)
+
+    # Nol qatorli subject (2) drift emas - shunchaki tozalanadi
+    assert sorted(fixed) == [1, 5]
+    assert _aggregates(conn) == {1: (8, 2, 0, 0, 1, 0, 1)}
+    assert app_module._reconcile_rating_aggregates(conn) == []
+
+
+def test_reconcile_invalidates_ratings_cache(tmp_path, monkeypatch):
+    conn = _make_db(tmp_path, [(1, 1, None, 5)])
+    migration.upgrade(conn, {})
+    conn.execute("DELETE FROM rating_aggregates")
+
+    invalidated = []
+    monkeypatch.setattr(app_module, "_schema_tables", {"rating_aggregates": True})
+    monkeypatch.setattr(app_module, "run_write", lambda job, timeout=30: job(conn))
+    monkeypatch.setattr(app_module, "invalidate_cache", lambda *tags: invalidated.extend(tags))
+
+    assert app_module.reconcile_rating_aggregates() == [1]
+    assert invalidated == ["ratings"]
+
+
+def test_rating_summary():
+    columns = ("rating_sum", "rating_count", "stars_1", "stars_2", "stars_3", "stars_4", "stars_5")
+    row = DbRow((14, 3, 0, 0, 0, 1, 2), {name: i for i, name in enumerate(columns)})
+    assert rating_summary(row) == {
+        "average_rating": 4.7,
+        "total_ratings": 3,
+        "distribution": {"1": 0, "2": 0, "3": 0, "4": 1, "5": 2},
+    }
+    assert rating_summary(None)["average_rating"] == 0.0
+
+
+@pytest.mark.parametrize("branch_column", [True, False])
+def test_migration_adds_branch_column(tmp_path, branch_column):
+    conn = sqlite3.connect(str(tmp_path / "legacy.sqlite3"))
+    conn.execute(
+        "CREATE TABLE ratings (id INTEGER PRIMARY KEY, user_id INTEGER, menu_item_id INTEGER, rating INTEGER"
+        + (", branch_id INTEGER)" if branch_column else ")")
+    )
+    conn.execute("INSERT INTO ratings (user_id, menu_item_id, rating) VALUES (1, 4, 2)")
+    migration.upgrade(conn, {})
+    assert conn.execute("SELECT rating_sum, rating_count, stars_2 FROM rating_aggregates").fetchall() == [(2, 1, 1)]
+
+
+def test_null_ratings_are_skipped(tmp_path):
+    # Eski sxemada rating ustuni NULL qabul qiladi
+    conn = sqlite3.connect(str(tmp_path / "legacy.sqlite3"))
+    conn.row_factory = sqlite3.Row
+    conn.execute(
+        "CREATE TABLE ratings (id INTEGER PRIMARY KEY, user_id INTEGER, menu_item_id INTEGER, "
+        "branch_id INTEGER, rating INTEGER)"
+    )
+    conn.executemany(
+        "INSERT INTO ratings (user_id, menu_item_id, rating) VALUES (?, ?, ?)",
+        [(1, 4, 2), (2, 4, None)],
+    )
+    migration.upgrade(conn, {})
+    assert _aggregates(conn) == {4: (2, 1, 0, 1, 0, 0, 0)}
+
+    conn.execute("INSERT INTO ratings (user_id, menu_item_id, rating) VALUES (3, 4, NULL)")
+    conn.execute("INSERT INTO ratings (user_id, menu_item_id, rating) VALUES (3, 9, NULL)")
+    conn.execute("UPDATE ratings SET rating = 5 WHERE user_id = 2")
+    conn.execute("UPDATE ratings SET rating = NULL WHERE user_id = 1")
+    conn.execute("DELETE FROM ratings WHERE user_id = 3")
+    assert _aggregates(conn) == {4: (5, 1, 0, 0, 0, 0, 1)}
+    assert app_module._reconcile_rating_aggregates(conn) == []
@@ -0,0 +1,118 @@
+# Per-request memoization and batched notification sender names
+import os
+import sys
+from pathlib import Path
+
+# Ensure project root is on sys.path for imports when running from tests folder
+project_root = str(Path(__file__).resolve().parent.parent)
+if project_root not in sys.path:
+    sys.path.insert(0, project_root)
+
+# Prevent heavy DB init during import in app
+os.environ["SKIP_DB_INIT"] = "1"
+
+import app as app_module
+from app import app, request_memoized
+
+
+def test_request_memoized_caches_within_one_request_only():
+    calls = []
+
+    @request_memoized
+    def lookup(key):
+        calls.append(key)
+        return len(calls)
+
+    with app.test_request_context("/"):
+        assert lookup("a") == lookup("a") == 1
+        assert lookup("b") == 2
+    with app.test_request_context("/"):
+        assert lookup("a") == 3
+    assert lookup("a") == 4  # so'rovdan tashqarida eslab qolinmaydi
+    assert calls == ["a", "b", "a", "a"]
+
+
+def test_request_memo_returns_copies_and_drops_after_write():
+    calls = []
+
+    @request_memoized
+    def branch():
+        calls.append(1)
+        return {"name": "Markaz", "countries": ["uz"]}
+
+    with app.test_request_context("/"):
+        branch()["countries"].append("kz")
+        assert branch() == {"name": "Markaz", "countries": ["uz"]}
+        assert len(calls) == 1
+        # Yozuvdan keyin (masalan, mark-read) qayta o'qiladi
+        app_module._mark_request_write()
+        branch()
+        assert len(calls) == 2
+
+
+def _fill_notifications(conn):
+    conn.executescript(
+        """
+        CREATE TABLE notifications (id INTEGER PRIMARY KEY, recipient_type TEXT,
+            recipient_id INTEGER, title TEXT, body TEXT, read_flag INTEGER DEFAULT 0,
+            created_at TEXT, sender_type TEXT, sender_id INTEGER);
+        CREATE TABLE staff (id INTEGER PRIMARY KEY, first_name TEXT, last_name TEXT);
+        CREATE TABLE couriers (id INTEGER PRIMARY KEY, first_name TEXT, last_name TEXT);
+        CREATE TABLE users (id INTEGER PRIMARY KEY, first_name TEXT, last_name TEXT);
+        INSERT INTO staff VALUES (1, 'Ali', 'Valiyev'), (2, '', '');
+        INSERT INTO couriers VALUES (7, 'Bobur', NULL);
+        """
+    )
+    senders = [("staff", 1), ("staff", 2), ("courier", 7), ("courier", 8), ("system", None)]
+    for n in range(100):
+        sender_type, sender_id = senders[n % len(senders)]
+        conn.execute(
+            "INSERT INTO notifications (recipient_type, recipient_id, title, body, created_at, sender_type, sender_id) "
+            "VALUES ('staff', 1, 't', 'b', '2024-01-01 10:00:00', ?, ?)",
+            (sender_type, sender_id),
+        )
+
+
+class _NoClose:
+    def __init__(self, conn):
+        self._conn = conn
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+    def close(self):
+        pass
+
+
+def test_notification_sender_names_are_loaded_per_type(query_db, monkeypatch):
+    _fill_notifications(query_db)
+    queries = query_db.queries
+    monkeypatch.setattr(app_module, "get_db", lambda: _NoClose(query_db))
+
+    notes = app_module.get_notifications_for_user({"type": "staff", "id": 1})
+    assert len(notes) == 100
+    assert len(queries) == 2  # staff va couriers - har biri bitta so'rov
+    names = {(n["sender_type"], n["sender_id"]): n.get("sender_name") for n in notes}
+    assert names == {
+        ("staff", 1): "Ali Valiyev",
+        ("staff", 2): "Staff #2",
+        ("courier", 7): "Bobur",
+        ("courier", 8): "Noma'lum",
+        ("system", None): None,
+    }
+    assert app_module.get_sender_name("super_admin", None) == "Super Admin"
+
+
+def test_unread_count_follows_mark_read_in_same_request():
+    # conftest dagi baza nusxasi; yozuv so'rov connectioni orqali commit qilinadi
+    with app.test_request_context("/"):
+        app_module.execute_query(
+            "INSERT INTO notifications (recipient_type, recipient_id, title, body, read_flag, created_at) "
+            "VALUES ('user', -77, 't', 'b', 0, '2024-01-01 10:00:00')"
+        )
+        assert app_module.count_unread_notifications(-77) == 1
+        app_module.execute_query(
+            "UPDATE notifications SET read_flag = 1 WHERE recipient_type = 'user' AND recipient_id = -77"
+        )
+        assert app_module.count_unread_notifications(-77) == 0
+        app_module.execute_query("DELETE FROM notifications WHERE recipient_id = -77")
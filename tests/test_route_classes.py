@@ -0,0 +1,55 @@
+# Lightweight route classes (static/probe/poll skip session and flash hooks)
+import os
+import sys
+from pathlib import Path
+
+# Ensure project root is on sys.path for imports when running from tests folder
+project_root = str(Path(__file__).resolve().parent.parent)
+if project_root not in sys.path:
+    sys.path.insert(0, project_root)
+
+# Prevent heavy DB init during import in app
+os.environ["SKIP_DB_INIT"] = "1"
+
+from app import app, route_class
+
+
+def _client_with_session():
+    client = app.test_client()
+    with client.session_transaction() as sess:
+        sess["session_id"] = "route-class-session-0001"
+        sess["_flashes"] = [("info", "hello")]
+        sess.permanent = True
+    return client
+
+
+def test_endpoints_are_classified():
+    views = app.view_functions
+    assert views["static_files"].route_class == "static"
+    assert views["api_health"].route_class == "probe"
+    assert views["api_cart_count"].route_class == "poll"
+    try:
+        route_class("bogus")
+        assert False, "unknown class must be rejected"
+    except ValueError:
+        pass
+
+
+def test_probe_and_static_do_not_reissue_session_cookie():
+    client = _client_with_session()
+    for path in ("/api/health", "/static/favicon.ico"):
+        resp = client.get(path)
+        assert resp.status_code == 200
+        assert "Set-Cookie" not in resp.headers
+
+
+def test_poll_leaves_flashes_and_does_not_create_session():
+    client = _client_with_session()
+    client.get("/api/chat-unread-count")
+    with client.session_transaction() as sess:
+        assert sess["_flashes"] == [("info", "hello")]
+
+    fresh = app.test_client()
+    fresh.get("/api/chat-unread-count")
+    with fresh.session_transaction() as sess:
+        assert "session_id" not in sess
@@ -0,0 +1,89 @@
+# Write-behind session activity tracker tests (coalescing, batched flush, merge)
+import os
+import sqlite3
+import sys
+from pathlib import Path
+
+# Ensure project root is on sys.path for imports when running from tests folder
+project_root = str(Path(__file__).resolve().parent.parent)
+if project_root not in sys.path:
+    sys.path.insert(0, project_root)
+
+# Prevent heavy DB init during import in app
+os.environ["SKIP_DB_INIT"] = "1"
+
+import app as app_module
+from app import DatabaseWriter, SessionActivityTracker
+
+
+def _make_tracker(tmp_path):
+    db_path = str(tmp_path / "activity.sqlite3")
+    writer = DatabaseWriter(db_path)
+    # Fon thread ishlamasin - flush testda qo'lda chaqiriladi
+    tracker = SessionActivityTracker(flush_interval=3600, submit=writer.submit)
+    return tracker, writer, db_path
+
+
+def _rows(db_path):
+    conn = sqlite3.connect(db_path)
+    try:
+        return conn.execute(
+            "SELECT session_id, user_id, ip FROM sessions ORDER BY session_id"
+        ).fetchall()
+    finally:
+        conn.close()
+
+
+def test_touches_are_coalesced_into_one_batch(tmp_path):
+    tracker, writer, db_path = _make_tracker(tmp_path)
+    for i in range(50):
+        tracker.touch("a", 1, f"10.0.0.{i}", "ua")
+    tracker.touch("b", None, "10.0.0.99", "ua")
+
+    assert tracker.flush() == 2
+    assert _rows(db_path) == [("a", 1, "10.0.0.49"), ("b", None, "10.0.0.99")]
+    assert writer.stats["batches"] == 1
+
+    # Keyingi flush mavjud qatorni yangilaydi
+    tracker.touch("b", 7, "10.0.0.100", "ua")
+    assert tracker.flush() == 1 and tracker.flush() == 0
+    assert _rows(db_path)[1] == ("b", 7, "10.0.0.100")
+
+
+def test_forget_drops_pending_and_stored_rows(tmp_path):
+    tracker, _, db_path = _make_tracker(tmp_path)
+    tracker.touch("a", 1)
+    tracker.flush()
+    tracker.touch("a", 1)
+    tracker.forget("a")
+    tracker.flush()
+    assert _rows(db_path) == []
+
+
+def test_user_sessions_include_unflushed_activity(monkeypatch, tmp_path):
+    tracker, _, _ = _make_tracker(tmp_path)
+    monkeypatch.setattr(app_module, "session_tracker", tracker)
+    stored = [
+        {
+            "session_id": "old",
+            "ip": "1",
+            "user_agent": "x",
+            "created_at": "2024-01-01 00:00:00",
+            "last_seen": "2024-01-01 00:00:00",
+        },
+        {
+            "session_id": "moved",
+            "ip": "1",
+            "user_agent": "x",
+            "created_at": "2024-01-01 00:00:00",
+            "last_seen": "2024-01-02 00:00:00",
+        },
+    ]
+    tracker.touch("old", 5, "2", "y")
+    tracker.touch("new", 5, "3", "z")
+    tracker.touch("moved", 6, "4", "w")
+
+    merged = app_module._merge_pending_sessions(5, stored)
+    assert sorted(r["session_id"] for r in merged) == ["new", "old"]
+    old = next(r for r in merged if r["session_id"] == "old")
+    assert old["created_at"] == "2024-01-01 00:00:00" and old["ip"] == "2"
@@ -0,0 +1,94 @@
+"""
+Request hook overhead benchmark for the lightweight route classes.
+
+Times static, probe and poll requests through the Flask test client twice:
+with route classification (normal) and with it switched off, so every
+request runs the full before_request / localize_flashes / after_request
+path. Prints the mean per-request time and how many responses re-issued
+the session cookie.
+
+Run with: SKIP_DB_INIT=1 python tools/bench_request_hooks.py [--n 2000] [--rounds 3]
+"""
+import argparse
+import os
+import sys
+import time
+
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if project_root not in sys.path:
+    sys.path.insert(0, project_root)
+
+os.environ.setdefault("SKIP_DB_INIT", "1")
+
+import app as app_module  # noqa: E402
+
+PATHS = ("/static/favicon.ico", "/api/health", "/api/cart-count")
+
+
+def bench(client, path, n):
+    client.get(path)  # warm-up (session cookie, connections, caches)
+    cookies = 0
+    start = time.perf_counter()
+    for _ in range(n):
+        resp = client.get(path)
+        assert resp.status_code == 200, (path, resp.status_code)
+        cookies += "Set-Cookie" in resp.headers
+        resp.close()
+    elapsed = time.perf_counter() - start
+    return elapsed / n * 1e6, cookies
+
+
+def _client():
+    client = app_module.app.test_client()
+    # Logged-in style session so that the full path does real session work
+    with client.session_transaction() as sess:
+        sess["session_id"] = "bench-session-000000"
+        sess["user_id"] = 1
+        sess.permanent = True
+    return client
+
+
+def run(n, rounds=3):
+    """Best of `rounds` per (mode, path); modes are interleaved so that
+    warm-up and background flushes do not favour either side."""
+    results = {}
+    # Bir IP dan minglab so'rov - rate limit o'lchovga aralashmasin
+    app_module.rate_limiter.enabled = False
+    original = app_module.classify_request
+    modes = {"full hooks": lambda: None, "classified": original}
+    clients = {mode: _client() for mode in modes}
+    try:
+        for _ in range(rounds):
+            for path in PATHS:
+                for mode, classify in modes.items():
+                    app_module.classify_request = classify
+                    timing = bench(clients[mode], path, n)
+                    best = results.get((mode, path))
+                    if best is None or timing[0] < best[0]:
+                        results[(mode, path)] = timing
+    finally:
+        app_module.classify_request = original
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Request hook overhead benchmark")
+    parser.add_argument("--n", type=int, default=2000)
+    parser.add_argument("--rounds", type=int, default=3)
+    args = parser.parse_args(argv)
+
+    results = run(args.n, args.rounds)
+    print(f"{'path':<24}{'full hooks':>14}{'classified':>14}{'saved':>10}  Set-Cookie")
+    for path in PATHS:
+        full_us, full_cookie = results[("full hooks", path)]
+        light_us, light_cookie = results[("classified", path)]
+        print(
+            f"{path:<24}{full_us:>11.1f} us{light_us:>11.1f} us"
+            f"{(1 - light_us / full_us) * 100:>9.1f}%  "
+            f"{full_cookie}/{args.n} -> {light_cookie}/{args.n}"
+        )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,297 @@
+"""EXPLAIN QUERY PLAN audit for the app's hot queries.
+
+Runs every query in QUERY_CATALOG against the database and fails (exit code 1)
+when one of them does a full SCAN of a table listed in LARGE_TABLES, or when an
+index declared in a migration's INDEXES list is missing.
+
+Usage:
+    python tools/query_plan_audit.py [--db path/to/database.sqlite3]
+"""
+
+import argparse
+import importlib.util
+import os
+import re
+import sqlite3
+import sys
+import urllib.parse
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+DEFAULT_DB = os.path.join(ROOT, "database.sqlite3")
+MIGRATIONS_DIR = os.path.join(ROOT, "migrations")
+
+# Files split off the main database by migrations/0004, attached under these
+# schema names next to the main file (same layout as app.SIDE_DB_PATHS)
+SIDE_DATABASES = ("messaging", "activity")
+
+# Tables expected to grow into the hundreds of thousands of rows
+LARGE_TABLES = {
+    "orders",
+    "order_details",
+    "receipts",
+    "cart_items",
+    "notifications",
+    "chat_messages",
+    "chat_members",
+    "ratings",
+    "product_media",
+    "favorites",
+    "sessions",
+    "users",
+}
+
+# (label, sql, params) - copied from the call sites in app.py
+QUERY_CATALOG = [
+    (
+        "get_cart_items (user)",
+        """SELECT ci.id, ci.menu_item_id, ci.quantity, ci.size, ci.color
+           FROM cart_items ci WHERE ci.user_id = ? ORDER BY ci.created_at DESC""",
+        (1,),
+    ),
+    (
+        "get_cart_items (session)",
+        """SELECT ci.id, ci.menu_item_id, ci.quantity, ci.size, ci.color
+           FROM cart_items ci WHERE ci.session_id = ? ORDER BY ci.created_at DESC""",
+        ("sid",),
+    ),
+    (
+        "add_to_cart existing line",
+        "SELECT id, quantity FROM cart_items WHERE user_id = ? AND menu_item_id = ? AND COALESCE(size,'') = COALESCE(?, '') AND COALESCE(color,'') = COALESCE(?, '')",
+        (1, 1, "", ""),
+    ),
+    (
+        "api_cart_count",
+        "SELECT COALESCE(SUM(quantity), 0) FROM cart_items WHERE session_id = ?",
+        ("sid",),
+    ),
+    (
+        "waiting_position",
+        "SELECT COUNT(*) FROM orders WHERE status='waiting'",
+        (),
+    ),
+    (
+        "admin_monitor waiting",
+        """SELECT o.*, GROUP_CONCAT(mi.name || ' x' || od.quantity) as order_items
+           FROM orders o
+           LEFT JOIN order_details od ON o.id = od.order_id
+           LEFT JOIN menu_items mi ON od.menu_item_id = mi.id
+           WHERE o.status='waiting' GROUP BY o.id ORDER BY o.eta_time ASC""",
+        (),
+    ),
+    (
+        "user_status by ticket",
+        "SELECT * FROM orders WHERE ticket_no=? ORDER BY id DESC LIMIT 1",
+        (10001,),
+    ),
+    (
+        "courier active orders",
+        "SELECT * FROM orders WHERE courier_id = ? AND status = 'on_way'",
+        (1,),
+    ),
+    (
+        "order details",
+        "SELECT od.quantity, mi.name, od.price, od.size, od.color FROM order_details od JOIN menu_items mi ON od.menu_item_id = mi.id WHERE od.order_id = ?",
+        (1,),
+    ),
+    (
+        "latest receipts",
+        "SELECT * FROM receipts ORDER BY created_at DESC LIMIT 50",
+        (),
+    ),
+    (
+        "navbar unread notifications",
+        "SELECT COUNT(1) FROM notifications WHERE recipient_type = 'user' AND recipient_id = ? AND read_flag = 0",
+        (1,),
+    ),
+    (
+        "get_notifications_for_user",
+        """SELECT n.id, n.title, n.body, n.read_flag, n.created_at, n.sender_type, n.sender_id
+           FROM notifications n
+           WHERE n.recipient_type=? AND (n.recipient_id=? OR n.recipient_id IS NULL)
+           ORDER BY n.created_at DESC LIMIT 100""",
+        ("staff", 1),
+    ),
+    (
+        "get_chat_messages",
+        "SELECT id, sender_type, sender_id, text, created_at FROM chat_messages WHERE chat_id=? ORDER BY id ASC LIMIT ?",
+        (1, 200),
+    ),
+    (
+        "chat preview",
+        "SELECT text FROM chat_messages WHERE chat_id=? ORDER BY id DESC LIMIT 1",
+        (1,),
+    ),
+    (
+        "private chat lookup",
+        "SELECT c.id FROM chats c JOIN chat_members m ON c.id=m.chat_id WHERE c.is_group=0 AND m.member_type=? AND m.member_id=?",
+        ("staff", 1),
+    ),
+    (
+        "api_get_menu_ratings",
+        """SELECT r.rating, r.comment, r.created_at,
+                  COALESCE(u.first_name || ' ' || u.last_name, 'Anonim') as user_name
+           FROM ratings r LEFT JOIN users u ON r.user_id = u.id
+           WHERE r.menu_item_id = ? ORDER BY r.created_at DESC LIMIT 20""",
+        (1,),
+    ),
+    (
+        "favorite lookup",
+        "SELECT id FROM favorites WHERE user_id = ? AND menu_item_id = ?",
+        (1, 1),
+    ),
+    (
+        "product gallery",
+        "SELECT id, media_type, media_url, display_order, is_main FROM product_media WHERE menu_item_id = ? ORDER BY is_main DESC, display_order ASC",
+        (1,),
+    ),
+    (
+        "search_menu_fts",
+        """SELECT m.* FROM menu_items_fts JOIN menu_items m ON m.id = menu_items_fts.rowid
+           WHERE menu_items_fts MATCH ? AND m.available = 1
+           ORDER BY bm25(menu_items_fts, 10.0, 2.0, 4.0, 1.0), m.id LIMIT 200""",
+        ('"qora"*',),
+    ),
+    (
+        "api_menu_search size filter",
+        "SELECT m.* FROM menu_items m WHERE m.available = 1 AND m.id IN (SELECT menu_item_id FROM menu_item_sizes WHERE size = ?) ORDER BY m.category, m.name LIMIT 200",
+        ("41",),
+    ),
+    (
+        "load_product_media (batch)",
+        "SELECT menu_item_id, id, media_type, media_url, display_order, is_main FROM product_media WHERE menu_item_id IN (?, ?, ?) ORDER BY menu_item_id, is_main DESC, display_order ASC, id ASC",
+        (1, 2, 3),
+    ),
+    (
+        "product media by url",
+        "SELECT id FROM product_media WHERE media_url = ?",
+        ("/static/x.jpg",),
+    ),
+    (
+        "favorites",
+        "SELECT menu_item_id FROM favorites WHERE user_id = ?",
+        (1,),
+    ),
+    (
+        "api_super_admin_reports totals",
+        "SELECT COUNT(*), COALESCE(SUM(r.total_amount), 0) FROM orders o LEFT JOIN receipts r ON o.id = r.order_id WHERE o.created_ts >= ? AND o.created_ts < ?",
+        (0, 86400),
+    ),
+    (
+        "api_super_admin_reports new customers",
+        "SELECT COUNT(*) FROM users WHERE created_ts >= ? AND created_ts < ?",
+        (0, 86400),
+    ),
+    (
+        "api_super_admin_reports daily sales",
+        "SELECT DATE(o.created_ts, 'unixepoch') as date, COUNT(*) as orders_count, COALESCE(SUM(r.total_amount),0) as revenue FROM orders o LEFT JOIN receipts r ON o.id = r.order_id WHERE o.created_ts >= ? AND o.created_ts < ? GROUP BY date ORDER BY date ASC",
+        (0, 86400),
+    ),
+    (
+        "cleanup_expired_orders",
+        "UPDATE orders SET status='cancelled' WHERE status='waiting' AND created_ts < ?",
+        (0,),
+    ),
+    (
+        "old pending orders",
+        "SELECT o.id, o.customer_name, COALESCE(r.total_amount, 0) FROM orders o LEFT JOIN receipts r ON r.order_id = o.id WHERE o.status = 'pending' AND o.created_ts < ?",
+        (0,),
+    ),
+    (
+        "birthday notification duplicate",
+        "SELECT id FROM notifications WHERE recipient_type=? AND recipient_id=? AND created_ts >= ? AND created_ts < ? AND title=?",
+        ("user", 1, 0, 86400, "t"),
+    ),
+    (
+        "get_user_sessions",
+        "SELECT session_id, ip, user_agent, created_at, last_seen FROM sessions WHERE user_id = ? ORDER BY last_seen DESC",
+        (1,),
+    ),
+]
+
+SCAN_RE = re.compile(r"^SCAN (?:TABLE )?(\w+)")
+
+
+def load_managed_indexes():
+    """INDEXES lists from every migration that declares one."""
+    indexes = []
+    for filename in sorted(os.listdir(MIGRATIONS_DIR)):
+        if not re.match(r"^\d{4}_\w+\.py$", filename):
+            continue
+        spec = importlib.util.spec_from_file_location(
+            f"audit_{filename[:-3]}", os.path.join(MIGRATIONS_DIR, filename)
+        )
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+        indexes.extend(getattr(module, "INDEXES", []))
+    return indexes
+
+
+def _ro_uri(path):
+    return f"file:{urllib.parse.quote(os.path.abspath(path))}?mode=ro"
+
+
+def open_database(db_path):
+    """Read-only connection with the side database files attached."""
+    conn = sqlite3.connect(_ro_uri(db_path), uri=True)
+    base = os.path.dirname(os.path.abspath(db_path))
+    for schema in SIDE_DATABASES:
+        path = os.path.join(base, f"{schema}.sqlite3")
+        if os.path.exists(path):
+            conn.execute(f"ATTACH DATABASE ? AS {schema}", (_ro_uri(path),))
+    return conn
+
+
+def audit(conn, catalog=QUERY_CATALOG, large_tables=LARGE_TABLES):
+    """Return a list of (label, plan_detail) for full scans of large tables."""
+    problems = []
+    for label, sql, params in catalog:
+        try:
+            plan = conn.execute(f"EXPLAIN QUERY PLAN {sql}", params).fetchall()
+        except sqlite3.OperationalError as e:
+            problems.append((label, f"ERROR: {e}"))
+            continue
+        for row in plan:
+            detail = row[-1]
+            match = SCAN_RE.match(detail)
+            # "SCAN x USING INDEX" is an ordered index walk, not a table scan
+            if match and match.group(1) in large_tables and "USING" not in detail:
+                problems.append((label, detail))
+    return problems
+
+
+def missing_indexes(conn):
+    existing = set()
+    for _, schema, _ in conn.execute("PRAGMA database_list").fetchall():
+        existing.update(
+            r[0]
+            for r in conn.execute(
+                f"SELECT name FROM {schema}.sqlite_master WHERE type='index'"
+            )
+        )
+    return [name for name, _, _ in load_managed_indexes() if name not in existing]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--db", default=DEFAULT_DB)
+    args = parser.parse_args(argv)
+
+    conn = open_database(args.db)
+    try:
+        problems = audit(conn)
+        missing = missing_indexes(conn)
+    finally:
+        conn.close()
+
+    for name in missing:
+        print(f"MISSING INDEX  {name}")
+    for label, detail in problems:
+        print(f"FULL SCAN      {label}: {detail}")
+    if problems or missing:
+        return 1
+    print(f"OK: {len(QUERY_CATALOG)} queries use indexes on large tables")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())